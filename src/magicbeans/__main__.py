@@ -1,5 +1,6 @@
 import importlib
 import os
+import shlex
 from collections import namedtuple
 from typing import List
 
@@ -8,11 +9,11 @@ import argparse
 
 from beancount import parser
 from beangulp import extract, identify, utils
-from magicbeans import prices
+from magicbeans import checkpoints, incremental, lotselection, prices, simulate, writer
 from magicbeans.common import ExtractionRecord
 from magicbeans.config import Config
 from magicbeans.prices import PriceFetcher
-from magicbeans.reports import default_report
+from magicbeans.reports import default_report, form8949, latexsplit, renderer, selection
 
 def build_argparser():
     """Build an argument parser for the command line interface."""
@@ -49,6 +50,39 @@ def build_argparser():
         action="store_false",
         help="Import and aggregate transactions from input_dir",
     )
+    parser.add_argument(
+        "--incremental",
+        default=False,
+        action="store_true",
+        help="Only import records newer than each source's watermark, appending "
+             "them to cached extractions kept in output_dir",
+    )
+    parser.add_argument(
+        "--checkpoints",
+        default=False,
+        action="store_true",
+        help="Write year-end inventory checkpoints (when the ledger changed "
+             "since they were last written), and report from the checkpoint "
+             "before --ty-start plus the reported years' entries, rather than "
+             "from the whole ledger",
+    )
+    parser.add_argument(
+        "--lot-selection",
+        default=None,
+        choices=lotselection.STRATEGY_NAMES,
+        help="Select lots for reductions with this strategy (min-tax uses the "
+             "report's tax rates), rather than by the ledger's booking_method",
+    )
+    parser.add_argument(
+        "--simulate",
+        default=None,
+        nargs="+",
+        choices=lotselection.STRATEGY_NAMES,
+        metavar="STRATEGY",
+        help="Compare gains and estimated tax under these lot selection "
+             f"strategies ({', '.join(lotselection.STRATEGY_NAMES)}), "
+             "booking the imported transactions with each in parallel",
+    )
     parser.add_argument(
         "--run-report",
         default=True,
@@ -60,6 +94,98 @@ def build_argparser():
         dest="run_report",
         action="store_false",
     )
+    parser.add_argument(
+        "--format",
+        default=["latex"],
+        nargs="+",
+        choices=renderer.FORMATS,
+        help="Report formats: a PDF compiled from LaTeX, plain text, CSV files "
+             "of each kind of table, or a static HTML page loading its data on "
+             "demand (the formats other than latex are much faster).  Several "
+             "formats are rendered in parallel from one computation",
+    )
+    parser.add_argument(
+        "--sections",
+        default=None,
+        nargs="+",
+        choices=selection.SECTIONS,
+        help="Only compute these sections of the report: tax estimates, 8949 "
+             "summaries, Sched. C mining summaries, the detailed log, or the "
+             "lot lineage export (default: all)",
+    )
+    parser.add_argument(
+        "--assets",
+        default=None,
+        nargs="+",
+        metavar="ASSET",
+        help="Only report on these assets (e.g. BTC); other assets' "
+             "transactions are left out of all sections and the 8949 export",
+    )
+    parser.add_argument(
+        "--pages",
+        default=None,
+        type=selection.parse_pages,
+        metavar="FIRST[-[LAST]]",
+        help="Only compute these pages of each year's detailed log, e.g. 3, "
+             "3-5 or 3-",
+    )
+    parser.add_argument(
+        "--save-model",
+        default=False,
+        action="store_true",
+        help="Save the report's data model in output_dir, for --render-only",
+    )
+    parser.add_argument(
+        "--render-only",
+        default=False,
+        action="store_true",
+        help="Render the report from the data model saved by an earlier "
+             "--save-model run, without reading the ledger",
+    )
+    parser.add_argument(
+        "--export-8949",
+        default=None,
+        choices=form8949.FORMATS,
+        help="Also export the Form 8949 rows of the reported years, in this "
+             "format, for import into other tax tools",
+    )
+    parser.add_argument(
+        "--export-8949-rows",
+        default=form8949.GROUP,
+        choices=form8949.ROW_KINDS,
+        help="Export a row per disposal, or per group of disposals of the same "
+             "asset, acquisition and disposal dates, and term (as in the report)",
+    )
+    parser.add_argument(
+        "--split-years",
+        default=None,
+        choices=latexsplit.ASSEMBLY_MODES,
+        help="Compile each tax year's detailed log separately, in parallel, and "
+             "then assemble them into a single PDF, or link them from the main "
+             "PDF as separate PDFs (linked)",
+    )
+    parser.add_argument(
+        "--latex-command",
+        default=" ".join(latexsplit.LATEXMK),
+        help="Command compiling a .tex file named by its last argument, with "
+             "--split-years",
+        type=str,
+    )
+    parser.add_argument(
+        "--cache-fragments",
+        default=False,
+        action="store_true",
+        help="Cache rendered report pages and tables (and, with --split-years, "
+             "compiled years) in output_dir, re-rendering only those whose "
+             "data changed",
+    )
+    parser.add_argument(
+        "--incremental-report",
+        default=False,
+        action="store_true",
+        help="Keep the report's data models in output_dir, and recompute only "
+             "those from the earliest changed entry on",
+    )
     parser.add_argument(
         "--ty-start",
         default=2018,
@@ -117,8 +243,16 @@ def run():
     path_directives = os.path.join(working_dir, "01-directives.beancount")
     path_extracted  = os.path.join(working_dir, "02-extracted.beancount")
     path_sorted     = os.path.join(working_dir, "03-extracted-sorted.beancount")
+    path_selected   = os.path.join(working_dir, "03-extracted-selected.beancount")
     path_final      = os.path.join(working_dir, "04-final.beancount")
-    path_report     = os.path.join(working_dir, "05-report")  # .pdf will be appended
+    path_unselected = os.path.join(working_dir, "04-final-unselected.beancount")
+    path_report     = os.path.join(working_dir, "05-report")  # .pdf (.txt, -<table>.csv, -html/) will be appended
+    path_model      = os.path.join(working_dir, "05-report.model")
+    path_simulation = os.path.join(working_dir, "06-simulation.txt")
+    path_incremental = os.path.join(working_dir, "incremental")
+    path_checkpoints = os.path.join(working_dir, "checkpoints")
+    path_fragments  = os.path.join(working_dir, "fragments")
+    path_models     = os.path.join(working_dir, "report-models")
 
     print(args.run_import)
     if args.run_import:
@@ -139,26 +273,37 @@ def run():
 
         # Extract
         print(f"==== Extracting data to {path_extracted}...")
-        with open(path_extracted, "w") as out:
+        with writer.open_output(path_extracted) as out:
             importers = config.get_importers()
             hooks = config.get_hooks()
-            extract_all(utils.walk([input_dir]), out, importers, hooks)
+            store = incremental.WatermarkStore(path_incremental) if args.incremental else None
+            extract_all(utils.walk([input_dir]), out, importers, hooks, store)
 
         # Sort
         print(f"==== Sorting extracted data to {path_sorted}...")
         def ts_key(entry):
             return (entry.date, dateutil.parser.parse(entry.meta['timestamp']))
-        with open(path_sorted, "w") as out:
+        with writer.open_output(path_sorted) as out:
             entries, errors, options = parser.parser.parse_file(path_extracted)
             entries.sort(key=ts_key)
-            parser.printer.print_entries(entries, file=out)
+            writer.write_entries(entries, out)
+
+        # Select lots.  The unselected ledger is kept for --simulate, as
+        # selected lots would be kept by every simulated strategy.
+        if args.lot_selection:
+            print(f"==== Selecting lots by {args.lot_selection} to {path_selected}...")
+            with writer.open_output(path_selected) as out:
+                strategy = lotselection.make_strategy(
+                    args.lot_selection, default_report.ST_RATE, default_report.LT_RATE)
+                writer.write_entries(lotselection.select_lots(entries, strategy), out)
+            join_files([path_preamble, path_directives, path_sorted], path_unselected)
+        elif os.path.exists(path_unselected):
+            os.remove(path_unselected)
 
         # Join files
         print(f"==== Joining directives and sorted data to {path_final}...")
-        with open(path_final, "w") as out:
-            for path in [path_preamble, path_directives, path_sorted]:
-                with open(path) as infile:
-                    out.write(infile.read())
+        join_files([path_preamble, path_directives,
+                    path_selected if args.lot_selection else path_sorted], path_final)
 
         # Save prices
         print(f"==== Saving prices...")
@@ -166,37 +311,111 @@ def run():
 
         print(f"==== Imported transactions to {path_final}.")
 
-    if args.run_report:
+    numeraire = "USD"  # Should be : config.get_numeraire() ?
+    tax_years = range(args.ty_start, args.ty_end + 1)
+
+    # Rewrite the checkpoints if the ledger changed since they were written
+    # (e.g., by an import without --checkpoints).
+    if args.checkpoints and not checkpoints.is_current(path_checkpoints, path_final):
+        print(f"==== Writing year-end checkpoints to {path_checkpoints}...")
+        years = checkpoints.write_checkpoints(path_final, path_checkpoints, numeraire)
+        print(f"==== Checkpointed years {', '.join(str(y) for y in years)}.")
+
+    if args.simulate:
+        print(f"==== Simulating lot selection strategies {', '.join(args.simulate)}...")
+        # Simulate from the ledger before any lot selection.
+        path_simulated = path_unselected if os.path.exists(path_unselected) else path_final
+        results = simulate.simulate(path_simulated, args.simulate, tax_years, numeraire,
+                                    default_report.ST_RATE, default_report.LT_RATE)
+        comparison = simulate.format_comparison(results, tax_years)
+        with open(path_simulation, "w") as out:
+            out.write(comparison + "\n")
+        print(comparison)
+        print(f"==== Simulation written to {path_simulation}.")
+
+    if args.run_report and args.render_only:
+        print(f"==== Rendering report from {path_model}...")
+        default_report.render(
+            path_model,
+            args.format,
+            path_report,
+            split_years=args.split_years,
+            compiler=shlex.split(args.latex_command),
+            cache_dir=path_fragments if args.cache_fragments else None,
+        )
+        print(f"==== Report complete.")
+
+    elif args.run_report:
         # Run the report
         print(f"==== Running report...")
 
-        numeraire = "USD"  # Should be : config.get_numeraire() ?
-        tax_years = range(args.ty_start, args.ty_end + 1)
+        path_ledger = path_final
+        if args.checkpoints:
+            path_sharded = os.path.join(
+                working_dir, f"04-final-{args.ty_start}-{args.ty_end}.beancount")
+            try:
+                checkpoints.join_years(path_checkpoints, tax_years, path_sharded)
+                path_ledger = path_sharded
+                print(f"==== Reporting from checkpointed ledger {path_ledger}")
+            except FileNotFoundError as e:
+                print(f"==== {e}; reporting from the whole ledger")
 
         default_report.generate(
             tax_years,
             numeraire,
             config.get_covered_currencies(),
-            path_final,
+            path_ledger,
             path_report,
+            split_years=args.split_years,
+            compiler=shlex.split(args.latex_command),
+            cache_dir=path_fragments if args.cache_fragments else None,
+            models_dir=path_models if args.incremental_report else None,
+            report_format=args.format,
+            export_8949=args.export_8949,
+            rows_8949=args.export_8949_rows,
+            model_path=path_model if args.save_model else None,
+            report_selection=selection.ReportSelection.new(args.sections, args.assets, args.pages),
         )
 
         print(f"==== Report complete.")
 
+def join_files(paths: List[str], out_path: str):
+    """Write the concatenation of the files to the output path."""
+    with open(out_path, "w") as out:
+        for path in paths:
+            with open(path) as infile:
+                out.write(infile.read())
+
 # Beangulp extract is designed to be called directly from the command
 # and has no exposed API.  It's hard to call through all the Click abstractions
 # and magic, so instead we just reimplement a very stripped down importer here.
-def extract_all(input_filenames, out, importers, hooks):
+#
+# If a WatermarkStore is provided, importers supporting incremental extraction
+# only extract records newer than their source's watermark, and the entries
+# for such sources are taken from the cached extractions.
+def extract_all(input_filenames, out, importers, hooks,
+                store: incremental.WatermarkStore = None):
     existing_entries = []  # Start from scratch each run
     extracted: List[ExtractionRecord] = []
+    incremental_sources = {}
     for filename in input_filenames:
         importer = identify.identify(importers, filename)
         if importer:
             print(f'  {importer.name()} importer processing {filename}')
-            entries = extract.extract_from_file(importer, filename, [])
             account = importer.account(filename)
+            if store and hasattr(importer, 'extract_incremental'):
+                entries = incremental.extract_new_entries(importer, filename, store)
+                print(f'    {len(entries)} new entries')
+                source = incremental.source_key(importer, filename)
+                incremental_sources[source] = (account, importer)
+                continue
+            entries = extract.extract_from_file(importer, filename, [])
             extracted.append(ExtractionRecord(filename, entries, account, importer))
 
+    for (source, (account, importer)) in incremental_sources.items():
+        extracted.append(ExtractionRecord(store.cache_path(source),
+                                          store.load_entries(source), account, importer))
+
     # Sort and dedup.
     extract.sort_extracted_entries(extracted)
     for filename, entries, account, importer in extracted:
@@ -208,7 +427,7 @@ def extract_all(input_filenames, out, importers, hooks):
         extracted = func(extracted, [])
 
     # Serialize entries.
-    extract.print_extracted_entries(extracted, out)
+    writer.write_extracted_entries(extracted, out)
 
 if __name__ == '__main__':
     run()
@@ -0,0 +1,141 @@
+import datetime
+from beancount.core.amount import Amount
+from beancount.core.data import Posting, Transaction
+from beancount.core.number import D
+from beancount.core.position import Cost
+from magicbeans.disposals import BookedDisposal
+from magicbeans.reports import columnar
+import numpy as np
+import pytest
+
+def lot_leg(btc: str, cost: str, acquired: datetime.date) -> Posting:
+    return Posting('Assets:Coinbase:BTC', Amount(D(btc), 'BTC'),
+                   Cost(D(cost), 'USD', acquired, None), None, None, None)
+
+def sale(date: datetime.date, timestamp: str, legs, usd: str, stcg: str, ltcg: str) -> BookedDisposal:
+    tx = Transaction({'timestamp': timestamp, 'stcg': D(stcg), 'ltcg': D(ltcg)},
+                     date, None, None, None, None, None, legs + [
+        Posting('Assets:Coinbase:USD', Amount(D(usd), 'USD'), None, None, None, None),
+        Posting('Income:CapGains:Short', Amount(-D(stcg), 'USD'), None, None, None, None),
+        Posting('Income:CapGains:Long', Amount(-D(ltcg), 'USD'), None, None, None, None),
+    ])
+    return BookedDisposal(tx, 'USD')
+
+def disposals():
+    return [
+        # Short-term
+        sale(datetime.date(2022, 3, 1), '2022-03-01T10:00:00Z',
+             [lot_leg('-0.5', '8000', datetime.date(2021, 6, 1))], '5000', '1000', '0'),
+        sale(datetime.date(2022, 3, 1), '2022-03-01T11:00:00Z',
+             [lot_leg('-0.25', '8000', datetime.date(2021, 6, 1))], '2600', '600', '0'),
+        # Mixed: 1 BTC long-term, 1 BTC short-term
+        sale(datetime.date(2022, 4, 1), '2022-04-01T10:00:00Z',
+             [lot_leg('-1', '1000', datetime.date(2015, 1, 1)),
+              lot_leg('-1', '9000', datetime.date(2021, 6, 1))], '20000', '1000', '9000'),
+    ]
+
+def test_allocate() -> None:
+    assert columnar.allocate(100, [1, 1, 1]) == [33, 33, 34]
+    assert columnar.allocate(-100, [1, 2]) == [-34, -66]
+    assert columnar.allocate(10, [1, 0]) == [10, 0]
+    assert columnar.allocate(10, [0, 0]) == [0, 10]
+
+def test_fixed_point() -> None:
+    assert columnar.to_fixed(D('0.123456789'), 9) == 123456789
+    assert columnar.to_fixed(D('-1.5'), 3) == -1500
+    assert columnar.to_fixed(D('1E+2'), 0) == 100
+    assert columnar.to_decimal(123456789, 9) == D('0.123456789')
+    assert str(columnar.to_decimal(150000, 5)) == '1.50000'
+    assert str(columnar.to_decimal(150000, 5, 1)) == '1.5'
+    assert str(columnar.to_decimal(150000, 5, 0)) == '1.5'
+    assert str(columnar.to_decimal(0, 5, 0)) == '0'
+    with pytest.raises(ValueError):
+        columnar.to_fixed(D('0.123'), 2)
+
+def test_exact() -> None:
+    # More than 8 decimal places, in units and in cost (units x cost per
+    # unit), which are kept exactly.
+    bd = sale(datetime.date(2022, 3, 1), '2022-03-01T10:00:00Z',
+              [lot_leg('-0.123456789', '3.33333333', datetime.date(2021, 6, 1)),
+               lot_leg('-0.000000001', '3.33333333', datetime.date(2021, 6, 1))],
+              '1', '0.58847736', '0')
+    table = columnar.DisposalsTable([bd])
+    [(_, _, summary)] = table.disposals_summaries()
+    [row] = summary.rows
+    assert row.disposed_amount == D('0.12345679')
+    assert row.disposed_cost == D('0.4115226329218107')
+    assert row.disposed_cost == bd.disposed_cost
+    assert table.amount.dtype == np.int64
+
+    # Results are at the scale of their inputs, not the table's.
+    assert table.decimals == 17
+    assert str(row.disposed_amount) == '0.123456790'
+    assert str(row.stcg) == '0.58847736'
+    report = table.tax_report(D('0.5'), D('0.2'))
+    assert str(report.rows[0].ltcg) == '0'
+    assert str(report.rows[0].ltcg_tax) == '0.0'
+    assert str(report.rows[0].stcg) == '0.58847736'
+
+def test_large_amounts() -> None:
+    # Two hundred billion units, beyond int64 at 8 decimal places
+    leg = Posting('Assets:Coinbase:SHIB', Amount(D('-200000000000.00000001'), 'SHIB'),
+                  Cost(D('0.00001'), 'USD', datetime.date(2021, 6, 1), None), None, None, None)
+    bd = sale(datetime.date(2022, 3, 1), '2022-03-01T10:00:00Z', [leg], '2500000', '500000', '0')
+    table = columnar.DisposalsTable([bd, bd])
+    [(asset, _, summary)] = table.disposals_summaries()
+    assert asset == 'SHIB'
+    assert summary.total_row.disposed_amount == D('400000000000.00000002')
+    assert summary.total_row.disposed_cost == bd.disposed_cost * 2
+    assert summary.total_row.stcg == D('1000000')
+    report = table.tax_report(D('0.5'), D('0.2'))
+    assert report.total_row.stcg == D('1000000')
+
+def test_columns() -> None:
+    table = columnar.DisposalsTable(disposals())
+    assert len(table) == 4
+    assert table.assets == ['BTC']
+    assert list(table.term) == [columnar.SHORT, columnar.SHORT, columnar.LONG, columnar.SHORT]
+    # The mixed disposal's proceeds are split evenly by units, and its gains
+    # go to the legs of their term.
+    assert [table.to_decimal(v, table.decimals) for v in table.numeraire_proceeds[2:]] == [D('10000'), D('10000')]
+    assert [table.to_decimal(v, table.decimals) for v in table.gain[2:]] == [D('9000'), D('1000')]
+    assert [table.to_decimal(v, table.decimals) for v in table.ltcg[2:]] == [D('9000'), D('0')]
+    assert list(table.year) == [2022] * 4
+    assert list(table.month) == [3, 3, 4, 4]
+
+def test_group_by() -> None:
+    table = columnar.DisposalsTable(disposals())
+    (groups, sums, places) = table.group_by(table.month, table.term)
+    assert groups.tolist() == [[3, columnar.SHORT], [4, columnar.SHORT], [4, columnar.LONG]]
+    assert [table.to_decimal(v, p) for (v, p) in zip(sums['amount'], places['amount'])] == [D('0.75'), D('1'), D('1')]
+    assert [table.to_decimal(v, p) for (v, p) in zip(sums['stcg'], places['stcg'])] == [D('1600'), D('1000'), D('0')]
+
+def test_tax_report() -> None:
+    report = columnar.DisposalsTable(disposals()).tax_report(D('0.5'), D('0.2'))
+    [row] = report.rows
+    assert (row.asset, row.stcg, row.ltcg) == ('BTC', D('2600'), D('9000'))
+    assert report.total_row.total_tax == D('2600') * D('0.5') + D('9000') * D('0.2')
+    assert columnar.DisposalsTable([]).tax_report(D('0.5'), D('0.2')) is None
+
+def test_disposals_summaries() -> None:
+    table = columnar.DisposalsTable(disposals())
+    summaries = table.disposals_summaries()
+    assert [(a, t, len(s.rows)) for (a, t, s) in summaries] == [
+        ('BTC', 'Short Term', 2), ('BTC', 'Mixed', 1)]
+    mixed = summaries[1][2].rows[0]
+    assert mixed.acquisition_date == 'Various'
+    assert (mixed.disposed_amount, mixed.disposed_cost, mixed.gain) == (D('2'), D('10000'), D('10000'))
+    short = summaries[0][2]
+    assert [r.cum_stcg for r in short.rows] == [D('1000'), D('1600')]
+    assert short.total_row.numeraire_proceeds == D('7600')
+
+
+def test_group_sums_empty_groups() -> None:
+    sums = columnar.group_sums(np.array([0, 2, 2]), 4, np.array([1, 2, 3], dtype=np.int64))
+    assert sums.tolist() == [1, 0, 5, 0]
+    values = columnar.to_array([2 ** 62, 2 ** 62, 1])
+    assert values.dtype == object
+    sums = columnar.group_sums(np.array([0, 2, 2]), 4, values)
+    assert sums.tolist() == [2 ** 62, 0, 2 ** 62 + 1, 0]
+    places = columnar.group_sums(np.array([0, 2, 2]), 4, np.array([3, 8, 5]), np.maximum)
+    assert places.tolist() == [3, 0, 8, 0]
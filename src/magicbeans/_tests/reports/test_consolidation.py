@@ -0,0 +1,39 @@
+import datetime
+from beancount.core.number import D
+from magicbeans.reports.consolidation import DisposalsConsolidator
+from magicbeans._tests.reports.test_columnar import disposals, lot_leg, sale
+
+def test_consolidate() -> None:
+    bds = disposals() + [
+        # Same lot and day as the first two, but long-term classified
+        sale(datetime.date(2022, 3, 1), '2022-03-01T12:00:00Z',
+             [lot_leg('-0.1', '8000', datetime.date(2021, 6, 1))], '1000', '0', '200'),
+        # Earlier disposal of the same lot, after the later ones
+        sale(datetime.date(2022, 2, 1), '2022-02-01T12:00:00Z',
+             [lot_leg('-0.1', '8000', datetime.date(2021, 6, 1))], '900', '100', '0'),
+    ]
+    consolidator = DisposalsConsolidator().add_all(bds)
+    assert consolidator.n_disposals == 5
+    assert len(consolidator) == 4
+    summaries = consolidator.summaries()
+    assert [(a, t, len(s.rows)) for (a, t, s) in summaries] == [
+        ('BTC', 'Short Term', 2), ('BTC', 'Long Term', 1), ('BTC', 'Mixed', 1)]
+
+    short = summaries[0][2]
+    assert [r.date for r in short.rows] == [datetime.date(2022, 2, 1), datetime.date(2022, 3, 1)]
+    row = short.rows[1]
+    assert (row.disposed_amount, row.acquisition_date) == (D('0.75'), datetime.date(2021, 6, 1))
+    assert (row.numeraire_proceeds, row.disposed_cost, row.gain) == (D('7600'), D('6000'), D('1600'))
+    assert (row.stcg, row.cum_stcg) == (D('1600'), D('1700'))
+    assert short.total_row.disposed_amount == D('0.85')
+
+    mixed = summaries[2][2].rows[0]
+    assert mixed.acquisition_date == 'Various'
+    assert (mixed.stcg, mixed.ltcg) == (D('1000'), D('9000'))
+
+def test_unclassified_disposals_skipped() -> None:
+    bd = sale(datetime.date(2022, 3, 1), '2022-03-01T10:00:00Z',
+              [lot_leg('-0.5', '8000', datetime.date(2021, 6, 1))], '4000', '0', '0')
+    consolidator = DisposalsConsolidator().add_all([bd])
+    assert consolidator.n_disposals == 1
+    assert consolidator.summaries() == []
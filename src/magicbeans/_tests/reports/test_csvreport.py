@@ -0,0 +1,38 @@
+import csv
+from magicbeans.reports.csvreport import COLUMNS, CsvRenderer
+from magicbeans._tests.reports.test_latexstream import render
+
+def read(path: str):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+def test_render(tmp_path) -> None:
+    renderer = CsvRenderer(str(tmp_path / 'report'))
+    render(renderer)
+    renderer.close()
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(f'report-{t}.csv' for t in COLUMNS)
+
+    tax = read(renderer.table_path('tax'))
+    assert len(tax) == 7
+    assert tax[0] == {'section': 'Tax report', 'asset': 'BTC', 'ltcg': '1000.123', 'stcg': '-5',
+                      'ltcg_tax': '200', 'stcg_tax': '0', 'total_tax': '200'}
+    assert tax[-1]['asset'] == 'Total'
+
+    summaries = read(renderer.table_path('disposals-summary'))
+    assert [row['title'] for row in summaries] == ['BTC Mixed'] * 8 + ['Empty']
+    assert summaries[0]['section'] == 'Sub-report'
+    assert summaries[7]['disposed_currency'] == 'Total'
+
+    # 100 + 1 lots on the first page, 3 + 1 on the third
+    inventory = read(renderer.table_path('inventory'))
+    assert len(inventory) == 105
+    assert inventory[10]['lot_id'] == '10' and inventory[11]['lot_id'] == ''
+
+    acquisitions = read(renderer.table_path('acquisitions'))
+    assert [row['narration'] for row in acquisitions] == ['Bought_it', '']
+
+    disposals = read(renderer.table_path('disposals'))
+    assert disposals[0]['narration'] == 'Sold 50% & more'
+    assert disposals[0]['lots'] == '0.2 BTC {1600 USD 2020-01-01} #7; 0.05 BTC {1600 USD 2020-01-02}'
+
+    assert len(read(renderer.table_path('mining'))) == 2
@@ -0,0 +1,55 @@
+import datetime
+import io
+import json
+from beancount.core.number import D
+from magicbeans.reports import form8949
+from magicbeans._tests.reports.test_columnar import disposals, lot_leg, sale
+
+def test_disposal_rows() -> None:
+    rows = list(form8949.disposal_rows(disposals()))
+    assert len(rows) == 3
+    assert rows[0] == form8949.Form8949Row('0.5 BTC', 'BTC', D('0.5'), '2021-06-01', datetime.date(2022, 3, 1),
+                                           D('5000'), D('4000.0'), D('1000.0'), 'Short Term')
+    assert (rows[2].acquired, rows[2].term) == ('Various', 'Mixed')
+
+def test_group_rows() -> None:
+    bds = disposals() + [
+        # Disposed at cost, so neither short nor long term
+        sale(datetime.date(2022, 4, 1), '2022-04-01T12:00:00Z',
+             [lot_leg('-0.1', '8000', datetime.date(2021, 6, 1))], '800', '0', '0'),
+        # Out of order
+        sale(datetime.date(2022, 3, 1), '2022-03-01T12:00:00Z',
+             [lot_leg('-0.1', '8000', datetime.date(2021, 6, 1))], '900', '100', '0'),
+    ]
+    rows = list(form8949.group_rows(bds))
+    assert [(r.amount, r.disposed, r.term) for r in rows] == [
+        (D('0.75'), datetime.date(2022, 3, 1), 'Short Term'),
+        # Written as soon as it's read, rather than grouped
+        (D('0.1'), datetime.date(2022, 3, 1), 'Short Term'),
+        (D('2'), datetime.date(2022, 4, 1), 'Mixed'),
+        (D('0.1'), datetime.date(2022, 4, 1), ''),
+    ]
+    assert (rows[0].proceeds, rows[0].cost, rows[0].gain) == (D('7600'), D('6000.00'), D('1600.00'))
+
+def test_export(tmp_path) -> None:
+    csv_path = str(tmp_path / '8949.csv')
+    assert form8949.export(disposals(), csv_path, 'csv') == 2
+    lines = open(csv_path).read().splitlines()
+    assert lines[0] == ','.join(form8949.FIELDS)
+    assert lines[1] == '0.75 BTC,BTC,0.75,2021-06-01,2022-03-01,7600,6000.00,1600.00,Short Term'
+
+    jsonl_path = str(tmp_path / '8949.jsonl')
+    assert form8949.export(disposals(), jsonl_path, 'jsonl', form8949.DISPOSAL) == 3
+    rows = [json.loads(line) for line in open(jsonl_path)]
+    assert rows[1] == {'description': '0.25 BTC', 'asset': 'BTC', 'amount': '0.25', 'acquired': '2021-06-01',
+                       'disposed': '2022-03-01', 'proceeds': '2600', 'cost': '2000.00', 'gain': '600.00',
+                       'term': 'Short Term'}
+
+def test_streams() -> None:
+    # Rows are written as the disposals are read.
+    out = io.StringIO()
+    def bds():
+        for bd in disposals():
+            yield bd
+            assert out.getvalue().count('\n') >= 1
+    form8949.write_csv(form8949.disposal_rows(bds()), out)
@@ -0,0 +1,103 @@
+import datetime
+import os
+import sys
+import pytest
+from beancount.core.amount import Amount
+from beancount.core.data import Posting
+from beancount.core.number import D
+from magicbeans.reports.data import AcquisitionsReportRow, DisposalsReport
+from magicbeans.reports.fragments import FragmentCache, fingerprint
+from magicbeans.reports.latexsplit import SplitLaTeXRenderer
+from magicbeans.reports.latexstream import StreamingLaTeXRenderer
+from magicbeans._tests.reports.test_latexstream import inventory_report, render
+from magicbeans._tests.reports.test_latexsplit import STUB_COMPILER
+
+def posting(meta) -> Posting:
+    return Posting('Assets:USD', Amount(D('1'), 'USD'), None, None, None, meta)
+
+def test_fingerprint() -> None:
+    assert fingerprint(posting({'lineno': 1})) == fingerprint(posting({'lineno': 2}))
+    assert fingerprint(posting(None)) != fingerprint(posting(None)._replace(account='Assets:EUR'))
+    assert fingerprint([D('1'), 'a']) != fingerprint([D('1.0'), 'a'])
+    assert fingerprint(inventory_report(3)) == fingerprint(inventory_report(3))
+    with pytest.raises(TypeError):
+        fingerprint(object())
+
+def test_cache(tmp_path) -> None:
+    cache = FragmentCache(str(tmp_path))
+    key = cache.key('page', inventory_report(3))
+    assert cache.get(key) is None
+    cache.put(key, 'text%\nmore', ['tabularx', 'xcolor'])
+    assert cache.get(key) == ('text%\nmore', ['tabularx', 'xcolor'])
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    stale = FragmentCache(str(tmp_path))
+    assert stale.prune() == 1
+    assert os.listdir(tmp_path) == []
+
+def acquisitions(n: int):
+    return [AcquisitionsReportRow(datetime.date(2021, 1, 1), f'Buy {i}', D('0.5'), 'BTC', D('100'), D('50'), None)
+            for i in range(n)]
+
+def render_pages(renderer, n_acquisitions) -> str:
+    for n in n_acquisitions:
+        renderer.newpage()
+        renderer.details_page(inventory_report(5), acquisitions(n), DisposalsReport('USD', [], D('0'), D('0'), False))
+    with open(renderer.write_tex()) as f:
+        return f.read()
+
+def test_cached_output_unchanged(tmp_path) -> None:
+    cache_dir = str(tmp_path / 'cache')
+    uncached = StreamingLaTeXRenderer(str(tmp_path / 'uncached'))
+    render(uncached)
+    with open(uncached.write_tex()) as f:
+        expected = f.read()
+    # Fragments come out the same whether rendered or cached, packages and all.
+    for run in range(2):
+        renderer = StreamingLaTeXRenderer(str(tmp_path / f'run{run}'), cache_dir)
+        render(renderer)
+        with open(renderer.write_tex()) as f:
+            assert f.read() == expected
+    assert (renderer.cache.hits, renderer.cache.misses) == (7, 0)
+
+def test_reuse(tmp_path) -> None:
+    cache_dir = str(tmp_path / 'cache')
+    uncached = render_pages(StreamingLaTeXRenderer(str(tmp_path / 'uncached')), [1, 2, 3])
+
+    first = StreamingLaTeXRenderer(str(tmp_path / 'first'), cache_dir)
+    assert render_pages(first, [1, 2, 3]) == uncached
+    assert (first.cache.hits, first.cache.misses) == (0, 3)
+
+    # Only the changed page is rendered again.
+    second = StreamingLaTeXRenderer(str(tmp_path / 'second'), cache_dir)
+    assert render_pages(second, [1, 2, 4]) == render_pages(StreamingLaTeXRenderer(str(tmp_path / 'u2')), [1, 2, 4])
+    assert (second.cache.hits, second.cache.misses) == (2, 1)
+    second.close_cache()
+    assert len(os.listdir(cache_dir)) == 3
+
+@pytest.fixture
+def counting_compiler(tmp_path):
+    # The stub compiler, logging the files it compiles.
+    path = tmp_path / 'stub_compiler.py'
+    path.write_text(STUB_COMPILER + f'\nopen({str(tmp_path / "log")!r}, "a").write(tex_path + "\\n")\n')
+    return [sys.executable, str(path)]
+
+def render_years(path: str, cache_dir: str, compiler, n_by_year) -> None:
+    renderer = SplitLaTeXRenderer(path, 'single', compiler, cache_dir=cache_dir)
+    for (year, n) in n_by_year.items():
+        renderer.begin_unit(str(year), f'{year} Transaction Log')
+        renderer.header(f'{year} Transaction Log')
+        renderer.details_page(inventory_report(5), acquisitions(n), DisposalsReport('USD', [], D('0'), D('0'), False))
+        renderer.end_unit()
+    renderer.close()
+
+def test_reuse_compiled_years(tmp_path, counting_compiler) -> None:
+    (path, cache_dir, log) = (str(tmp_path / 'report'), str(tmp_path / 'cache'), tmp_path / 'log')
+    render_years(path, cache_dir, counting_compiler, {2021: 1, 2022: 1})
+    assert sorted(log.read_text().split()) == ['report-2021.tex', 'report-2022.tex', 'report.tex']
+
+    # Only the year with a changed page, and the main document, are compiled.
+    log.write_text('')
+    render_years(path, cache_dir, counting_compiler, {2021: 1, 2022: 2})
+    assert sorted(log.read_text().split()) == ['report-2022.tex', 'report.tex']
+    assert 'Buy 1' in open(path + '-2022.pdf').read()
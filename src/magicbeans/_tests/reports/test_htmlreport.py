@@ -0,0 +1,53 @@
+import datetime
+import json
+import os
+import pytest
+from beancount.core.number import D
+from magicbeans.reports.data import DisposalsReport
+from magicbeans.reports.htmlreport import INDEX_FILENAME, HtmlRenderer, jsonable, read_chunk
+from magicbeans._tests.reports.test_latexstream import inventory_report, render
+
+def test_jsonable() -> None:
+    assert jsonable(inventory_report(1))['accounts'][0]['positions_and_ids'][0] == [
+        {'units': {'number': '0.5', 'currency': 'BTC'},
+         'cost': {'number': '100', 'currency': 'USD', 'date': '2020-01-01', 'label': None}},
+        0]
+    assert jsonable([D('0E-8'), datetime.date(2021, 1, 1)]) == ['0.00000000', '2021-01-01']
+    with pytest.raises(TypeError):
+        jsonable(object())
+
+def read_index(directory: str):
+    html = open(os.path.join(directory, INDEX_FILENAME)).read()
+    start = html.index('const REPORT = ') + len('const REPORT = ')
+    return json.loads(html[start:html.index(';\n', start)])
+
+def test_render(tmp_path) -> None:
+    directory = str(tmp_path / 'report-html')
+    renderer = HtmlRenderer(directory, pages_per_chunk=2)
+    render(renderer)
+    renderer.header('Log </script>')
+    renderer.subheader('Page 4')
+    renderer.details_page(inventory_report(1), [], DisposalsReport('USD', [], D('0'), D('0'), False))
+    renderer.close()
+
+    report = read_index(directory)
+    assert report['cover']['summary_lines'] == ['Summary: 100% {ok}', 'line 2']
+    assert [s['title'] for s in report['sections']] == ['Tax report', 'Log </script>']
+    assert '</script>' not in open(os.path.join(directory, INDEX_FILENAME)).read().split('const REPORT')[1].split(';\n')[0]
+
+    items = read_chunk(renderer.chunk_path(report['sections'][0]['chunk']))
+    assert [item['kind'] for item in items] == [
+        'tax_report', 'subheader', 'text', 'paragraph', 'disposals_summary', 'disposals_summary',
+        'page', 'page', 'page', 'mining_summary']
+    # Pages are in chunks of their own, two at a time.
+    pages = [item for item in items if item['kind'] == 'page']
+    assert [(p['chunk'], p['index']) for p in pages] == [(pages[0]['chunk'], 0), (pages[0]['chunk'], 1),
+                                                          (pages[2]['chunk'], 0)]
+    first = read_chunk(renderer.chunk_path(pages[0]['chunk']))
+    assert len(first) == 2
+    assert len(first[0]['inventory']['accounts'][0]['positions_and_ids']) == 100
+    assert first[0]['disposals']['rows'][0]['narration'] == 'Sold 50% & more'
+
+    log = read_chunk(renderer.chunk_path(report['sections'][1]['chunk']))
+    assert log == [{'kind': 'page', 'title': 'Page 4', 'chunk': log[0]['chunk'], 'index': 0}]
+    assert len(os.listdir(os.path.join(directory, 'data'))) == renderer.n_chunks == 5
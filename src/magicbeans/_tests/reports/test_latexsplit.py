@@ -0,0 +1,80 @@
+import os
+import re
+import sys
+import pytest
+from magicbeans.reports.latexsplit import SplitLaTeXRenderer
+
+# Stands in for latexmk: "compiles" a .tex file to a .pdf holding its
+# source, failing if a PDF it includes doesn't exist yet.
+STUB_COMPILER = r'''
+import os, re, sys
+tex_path = sys.argv[-1]
+source = open(tex_path).read()
+for included in re.findall(r"\\includepdf\[[^\]]*\]\{([^}]*)\}", source):
+    if not os.path.exists(included):
+        sys.exit(f"missing {included}")
+with open(os.path.splitext(tex_path)[0] + ".pdf", "w") as out:
+    out.write(source)
+'''
+
+@pytest.fixture
+def compiler(tmp_path):
+    path = tmp_path / 'stub_compiler.py'
+    path.write_text(STUB_COMPILER)
+    return [sys.executable, str(path)]
+
+def render(renderer: SplitLaTeXRenderer) -> None:
+    renderer.header('Summary')
+    renderer.write_text('Main document')
+    for ty in [2021, 2022]:
+        renderer.begin_unit(str(ty), f'{ty} Transaction Log')
+        renderer.header(f'{ty} Transaction Log')
+        renderer.write_text(f'Log of {ty}')
+        renderer.end_unit()
+    renderer.write_text('The end')
+
+def test_single(tmp_path, compiler) -> None:
+    path = str(tmp_path / 'report')
+    renderer = SplitLaTeXRenderer(path, 'single', compiler, n_workers=2)
+    render(renderer)
+    renderer.close()
+
+    main = open(path + '.pdf').read()
+    assert re.findall(r'\\includepdf\[[^\]]*\]\{([^}]*)\}', main) == ['report-2021.pdf', 'report-2022.pdf']
+    assert r'\usepackage{pdfpages}' in main
+    assert 'addtotoc={1,section,1,{2021 Transaction Log},unit:2021}' in main
+    assert main.index('Main document') < main.index('report-2021.pdf') < main.index('The end')
+    assert 'Log of' not in main
+
+    unit = open(path + '-2022.pdf').read()
+    assert 'Log of 2022' in unit and 'Log of 2021' not in unit and 'Main document' not in unit
+    # Units are complete documents, with the main document's preamble.
+    assert unit.split(r'\begin{document}')[0] == main.split(r'\begin{document}')[0]
+    assert unit.rstrip().endswith(r'\end{document}')
+    assert not [f for f in os.listdir(tmp_path) if f.endswith('.body.tex')]
+
+def test_linked(tmp_path, compiler) -> None:
+    path = str(tmp_path / 'report')
+    renderer = SplitLaTeXRenderer(path, 'linked', compiler)
+    render(renderer)
+    renderer.close()
+
+    main = open(path + '.pdf').read()
+    assert r'\includepdf' not in main
+    assert r'\href{run:report-2021.pdf}{See report{-}2021.pdf}' in main
+    assert r'\section{2022 Transaction Log}' in main
+    assert 'Log of 2022' in open(path + '-2022.pdf').read()
+
+def test_compile_failure(tmp_path) -> None:
+    renderer = SplitLaTeXRenderer(str(tmp_path / 'report'), compiler=[sys.executable, '-c', 'pass'])
+    render(renderer)
+    with pytest.raises(FileNotFoundError):
+        renderer.close()
+
+def test_unit_nesting(tmp_path) -> None:
+    renderer = SplitLaTeXRenderer(str(tmp_path / 'report'))
+    with pytest.raises(ValueError):
+        renderer.end_unit()
+    renderer.begin_unit('2021', '2021')
+    with pytest.raises(ValueError):
+        renderer.begin_unit('2022', '2022')
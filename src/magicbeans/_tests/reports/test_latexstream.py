@@ -0,0 +1,99 @@
+import datetime
+import tracemalloc
+from beancount.core.amount import Amount
+from beancount.core.data import Posting
+from beancount.core.number import D
+from beancount.core.position import Cost, Position
+from magicbeans.reports.data import (AccountInventoryReport, AcquisitionsReportRow, CoverPage,
+                                     DisposalsReport, DisposalsReportRow, DisposalsSummary,
+                                     DisposalsSummaryRow, DisposalsSummaryTotalRow, InventoryReport,
+                                     MiningSummaryRow, TaxReport, TaxReportRow)
+from magicbeans.reports.latex import LaTeXRenderer
+from magicbeans.reports.latexstream import StreamingLaTeXRenderer, escape
+from pylatex.utils import escape_latex
+
+def lot(units: str, cost: str, acquired: datetime.date) -> Posting:
+    return Posting('Assets:Wallet_1', Amount(D(units), 'BTC'),
+                   Cost(D(cost), 'USD', acquired, None), None, None, None)
+
+def inventory_report(n_lots: int) -> InventoryReport:
+    positions = [(Position(Amount(D('0.5'), 'BTC'), Cost(D('100'), 'USD', datetime.date(2020, 1, i % 28 + 1), None)),
+                  i if i % 10 == 0 else None)
+                 for i in range(n_lots)]
+    return InventoryReport(datetime.datetime(2021, 1, 2, 3, 4, 5), [
+        AccountInventoryReport('Assets:Exchange:BTC', Amount(D('0.5') * n_lots, 'BTC'), positions),
+        AccountInventoryReport('Assets:Wallet_1', Amount(D('1'), 'BTC'), positions[:1]),
+    ])
+
+def render(renderer) -> None:
+    """Render one of everything, with text in need of escaping."""
+    renderer.coverpage(CoverPage('Title & co', ['Summary: 100% {ok}', 'line 2'], 'Text_#1'))
+    renderer.header('Tax report')
+    renderer.tax_report(TaxReport(
+        [TaxReportRow('BTC', D('1000.123'), D('-5'), D('200'), D('0'), D('200'))] * 6,
+        TaxReportRow(None, D('6000'), D('-30'), D('1200'), D('0'), D('1200'))))
+    renderer.subreport_header('Sub-report', 'SELECT *')
+    renderer.write_text('Costs ~ $5 ^ [a]\\b\nnext\xa0line')
+    renderer.write_paragraph(r'\textbf{raw}')
+    summary_row = DisposalsSummaryRow('BTC', D('0.25'), datetime.date(2021, 3, 1), 'Various',
+                                      D('500'), D('1.5'), D('400'), D('101.5'), D('101.5'),
+                                      D('101.5'), D('0'), D('0'))
+    renderer.disposals_summary('BTC Mixed', DisposalsSummary('', [summary_row] * 7, DisposalsSummaryTotalRow(
+        D('1.75'), D('3500'), D('10.5'), D('2800'), D('710.5'), D('710.5'), D('0'))))
+    renderer.disposals_summary('Empty', DisposalsSummary('', [], DisposalsSummaryTotalRow(*[D('0')] * 7)))
+    renderer.newpage()
+    report_row = DisposalsReportRow(
+        datetime.date(2021, 3, 1), 'Various', 'Sold 50% & more', D('500'), D('1.5'), D('400'),
+        D('101.5'), D('101.5'), D('101.5'), D('0'), D('0'), 'BTC', D('0.25'),
+        [Posting('Assets:USD', Amount(D('500'), 'USD'), None, None, None, None)],
+        [Posting('Assets:ETH', Amount(D('0.01'), 'ETH'), Cost(D('150'), 'USD', None, None), None, None, None)],
+        [(lot('-0.2', '1600', datetime.date(2020, 1, 1)), 7),
+         (lot('-0.05', '1600', datetime.date(2020, 1, 2)), None)],
+        3)
+    renderer.details_page(
+        inventory_report(100),
+        [AcquisitionsReportRow(datetime.date(2021, 1, 1), 'Bought_it', D('0.5'), 'BTC', D('100'), D('50'), 12),
+         AcquisitionsReportRow(datetime.date(2021, 1, 1), None, D('0.5'), 'BTC', D('100'), D('50'), None)],
+        DisposalsReport('USD', [report_row, report_row._replace(narration=None)], D('203'), D('0'), True))
+    renderer.details_page(InventoryReport(datetime.datetime(2021, 1, 1), []), [],
+                          DisposalsReport('USD', [], D('0'), D('0'), False))
+    renderer.details_page(inventory_report(3), [], DisposalsReport('USD', [], D('0'), D('0'), False))
+    renderer.mining_summary([MiningSummaryRow('BTC', 1, 30, D('0.001'), D('0.00003'), D('0.001'),
+                                              D('30000'), D('30'), D('30'))] * 2)
+
+def test_escape() -> None:
+    text = 'a&b%c$d#e_f{g}h~i^j\\k\nl-m\xa0n[o]p'
+    assert escape(text) == escape_latex(text)
+
+def test_matches_latex_renderer(tmp_path) -> None:
+    path = str(tmp_path / 'report')
+    expected = LaTeXRenderer(path)
+    render(expected)
+
+    streaming = StreamingLaTeXRenderer(path)
+    render(streaming)
+    with open(streaming.write_tex()) as f:
+        assert f.read() == expected.doc.dumps()
+    assert not (tmp_path / 'report.body.tex').exists()
+
+def test_empty_document(tmp_path) -> None:
+    path = str(tmp_path / 'report')
+    with open(StreamingLaTeXRenderer(path).write_tex()) as f:
+        assert f.read() == LaTeXRenderer(path).doc.dumps()
+
+def peak_memory(path: str, n_pages: int) -> int:
+    renderer = StreamingLaTeXRenderer(path)
+    disposals_report = DisposalsReport('USD', [], D('0'), D('0'), False)
+    tracemalloc.start()
+    for _ in range(n_pages):
+        renderer.newpage()
+        renderer.details_page(inventory_report(50), [], disposals_report)
+    (_, peak) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    renderer.write_tex()
+    return peak
+
+def test_memory_bounded_by_page(tmp_path) -> None:
+    # Pages are written out as they're rendered, so memory use doesn't grow
+    # with the number of pages.
+    assert peak_memory(str(tmp_path / 'long'), 200) < 1.5 * peak_memory(str(tmp_path / 'short'), 10)
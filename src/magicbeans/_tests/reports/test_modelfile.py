@@ -0,0 +1,76 @@
+import datetime
+import pickle
+import pytest
+from beancount.core.number import D
+from magicbeans.reports import modelfile
+from magicbeans.reports.latexsplit import SplitLaTeXRenderer
+from magicbeans.reports.latexstream import StreamingLaTeXRenderer
+from magicbeans.reports.modelfile import ModelWriter, read_records, replay
+from magicbeans._tests.reports.test_latexstream import inventory_report, render
+
+VALUES = [None, True, False, 0, -1, 300, -2**70, '', 'BTC', 'BTC', 'x' * 100, 'x' * 100,
+          D('0E-8'), D('-1.50'), D('-0'), D('123456789.123456789012345678'), datetime.date(2021, 3, 1),
+          datetime.datetime(2021, 3, 1, 2, 3, 4, tzinfo=datetime.timezone.utc), [1, (2, 'a')], (),
+          inventory_report(3)]
+
+def test_round_trip(tmp_path) -> None:
+    path = str(tmp_path / 'report.model')
+    writer = ModelWriter(path)
+    writer.write_text(VALUES)
+    writer.close()
+    [(method, (values,))] = list(read_records(path))
+    assert method == 'write_text'
+    assert values == VALUES
+    assert [type(v) for v in values] == [type(v) for v in VALUES]
+    assert [str(v) for v in values[12:15]] == ['0E-8', '-1.50', '-0']
+
+def test_unknown_type(tmp_path) -> None:
+    writer = ModelWriter(str(tmp_path / 'report.model'))
+    with pytest.raises(TypeError):
+        writer.write_text({'a': 1})
+
+def test_render_from_model(tmp_path) -> None:
+    path = str(tmp_path / 'report.model')
+    writer = ModelWriter(path)
+    render(writer)
+    writer.begin_unit('2021', '2021 Transaction Log')
+    writer.end_unit()
+    writer.close()
+
+    direct = StreamingLaTeXRenderer(str(tmp_path / 'direct'))
+    render(direct)
+    # The renderer doesn't have units, so they're skipped.
+    replayed = StreamingLaTeXRenderer(str(tmp_path / 'replayed'))
+    assert replay(path, replayed) == writer.n_records - 2
+    with open(direct.write_tex()) as f, open(replayed.write_tex()) as g:
+        assert f.read() == g.read()
+
+    split = SplitLaTeXRenderer(str(tmp_path / 'split'))
+    assert replay(path, split) == writer.n_records
+    assert len(split.write_tex()) == 2
+
+def test_compact(tmp_path) -> None:
+    path = tmp_path / 'report.model'
+    writer = ModelWriter(str(path))
+    for _ in range(10):
+        writer.details_page(inventory_report(100), [], None)
+    writer.close()
+    pickled = len(pickle.dumps(inventory_report(100), pickle.HIGHEST_PROTOCOL))
+    assert path.stat().st_size < 10 * pickled / 2
+
+def test_bad_files(tmp_path) -> None:
+    path = tmp_path / 'report.model'
+    writer = ModelWriter(str(path))
+    writer.header('Title')
+    writer.close()
+    content = path.read_bytes()
+
+    path.write_bytes(content[:-1])
+    with pytest.raises(ValueError, match='truncated'):
+        list(read_records(str(path)))
+    path.write_bytes(modelfile.MAGIC + bytes([modelfile.VERSION + 1]) + content[5:])
+    with pytest.raises(ValueError, match='version'):
+        list(read_records(str(path)))
+    path.write_bytes(b'junk')
+    with pytest.raises(ValueError):
+        list(read_records(str(path)))
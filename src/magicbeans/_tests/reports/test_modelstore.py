@@ -0,0 +1,85 @@
+import os
+from beancount import loader
+from magicbeans.reports.modelstore import ModelStore
+
+LEDGER = '''
+2020-01-01 open Assets:Cash
+2020-01-01 open Income:Salary
+
+2020-03-01 * "Pay"
+  timestamp: "2020-03-01T12:00:00Z"
+  Assets:Cash      100 USD
+  Income:Salary
+
+2021-03-01 * "Pay"
+  timestamp: "2021-03-01T12:00:00Z"
+  Assets:Cash      100 USD
+  Income:Salary
+'''
+
+LATE = '''
+2021-06-01 * "Pay"
+  timestamp: "2021-06-01T12:00:00Z"
+  Assets:Cash      50 USD
+  Income:Salary
+'''
+
+def load(text: str):
+    (entries, errors, _) = loader.load_string(text)
+    assert not errors
+    return entries
+
+def run(directory: str, entries, identity=('USD',)):
+    """Get models for the 2020 and 2021 years, returning the store and the
+    keys of the models computed."""
+    store = ModelStore(directory, entries, identity)
+    computed = []
+    for (year, boundary) in [(2020, 3), (2021, len(entries))]:
+        store.get(('year', year), boundary, lambda: computed.append(year) or f'model {year}')
+    store.save()
+    return (store, computed)
+
+def test_reuse(tmp_path) -> None:
+    entries = load(LEDGER)
+    (store, computed) = run(str(tmp_path), entries)
+    assert computed == [2020, 2021]
+    assert store.earliest_change() == '2020-01-01'
+
+    (store, computed) = run(str(tmp_path), load(LEDGER))
+    assert computed == []
+    assert store.earliest_change() is None
+    assert (store.n_reused, store.n_computed) == (2, 0)
+    assert store.get(('year', 2020), 3, lambda: None) == 'model 2020'
+
+def test_recompute_from_change(tmp_path) -> None:
+    run(str(tmp_path), load(LEDGER))
+    # Source positions don't matter
+    (_, computed) = run(str(tmp_path), load('\n\n' + LEDGER))
+    assert computed == []
+
+    # A new entry at the end invalidates the models depending on the end of
+    # the ledger only.
+    (store, computed) = run(str(tmp_path), load(LEDGER + LATE))
+    assert store.earliest_change() == '2021-06-01T12:00:00Z'
+    assert computed == [2021]
+
+    # As does a change to a late entry.
+    (store, computed) = run(str(tmp_path), load(LEDGER + LATE.replace('50 USD', '60 USD')))
+    assert store.first_change == 4
+    assert computed == [2021]
+
+def test_identity(tmp_path) -> None:
+    run(str(tmp_path), load(LEDGER))
+    (_, computed) = run(str(tmp_path), load(LEDGER), ('EUR',))
+    assert computed == [2020, 2021]
+
+def test_save_prunes(tmp_path) -> None:
+    entries = load(LEDGER)
+    store = ModelStore(str(tmp_path), entries)
+    store.get(('a',), 0, lambda: 1)
+    store.get(('b',), 0, lambda: 2)
+    store.save()
+    store = ModelStore(str(tmp_path), entries)
+    store.get(('a',), 0, lambda: 1)
+    store.save()
+    assert len(os.listdir(tmp_path)) == 2
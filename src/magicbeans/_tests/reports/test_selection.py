@@ -0,0 +1,61 @@
+import datetime
+from beancount.core.amount import Amount
+from beancount.core.data import Posting, Transaction
+from beancount.core.number import D
+from magicbeans import disposals
+from magicbeans.reports.selection import ReportSelection, parse_pages, tx_assets
+import pytest
+
+def posting(account: str, number: str, currency: str) -> Posting:
+    return Posting(account, Amount(D(number), currency), None, None, None, None)
+
+def tx(*postings: Posting) -> Transaction:
+    return Transaction({}, datetime.date(2020, 1, 1), None, None, "tx", None, None, list(postings))
+
+# A trade of BTC for ETH, a BTC disposal
+TRADE = tx(posting('Assets:Account:ETH', '10.0', 'ETH'),
+           posting('Assets:Account:BTC', '-1.0', 'BTC'),
+           posting(disposals.STCG_ACCOUNT, '0.0', 'USD'))
+BUY = tx(posting('Assets:Account:ETH', '1.0', 'ETH'),
+         posting('Assets:Account:USD', '-1000.0', 'USD'))
+
+def test_parse_pages() -> None:
+    assert parse_pages('3') == (3, 3)
+    assert parse_pages('3-5') == (3, 5)
+    assert parse_pages('3-') == (3, None)
+    for text in ['', 'x', '0', '5-3', '-3']:
+        with pytest.raises(ValueError):
+            parse_pages(text)
+
+def test_tx_assets() -> None:
+    assert tx_assets(TRADE, 'USD') == {'BTC'}
+    assert tx_assets(BUY, 'USD') == {'ETH'}
+
+def test_selects() -> None:
+    assert ReportSelection().selects(TRADE, 'USD')
+    btc = ReportSelection.new(assets=['BTC'])
+    assert btc.selects(TRADE, 'USD') and not btc.selects(BUY, 'USD')
+    eth = ReportSelection.new(assets=['ETH'])
+    assert not eth.selects(TRADE, 'USD') and eth.selects(BUY, 'USD')
+
+def test_pages() -> None:
+    assert all(ReportSelection().has_page(n) for n in range(10))
+    selection = ReportSelection.new(pages=(2, 3))
+    assert [n for n in range(5) if selection.has_page(n)] == [1, 2]
+    selection = ReportSelection.new(pages=(2, None))
+    assert [n for n in range(5) if selection.has_page(n)] == [1, 2, 3, 4]
+
+def test_new() -> None:
+    assert ReportSelection.new() == ReportSelection()
+    assert ReportSelection().describe() == []
+    assert ReportSelection().identity() == ()
+
+    selection = ReportSelection.new(['log', 'tax'], ['ETH', 'BTC'], (2, 2))
+    assert selection.has_section('tax') and not selection.has_section('mining')
+    assert selection.identity() == (('BTC', 'ETH'),)
+    assert selection.describe() == ["Including sections tax, log",
+                                    "Including only assets BTC, ETH",
+                                    "Including page 2 of each year's detailed log"]
+
+    with pytest.raises(ValueError):
+        ReportSelection.new(['taxes'])
@@ -0,0 +1,23 @@
+from magicbeans.reports.text import TextRenderer
+from magicbeans._tests.reports.test_latexstream import render
+
+def test_render(tmp_path) -> None:
+    path = tmp_path / 'report.txt'
+    renderer = TextRenderer(str(path))
+    render(renderer)
+    renderer.write_paragraph('Rates of 37\\% and\n\n  20\\%.')
+    renderer.close()
+
+    text = path.read_text()
+    assert 'Summary: 100% {ok}' in text
+    assert 'Rates of 37% and\n\n20%.\n' in text
+    # Tax report, with its total row
+    assert text.count('1000.12') == 6 and '6000.00' in text
+    # Disposals summaries, detailed log pages and mining summary
+    assert text.count('Total: 1.75000000') == 1
+    assert 'Inventory 2021-01-02 03:04:05 UTC' in text
+    assert 'No inventory to report' in text
+    assert '#12  Bought_it' in text
+    assert 'Sold 50% & more' in text
+    assert 'and 3 more (smaller) lot(s)' in text
+    assert 'Jan' in text and '30.00 USD' in text
@@ -0,0 +1,60 @@
+import textwrap
+from decimal import Decimal as D
+
+from beancount import loader
+from beancount.core.data import Open, Transaction
+from magicbeans.disposals import BookedDisposal, get_capgains_postings
+
+LEDGER = """
+    option "operating_currency" "USD"
+    option "booking_method" "FIFO"
+
+    plugin "magicbeans.capgains"
+
+    2019-01-01 open Assets:Coinbase:BTC
+    2019-01-01 open Assets:Coinbase:USD
+    2019-01-01 open Income:CapGains
+
+    2019-01-02 * "Buy 1 BTC"
+      Assets:Coinbase:BTC   1 BTC {9000 USD}
+      Assets:Coinbase:USD  -9000 USD
+
+    2020-01-02 * "Buy 1 BTC"
+      Assets:Coinbase:BTC   1 BTC {9500 USD}
+      Assets:Coinbase:USD  -9500 USD
+
+    2020-01-03 * "Sell 1.5 BTC"
+      Assets:Coinbase:BTC  -1.5 BTC {} @ 10000 USD
+      Assets:Coinbase:USD   15000 USD
+      Income:CapGains
+"""
+
+def load(ledger=LEDGER):
+    (entries, errors, _) = loader.load_string(textwrap.dedent(ledger))
+    assert not errors
+    return entries
+
+def test_classifies_gains() -> None:
+    entries = load()
+    opened = [e.account for e in entries if isinstance(e, Open)]
+    assert "Income:CapGains:Short" in opened and "Income:CapGains:Long" in opened
+
+    sale = [e for e in entries if isinstance(e, Transaction)][2]
+    (short_term, long_term) = get_capgains_postings(sale)
+    assert short_term.units.number == D("-250")
+    assert long_term.units.number == D("-1000")
+    assert (sale.meta["stcg"], sale.meta["ltcg"]) == (D("250"), D("1000"))
+
+    legs = [p for p in sale.postings if p.account == "Assets:Coinbase:BTC"]
+    assert [(p.meta["holding_period"], p.meta["term"]) for p in legs] == [(366, "long"), (1, "short")]
+
+    bd = BookedDisposal(sale, "USD")
+    assert (bd.stcg(), bd.ltcg()) == (D("250"), D("1000"))
+
+def test_long_short_config_syntax() -> None:
+    ledger = LEDGER.replace('plugin "magicbeans.capgains"', """plugin "magicbeans.capgains" "{
+    'Income.*:CapGains': [':CapGains', ':CapGains:Short', ':CapGains:Long']
+    }"
+""")
+    sale = [e for e in load(ledger) if isinstance(e, Transaction)][2]
+    assert (sale.meta["stcg"], sale.meta["ltcg"]) == (D("250"), D("1000"))
@@ -0,0 +1,117 @@
+import datetime
+import textwrap
+
+from beancount import loader
+from beancount.core.data import Transaction
+from magicbeans import checkpoints
+from magicbeans.disposals import BookedDisposal, is_disposal_tx
+from magicbeans.lifetimes import LotLifetimes
+
+LEDGER = """
+    option "operating_currency" "USD"
+    option "booking_method" "FIFO"
+    plugin "magicbeans.capgains" "{
+      'Income.*:CapGains': [':CapGains', ':CapGains:Short', ':CapGains:Long']
+      }"
+
+    2020-01-01 open Assets:Coinbase:USD
+    2020-01-01 open Assets:Coinbase:BTC
+    2020-01-01 open Assets:Ledger:BTC
+    2020-01-01 open Assets:Xfer:BTC
+    2020-01-01 open Income:CapGains
+    2020-01-01 open Equity:Opening-Balances
+
+    2020-01-01 commodity BTC
+
+    2020-01-02 * "Deposit"
+      Assets:Coinbase:USD   100000 USD
+      Equity:Opening-Balances
+
+    2020-01-02 * "Buy 1 BTC"
+      Assets:Coinbase:BTC   1 BTC {8000.123456789012345 USD}
+      Assets:Coinbase:USD   -8000.123456789012345 USD
+
+    2020-06-01 * "Buy 2 BTC"
+      Assets:Coinbase:BTC   2 BTC {9000 USD}
+      Assets:Coinbase:USD   -18000 USD
+
+    2020-09-01 * "Transfer 0.5 BTC, through a buffer account"
+      Assets:Coinbase:BTC   -0.5 BTC {9000 USD, 2020-06-01}
+      Assets:Xfer:BTC        0.5 BTC {9000 USD, 2020-06-01}
+      Assets:Xfer:BTC       -0.5 BTC {9000 USD, 2020-06-01}
+      Assets:Ledger:BTC      0.5 BTC {9000 USD, 2020-06-01}
+
+    2020-12-31 price BTC 29000 USD
+
+    2021-03-01 * "Sell 1.5 BTC"
+      Assets:Coinbase:BTC   -1.5 BTC {} @ 50000 USD
+      Assets:Coinbase:USD   75000 USD
+      Income:CapGains
+
+    2022-03-01 * "Sell 1 BTC"
+      Assets:Coinbase:BTC   -1 BTC {} @ 40000 USD
+      Assets:Coinbase:USD   40000 USD
+      Income:CapGains
+"""
+
+def write_ledger(tmp_path):
+    path = tmp_path / "ledger.beancount"
+    path.write_text(textwrap.dedent(LEDGER))
+    return str(path)
+
+def disposals(entries, year):
+    return [BookedDisposal(e, "USD") for e in entries if e.date.year == year and is_disposal_tx(e)]
+
+def test_checkpoint_preserves_lots(tmp_path) -> None:
+    ledger_path = write_ledger(tmp_path)
+    checkpoint_dir = str(tmp_path / "checkpoints")
+    assert checkpoints.write_checkpoints(ledger_path, checkpoint_dir, "USD") == [2020, 2021, 2022]
+
+    (full, errors, _) = loader.load_file(ledger_path)
+    assert not errors
+    full_lifetimes = LotLifetimes(full, "USD")
+    for year in [2021, 2022]:
+        sharded_path = str(tmp_path / f"sharded-{year}.beancount")
+        checkpoints.join_years(checkpoint_dir, [year], sharded_path)
+        (sharded, errors, options) = loader.load_file(sharded_path)
+        assert not errors
+        assert options["booking_method"].name == "FIFO"
+        assert all(e.date.year >= year - 1 for e in sharded if isinstance(e, Transaction))
+
+        # The same disposals, with the same lots and gains
+        strip = lambda bd: ([p._replace(meta=None) for p in bd.disposal_legs], bd.stcg(), bd.ltcg())
+        assert [strip(bd) for bd in disposals(sharded, year)] == [
+            strip(bd) for bd in disposals(full, year)]
+
+        # The same inventories at the end of the year
+        end = datetime.date(year + 1, 1, 1)
+        sharded_lifetimes = LotLifetimes(sharded, "USD")
+        assert (sharded_lifetimes.inventories_at(sharded_lifetimes.point_at_date(end))
+                == full_lifetimes.inventories_at(full_lifetimes.point_at_date(end)))
+
+def test_checkpoint_contents(tmp_path) -> None:
+    ledger_path = write_ledger(tmp_path)
+    checkpoint_dir = str(tmp_path / "checkpoints")
+    checkpoints.write_checkpoints(ledger_path, checkpoint_dir, "USD")
+    text = open(checkpoints.checkpoint_path(checkpoint_dir, 2020)).read()
+    assert "'Income.*:CapGains'" in text
+    assert "2020-12-31 price BTC" in text
+    assert "1 BTC {8000.123456789012345 USD, 2020-01-02}" in text
+
+    # The checkpoint before the first year has no balances.
+    (entries, errors, _) = loader.load_file(checkpoints.checkpoint_path(checkpoint_dir, 2019))
+    assert not errors
+    assert not [e for e in entries if e.date.year == 2019 and hasattr(e, "postings")]
+
+def test_is_current(tmp_path) -> None:
+    ledger_path = write_ledger(tmp_path)
+    checkpoint_dir = str(tmp_path / "checkpoints")
+    assert not checkpoints.is_current(checkpoint_dir, ledger_path)
+    checkpoints.write_checkpoints(ledger_path, checkpoint_dir, "USD")
+    assert checkpoints.is_current(checkpoint_dir, ledger_path)
+
+    with open(ledger_path, "a") as f:
+        f.write("\n2022-06-01 price BTC 20000 USD\n")
+    assert not checkpoints.is_current(checkpoint_dir, ledger_path)
+    checkpoints.write_checkpoints(ledger_path, checkpoint_dir, "USD")
+    assert checkpoints.is_current(checkpoint_dir, ledger_path)
@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+from beancount.parser import printer
+from magicbeans import chunking
+from magicbeans._tests import mocks
+from magicbeans.importers.coinbase import CoinbaseImporter, coinbase_header_prefixes
+
+FILES_DIR = os.path.join(os.path.dirname(__file__), "importer_files")
+CB_FILE = os.path.join(FILES_DIR, "coinbase",
+                       "Coinbase-d34db33f-TransactionsHistoryReport-2020-01-01-00-00-00.csv")
+CHIA_FILE = os.path.join(FILES_DIR, "chiawallet", "chiawallet.2022.12.12.csv")
+
+def formatted(entries):
+    return [(e.meta["lineno"], printer.format_entry(e)) for e in entries]
+
+def test_plan_chunks_line_aligned() -> None:
+    plan = chunking.plan_chunks(CB_FILE, coinbase_header_prefixes,
+                                n_workers=4, min_chunk_bytes=100)
+    assert plan.fieldnames[:2] == ["Timestamp", "Transaction Type"]
+    assert len(plan.ranges) == 4
+
+    with open(CB_FILE, "rb") as f:
+        contents = f.read()
+    (first_start, _) = plan.ranges[0]
+    assert contents[:first_start].endswith(b"Notes\n")
+    for ((_, end), (next_start, _)) in zip(plan.ranges, plan.ranges[1:]):
+        assert end == next_start
+        assert contents[end - 1:end] == b"\n"
+    assert plan.ranges[-1][1] == len(contents)
+
+def test_plan_chunks_small_file() -> None:
+    assert chunking.plan_chunks(CB_FILE, coinbase_header_prefixes, n_workers=4) is None
+    assert chunking.plan_chunks(CB_FILE, coinbase_header_prefixes,
+                                n_workers=1, min_chunk_bytes=100) is None
+
+@pytest.mark.parametrize("min_chunk_bytes", [40, 150, 300])
+def test_coinbase_chunked_matches_serial(monkeypatch, min_chunk_bytes) -> None:
+    serial = CoinbaseImporter.test_instance().extract(CB_FILE, [])
+
+    monkeypatch.setattr(chunking, "MIN_CHUNK_BYTES", min_chunk_bytes)
+    importer = CoinbaseImporter.test_instance()
+    importer.parse_workers = 4
+    assert chunking.plan_chunks(CB_FILE, coinbase_header_prefixes, 4) is not None
+    assert formatted(importer.extract(CB_FILE, [])) == formatted(serial)
+
+@pytest.mark.parametrize("min_chunk_bytes", [40, 70, 150, 300])
+def test_chiawallet_chunked_matches_serial(monkeypatch, min_chunk_bytes) -> None:
+    serial = mocks.chia_wallet_importer_for_testing().extract(CHIA_FILE, [])
+
+    # Small chunks split groups of rows across chunk boundaries.
+    monkeypatch.setattr(chunking, "MIN_CHUNK_BYTES", min_chunk_bytes)
+    importer = mocks.chia_wallet_importer_for_testing()
+    importer.parse_workers = 8
+    assert formatted(importer.extract(CHIA_FILE, [])) == formatted(serial)
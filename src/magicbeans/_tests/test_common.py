@@ -1,3 +1,4 @@
+import datetime
 from typing import List, Sequence
 
 from beancount.core import amount, data
@@ -141,3 +142,68 @@ def test_split_out_marked_fees_dosplit() -> None:
             '  Income:PnL\n'
             '    is_fee: TRUE\n')
 
+
+def test_split_out_marked_fees_does_not_mutate() -> None:
+    original_tx = get_tx_wtimestamp_wfees()
+    original_text = printer.format_entry(original_tx)
+    original_meta = dict(original_tx.meta)
+    original_postings = list(original_tx.postings)
+
+    timestamp = dateutil.parser.isoparse(original_tx.meta["timestamp"])
+    (nonfee_tx, fee_tx) = common.split_out_marked_fees(original_tx, "Income:PnL", timestamp)
+    assert fee_tx.meta["timestamp"] == "2020-01-05T16:12:51.377Z"
+
+    # Mutating the results' metadata doesn't leak back into the original.
+    common.attach_timestamp(nonfee_tx, timestamp + datetime.timedelta(seconds=1))
+    nonfee_tx.meta["remark"] = "changed"
+    fee_tx.meta["remark"] = "changed"
+
+    assert printer.format_entry(original_tx) == original_text
+    assert original_tx.meta == original_meta
+    assert original_tx.postings == original_postings
+    assert "remark" not in original_tx.meta
+    assert nonfee_tx.meta is not fee_tx.meta
+
+def test_hook_dispatcher() -> None:
+    extractions: Sequence[ExtractionRecord] = [
+        ExtractionRecord("file1", [mk_tx("alice"), mk_tx("bob")], "acct1", "imp1"),
+        ExtractionRecord("file2", [mk_tx("charlie"), mk_tx("bob"), mk_tx("diane")], "acct2", "imp2"),
+    ]
+    entry_lists = [record.entries for record in extractions]
+
+    def key_remark(tx: Transaction) -> str:
+        return tx.meta["remark"]
+
+    def set_narration(tx: Transaction, narration: str) -> Transaction:
+        return tx._replace(narration=narration)
+
+    dispatcher = common.HookDispatcher([
+        common.KeyedHook(key_remark, {"bob": None, "earl": None}, common.drop_entry),
+        common.KeyedHook(key_remark, {"diane": "Renamed"}, set_narration),
+        common.KeyedHook(common.key_timestamp, {"2020-01-01T00:00:00Z": None}, common.drop_entry),
+    ])
+    result = dispatcher(extractions, [])
+
+    assert [[tx.meta["remark"] for tx in record.entries] for record in result] == [
+        ["alice"], ["charlie", "diane"]]
+    assert result[1].entries[1].narration == "Renamed"
+    assert result[1].entries[0].narration == "CBP: Buy 1.10 BTC"
+
+    # Entry lists are edited in place.
+    assert [record.entries for record in result] == entry_lists
+    assert all(a is b for (a, b) in zip([r.entries for r in result], entry_lists))
+
+def test_hook_dispatcher_keys_computed_once() -> None:
+    def key_narration(tx: Transaction) -> str:
+        return tx.narration
+
+    def set_narration(tx: Transaction, narration: str) -> Transaction:
+        return tx._replace(narration=narration)
+
+    # Keys are computed once per key function, so the second hook doesn't
+    # match on the narration set by the first.
+    dispatcher = common.HookDispatcher([
+        common.KeyedHook(key_narration, {"CBP: Buy 1.10 BTC": "Step 1"}, set_narration),
+        common.KeyedHook(key_narration, {"Step 1": None}, common.drop_entry),
+    ])
+    assert dispatcher.apply(mk_tx("alice")).narration == "Step 1"
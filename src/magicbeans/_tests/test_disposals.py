@@ -2,8 +2,8 @@ import datetime
 from beancount.core.amount import Amount
 from beancount.core.data import Posting, Transaction
 from beancount.core.number import D
-from beancount.core.position import Cost, Position
-from magicbeans.disposals import InventoryBlock, LotIndex
+from beancount.core.position import Cost
+from magicbeans.disposals import BDGroupKey, BookedDisposal, BookedDisposalGroup, LotRegistry
 import pytest
 
 DAY1 = datetime.date(2015, 1, 1)
@@ -16,14 +16,16 @@ def usd_cost(amount: str, year: int):
 def nyd(year: int):
     return datetime.date(year, 1, 1)
 
-def test_lotindex_from_inventories():
-    inventory_blocks = [
-        InventoryBlock('BTC', 'Assets:MtGox', [
-            Position(Amount(D('1.8'), 'BTC'), usd_cost('1000.0', 2015)),
-            Position(Amount(D('1.2'), 'BTC'), usd_cost('2000.0', 2016)), ]),
-        InventoryBlock('BTC', 'Assets:Coinbase', [
-            Position(Amount(D('0.5'), 'BTC'), usd_cost('8000.0', 2020)), ]),
-    ]
+def test_lotregistry_view_from_inventories():
+    # The lots held in inventory, as acquired
+    acquisitions = [
+        Transaction({}, nyd(year), None, None, None, None, None, [
+            Posting(account, Amount(D(btc), 'BTC'), usd_cost(cost, year), None, None, None),
+            Posting('Assets:Bank', Amount(-D(btc) * D(cost), 'USD'), None, None, None, None),
+        ])
+        for (account, btc, cost, year) in [('Assets:MtGox', '1.8', '1000.0', 2015),
+                                           ('Assets:MtGox', '1.2', '2000.0', 2016),
+                                           ('Assets:Coinbase', '0.5', '8000.0', 2020)]]
 
     disposals = [
         Transaction({}, nyd(2022), None, None, None, None, None, [
@@ -42,14 +44,15 @@ def test_lotindex_from_inventories():
         ]),
     ]
 
-    lotindex = LotIndex(inventory_blocks, [], disposals, "USD")
+    view = LotRegistry(acquisitions + disposals, "USD").page_view(disposals)
 
-    # These should have been assigned IDs (always in sequential order starting
-    # from 1)
-    assert lotindex.get_lotid('BTC', usd_cost('2000.0', 2016)) == 1
-    assert lotindex.get_lotid('BTC', usd_cost('8000.0', 2020)) == 2
+    # The referenced lots show their IDs (in order of acquisition, starting
+    # from 1), and the others none.
+    assert view.get_lotid('BTC', usd_cost('1000.0', 2015)) is None
+    assert view.get_lotid('BTC', usd_cost('2000.0', 2016)) == 2
+    assert view.get_lotid('BTC', usd_cost('8000.0', 2020)) == 3
 
-def test_lotindex_from_acquisitions():
+def test_lotregistry_view_from_acquisitions():
     acquisitions = [
         Transaction({}, nyd(2015), None, None, None, None, None, [
             Posting('Assets:MtGox',
@@ -78,11 +81,82 @@ def test_lotindex_from_acquisitions():
         ]),
     ]
 
-    lotindex = LotIndex([], acquisitions, disposals, "USD")
+    view = LotRegistry(acquisitions + disposals, "USD").page_view(disposals)
+
+    # Only the referenced lot shows its ID.
+    assert view.get_lotid('BTC', usd_cost('1000.0', 2015)) is None
+    assert view.get_lotid('BTC', usd_cost('2000.0', 2016)) == 2
+
+def test_lotregistry() -> None:
+    entries = [
+        Transaction({}, nyd(2015), None, None, None, None, None, [
+            Posting('Assets:MtGox', Amount(D('1.8'), 'BTC'), usd_cost('1000.0', 2015),
+                    None, None, None),
+            Posting('Assets:Bank', Amount(D('-1800'), 'USD'), None, None, None, None),
+        ]),
+        Transaction({}, nyd(2016), None, None, None, None, None, [
+            Posting('Assets:MtGox', Amount(D('0.2'), 'BTC'), usd_cost('2000.0', 2016),
+                    None, None, None),
+            Posting('Assets:Bank', Amount(D('-400'), 'USD'), None, None, None, None),
+        ]),
+        # A transfer keeps the lot's cost, and thus its ID.
+        Transaction({}, nyd(2017), None, None, None, None, None, [
+            Posting('Assets:MtGox', Amount(D('-0.2'), 'BTC'), usd_cost('2000.0', 2016),
+                    None, None, None),
+            Posting('Assets:Coinbase', Amount(D('0.2'), 'BTC'), usd_cost('2000.00', 2016),
+                    None, None, None),
+        ]),
+    ]
+    disposals = [
+        Transaction({}, nyd(2022), None, None, None, None, None, [
+            Posting('Assets:Coinbase', Amount(D('-0.1'), 'BTC'),
+                    usd_cost('2000.000000001', 2016), None, None, None),
+            Posting('Assets:Bank', Amount(D('6000'), 'USD'), None, None, None, None),
+        ]),
+    ]
+
+    registry = LotRegistry(entries + disposals, "USD")
+    assert len(registry) == 2
+    assert registry.get_lotid('BTC', usd_cost('1000.0', 2015)) == 1
+    assert registry.get_lotid('BTC', usd_cost('2000.0', 2016)) == 2
+    assert registry.get_lotid('BTC', usd_cost('2000.000000001', 2016)) == 2
+    assert registry.get_lotid('BTC', usd_cost('3000.0', 2016)) is None
+    assert registry.get_lot(2) == ('BTC', usd_cost('2000.0', 2016))
+
+    # Views only show the lots referenced by the page's disposals, but with
+    # their report-wide IDs.
+    view = registry.page_view(disposals)
+    assert view.get_lotid('BTC', usd_cost('1000.0', 2015)) is None
+    assert view.get_lotid('BTC', usd_cost('2000.0', 2016)) == 2
+    assert registry.page_view([]).get_lotid('BTC', usd_cost('2000.0', 2016)) is None
 
-    # This should have been assigned an ID (always in sequential order starting
-    # from 1)
-    assert lotindex.get_lotid('BTC', usd_cost('2000.0', 2016)) == 1
- 
+def sale(timestamp: str, btc: str, cost: str, usd: str, stcg: str) -> Transaction:
+    return Transaction({'timestamp': timestamp, 'stcg': D(stcg), 'ltcg': D('0')},
+                       nyd(2022), None, None, None, None, None, [
+        Posting('Assets:Coinbase', Amount(D(btc), 'BTC'),
+                Cost(D(cost), 'USD', nyd(2021), None), None, None, None),
+        Posting('Assets:Coinbase', Amount(D(usd), 'USD'), None, None, None, None),
+        Posting('Income:CapGains:Short', Amount(-D(stcg), 'USD'), None, None, None, None),
+    ])
 
+def test_booked_disposal_and_group() -> None:
+    bd1 = BookedDisposal(sale('2022-01-01T10:00:00Z', '-0.5', '8000', '5000', '1000'), 'USD')
+    assert bd1.disposed_asset() == 'BTC'
+    assert bd1.disposed_amount() == D('0.5')
+    assert bd1.acquisition_date() == nyd(2021)
+    assert bd1.timestamp() == datetime.datetime(2022, 1, 1, 10, tzinfo=datetime.timezone.utc)
+    assert bd1.total_numeriare_proceeds() == Amount(D('5000'), 'USD')
+    assert bd1.total_disposed_cost() == Amount(D('4000.0'), 'USD')
+    assert bd1.total_other_proceeds_value() == Amount(D('0'), 'USD')
+    assert (bd1.stcg(), bd1.ltcg()) == (D('1000'), D('0'))
+    with pytest.raises(AttributeError):
+        bd1.extra = 1
 
+    bd2 = BookedDisposal(sale('2022-01-01T11:00:00Z', '-0.25', '8000', '2600', '600'), 'USD')
+    assert BDGroupKey.new(bd1) == BDGroupKey.new(bd2)
+    group = BookedDisposalGroup(bd1)
+    group.add(bd2)
+    assert group.disposed_amount() == D('0.75')
+    assert group.total_numeriare_proceeds() == Amount(D('7600'), 'USD')
+    assert group.total_disposed_cost() == Amount(D('6000'), 'USD')
+    assert group.stcg() == D('1600')
@@ -0,0 +1,111 @@
+import datetime
+import os
+
+import dateutil.parser
+import pytz
+
+from magicbeans import incremental
+from magicbeans._tests import mocks
+from magicbeans.incremental import Watermark, WatermarkFilter, WatermarkStore
+
+CBP_FILE = os.path.join(os.path.dirname(__file__), "importer_files/coinbasepro/account.csv")
+GATEIO_FILE = os.path.join(os.path.dirname(__file__), "importer_files/gateio/joined.csv")
+
+def ts(day: int, second: int = 0):
+    return datetime.datetime(2020, 1, day, 0, 0, second, tzinfo=pytz.utc)
+
+def test_filter_no_watermark() -> None:
+    wm_filter = WatermarkFilter(None)
+    assert wm_filter.result() is None
+    assert wm_filter.is_new(ts(2), "b")
+    assert wm_filter.is_new(ts(1), "a")
+    assert wm_filter.is_new(ts(2), "c")
+    assert wm_filter.result() == Watermark(ts(2), frozenset(["b", "c"]))
+
+def test_filter_skips_up_to_watermark() -> None:
+    wm_filter = WatermarkFilter(Watermark(ts(2), frozenset(["b"])))
+    assert not wm_filter.is_new(ts(1), "a")
+    assert not wm_filter.is_new(ts(2), "b")
+    assert not wm_filter.is_new(ts(2))      # No ID, can't tell it apart
+    assert wm_filter.is_new(ts(2), "c")     # Same timestamp, new ID
+    assert wm_filter.n_skipped == 3
+    assert wm_filter.result() == Watermark(ts(2), frozenset(["b", "c"]))
+
+    assert wm_filter.is_new(ts(3), "d")
+    assert wm_filter.result() == Watermark(ts(3), frozenset(["d"]))
+
+def test_filter_merge() -> None:
+    start = Watermark(ts(1), frozenset())
+    wm_filter_a = WatermarkFilter(start)
+    wm_filter_b = WatermarkFilter(start)
+    wm_filter_a.is_new(ts(2), "a")
+    wm_filter_b.is_new(ts(2), "b")
+    wm_filter_b.is_new(ts(1))
+    wm_filter_a.merge(wm_filter_b)
+    assert wm_filter_a.n_skipped == 1
+    assert wm_filter_a.result() == Watermark(ts(2), frozenset(["a", "b"]))
+
+def test_watermark_json_roundtrip() -> None:
+    wm = Watermark(ts(2, 30), frozenset(["x", "y"]))
+    assert Watermark.from_json(wm.to_json()) == wm
+
+def test_importer_skips_imported_records() -> None:
+    importer = mocks.coinbasepro_importer_for_testing()
+    all_entries, wm = importer.extract_incremental(CBP_FILE, [], None)
+    assert len(all_entries) == len(importer.extract(CBP_FILE, []))
+    assert wm.timestamp == max(dateutil.parser.isoparse(e.meta["timestamp"]) for e in all_entries)
+
+    (new_entries, same_wm) = importer.extract_incremental(CBP_FILE, [], wm)
+    assert new_entries == []
+    assert same_wm == wm
+
+    # Pretend the first three entries were imported on an earlier run.
+    third = all_entries[2]
+    partial_wm = Watermark(dateutil.parser.isoparse(third.meta["timestamp"]),
+                           frozenset([third.meta["orderid"]]))
+    (new_entries, _) = importer.extract_incremental(CBP_FILE, [], partial_wm)
+    assert [e.narration for e in new_entries] == [e.narration for e in all_entries[3:]]
+
+def test_store_appends_only_new_entries(tmp_path) -> None:
+    importer = mocks.coinbasepro_importer_for_testing()
+    store = WatermarkStore(str(tmp_path))
+    source = incremental.source_key(importer, CBP_FILE)
+
+    first_run = incremental.extract_new_entries(importer, CBP_FILE, store)
+    assert len(first_run) == 7
+
+    # A fresh store picks up the persisted watermark.
+    store = WatermarkStore(str(tmp_path))
+    assert store.get(source) is not None
+    assert incremental.extract_new_entries(importer, CBP_FILE, store) == []
+
+    cached = store.load_entries(source)
+    assert [e.narration for e in cached] == [e.narration for e in first_run]
+
+def test_store_replaces_orders_split_across_exports(tmp_path) -> None:
+    importer = mocks.gateio_importer_for_testing()
+    full_run = importer.extract(GATEIO_FILE, [])
+    store = WatermarkStore(str(tmp_path / "cache"))
+    source = incremental.source_key(importer, GATEIO_FILE)
+
+    # An earlier export ending partway through order 462845726's rows
+    with open(GATEIO_FILE) as f:
+        lines = f.readlines()
+    os.makedirs(tmp_path / "partial")
+    partial_file = str(tmp_path / "partial" / "joined.csv")
+    with open(partial_file, "w") as f:
+        f.writelines(lines[:6])
+    first_run = incremental.extract_new_entries(importer, partial_file, store)
+    assert [e.meta["orderid"] for e in first_run] == ["2467345", "2645835", "462845726"]
+
+    # The order is extracted again, with all its rows, and replaces the
+    # cached entry.
+    second_run = incremental.extract_new_entries(importer, GATEIO_FILE, store)
+    assert second_run[0].meta["orderid"] == "462845726"
+    cached = store.load_entries(source)
+    assert sorted(e.narration for e in cached) == sorted(e.narration for e in full_run)
+
+    # Only the latest order is extracted again, from the same export.
+    third_run = incremental.extract_new_entries(importer, GATEIO_FILE, store)
+    assert [e.meta["orderid"] for e in third_run] == ["26435237"]
+    assert len(store.load_entries(source)) == len(full_run)
@@ -0,0 +1,98 @@
+import collections
+import datetime
+import textwrap
+
+from beancount import loader
+from beancount.core import inventory
+from beancount.core.data import Transaction
+from beancount.core.number import D
+from magicbeans._tests.test_lineage import load
+from magicbeans.lifetimes import LotLifetimes
+
+def replay(entries, point):
+    """The balances of entries[:point], as balance_by_account() computes them."""
+    balances = collections.defaultdict(inventory.Inventory)
+    for entry in entries[:point]:
+        if isinstance(entry, Transaction):
+            for posting in entry.postings:
+                balances[posting.account].add_position(posting)
+    return {account: inv for (account, inv) in balances.items() if not inv.is_empty()}
+
+def with_timestamps(entries):
+    # Timestamp each transaction at noon UTC of its date.
+    return [e._replace(meta={**e.meta, "timestamp": f"{e.date}T12:00:00Z"})
+            if isinstance(e, Transaction) else e for e in entries]
+
+def test_inventories_match_replay() -> None:
+    entries = load()
+    lifetimes = LotLifetimes(entries, "USD")
+    for point in range(len(entries) + 1):
+        expected = replay(entries, point)
+        actual = lifetimes.inventories_at(point, include_numeraire=True)
+        assert actual == expected, point
+        # Same positions, in the same order.
+        for (account, inv) in expected.items():
+            assert list(actual[account].keys()) == list(inv.keys())
+
+def test_numeraire_accounts_left_out() -> None:
+    entries = load()
+    inventories = LotLifetimes(entries, "USD").inventories_at(len(entries))
+    assert "Assets:Coinbase:USD" not in inventories
+    assert "Assets:Xfer:Coinbase-Ledger:BTC" not in inventories    # Emptied
+    assert inventories["Assets:Coinbase:BTC"].get_currency_units("BTC").number == D("1.5")
+
+def test_lots_held_at_timestamp() -> None:
+    entries = with_timestamps(load())
+    lifetimes = LotLifetimes(entries, "USD")
+    utc = datetime.timezone.utc
+
+    # Before the transfer is received, the lots are in the buffer account.
+    ts = datetime.datetime(2020, 2, 2, 12, tzinfo=utc)
+    assert [p.units.number for p in lifetimes.lots_held("Assets:Xfer:Coinbase-Ledger:BTC", ts)
+            ] == [D("1.0"), D("0.5")]
+    assert lifetimes.lots_held("Assets:Ledger:BTC", ts) == []
+
+    # After the first sale, 0.8 BTC of the (FIFO) first lot remains.
+    ts = datetime.datetime(2020, 3, 2, tzinfo=utc)
+    held = lifetimes.lots_held("Assets:Ledger:BTC", ts)
+    assert [(p.units.number, p.cost.number) for p in held] == [
+        (D("0.8"), D("8000")), (D("0.5"), D("9000"))]
+
+    # After the end of the ledger
+    ts = datetime.datetime(2021, 1, 1, tzinfo=utc)
+    assert lifetimes.point_at_ts(ts) == len(entries)
+    assert [p.units.number for p in lifetimes.lots_held("Assets:Ledger:BTC", ts)] == [
+        D("0.5"), D("0.5")]
+
+def test_point_at_date() -> None:
+    entries = load()
+    lifetimes = LotLifetimes(entries, "USD")
+    point = lifetimes.point_at_date(datetime.date(2020, 2, 1))
+    assert entries[point].narration == "Send 1.5 BTC"
+
+PASS_THROUGH = """
+    option "booking_method" "FIFO"
+
+    2020-01-01 open Assets:Coinbase:USD
+    2020-01-01 open Assets:Coinbase:BTC
+    2020-01-01 open Assets:Ledger:BTC
+    2020-01-01 open Assets:Xfer:BTC
+
+    2020-01-02 * "Buy 1 BTC"
+      Assets:Coinbase:BTC   1 BTC {8000 USD}
+      Assets:Coinbase:USD   -8000 USD
+
+    2020-02-01 * "Transfer 1 BTC"
+      Assets:Coinbase:BTC   -1 BTC {8000 USD, 2020-01-02}
+      Assets:Xfer:BTC        1 BTC {8000 USD, 2020-01-02}
+      Assets:Xfer:BTC       -1 BTC {8000 USD, 2020-01-02}
+      Assets:Ledger:BTC      1 BTC {8000 USD, 2020-01-02}
+"""
+
+def test_same_entry_pass_through() -> None:
+    entries, errors, _ = loader.load_string(textwrap.dedent(PASS_THROUGH))
+    assert not errors
+    lifetimes = LotLifetimes(entries, "USD")
+    assert not [lt for lt in lifetimes.lifetimes if lt.account == "Assets:Xfer:BTC"]
+    for point in range(len(entries) + 1):
+        assert lifetimes.inventories_at(point, include_numeraire=True) == replay(entries, point)
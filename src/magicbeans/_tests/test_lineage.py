@@ -0,0 +1,105 @@
+import datetime
+import io
+import json
+import textwrap
+
+from beancount import loader
+from beancount.core.data import Transaction
+from beancount.core.number import D
+from beancount.core.position import Cost
+from magicbeans.disposals import LotRegistry, get_disposal_postings
+from magicbeans.lineage import ACQUIRE, DISPOSE, TRANSFER, LotLineage
+from magicbeans.transfers import Link, Network
+
+LEDGER = """
+    option "booking_method" "FIFO"
+
+    2020-01-01 open Assets:Coinbase:USD
+    2020-01-01 open Assets:Coinbase:BTC
+    2020-01-01 open Assets:Ledger:BTC
+    2020-01-01 open Assets:Xfer:Coinbase-Ledger:BTC
+    2020-01-01 open Assets:Xfer:Ledger-Coinbase:BTC
+    2020-01-01 open Income:CapGains
+
+    2020-01-02 * "Buy 1 BTC"
+      Assets:Coinbase:BTC   1 BTC {8000 USD}
+      Assets:Coinbase:USD   -8000 USD
+
+    2020-01-03 * "Buy 2 BTC"
+      Assets:Coinbase:BTC   2 BTC {9000 USD}
+      Assets:Coinbase:USD   -18000 USD
+
+    2020-02-01 * "Send 1.5 BTC"
+      Assets:Coinbase:BTC              -1.0 BTC {8000 USD, 2020-01-02}
+      Assets:Coinbase:BTC              -0.5 BTC {9000 USD, 2020-01-03}
+      Assets:Xfer:Coinbase-Ledger:BTC   1.0 BTC {8000 USD, 2020-01-02}
+      Assets:Xfer:Coinbase-Ledger:BTC   0.5 BTC {9000 USD, 2020-01-03}
+
+    2020-02-02 * "Receive 1.5 BTC"
+      Assets:Xfer:Coinbase-Ledger:BTC  -1.0 BTC {8000 USD, 2020-01-02}
+      Assets:Xfer:Coinbase-Ledger:BTC  -0.5 BTC {9000 USD, 2020-01-03}
+      Assets:Ledger:BTC                 1.0 BTC {8000 USD, 2020-01-02}
+      Assets:Ledger:BTC                 0.5 BTC {9000 USD, 2020-01-03}
+
+    2020-03-01 * "Sell 0.2 BTC"
+      Assets:Ledger:BTC   -0.2 BTC {} @ 10000 USD
+      Assets:Coinbase:USD  2000 USD
+      Income:CapGains
+
+    2020-03-02 * "Sell 0.3 BTC"
+      Assets:Ledger:BTC   -0.3 BTC {} @ 10000 USD
+      Assets:Coinbase:USD  3000 USD
+      Income:CapGains
+"""
+
+def load():
+    entries, errors, _ = loader.load_string(textwrap.dedent(LEDGER))
+    assert not errors
+    return entries
+
+def test_lineage() -> None:
+    entries = load()
+    registry = LotRegistry(entries, "USD")
+    network = Network([Link("Coinbase", "Ledger", "BTC")])
+    lineage = LotLineage(entries, registry, network)
+    assert len(lineage) == 2
+
+    first_lot = Cost(D("8000"), "USD", datetime.date(2020, 1, 2), None)
+    second_lot = Cost(D("9000"), "USD", datetime.date(2020, 1, 3), None)
+
+    # The first lot was entirely transferred and then partially disposed of.
+    history = lineage.history("BTC", first_lot)
+    assert [(e.kind, e.from_account, e.to_account, e.units) for e in history.events] == [
+        (ACQUIRE, None, "Assets:Coinbase:BTC", D("1")),
+        (TRANSFER, "Assets:Coinbase:BTC", "Assets:Xfer:Coinbase-Ledger:BTC", D("1.0")),
+        (TRANSFER, "Assets:Xfer:Coinbase-Ledger:BTC", "Assets:Ledger:BTC", D("1.0")),
+        (DISPOSE, "Assets:Ledger:BTC", None, D("0.2")),
+        (DISPOSE, "Assets:Ledger:BTC", None, D("0.3")),
+    ]
+    assert lineage.path(history) == [
+        "Assets:Coinbase:BTC", "Assets:Xfer:Coinbase-Ledger:BTC", "Assets:Ledger:BTC"]
+    assert lineage.path(history, exclude_buffers=True) == [
+        "Assets:Coinbase:BTC", "Assets:Ledger:BTC"]
+
+    # Only part of the second lot was transferred.
+    history = lineage.history("BTC", second_lot)
+    assert [e.units for e in history.transfers()] == [D("0.5"), D("0.5")]
+    assert history.disposals() == []
+
+    # Disposal legs lead directly to their lot's history.
+    sale = [e for e in entries if isinstance(e, Transaction) and e.narration == "Sell 0.3 BTC"][0]
+    (leg,) = get_disposal_postings(sale, "USD")
+    assert lineage.history_of(leg).lotid == registry.get_lotid("BTC", first_lot)
+    assert lineage.history_of(leg).disposals()[-1].entry is sale
+
+def test_lineage_export() -> None:
+    entries = load()
+    lineage = LotLineage(entries, LotRegistry(entries, "USD"))
+    out = io.StringIO()
+    lineage.write_jsonl(out)
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [r["lotid"] for r in records] == [1, 2]
+    assert records[0]["cost"] == "8000"
+    assert [e["kind"] for e in records[0]["events"]] == [
+        "acquire", "transfer", "transfer", "dispose", "dispose"]
+    assert records[0]["events"][1]["to"] == "Assets:Xfer:Coinbase-Ledger:BTC"
@@ -0,0 +1,157 @@
+import datetime
+import textwrap
+from decimal import Decimal as D
+
+import pytest
+
+from beancount import loader
+from beancount.parser import parser, printer
+from magicbeans import lotselection
+
+ACCOUNTS = """
+    2019-01-01 open Assets:Coinbase:BTC
+    2019-01-01 open Assets:Coinbase:USD
+    2019-01-01 open Assets:Xfer:Coinbase-Ledger:BTC
+    2019-01-01 open Assets:Ledger:BTC
+    2019-01-01 open Income:CapGains
+"""
+
+BUYS = """
+    2019-01-02 * "Buy 1 BTC"
+      Assets:Coinbase:BTC   1 BTC {9000 USD}
+      Assets:Coinbase:USD  -9000 USD
+
+    2020-03-01 * "Buy 1 BTC"
+      Assets:Coinbase:BTC   1 BTC {9500 USD}
+      Assets:Coinbase:USD  -9500 USD
+
+    2020-04-01 * "Buy 1 BTC"
+      Assets:Coinbase:BTC   1 BTC {7000 USD}
+      Assets:Coinbase:USD  -7000 USD
+"""
+
+SELL = """
+    2020-06-01 * "Sell 1.5 BTC"
+      Assets:Coinbase:BTC  -1.5 BTC {} @ 10000 USD
+      Assets:Coinbase:USD   15000 USD
+      Income:CapGains
+"""
+
+TRANSFER = """
+    2020-05-01 * "Send 2.5 BTC"
+      Assets:Coinbase:BTC              -2.5 BTC {}
+      Assets:Xfer:Coinbase-Ledger:BTC   2.5 BTC {}
+
+    2020-05-02 * "Receive 2.5 BTC"
+      Assets:Ledger:BTC                 2.5 BTC {}
+      Assets:Xfer:Coinbase-Ledger:BTC  -2.5 BTC {}
+
+    2020-06-01 * "Sell 1.5 BTC"
+      Assets:Ledger:BTC    -1.5 BTC {} @ 10000 USD
+      Assets:Coinbase:USD   15000 USD
+      Income:CapGains
+"""
+
+def select(ledger: str, strategy: lotselection.Strategy):
+    (entries, errors, _) = parser.parse_string(textwrap.dedent(ledger))
+    assert not errors
+    return lotselection.select_lots(entries, strategy)
+
+def lots(posting_filter, entry):
+    # Costs are CostSpecs before booking, and Costs after.
+    return [(p.units.number, getattr(p.cost, "number", None) or p.cost.number_per, p.cost.date)
+            for p in entry.postings if posting_filter(p)]
+
+def is_reduction(p):
+    return p.cost is not None and p.units.number < 0
+
+def booked(entries):
+    """Book the entries with (stock) beancount, returning them."""
+    text = textwrap.dedent(ACCOUNTS) + "".join(
+        printer.format_entry(e) + "\n" for e in entries if e.date > datetime.date(2019, 1, 1))
+    (booked_entries, errors, _) = loader.load_string(text)
+    assert not errors
+    return booked_entries
+
+@pytest.mark.parametrize("strategy, expected", [
+    (lotselection.FIFO(), [(D("-1"), D("9000"), datetime.date(2019, 1, 2)),
+                           (D("-0.5"), D("9500"), datetime.date(2020, 3, 1))]),
+    (lotselection.LIFO(), [(D("-1"), D("7000"), datetime.date(2020, 4, 1)),
+                           (D("-0.5"), D("9500"), datetime.date(2020, 3, 1))]),
+    (lotselection.HIFO(), [(D("-1"), D("9500"), datetime.date(2020, 3, 1)),
+                           (D("-0.5"), D("9000"), datetime.date(2019, 1, 2))]),
+    (lotselection.PreferLongTerm(), [(D("-1"), D("9000"), datetime.date(2019, 1, 2)),
+                                     (D("-0.5"), D("9500"), datetime.date(2020, 3, 1))]),
+    # Selling the short-term 9500 lot is taxed 0.5 * 500, the long-term 9000
+    # lot 0.3 * 1000, and the short-term 7000 lot 0.5 * 3000.
+    (lotselection.MinTax(D("0.5"), D("0.3")),
+     [(D("-1"), D("9500"), datetime.date(2020, 3, 1)),
+      (D("-0.5"), D("9000"), datetime.date(2019, 1, 2))]),
+])
+def test_select_for_sale(strategy, expected) -> None:
+    entries = select(BUYS + SELL, strategy)
+    sale = entries[-1]
+    assert lots(is_reduction, sale) == expected
+    assert sale.postings[-1].account == "Income:CapGains"
+
+    booked_sale = booked(entries)[-1]
+    assert lots(is_reduction, booked_sale) == expected
+
+def test_min_tax_long_term_when_cheaper() -> None:
+    # With a large gap between the rates, the long-term lot is cheaper to sell.
+    entries = select(BUYS + SELL, lotselection.MinTax(D("0.5"), D("0.1")))
+    assert lots(is_reduction, entries[-1])[0] == (D("-1"), D("9000"), datetime.date(2019, 1, 2))
+
+def test_select_for_transfers() -> None:
+    entries = select(BUYS + TRANSFER, lotselection.HIFO())
+    (send, receive, sale) = entries[-3:]
+    sent = [(D("-1"), D("9500"), datetime.date(2020, 3, 1)),
+            (D("-1"), D("9000"), datetime.date(2019, 1, 2)),
+            (D("-0.5"), D("7000"), datetime.date(2020, 4, 1))]
+    assert lots(lambda p: p.account == "Assets:Coinbase:BTC", send) == sent
+    assert (lots(lambda p: p.account == "Assets:Xfer:Coinbase-Ledger:BTC", send)
+            == [(-n, c, d) for (n, c, d) in sent])
+    assert (lots(lambda p: p.account == "Assets:Ledger:BTC", receive)
+            == [(-n, c, d) for (n, c, d) in sent])
+    assert lots(is_reduction, sale) == [
+        (D("-1"), D("9500"), datetime.date(2020, 3, 1)),
+        (D("-0.5"), D("9000"), datetime.date(2019, 1, 2))]
+
+    # Half a BTC of the 7000 lot remains on Coinbase.
+    booked_entries = booked(entries)
+    assert lots(is_reduction, booked_entries[-1]) == lots(is_reduction, sale)
+
+def test_specified_reduction_of_several_lots() -> None:
+    # Both 9000 lots are sent, with a cost but no date; neither is left to
+    # sell, and each is passed on to the transfer account.
+    ledger = BUYS.replace("9500 USD", "9000 USD").replace("-9500 USD", "-9000 USD") + """
+    2020-05-01 * "Send 2 BTC"
+      Assets:Coinbase:BTC              -2 BTC {9000 USD}
+      Assets:Xfer:Coinbase-Ledger:BTC   2 BTC {}
+
+    2020-06-01 * "Sell 1 BTC"
+      Assets:Coinbase:BTC  -1 BTC {} @ 10000 USD
+      Assets:Coinbase:USD   10000 USD
+      Income:CapGains
+"""
+    entries = select(ledger, lotselection.HIFO())
+    (send, sale) = entries[-2:]
+    assert lots(lambda p: p.account == "Assets:Xfer:Coinbase-Ledger:BTC", send) == [
+        (D("1"), D("9000"), datetime.date(2019, 1, 2)),
+        (D("1"), D("9000"), datetime.date(2020, 3, 1))]
+    assert lots(is_reduction, sale) == [(D("-1"), D("7000"), datetime.date(2020, 4, 1))]
+    assert lots(is_reduction, booked(entries)[-1]) == lots(is_reduction, sale)
+
+def test_insufficient_lots_left_for_booking() -> None:
+    entries = select(BUYS + SELL.replace("1.5 BTC", "3.5 BTC"), lotselection.HIFO())
+    reductions = [p for p in entries[-1].postings if is_reduction(p)]
+    assert [p.units.number for p in reductions] == [D("-1"), D("-1"), D("-1"), D("-0.5")]
+    assert not isinstance(reductions[-1].cost.number_per, D)
+
+def test_make_strategy() -> None:
+    assert isinstance(lotselection.make_strategy("hifo"), lotselection.HIFO)
+    assert lotselection.make_strategy("min-tax", D("0.5"), D("0.3")).lt_rate == D("0.3")
+    with pytest.raises(ValueError):
+        lotselection.make_strategy("min-tax")
+    with pytest.raises(ValueError):
+        lotselection.make_strategy("random")
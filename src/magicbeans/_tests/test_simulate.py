@@ -0,0 +1,55 @@
+import textwrap
+from decimal import Decimal as D
+
+import pytest
+
+from magicbeans import simulate
+
+LEDGER = """
+    option "operating_currency" "USD"
+    option "booking_method" "FIFO"
+
+    plugin "magicbeans.capgains" "{
+    'Income.*:CapGains': [':CapGains', ':CapGains:Short', ':CapGains:Long']
+    }"
+
+    2019-01-01 open Assets:Coinbase:BTC
+    2019-01-01 open Assets:Coinbase:USD
+    2019-01-01 open Income:CapGains
+
+    2019-01-02 * "Buy 1 BTC"
+      Assets:Coinbase:BTC   1 BTC {9000 USD}
+      Assets:Coinbase:USD  -9000 USD
+
+    2020-03-01 * "Buy 1 BTC"
+      Assets:Coinbase:BTC   1 BTC {9500 USD}
+      Assets:Coinbase:USD  -9500 USD
+
+    2020-06-01 * "Sell 1 BTC"
+      Assets:Coinbase:BTC  -1 BTC {} @ 10000 USD
+      Assets:Coinbase:USD   10000 USD
+      Income:CapGains
+"""
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_simulate(tmp_path, n_workers) -> None:
+    ledger_path = tmp_path / "ledger.beancount"
+    ledger_path.write_text(textwrap.dedent(LEDGER))
+
+    results = simulate.simulate(str(ledger_path), ["fifo", "hifo", "min-tax"],
+                                [2019, 2020], "USD", D("0.5"), D("0.3"),
+                                n_workers=n_workers)
+    assert results["fifo"][2019] is None
+
+    # FIFO sells the long-term lot; HIFO the short-term one.
+    fifo = results["fifo"][2020].total_row
+    assert (fifo.stcg, fifo.ltcg, fifo.total_tax) == (D("0"), D("1000"), D("300.0"))
+    hifo = results["hifo"][2020].total_row
+    assert (hifo.stcg, hifo.ltcg, hifo.total_tax) == (D("500"), D("0"), D("250.0"))
+    assert results["min-tax"][2020] == results["hifo"][2020]
+
+    table = simulate.format_comparison(results, [2019, 2020]).splitlines()
+    assert table[0].split() == ["Year", "Asset", "Strategy", "STCG", "LTCG", "Est.", "Tax"]
+    assert table[2].split() == ["2019", "(total)", "fifo", "0.00", "0.00", "0.00"]
+    assert table[6].split() == ["2020", "BTC", "hifo", "500.00", "0.00", "250.00"]
+    assert len(table) == 2 + 3 + 6
@@ -0,0 +1,97 @@
+import io
+import os
+import textwrap
+
+import pytest
+
+from beancount.core import data
+from beancount.parser import parser, printer
+from beangulp import extract
+from magicbeans import writer
+from magicbeans._tests import mocks
+from magicbeans.common import ExtractionRecord
+from magicbeans.importers.coinbase import CoinbaseImporter
+
+FILES_DIR = os.path.join(os.path.dirname(__file__), "importer_files")
+
+def extract_test_files():
+    extracted = []
+    for (importer, filename) in [
+            (CoinbaseImporter.test_instance(),
+             "coinbase/Coinbase-d34db33f-TransactionsHistoryReport-2020-01-01-00-00-00.csv"),
+            (mocks.coinbasepro_importer_for_testing(), "coinbasepro/account.csv"),
+            (mocks.gateio_importer_for_testing(), "gateio/joined.csv"),
+            (mocks.chia_wallet_importer_for_testing(), "chiawallet/chiawallet.2022.12.12.csv")]:
+        filepath = os.path.join(FILES_DIR, filename)
+        entries = extract.extract_from_file(importer, filepath, [])
+        extracted.append(ExtractionRecord(filepath, entries, importer.account(filepath), importer))
+    return extracted
+
+def test_write_extracted_entries_matches_beangulp() -> None:
+    extracted = extract_test_files()
+    expected = io.StringIO()
+    extract.print_extracted_entries(extracted, expected)
+    actual = io.StringIO()
+    writer.write_extracted_entries(extracted, actual)
+    assert actual.getvalue() == expected.getvalue()
+
+def test_write_entries_round_trips(tmp_path) -> None:
+    entries = [e for record in extract_test_files() for e in record.entries]
+    path = str(tmp_path / "extracted.beancount")
+    with writer.open_output(path) as out:
+        writer.write_entries(entries, out)
+
+    parsed, errors, _ = parser.parse_file(path)
+    assert not errors
+    assert len(parsed) == len(entries)
+
+    expected = io.StringIO()
+    printer.print_entries(parsed, file=expected)
+    actual = io.StringIO()
+    writer.write_entries(parsed, actual)
+    assert actual.getvalue() == expected.getvalue()
+
+    # The parser sorts entries, so compare after reparsing.
+    reparsed, errors, _ = parser.parse_string(actual.getvalue())
+    assert not errors
+    assert [printer.format_entry(e) for e in reparsed] == \
+        [printer.format_entry(e) for e in parsed]
+
+@pytest.mark.parametrize("text", [
+    """
+    2020-01-05 * "Payee" "Buy \\"1.10\\" BTC" #tag ^link
+      remark: "ok"
+      amt: 10.00 USD
+      flagged: TRUE
+      Assets:Coinbase:BTC           1.1 BTC {1000.00 USD, 2020-01-01, "lot"}
+      ! Assets:Coinbase:USD       -1105.0 USD
+      Assets:Coinbase:XCH          -2 XCH {# 10 USD} @ 5.25 USD
+        is_fee: TRUE
+      Expenses:Financial:Fees
+    """,
+    """
+    2020-01-05 balance Assets:Coinbase:BTC  1.1 BTC
+    2020-01-05 price BTC  10000 USD
+    """,
+])
+def test_format_entry_matches_printer(text) -> None:
+    entries, errors, _ = parser.parse_string(textwrap.dedent(text))
+    assert not errors
+    for entry in entries:
+        assert writer.format_entry(entry) == printer.format_entry(entry)
+
+def test_write_extracted_duplicates() -> None:
+    extracted = extract_test_files()[:1]
+    entries = extracted[0].entries
+    entries[1].meta[extract.DUPLICATE] = entries[0]
+    entries[2].meta[extract.DUPLICATE] = True
+    actual = io.StringIO()
+    writer.write_extracted_entries(extracted, actual)
+    for entry in entries:
+        assert extract.DUPLICATE not in entry.meta
+
+    entries[1].meta[extract.DUPLICATE] = entries[0]
+    entries[2].meta[extract.DUPLICATE] = True
+    expected = io.StringIO()
+    extract.print_extracted_entries(extracted, expected)
+    assert actual.getvalue() == expected.getvalue()
@@ -0,0 +1,153 @@
+"""Beancount plugin classifying capital gains as short-term or long-term.
+
+Splits the generic capital gains posting of each disposal into short-term
+and long-term postings (as beancount_reds_plugins' long_short plugin does),
+according to the holding period of each disposed lot under the IRS
+definition.  In the same pass, it records for later use:
+
+  - on each disposal leg, `holding_period` (in days) and `term` ("short"
+    or "long"); and
+  - on the transaction, `stcg` and `ltcg`, the short- and long-term gains
+    (positive numbers for gains, negative for losses).
+
+so that reports can read the classification directly rather than search
+the postings for it.
+
+Enable it in the ledger with:
+
+  plugin "magicbeans.capgains"
+
+which classifies Income:CapGains into Income:CapGains:Short and
+Income:CapGains:Long.  The long_short plugin's configuration syntax is also
+accepted, e.g.:
+
+  plugin "magicbeans.capgains" "{
+    'Income.*:CapGains': [':CapGains', ':CapGains:Short', ':CapGains:Long']
+    }"
+"""
+
+import ast
+import re
+from decimal import Decimal
+from typing import List, Optional, Tuple
+
+from beancount.core import data, getters
+from beancount.core.data import Posting, Transaction
+from beancount.core.number import ZERO
+from magicbeans.disposals import CG_ACCOUNT, is_long_term
+
+__plugins__ = ('long_short',)
+
+SHORT = "short"
+LONG = "long"
+
+DEFAULT_CONFIG = {
+    f"^{CG_ACCOUNT}$": [":CapGains", ":CapGains:Short", ":CapGains:Long"],
+}
+
+
+def long_short(entries, options_map, config: Optional[str] = None):
+    """Classify capital gains postings into short- and long-term ones."""
+    config_obj = ast.literal_eval(config) if config else DEFAULT_CONFIG
+    # As with long_short, only the first pattern is used.
+    acct_match_regex = next(iter(config_obj))
+    acct_match = re.compile(acct_match_regex)
+    (to_replace, short_repl, long_repl) = config_obj[acct_match_regex]
+
+    new_accounts = set()
+    new_entries = []
+    for entry in entries:
+        if isinstance(entry, Transaction):
+            entry = classify(entry, acct_match, to_replace, short_repl, long_repl,
+                             new_accounts)
+        new_entries.append(entry)
+
+    return (_open_directives(new_accounts, new_entries) + new_entries, [])
+
+
+def classify(entry: Transaction, acct_match: re.Pattern, to_replace: str,
+             short_repl: str, long_repl: str, new_accounts: set) -> Transaction:
+    """Return the transaction with its capital gains classified, or as is if
+    it has no capital gains postings (or has already been classified)."""
+    gains_postings = []
+    for posting in entry.postings:
+        if short_repl in posting.account or long_repl in posting.account:
+            return entry
+        if acct_match.match(posting.account):
+            gains_postings.append(posting)
+    if not gains_postings:
+        return entry
+
+    # One pass over the postings: annotate the disposal legs (reductions with
+    # a sale price) with their term, summing up gains by term.
+    short_gains = long_gains = ZERO    # Income, i.e., negative for gains
+    n_legs = 0
+    postings: List[Posting] = []
+    for posting in entry.postings:
+        if any(posting is p for p in gains_postings):
+            continue
+        if posting.cost and posting.units.number and posting.price is not None:
+            n_legs += 1
+            (holding_period, long_term) = _holding_period(posting, entry)
+            gain = (posting.cost.number - posting.price.number) * abs(posting.units.number)
+            if long_term:
+                long_gains += gain
+            else:
+                short_gains += gain
+            meta = dict(posting.meta) if posting.meta else {}
+            meta["holding_period"] = holding_period
+            meta["term"] = LONG if long_term else SHORT
+            posting = posting._replace(meta=meta)
+        postings.append(posting)
+
+    # Without disposal legs, there's nothing to classify by; leave the
+    # gains in the generic account.
+    if not n_legs:
+        return entry
+
+    # Ensure the replacement postings add up to the original ones, dividing
+    # any difference between short- and long-term.
+    orig_posting = gains_postings[0]
+    orig_sum = sum((p.units.number for p in gains_postings), ZERO)
+    diff = orig_sum - (short_gains + long_gains)
+    tolerances = entry.meta.get("__tolerances__", {})
+    if diff and abs(diff) >= tolerances.get(orig_posting.units.currency, ZERO):
+        total = short_gains + long_gains
+        if total:
+            short_gains += (short_gains / total) * diff
+            long_gains += (long_gains / total) * diff
+
+    def gains_posting(gains: Decimal, account_repl: str) -> Posting:
+        account = orig_posting.account.replace(to_replace, account_repl)
+        new_accounts.add(account)
+        return orig_posting._replace(account=account,
+                                     units=orig_posting.units._replace(number=gains))
+
+    if short_gains:
+        postings.append(gains_posting(short_gains, short_repl))
+    if long_gains:
+        postings.append(gains_posting(long_gains, long_repl))
+    if not (short_gains or long_gains):
+        postings.append(orig_posting)
+
+    meta = dict(entry.meta)
+    meta["stcg"] = -short_gains
+    meta["ltcg"] = -long_gains
+    return entry._replace(meta=meta, postings=postings)
+
+
+def _holding_period(posting: Posting, entry: Transaction) -> Tuple[int, bool]:
+    """Return the number of days the lot was held, and if that's long-term."""
+    acquired = posting.cost.date
+    return ((entry.date - acquired).days, is_long_term(acquired, entry.date))
+
+
+def _open_directives(new_accounts: set, entries: data.Entries) -> data.Entries:
+    """Create Open directives for new accounts which aren't already opened."""
+    if not entries:
+        return []
+    opened = getters.get_account_open_close(entries)
+    earliest_date = entries[0].date
+    return [data.Open(data.new_metadata("<magicbeans.capgains>", 0), earliest_date,
+                      account, None, None)
+            for account in sorted(new_accounts) if account not in opened]
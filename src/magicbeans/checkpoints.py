@@ -0,0 +1,190 @@
+"""Year-end inventory checkpoints, for reports on a range of tax years.
+
+A report on one tax year shouldn't need to load and book every entry since
+the ledger began.  After importing, the pipeline splits the final ledger
+into shards in a checkpoint directory:
+
+  - checkpoint-<Y>.beancount: the ledger's options and plugins, its Open,
+    Close and Commodity directives, the latest prices, and the balances of
+    all asset and liability accounts as of the end of year Y, as one
+    transaction per account.  Lots keep their full Cost (number, currency
+    and acquisition date), written at full precision, so they book back
+    into identical positions.
+  - entries-<Y>.beancount: the (unbooked) entries dated in year Y.
+
+A ledger for tax years A through B is then the checkpoint for A - 1 followed
+by the entries of years A to B, and loading it costs time proportional to
+the activity in those years.  The balancing legs of the checkpoint
+transactions post to CHECKPOINT_ACCOUNT.
+
+The directory also holds a digest of the ledger the shards were split from
+(written last, once they're all written), so that shards left from an older
+ledger can be told apart (see is_current()) and rebuilt.
+"""
+
+import bisect
+import datetime
+import hashlib
+import os
+import re
+from typing import Dict, List, Sequence, Tuple
+
+from beancount import loader
+from beancount.core import account_types, data, flags
+from beancount.ops import summarize
+from beancount.parser import parser
+from magicbeans import writer
+from magicbeans.lifetimes import LotLifetimes
+
+CHECKPOINT_ACCOUNT = "Equity:Checkpoints"
+
+# Header lines of a ledger, carried over into each checkpoint
+HEADER_RE = re.compile(r"^(option|plugin)\s")
+
+DIGEST_FILENAME = "ledger.sha256"
+
+
+def checkpoint_path(checkpoint_dir: str, year: int) -> str:
+    return os.path.join(checkpoint_dir, f"checkpoint-{year}.beancount")
+
+
+def entries_path(checkpoint_dir: str, year: int) -> str:
+    return os.path.join(checkpoint_dir, f"entries-{year}.beancount")
+
+
+def digest_path(checkpoint_dir: str) -> str:
+    return os.path.join(checkpoint_dir, DIGEST_FILENAME)
+
+
+def ledger_digest(ledger_path: str) -> str:
+    """Return the SHA-256 digest of the ledger file, in hex."""
+    digest = hashlib.sha256()
+    with open(ledger_path, "rb") as f:
+        for chunk in iter(lambda: f.read(writer.BUFFER_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_current(checkpoint_dir: str, ledger_path: str) -> bool:
+    """Return true if the checkpoints were written from the ledger as it
+    is now."""
+    try:
+        with open(digest_path(checkpoint_dir)) as f:
+            return f.read().strip() == ledger_digest(ledger_path)
+    except FileNotFoundError:
+        return False
+
+
+def read_header(ledger_path: str) -> str:
+    """Return the option and plugin directives of a ledger file (which may
+    span lines, within a quoted string)."""
+    header = []
+    in_directive = False
+    with open(ledger_path) as f:
+        for line in f:
+            if in_directive or HEADER_RE.match(line):
+                header.append(line)
+                # Continue until the directive's quotes are balanced.
+                n_quotes = len(re.findall(r'(?<!\\)"', line))
+                in_directive = in_directive != (n_quotes % 2 == 1)
+    return "".join(header)
+
+
+class Checkpointer:
+    """Computes year-end checkpoints of a ledger.
+
+    `entries` are the ledger's unbooked entries (as parsed), and
+    `booked_entries` the same, as loaded (booked and with plugins run),
+    from which the balances are taken."""
+
+    def __init__(self, entries: data.Entries, booked_entries: data.Entries,
+                 numeraire: str) -> None:
+        self.entries = sorted(entries, key=data.entry_sortkey)
+        self.lifetimes = LotLifetimes(booked_entries, numeraire)
+        self._dates = [entry.date for entry in self.entries]
+
+    def years(self) -> range:
+        """Return the years with entries."""
+        if not self.entries:
+            return range(0)
+        return range(self.entries[0].date.year, self.entries[-1].date.year + 1)
+
+    def entries_in_year(self, year: int) -> data.Entries:
+        (begin, end) = self._year_bounds(year)
+        return self.entries[begin:end]
+
+    def checkpoint(self, year: int) -> data.Entries:
+        """Return the entries summarizing the ledger up to the end of the year."""
+        (_, end) = self._year_bounds(year)
+        date = datetime.date(year, 12, 31)
+
+        directives: data.Entries = []
+        prices: Dict[Tuple[str, str], data.Price] = {}
+        for entry in self.entries[:end]:
+            if isinstance(entry, (data.Open, data.Close, data.Commodity)):
+                directives.append(entry)
+            elif isinstance(entry, data.Price):
+                prices[(entry.currency, entry.amount.currency)] = entry
+        if not any(isinstance(e, data.Open) and e.account == CHECKPOINT_ACCOUNT
+                   for e in directives):
+            opened = min((e.date for e in directives), default=date)
+            directives.insert(0, data.Open(data.new_metadata("<checkpoint>", 0), opened,
+                                           CHECKPOINT_ACCOUNT, None, None))
+
+        point = self.lifetimes.point_at_date(datetime.date(year + 1, 1, 1))
+        balances = {account: inventory for (account, inventory)
+                    in self.lifetimes.inventories_at(point, include_numeraire=True).items()
+                    if account_types.get_account_type(account) in ("Assets", "Liabilities")}
+        meta = data.new_metadata("<checkpoint>", 0)
+        balance_entries = summarize.create_entries_from_balances(
+            balances, date, CHECKPOINT_ACCOUNT, True, meta, flags.FLAG_SUMMARIZE,
+            "Checkpoint of '{account}' at end of " + str(year))
+
+        return directives + list(prices.values()) + balance_entries
+
+    def _year_bounds(self, year: int) -> Tuple[int, int]:
+        return (bisect.bisect_left(self._dates, datetime.date(year, 1, 1)),
+                bisect.bisect_left(self._dates, datetime.date(year + 1, 1, 1)))
+
+
+def write_checkpoints(ledger_path: str, checkpoint_dir: str, numeraire: str) -> List[int]:
+    """Split the ledger into year-end checkpoints and yearly entries, in the
+    checkpoint directory.  Returns the years covered; a checkpoint is also
+    written for the year before the first (with no balances)."""
+    (entries, errors, _) = parser.parse_file(ledger_path)
+    if errors:
+        raise Exception(f"Errors parsing {ledger_path}: {errors}")
+    (booked_entries, errors, _) = loader.load_file(ledger_path)
+    if errors:
+        raise Exception(f"Errors loading {ledger_path}: {errors}")
+
+    checkpointer = Checkpointer(entries, booked_entries, numeraire)
+    header = read_header(ledger_path)
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    if os.path.exists(digest_path(checkpoint_dir)):
+        os.remove(digest_path(checkpoint_dir))
+    years = checkpointer.years()
+    for year in ([years.start - 1] + list(years)) if years else []:
+        with writer.open_output(checkpoint_path(checkpoint_dir, year)) as out:
+            out.write(header + "\n")
+            writer.write_entries(checkpointer.checkpoint(year), out)
+        if year in years:
+            with writer.open_output(entries_path(checkpoint_dir, year)) as out:
+                writer.write_entries(checkpointer.entries_in_year(year), out)
+    with open(digest_path(checkpoint_dir), "w") as out:
+        out.write(ledger_digest(ledger_path) + "\n")
+    return list(years)
+
+
+def join_years(checkpoint_dir: str, tax_years: Sequence[int], out_path: str) -> None:
+    """Write a ledger for the (consecutive) tax years: the checkpoint for the
+    year before the first, and the entries of the years."""
+    paths = [checkpoint_path(checkpoint_dir, tax_years[0] - 1)]
+    paths += [entries_path(checkpoint_dir, year) for year in tax_years]
+    for path in paths:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Missing checkpoint file {path}")
+    with open(out_path, "w") as out:
+        for path in paths:
+            with open(path) as infile:
+                out.write(infile.read())
@@ -0,0 +1,126 @@
+"""Chunked parallel parsing of very large CSV exports.
+
+Parallelizing across files doesn't help when a single export (e.g., a
+multi-year Coinbase history, or a Chia wallet dump) dominates import time.
+Instead, the data portion of such a file is split into line-aligned byte
+ranges using a memory map, each range is parsed in a worker process, and the
+per-chunk results are combined back in file order by the caller.
+
+Rows are split at newlines, so this assumes quoted CSV fields don't contain
+embedded newlines, which holds for the exports handled here.  Row indexes
+are relative to the start of each chunk; workers return their row counts so
+the caller can translate them to file-wide indexes.
+"""
+
+import concurrent.futures
+import csv
+import io
+import mmap
+import os
+from typing import Any, Callable, List, NamedTuple, Optional, Sequence, Tuple
+
+from beancount.core import data
+
+# Files (or rather, their data portions) smaller than twice this are parsed
+# serially in-process, as the worker startup and pickling overhead would
+# outweigh the gains.
+MIN_CHUNK_BYTES = 4 * 1024 * 1024
+
+# A half-open [start, end) byte range of a file.
+ByteRange = Tuple[int, int]
+
+
+class ChunkPlan(NamedTuple):
+    """The layout of a CSV file to be parsed in chunks: its header field
+    names, and the line-aligned byte ranges covering its data rows."""
+    fieldnames: List[str]
+    ranges: List[ByteRange]
+
+
+def plan_chunks(filepath: str, header_prefixes: Sequence[str] = ("",),
+                n_workers: Optional[int] = None,
+                min_chunk_bytes: Optional[int] = None) -> Optional[ChunkPlan]:
+    """Plan the chunks for parsing a CSV file in parallel.
+
+    The header is the first line starting with one of `header_prefixes`
+    (by default, the first line of the file); anything before it is skipped.
+    Returns None if the file is too small to be worth splitting, or if there
+    is no header line."""
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    if min_chunk_bytes is None:
+        min_chunk_bytes = MIN_CHUNK_BYTES
+    if n_workers < 2 or os.path.getsize(filepath) < 2 * min_chunk_bytes:
+        return None
+
+    with open(filepath, "rb") as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        header_start = _find_line(mm, [p.encode() for p in header_prefixes])
+        if header_start is None:
+            return None
+        data_start = _next_line(mm, header_start)
+        header = mm[header_start:data_start].decode()
+        fieldnames = next(csv.reader([header]))
+
+        size = len(mm)
+        n_chunks = min(n_workers, max(1, (size - data_start) // min_chunk_bytes))
+        chunk_size = (size - data_start) // n_chunks
+        ranges = []
+        start = data_start
+        for i in range(1, n_chunks):
+            end = _next_line(mm, max(start, data_start + i * chunk_size))
+            if end > start:
+                ranges.append((start, end))
+                start = end
+        if start < size:
+            ranges.append((start, size))
+
+    return ChunkPlan(fieldnames, ranges)
+
+
+def _find_line(mm: mmap.mmap, prefixes: Sequence[bytes]) -> Optional[int]:
+    """Return the offset of the first line starting with any of the prefixes."""
+    pos = 0
+    while pos < len(mm):
+        if any(mm[pos:pos + len(p)] == p for p in prefixes):
+            return pos
+        pos = _next_line(mm, pos)
+    return None
+
+
+def _next_line(mm: mmap.mmap, pos: int) -> int:
+    """Return the offset of the start of the line following `pos`."""
+    newline = mm.find(b"\n", pos)
+    return len(mm) if newline < 0 else newline + 1
+
+
+def read_rows(filepath: str, fieldnames: List[str], byte_range: ByteRange) -> csv.DictReader:
+    """Return a DictReader over the rows in a byte range of a CSV file."""
+    (start, end) = byte_range
+    with open(filepath, "rb") as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        text = mm[start:end].decode()
+    return csv.DictReader(io.StringIO(text), fieldnames=fieldnames)
+
+
+def map_chunks(fn: Callable[..., Any], plan: ChunkPlan, *args,
+               n_workers: Optional[int] = None) -> List[Any]:
+    """Call fn(byte_range, *args) for each chunk of the plan in worker
+    processes, returning the results in file order.  `fn` and `args` must be
+    picklable."""
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    n_workers = min(n_workers, len(plan.ranges))
+    if n_workers < 2:
+        return [fn(byte_range, *args) for byte_range in plan.ranges]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = [executor.submit(fn, byte_range, *args) for byte_range in plan.ranges]
+        return [future.result() for future in futures]
+
+
+def offset_row_indexes(entries: data.Entries, offset: int) -> None:
+    """Translate chunk-relative row indexes (the 'lineno' metadata) of
+    entries to file-wide ones by adding the chunk's starting row index."""
+    if offset:
+        for entry in entries:
+            entry.meta["lineno"] += offset
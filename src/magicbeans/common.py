@@ -1,7 +1,6 @@
-import copy
 import datetime
 from decimal import Decimal
-from typing import Callable, List, NamedTuple, Sequence, Tuple
+from typing import Any, Callable, Dict, Hashable, List, Mapping, NamedTuple, Optional, Sequence, Tuple
 import typing
 from beancount.core import position
 from beancount.core.data import Posting, Transaction
@@ -31,6 +30,84 @@ def filter_extractions(
     return [ExtractionRecord(filename, list(filter(keep_fun, entries)), account, importer)
             for (filename, entries, account, importer) in extracted]
 
+class KeyedHook(NamedTuple):
+    """A declarative fix-up for extracted entries.
+
+    `key_fn` computes a match key for a transaction (or None if it has
+    none), and `keys` maps the keys of the entries to fix up to a per-key
+    value.  For each matching entry, `action(entry, value)` is called and
+    returns the replacement entry (which may be the same, mutated entry), or
+    None to drop the entry."""
+    key_fn: Callable[[Transaction], Optional[Hashable]]
+    keys: Mapping[Hashable, Any]
+    action: Callable[[Transaction, Any], Optional[Transaction]]
+
+def key_timestamp(entry: Transaction) -> Optional[str]:
+    return entry.meta.get('timestamp')
+
+def key_transferid(entry: Transaction) -> Optional[str]:
+    return entry.meta.get('transferid')
+
+def key_timestamp_narration(entry: Transaction) -> Tuple[str, str]:
+    return (entry.meta.get('timestamp'), entry.narration)
+
+def drop_entry(entry: Transaction, _value: Any) -> None:
+    """A KeyedHook action which filters out matching entries."""
+    return None
+
+class HookDispatcher:
+    """Applies many KeyedHooks to extracted entries in a single pass.
+
+    Hooks are indexed by key function and key, so each entry costs one dict
+    lookup per distinct key function, regardless of the number of hooks or
+    the length of their key lists.  Entries are edited in place in the
+    ExtractionRecords' entry lists, which must therefore be lists.
+
+    For each entry, hooks are applied in the order their key functions were
+    first registered (and then in registration order), with each key
+    computed on the entry as modified by the preceding hooks.
+
+    An instance is itself a hook, so it can be returned from
+    Config.get_hooks()."""
+
+    def __init__(self, hooks: Sequence[KeyedHook] = ()) -> None:
+        self._index: Dict[Callable, Dict[Hashable, List[Tuple[KeyedHook, Any]]]] = {}
+        for hook in hooks:
+            self.register(hook)
+
+    def register(self, hook: KeyedHook) -> None:
+        by_key = self._index.setdefault(hook.key_fn, {})
+        for (key, value) in hook.keys.items():
+            by_key.setdefault(key, []).append((hook, value))
+
+    def apply(self, entry):
+        """Return the entry after applying all matching hooks, or None if
+        it was dropped."""
+        if not isinstance(entry, Transaction):
+            return entry
+        for (key_fn, by_key) in self._index.items():
+            matches = by_key.get(key_fn(entry))
+            if not matches:
+                continue
+            for (hook, value) in matches:
+                entry = hook.action(entry, value)
+                if entry is None:
+                    return None
+        return entry
+
+    def __call__(self, extracted: Sequence[ExtractionRecord],
+                 _existing_entries: Sequence[Transaction]) -> Sequence[ExtractionRecord]:
+        for record in extracted:
+            entries = record.entries
+            n_kept = 0
+            for entry in entries:
+                entry = self.apply(entry)
+                if entry is not None:
+                    entries[n_kept] = entry
+                    n_kept += 1
+            del entries[n_kept:]
+        return extracted
+
 def file_begins_with(filepath: str, expected: str) -> bool:
     """Return True if the provided file begins with the provided string."""
     with open(filepath, "r") as file:
@@ -93,16 +170,22 @@ def attach_timestamp(entry: Transaction, ts: datetime.datetime):
     entry.meta['timestamp'] = fmt3
     None
 
-def split_out_marked_fees(entry: Transaction, pnl_account) -> Tuple[Transaction, Transaction]:
+def split_out_marked_fees(entry: Transaction, pnl_account,
+                          timestamp: datetime.datetime = None) -> Tuple[Transaction, Transaction]:
     """Examine the provided transaction; if it contains fee postings,
-    split those out into a separate transaction.  The provided tx will
-    be modified to omit the fees while a new transaction containing
-    the fees will be returned, with timestamp 1ms later."""
+    split those out into a separate transaction.  Returns a copy of the
+    provided tx omitting the fees, and a new transaction containing the
+    fees, with timestamp 1ms later.  The provided tx is not modified.
+
+    The new transactions share postings (and everything but the top level
+    metadata dict) with the original, so callers must not mutate those.
+    If the caller has the parsed timestamp of the tx on hand, it can be
+    passed in to avoid reparsing it."""
     reg_postings = []
     fee_postings = []
     for posting in entry.postings:
         meta = posting.meta
-        if meta and 'is_fee' in meta and meta['is_fee']:
+        if meta and meta.get('is_fee'):
             fee_postings.append(posting)
         else:
             reg_postings.append(posting)
@@ -110,15 +193,17 @@ def split_out_marked_fees(entry: Transaction, pnl_account) -> Tuple[Transaction,
     if len(fee_postings) == 0:
         return (None, None)
     else:
-        # Split fee and nonfee transactions, using a deep copy so we can mutate
-        # the fee transaction without mutating the others.
-        new_txn = copy.deepcopy(entry._replace(postings=reg_postings))
-        fee_txn = copy.deepcopy(entry._replace(postings=fee_postings,
-                                               narration="Fees for " + entry.narration))
+        # Split fee and nonfee transactions, giving each its own metadata
+        # dict so we can mutate the fee transaction's timestamp without
+        # mutating the others.
+        new_txn = entry._replace(meta=dict(entry.meta), postings=reg_postings)
+        fee_txn = entry._replace(meta=dict(entry.meta), postings=fee_postings,
+                                 narration="Fees for " + entry.narration)
 
         # Increment the timestamp so it comes after the original transaction.
-        orig_ts = dateutil.parser.parse(fee_txn.meta['timestamp'])
-        attach_timestamp(fee_txn, orig_ts + datetime.timedelta(milliseconds=1))
+        if timestamp is None:
+            timestamp = dateutil.parser.isoparse(entry.meta['timestamp'])
+        attach_timestamp(fee_txn, timestamp + datetime.timedelta(milliseconds=1))
 
         return (new_txn, fee_txn)
 
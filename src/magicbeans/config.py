@@ -26,7 +26,9 @@ class Config:
 
         Hooks are functions which take a list of extracted entries and
         optionally a list of existing entries, and return a list of
-        entries."""
+        entries.  Fix-ups targeting specific entries are best expressed as
+        common.KeyedHooks registered on a single common.HookDispatcher,
+        which applies them all in one pass."""
         raise NotImplementedError
 
     def get_preamble(self) -> str:
@@ -36,7 +36,7 @@ option "inferred_tolerance_default" "USD:0.01"
 
 ;; Use the cap gains plugin.
 
-plugin "beancount_reds_plugins.capital_gains_classifier.long_short" "{
+plugin "magicbeans.capgains" "{
   'Income.*:CapGains': [':CapGains', ':CapGains:Short', ':CapGains:Long']
   }"
 
@@ -135,10 +135,11 @@ class LocalConfig(magicbeans.config.Config):
     def get_hooks(self) -> Sequence[Callable[
             [Sequence[ExtractionRecord], Sequence[Transaction]],
             Sequence[ExtractionRecord]]]:
-        return [chiawallet_filter_change_coins_hook,
-                cbp_tweak_xfer_timestamp_hook,
-                chiawallet_recharacterize_sale_hook,
-                ]
+        return [common.HookDispatcher([
+                    chiawallet_filter_change_coins_hook,
+                    cbp_tweak_xfer_timestamp_hook,
+                    chiawallet_recharacterize_sale_hook,
+                ])]
 
     def get_price_fetcher(self):
         return self.price_fetcher
@@ -155,7 +156,7 @@ class LocalConfig(magicbeans.config.Config):
 # Example hooks (ie Beangulp hooks).  These are for illustration purposes; you
 # should write your own to tweak your data as needed.
 #
-# Hooks should take arguments:
+# Hooks in general should take arguments:
 #   extracted: Sequence[common.ExtractionRecord]
 #   existing_entries: Sequence[Transaction]
 # and return a new
@@ -164,80 +165,83 @@ class LocalConfig(magicbeans.config.Config):
 # Unfortunately these types are not really defined or documented; please refer
 # to the Beangulp source code for more information.
 #
+# Most fix-ups only apply to a handful of specific entries, though, and are
+# simplest to write as a common.KeyedHook: a key function, a dict of the keys
+# of the entries to fix (mapped to a per-entry value), and an action applied
+# to each matching entry.  A common.HookDispatcher applies all its KeyedHooks
+# in a single pass over the extracted entries.
+#
 
-def chiawallet_filter_change_coins_hook(extracted: Sequence[ExtractionRecord], _existing_entries: Sequence[Transaction]) -> Sequence[ExtractionRecord]:
-    return common.filter_extractions(extracted, chiawallet_filter_change_coins)
-
-def chiawallet_filter_change_coins(entry: Transaction):
-    """The chia wallet sometimes has trouble accurately reporting change from
-    a UTXO spend.  These are change coins that show up as solo receives instead
-    of netting out against the spend.  Filter them."""
-    to_filter = [
-        ('2022-01-02T18:20:55Z', Decimal("1.74999999")),
-        ('2022-02-08T08:45:10Z', Decimal("1.749999")),
-    ]   
-    return (isinstance(entry, Transaction) and
-            (entry.meta['timestamp'], entry.postings[0].units.number) in to_filter)
+def timestamp_and_units(entry: Transaction):
+    if not entry.postings:
+        return None
+    return (entry.meta.get('timestamp'), entry.postings[0].units.number)
 
+# The chia wallet sometimes has trouble accurately reporting change from a UTXO
+# spend.  These are change coins that show up as solo receives instead of
+# netting out against the spend.  Filter them.
+chiawallet_filter_change_coins_hook = common.KeyedHook(
+    timestamp_and_units,
+    {
+        ('2022-01-02T18:20:55Z', Decimal("1.74999999")): None,
+        ('2022-02-08T08:45:10Z', Decimal("1.749999")): None,
+    },
+    common.drop_entry)
 
-def cbp_tweak_xfer_timestamp_hook(extracted: Sequence[ExtractionRecord], _existing_entries: Sequence[Transaction]) -> Sequence[ExtractionRecord]:
-    return [ExtractionRecord(filename, list(map(cbp_tweak_xfer_timestamp, entries)), account, importer)
-            for (filename, entries, account, importer) in extracted]
 
-def cbp_tweak_xfer_timestamp(tx: Transaction) -> Transaction:
+def cbp_tweak_xfer_timestamp(tx: Transaction, minutes_to_backdate: int) -> Transaction:
     """Adjust timestamps on transactions, which were transfers of USDT from CBP
     to GateIO, but which show up in GateIO some minutes before CBP registers
     it, which throws off all the bookkeeping.  Tweak the timestamp to send
     before it's received."""
-    minutes_to_backdate = None
-    if ('transferid' in tx.meta):
-        if (tx.meta['transferid'] == 'abcd1234-12ab-abcd-1234-09876abcdef0'):
-            minutes_to_backdate = 5
-    if minutes_to_backdate:
-        orig_ts = dateutil.parser.parse(tx.meta['timestamp'])
-        new_ts = orig_ts + datetime.timedelta(minutes=-minutes_to_backdate)
-        tx.meta['backdated-by'] = f"{minutes_to_backdate} minutes"
-        common.attach_timestamp(tx, new_ts)
-    return tx   # So can be used in map()
-
-
-def chiawallet_recharacterize_sale_hook(extracted: Sequence[ExtractionRecord], _existing_entries: Sequence[Transaction]) -> Sequence[ExtractionRecord]:
-    return [ExtractionRecord(filename, list(map(chiawallet_recharacterize_sale_entry, entries)), account, importer)
-            for (filename, entries, account, importer) in extracted]
-
-def chiawallet_recharacterize_sale_entry(entry: Transaction) -> Transaction:
+    orig_ts = dateutil.parser.parse(tx.meta['timestamp'])
+    new_ts = orig_ts + datetime.timedelta(minutes=-minutes_to_backdate)
+    tx.meta['backdated-by'] = f"{minutes_to_backdate} minutes"
+    common.attach_timestamp(tx, new_ts)
+    return tx
+
+# Maps transfer IDs to the number of minutes to backdate them.
+cbp_tweak_xfer_timestamp_hook = common.KeyedHook(
+    common.key_transferid,
+    {
+        'abcd1234-12ab-abcd-1234-09876abcdef0': 5,
+    },
+    cbp_tweak_xfer_timestamp)
+
+
+def chiawallet_recharacterize_sale_entry(entry: Transaction, price: Decimal) -> Transaction:
     """Handle some transactions which appears to simply be a Send transaction,
     but which were actually transfers to a buyer, in exchange for USD.  Namely,
     recharacterize them as a sale instead of a Send."""
-    to_recharacterize = [
-        ("2022-01-01T09:30:15Z", "Send 1.0000 XCH"),
-        ("2022-01-01T09:45:50Z", "Send 2.0000 XCH"),
-    ]
-    if isinstance(entry, Transaction) and (entry.meta['timestamp'], entry.narration) in to_recharacterize:
-        new_narration = entry.narration.replace("Send", "Sell") + " at 100.0 USD/XCH"
-        new_entry = entry._replace(narration=new_narration)
-        new_entry.meta['original_narration'] = entry.narration
-
-        assert len(new_entry.postings) == 2
-        debit_leg = next(filter(lambda p: p.units.number < 0, new_entry.postings))
-        credit_leg = next(filter(lambda p: p.units.number > 0, new_entry.postings))
-        assert debit_leg
-        assert credit_leg
-        new_entry.postings.clear()
-
-        price = Decimal("100.0")
-
-        # Construct the debit leg with price and add it
-        debit_leg = debit_leg._replace(price = Amount(price, "USD"))
-        new_entry.postings.append(debit_leg)
-
-        # Replace the credit leg
-        usd_amount = - debit_leg.units.number * price
-        create_simple_posting(new_entry, "Assets:Bank:USD", usd_amount, "USD")
-
-        # Add the cap gains leg
-        create_simple_posting(new_entry, "Income:CapGains", None, None)
-
-        return new_entry   # So can be used in map()
-    else:
-        return entry
\ No newline at end of file
+    new_narration = entry.narration.replace("Send", "Sell") + f" at {price} USD/XCH"
+    new_entry = entry._replace(narration=new_narration)
+    new_entry.meta['original_narration'] = entry.narration
+
+    assert len(new_entry.postings) == 2
+    debit_leg = next(filter(lambda p: p.units.number < 0, new_entry.postings))
+    credit_leg = next(filter(lambda p: p.units.number > 0, new_entry.postings))
+    assert debit_leg
+    assert credit_leg
+    new_entry.postings.clear()
+
+    # Construct the debit leg with price and add it
+    debit_leg = debit_leg._replace(price = Amount(price, "USD"))
+    new_entry.postings.append(debit_leg)
+
+    # Replace the credit leg
+    usd_amount = - debit_leg.units.number * price
+    create_simple_posting(new_entry, "Assets:Bank:USD", usd_amount, "USD")
+
+    # Add the cap gains leg
+    create_simple_posting(new_entry, "Income:CapGains", None, None)
+
+    return new_entry
+
+# Maps (timestamp, narration) of the sends to recharacterize to the sale price.
+chiawallet_recharacterize_sale_hook = common.KeyedHook(
+    common.key_timestamp_narration,
+    {
+        ("2022-01-01T09:30:15Z", "Send 1.0000 XCH"): Decimal("100.0"),
+        ("2022-01-01T09:45:50Z", "Send 2.0000 XCH"): Decimal("100.0"),
+    },
+    chiawallet_recharacterize_sale_entry)
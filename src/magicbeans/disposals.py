@@ -3,9 +3,10 @@
 import datetime
 from decimal import Decimal
 from functools import partial
-from typing import Dict, List, NamedTuple, Sequence, Tuple
+from typing import Dict, List, NamedTuple, Sequence, Set, Tuple
 
 import dateutil
+from dateutil.relativedelta import relativedelta
 from beancount.parser.printer import format_entry
 from beancount.parser.printer import print_entry
 from beancount.core import amount
@@ -21,6 +22,14 @@ CG_ACCOUNT = "Income:CapGains"
 STCG_ACCOUNT = "Income:CapGains:Short"
 LTCG_ACCOUNT = "Income:CapGains:Long"
 
+# Term groups of disposals, by their classified gains
+TERM_GROUPS = ["Short Term", "Long Term", "Mixed"]
+
+def is_long_term(acquired: datetime.date, disposed: datetime.date) -> bool:
+	"""Return True if an asset acquired and disposed of on the given dates was
+	held for more than one year (the IRS definition of long-term)."""
+	return disposed > acquired + relativedelta(years=1)
+
 def assert_valid_position(position):
 	assert(position.cost is not None), f"Position {position} has no cost"
 
@@ -29,125 +38,102 @@ class InventoryBlock(NamedTuple):
 	account: str
 	positions: List[Position]
 
-class LotIndex():
-	"""Tracks lots from inventories or acquisitions and enables ID assignment.
+def normalized_lot_key(currency: str, cost: Cost) -> Tuple[str, Cost]:
+	"""Return a key identifying a lot, robust to insignificant differences in
+	the representation of the cost number."""
+	num = cost.number.quantize(Decimal("1.00000000")).normalize()
+	return (currency, cost._replace(number=num))
+
+class LotRegistry():
+	"""Assigns report-wide lot IDs to all lots in a booked ledger.
+
+	The registry is built once, in one pass over the booked entries.  Each lot
+	(i.e., (currency, Cost) pair) gets an ID when it is first augmented into
+	an account, in ledger order, so IDs are stable across the pages of a
+	report, and across regenerations of the report as the ledger grows.  A
+	transferred lot keeps its cost, and thus its ID.
 
-	This class enables us to create an index of lots (i.e., positions) from
-	multiple accounts with an inventory snapshot, as well as from lots obtained
-	in subsequent acquisition transactions, and index relevant ones from
-	subsequent disposal transactions.
+	Lookups are by (currency, Cost) in O(1): the lot keys as they appear in
+	the ledger are indexed directly, and other representations of the same
+	cost fall back to a precomputed normalized key.
 	"""
 
-	# TODO: filter out numeraire accounts
-
-	def __init__(self, inventory_blocks: Sequence[InventoryBlock], acquisitions:
-	Sequence[Transaction], disposals: Sequence[Transaction], numeraire: str):
-		"""Initialize the index for a set of inventories and transactions.
-		
-		This will collect lots from inventories and the augmentation legs
-		of transactions, identify the relevant ones based on the disposals,
-		and index those for future reference.
-
-		Args:
-		- inventory_blocks: list of (currency, account, positions) tuples
-		- acquisitions: acquisition transactions (purchases and mining awards)
-		- disposals: disposal transactions
-		- numeraire: needed to ignore cash-proceeds augmentations
-		"""
-
-		# Our index is logically a dict mapping
-		#   (currency, Cost) to (ID number or None)
-		# where currency is the held asset.
-		#
-		# We share lots IDs across accounts in order to refer to a lot id even
-		# if it's been transferred.
-		self._index: Dict[Tuple[str, Cost], int] = {}
-
-		# Collect all lots that are referenced in disposals
-		referenced_lots = set()
+	def __init__(self, entries: Sequence[Transaction], numeraire: str):
+		self.numeraire = numeraire
+		self._ids: Dict[Tuple[str, Cost], int] = {}
+		self._ids_normalized: Dict[Tuple[str, Cost], int] = {}
+		self._lots: List[Tuple[str, Cost]] = [None]  # Indexed by lot ID
+
+		for entry in entries:
+			if not isinstance(entry, Transaction):
+				continue
+			for posting in entry.postings:
+				if (isinstance(posting.cost, Cost)
+						and posting.cost.number is not None
+						and is_non_numeraire_proceeds_leg(posting, numeraire)):
+					self._register(posting.units.currency, posting.cost)
+
+	def __len__(self) -> int:
+		return len(self._lots) - 1
+
+	def _register(self, currency: str, cost: Cost) -> None:
+		key = (currency, cost)
+		if key in self._ids:
+			return
+		normalized_key = normalized_lot_key(currency, cost)
+		lotid = self._ids_normalized.get(normalized_key)
+		if lotid is None:
+			lotid = len(self._lots)
+			self._lots.append(key)
+			self._ids_normalized[normalized_key] = lotid
+		self._ids[key] = lotid
+
+	def get_lotid(self, currency: str, cost: Cost) -> int | None:
+		"""Return the ID of the lot, or None if it's not in the ledger."""
+		key = (currency, cost)
+		lotid = self._ids.get(key)
+		if lotid is None and cost is not None and cost.number is not None:
+			lotid = self._ids_normalized.get(normalized_lot_key(currency, cost))
+			if lotid is not None:
+				self._ids[key] = lotid
+		return lotid
+
+	def get_lot(self, lotid: int) -> Tuple[str, Cost]:
+		"""Return the (currency, Cost) of the lot with the given ID."""
+		return self._lots[lotid]
+
+	def page_view(self, disposals: Sequence[Transaction]) -> 'LotRegistryView':
+		"""Return a view showing IDs only for the lots referenced by the
+		given disposals."""
+		referenced_ids = set()
+		missing_lots = set()
 		for e in disposals:
-			for a in get_disposal_postings(e, numeraire):
-				key = self._mk_key(a.units.currency, a.cost)
-				referenced_lots.add(key)
-
-
-		# Use user-visible index IDs starting from 1, and in the order that lots
-		# appear in inventory and acquisitions, so they're easy to find in the
-		# report.
-		self.next_id = 1
-
-		# Index all lots from inventories and acquisitions
-		indexed_lots = set()
-		for (currency, account, positions) in inventory_blocks:
-			for position in positions:
-				assert_valid_position(position)
-				key = self._mk_key(position.units.currency, position.cost)
-				if key in referenced_lots:
-					indexed_lots.add(key)
-					self._assign_lotid(key[0], key[1])
-		for tx in list(acquisitions) + list(disposals):
-			for posting in tx.postings:
-				if is_non_numeraire_proceeds_leg(posting, numeraire):
-					key = self._mk_key(posting.units.currency, posting.cost)
-					if key in referenced_lots:
-						indexed_lots.add(key)
-						self._assign_lotid(key[0], key[1])
-		
-		# for (currency, cost) in available_lots:
-		# 	self._set(currency, cost, None)
-
-		missing_lots = referenced_lots - indexed_lots
+			for p in get_disposal_postings(e, self.numeraire):
+				lotid = self.get_lotid(p.units.currency, p.cost)
+				if lotid is None:
+					missing_lots.add((p.units.currency, p.cost))
+				else:
+					referenced_ids.add(lotid)
+
 		if missing_lots:
-			print("\n!!! Warning: LotIndex had no index for these referenced lots:")
+			print("\n!!! Warning: LotRegistry had no ID for these referenced lots:")
 			for (currency, cost) in missing_lots:
 				print(f"!!!   {currency} {{{cost.number} {cost.currency} {cost.date}}}")
-			all_tx = list(acquisitions) + list(disposals)
-			tx_earliest = min([tx.date for tx in all_tx], default=None)
-			tx_latest = max([tx.date for tx in all_tx], default=None)
-			print(f'!!! Indexed lots (inc. tx between {tx_earliest} and {tx_latest}:')
-			for line in self.debug_str():
-				print(f"!!!   {line}")
-
-
-	# For robustness, round Cost values.  TODO: determine if this is necessary
-	def _mk_key(self, currency: str, cost: Cost):
-		num = cost.number.quantize(Decimal("1.00000000")).normalize()
-		return (currency, cost._replace(number=num))
 
-	def _get(self, currency: str, cost: Cost):
-		return self._index[self._mk_key(currency, cost)]
+		return LotRegistryView(self, referenced_ids)
 
-	def _has(self, currency: str, cost: Cost):
-		return self._mk_key(currency, cost) in self._index
+class LotRegistryView():
+	"""A view on a LotRegistry which selects the lot IDs to show (e.g., those
+	relevant to one page of a report)."""
 
-	def _set(self, currency: str, cost: Cost, new_value):
-		self._index[self._mk_key(currency, cost)] = new_value
-
-	def _assign_lotid(self, currency: str, cost: Cost) -> None:
-		"""Finds the lot in the inventory, assigns an index number to it
-		   if it doesn't already have one, remembers that and returns it"""
-		self._set(currency, cost, self.next_id)
-		self.next_id += 1
+	def __init__(self, registry: LotRegistry, lotids: Set[int]):
+		self.registry = registry
+		self.lotids = lotids
 
 	def get_lotid(self, currency: str, cost: Cost) -> int | None:
-		"""If this lot has been indexed, return the index, otherwise None"""
-		if self._has(currency, cost):
-			return self._get(currency, cost)
-		return None
-
-	def render_lot(self, currency: str, cost: Cost) -> str:
-		"""Return a string representation of the lot"""
-		return f"{currency:<15} {cost.number:>16f} {cost.currency:<6} {cost.date}"
-
-	def debug_str(self, select_currency=None) -> List[str]:
-		result = []
-		for ((currency, cost), lotid) in self._index.items():
-			if not lotid:
-				continue
-			if select_currency and currency != select_currency:
-				continue
-			result.append(f"  {self.render_lot(currency, cost)} -> #{lotid}")
-		return result
+		"""If this lot is selected, return its ID, otherwise None"""
+		lotid = self.registry.get_lotid(currency, cost)
+		return lotid if lotid in self.lotids else None
 
 class BookedDisposal():
 	"""Provides a view on a transaction which contains booked disposals
@@ -157,7 +143,14 @@ class BookedDisposal():
 	booked (i.e., have an unambiguous cost assigned).
 	
 	One initialized, provides convenient accessors for explaining capital
-	gains (in terms of the provided numeraire)."""
+	gains (in terms of the provided numeraire).  Reports read these many
+	times per disposal, so all of them are computed once, up front, and
+	totals are kept as plain Decimals."""
+
+	__slots__ = ("tx", "numeraire", "disposal_legs", "numeraire_proceeds_legs",
+		"other_proceeds_legs", "disposed_currency", "numeraire_proceeds",
+		"other_proceeds", "disposed_cost", "_timestamp", "_acquisition_date",
+		"_disposed_amount", "_stcg", "_ltcg")
 
 	disposal_legs: Sequence[Posting]
 	numeraire_proceeds_legs: Sequence[Posting]
@@ -170,12 +163,22 @@ class BookedDisposal():
 			raise Exception(f"Expected a disposal transaction, got: {entry}")
 		self.tx = entry
 		self.numeraire = numeraire
-		self.numeraire_zero = Amount(ZERO, numeraire)
 
 		# TODO: expect that this is a complete nonoverlapping partition?
-		self.disposal_legs = self._filter_and_sort_legs(entry, is_disposal_leg)
-		self.numeraire_proceeds_legs = self._filter_and_sort_legs(entry, is_numeraire_proceeds_leg)
-		self.other_proceeds_legs = self._filter_and_sort_legs(entry, is_non_numeraire_proceeds_leg)
+		disposal_legs = []
+		numeraire_proceeds_legs = []
+		other_proceeds_legs = []
+		for p in entry.postings:
+			if is_disposal_leg(p, numeraire):
+				disposal_legs.append(p)
+			elif is_numeraire_proceeds_leg(p, numeraire):
+				numeraire_proceeds_legs.append(p)
+			elif is_non_numeraire_proceeds_leg(p, numeraire):
+				other_proceeds_legs.append(p)
+		by_units = lambda p: p.units.number
+		self.disposal_legs = sorted(disposal_legs, key=by_units)
+		self.numeraire_proceeds_legs = sorted(numeraire_proceeds_legs, key=by_units)
+		self.other_proceeds_legs = sorted(other_proceeds_legs, key=by_units)
 
 		# Sanity check that all disposals are of the same currency, and hang on to it.
 		disposed_currencies = set([d.units.currency for d in self.disposal_legs])
@@ -183,37 +186,48 @@ class BookedDisposal():
 			raise Exception(f"Disposals should be of one currency; got: {disposed_currencies}")
 		self.disposed_currency = disposed_currencies.pop()
 
-		# TODO: verify these add up to the gains we compute ourselves?
-		(self.short_term, self.long_term) = get_capgains_postings(entry)
+		dates = set([p.cost.date for p in self.disposal_legs])
+		self._acquisition_date = "Various" if len(dates) > 1 else dates.pop()
+
+		timestamp = entry.meta.get("timestamp")
+		self._timestamp = dateutil.parser.parse(timestamp) if timestamp else None
 
-	def _filter_and_sort_legs(self, tx: Transaction, filter_pred) -> Posting:
-		filter_pred_w_numeraire = partial(filter_pred, numeraire=self.numeraire)
-		return sorted(filter(filter_pred_w_numeraire, tx.postings),
-				key=lambda p: p.units.number)
+		self._disposed_amount = -sum([p.units.number for p in self.disposal_legs], ZERO)
+		self.numeraire_proceeds = sum_numbers(numeraire,
+			[(p.units.currency, p.units.number) for p in self.numeraire_proceeds_legs])
+		self.other_proceeds = sum_numbers(numeraire,
+			[(p.cost.currency, p.cost.number * p.units.number) for p in self.other_proceeds_legs])
+		self.disposed_cost = sum_numbers(numeraire,
+			[(p.cost.currency, p.cost.number * -p.units.number) for p in self.disposal_legs])
+
+		# TODO: verify these add up to the gains we compute ourselves?
+		# Gains classified by the magicbeans.capgains plugin are recorded on
+		# the transaction; otherwise look for the classified postings.
+		if "stcg" in entry.meta and "ltcg" in entry.meta:
+			self._stcg = entry.meta["stcg"]
+			self._ltcg = entry.meta["ltcg"]
+		else:
+			(short_term, long_term) = get_capgains_postings(entry)
+			self._stcg = -short_term.units.number if short_term else Decimal(0)
+			self._ltcg = -long_term.units.number if long_term else Decimal(0)
 
 	def timestamp(self) -> datetime.datetime:
 		"""Return the timestamp of the transaction"""
-		return dateutil.parser.parse(self.tx.meta["timestamp"])
+		if self._timestamp is None:
+			raise KeyError(f"No timestamp on transaction: {self.tx}")
+		return self._timestamp
 
 	def acquisition_date(self) -> str:
 		"""Return the date of the acquisition legs, if unique, otherwise "Various"."""
-		dates = set([p.cost.date for p in self.disposal_legs])
-		if len(dates) > 1:
-			return "Various"
-		return dates.pop()
+		return self._acquisition_date
 
-	# TODO: this should just return self.disposed_currency, no?
 	def disposed_asset(self) -> str:
 		"""Return the name of the asset disposed"""
-		all_disposed_assets = set([p.units.currency for p in self.disposal_legs])
-		if len(all_disposed_assets) > 1:
-			raise Exception(f"Expected one disposed asset, got: {all_disposed_assets}")
-		return all_disposed_assets.pop()
+		return self.disposed_currency
 
 	def disposed_amount(self) -> Decimal:
 		"""Return the total amount disposed"""
-		amounts = [p.units.number for p in self.disposal_legs]
-		return -sum(amounts)  # Return a positive number
+		return self._disposed_amount  # A positive number
 
 	def disposal_date(self) -> datetime.date:
 		"""Return the date of the disposal"""
@@ -221,57 +235,78 @@ class BookedDisposal():
 
 	def total_numeriare_proceeds(self) -> Amount:
 		"""Return the total proceeds obtained natively in the numeraire"""
-		nums = [p.units for p in self.numeraire_proceeds_legs]
-		return sum_amounts(self.numeraire, nums)
+		return Amount(self.numeraire_proceeds, self.numeraire)
 
 	def total_other_proceeds_value(self) -> Amount:
 		"""Return the total value of the proceeds"""
-		costs = [amount.mul(p.cost, p.units.number) for p in self.other_proceeds_legs]
-		return sum_amounts(self.numeraire, costs)
+		return Amount(self.other_proceeds, self.numeraire)
 	
 	def total_disposed_cost(self) -> Amount:
 		"""Return the total cost of the disposed assets"""
-		costs = [amount.mul(p.cost, -p.units.number) for p in self.disposal_legs]
-		return sum_amounts(self.numeraire, costs)
+		return Amount(self.disposed_cost, self.numeraire)
 
 	def stcg(self) -> Decimal:
-		if self.short_term:
-			return - self.short_term.units.number
-		else:
-			return Decimal(0)
+		return self._stcg
 
 	def ltcg(self) -> Decimal:
-		if self.long_term:
-			return - self.long_term.units.number
-		else:
-			return Decimal(0)
+		return self._ltcg
+
+	def term_group(self) -> str | None:
+		"""Return the term group of the disposal (one of TERM_GROUPS) by its
+		classified gains, or None if it has neither short nor long term gains."""
+		if self._stcg:
+			return TERM_GROUPS[2] if self._ltcg else TERM_GROUPS[0]
+		return TERM_GROUPS[1] if self._ltcg else None
 
 class BDGroupKey(NamedTuple):
 	asset: str
 	acquired: str  # May be "Various"
 	disposed: datetime.date
+	term: str | None  # Term group
 
 	@staticmethod
 	def new(bd: BookedDisposal):
-		return BDGroupKey(bd.disposed_asset(), bd.acquisition_date(), bd.timestamp().date())
+		return BDGroupKey(bd.disposed_asset(), bd.acquisition_date(), bd.timestamp().date(),
+			bd.term_group())
 
 class BookedDisposalGroup():
 	"""Looks like a BookedDisposal for reporting, but actually a group of them.
+	Totals are accumulated as disposals are added.
 	TODO: explicitly define the shared interface."""
+
+	__slots__ = ("numeraire", "idx", "disposals", "numeraire_proceeds",
+		"other_proceeds", "disposed_cost", "_disposed_amount", "_stcg", "_ltcg")
+
 	def __init__(self, bd: BookedDisposal):
 		self.numeraire = bd.numeraire
 		self.idx = BDGroupKey.new(bd)
-		self.disposals = [bd]
+		self.disposals = []
+		self.numeraire_proceeds = ZERO
+		self.other_proceeds = ZERO
+		self.disposed_cost = ZERO
+		self._disposed_amount = ZERO
+		self._stcg = ZERO
+		self._ltcg = ZERO
+		self._accumulate(bd)
 
 	def add(self, bd: BookedDisposal):
 		if self.idx != BDGroupKey.new(bd):
 			raise Exception(f"Cannot add {bd} (key {BDGroupKey.new(bd)} to {self} (key {self.idx})")
 		if self.numeraire != bd.numeraire:
 			raise Exception(f"Cannot add {bd} (numeraire {bd.numeraire} to {self} (numeraire {self.numeraire})")
+		self._accumulate(bd)
+
+	def _accumulate(self, bd: BookedDisposal):
 		self.disposals.append(bd)
+		self.numeraire_proceeds += bd.numeraire_proceeds
+		self.other_proceeds += bd.other_proceeds
+		self.disposed_cost += bd.disposed_cost
+		self._disposed_amount += bd.disposed_amount()
+		self._stcg += bd.stcg()
+		self._ltcg += bd.ltcg()
 
 	def zero(self) -> Amount:
-		return Amount(ZERO, self.disposals[0].numeraire)
+		return Amount(ZERO, self.numeraire)
 
 	def acquisition_date(self) -> str:
 		return self.idx.acquired
@@ -280,26 +315,25 @@ class BookedDisposalGroup():
 		return self.idx.asset
 
 	def disposed_amount(self) -> Decimal:
-		return sum([bd.disposed_amount() for bd in self.disposals], Decimal(0))
+		return self._disposed_amount
 
 	def disposal_date(self) -> datetime.date:
 		return self.idx.disposed
 	
 	def total_numeriare_proceeds(self) -> Amount:
-		return sum_amounts(self.numeraire, [bd.total_numeriare_proceeds() for bd in self.disposals])
+		return Amount(self.numeraire_proceeds, self.numeraire)
 	
 	def total_other_proceeds_value(self) -> Amount:
-		return sum_amounts(self.numeraire, [bd.total_other_proceeds_value() for bd in self.disposals])
+		return Amount(self.other_proceeds, self.numeraire)
 	
 	def total_disposed_cost(self) -> Amount:
-		return sum_amounts(self.numeraire, [bd.total_disposed_cost() for bd in self.disposals])
+		return Amount(self.disposed_cost, self.numeraire)
 	
 	def stcg(self) -> Decimal:
-		return sum(([bd.stcg() for bd in self.disposals]), Decimal(0))
+		return self._stcg
 	
 	def ltcg(self) -> Decimal:
-		result = sum(([bd.ltcg() for bd in self.disposals]), Decimal(0))
-		return result
+		return self._ltcg
 
 
 def is_disposal_leg(posting: Posting, numeraire: str) -> bool:
@@ -347,6 +381,16 @@ def sum_amounts(cur: str, amounts: List[Amount]) -> Amount:
 		sum = amount.add(sum, a)
 	return sum
 
+def sum_numbers(cur: str, numbers: List[Tuple[str, Decimal]]) -> Decimal:
+	"""Add up a list of (currency, number) pairs, all of which must be in the
+	given currency, like sum_amounts() but without allocating Amounts."""
+	total = ZERO
+	for (currency, number) in numbers:
+		if currency != cur:
+			raise ValueError(f"Unmatching currencies for operation on {cur} and {currency}")
+		total += number
+	return total
+
 # TODO: dedup this with the one in common
 def format_money(num) -> str:
 	if num:
@@ -158,7 +158,7 @@ if __name__ == '__main__':
         option "booking_method" "HIFO"
         option "inferred_tolerance_default" "USD:0.01"
 
-        plugin "beancount_reds_plugins.capital_gains_classifier.long_short" "{
+        plugin "magicbeans.capgains" "{
         'Income.*:CapGains': [':CapGains', ':CapGains:Short', ':CapGains:Long']
         }"
         """)
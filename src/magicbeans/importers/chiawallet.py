@@ -37,7 +37,6 @@ __license__ = "GNU GPLv2"
 import csv
 import datetime
 import decimal
-import itertools
 import logging
 import re
 from decimal import Decimal
@@ -54,7 +53,8 @@ import beangulp
 import beancount.core
 from beancount.core.number import ZERO, D
 from beangulp.testing import main
-from magicbeans import common
+from magicbeans import chunking, common
+from magicbeans.incremental import Watermark, WatermarkFilter
 from magicbeans.transfers import Link, Network
 from magicbeans.tripod import Tripod
 
@@ -63,6 +63,126 @@ from magicbeans.tripod import Tripod
 # report in UTC?
 rendered_tz = 'US/Pacific'
 
+def key_record(row, chiawallet_config):
+    """Return the key by which rows are grouped (see
+    ChiaWalletImporter.key_record())."""
+    # return row['time']
+    return row['time'] + str(
+            row['type'] in ['COINBASE_REWARD', 'FEE_REWARD']
+            or row['transaction'] in chiawallet_config['known_farming_reward_txs'])
+
+class RowGroup:
+    """Facts collected about a group of consecutive rows with the same key,
+    which together make up one transaction.  `index` is the row index of
+    the first row of the group.
+
+    Groups are collected per chunk of the file, so a group which crosses a
+    chunk boundary is collected in two parts and then merged."""
+
+    def __init__(self, key: str, index: int, first_row_time: str) -> None:
+        self.key = key
+        self.index = index
+        self.first_row_time = first_row_time
+        self.size = 0
+        self.amount_out = decimal.Decimal(0)
+        self.amount_in = decimal.Decimal(0)
+        self.has_coinbase_reward = False
+        self.has_outgoing_tx = False
+        self.has_incoming_tx = False
+        self.has_incoming_to_farmer_reward_addr = False
+        self.time = None
+        self.token_name = None
+
+    def add_row(self, row, chiawallet_config) -> None:
+        # n.b.: row['sent'] isn't what you think it is, and is irrelevant.
+        # It has to do with whether the tx has been sent to a node or something
+        # like that, not whether it is semantically a send transaction.
+
+        self.token_name = row['token_name']
+        if self.token_name in chiawallet_config['ignored_tokens']:
+            return
+        if not self.token_name in chiawallet_config['allowed_tokens']:
+            raise Exception("Token: {token_name} not recognized")
+
+        if row['transaction'] in chiawallet_config['blocklisted_txs']:
+            return
+
+        this_tx_time = datetime.datetime.fromisoformat(row['time'])
+        if not self.time in [None, this_tx_time]:
+            raise Exception("Transactions in a group must have the same time")
+        self.time = this_tx_time
+
+        amount = decimal.Decimal(row['amount'])
+        dst_addr = row['destination']
+        txtype = row['type']
+
+        # TODO: put this in the config
+        if amount < 0.000_000_000_010:
+            return
+
+        self.size += 1
+
+        if (txtype in ['COINBASE_REWARD', 'FEE_REWARD']):
+            # Block rewards should always go to reward addresses.
+            assert dst_addr in chiawallet_config['farming_reward_addrs']
+            self.has_coinbase_reward = True
+            self.amount_in += amount
+
+        elif (txtype in ['OUTGOING_TX']):
+            # Outgoing tx should never go to farming reward addresses.
+            assert not dst_addr in chiawallet_config['farming_reward_addrs']
+            self.has_outgoing_tx = True
+            self.amount_out += amount
+
+        elif (txtype in ['INCOMING_TX']):
+            # This is the tricky case.  An incoming tx can be:
+            # - an actual receipt of a coin
+            # - a pool reward, marked as a farming reward
+            # - a change coin which needs to be discarded later
+            # We have to sort these out later.
+            self.has_incoming_tx = True
+            self.has_incoming_to_farmer_reward_addr = \
+                dst_addr in chiawallet_config['farming_reward_addrs']
+            self.amount_in += amount
+
+        else:
+            assert False
+
+    def merge(self, other: 'RowGroup') -> None:
+        """Append the rows collected in another group, which must
+        immediately follow this one in the file."""
+        if other.time is not None:
+            if not self.time in [None, other.time]:
+                raise Exception("Transactions in a group must have the same time")
+            self.time = other.time
+        self.size += other.size
+        self.amount_out += other.amount_out
+        self.amount_in += other.amount_in
+        self.has_coinbase_reward |= other.has_coinbase_reward
+        self.has_outgoing_tx |= other.has_outgoing_tx
+        if other.has_incoming_tx:
+            self.has_incoming_tx = True
+            self.has_incoming_to_farmer_reward_addr = other.has_incoming_to_farmer_reward_addr
+        self.token_name = other.token_name
+
+def summarize_rows(rows, chiawallet_config):
+    """Group consecutive rows by key, and collect the facts about each group.
+    Returns the groups, and the number of rows read."""
+    groups = []
+    n_rows = 0
+    for index, row in enumerate(rows):
+        n_rows = index + 1
+        key = key_record(row, chiawallet_config)
+        if not groups or groups[-1].key != key:
+            groups.append(RowGroup(key, index, row['time']))
+        groups[-1].add_row(row, chiawallet_config)
+    return (groups, n_rows)
+
+def _summarize_chunk(byte_range, filepath, fieldnames, chiawallet_config):
+    """Summarize the row groups in one chunk of a file, in a worker process."""
+    rows = chunking.read_rows(filepath, fieldnames, byte_range)
+    return summarize_rows(rows, chiawallet_config)
+
 class ChiaWalletImporter(beangulp.Importer):
     """An importer for Chia Wallet csv transaction files.
     
@@ -94,7 +214,8 @@ class ChiaWalletImporter(beangulp.Importer):
                  account_gains, account_fees, network: Network,
                  config: Config = None,
                  chiawallet_config_path: str = None,
-                 chiawallet_config_dict: dict = None):
+                 chiawallet_config_dict: dict = None,
+                 parse_workers: int = None):
         self.account_root = account_root
         self.account_mining_income = account_mining_income
         self.account_gains = account_gains
@@ -102,6 +223,7 @@ class ChiaWalletImporter(beangulp.Importer):
         self.network = network
         if config:
             self.config = config
+        self.parse_workers = parse_workers  # Default: one per CPU
 
         if chiawallet_config_dict and chiawallet_config_path:
             raise ValueError("Cannot specify both chiawallet_config_path and chiawallet_config_dict")
@@ -148,203 +270,161 @@ class ChiaWalletImporter(beangulp.Importer):
     # farming rewards because that takes additional analysis, except for the case
     # of specifically enumerated farming reward tx's.
     def key_record(self, row):
-        # return row['time']
-        return row['time'] + str(
-                row['type'] in ['COINBASE_REWARD', 'FEE_REWARD']
-                or row['transaction'] in self.chiawallet_config['known_farming_reward_txs'])
+        return key_record(row, self.chiawallet_config)
 
     def extract(self, filepath, existing):
-        # Open the CSV file and create directives.
+        entries, _ = self.extract_incremental(filepath, existing, None)
+        return entries
+
+    def extract_incremental(self, filepath, existing, watermark: Watermark):
+        """Extract entries for row groups after the watermark (all if None).
+        Groups are identified by their grouping key (see key_record()).
+
+        Large files are split into chunks which are summarized in parallel
+        by worker processes (see chunking.py)."""
+        plan = chunking.plan_chunks(filepath, n_workers=self.parse_workers)
+        if plan is None:
+            # New direct from chia dump code
+            with open(filepath) as infile:
+                inreader = csv.DictReader(infile, delimiter=',', quotechar='"')
+                (groups, _) = summarize_rows(inreader, self.chiawallet_config)
+        else:
+            groups = []
+            n_rows = 0
+            for (chunk_groups, chunk_rows) in chunking.map_chunks(
+                    _summarize_chunk, plan, filepath, plan.fieldnames,
+                    self.chiawallet_config, n_workers=self.parse_workers):
+                for group in chunk_groups:
+                    group.index += n_rows
+                # Stitch together a group split across the chunk boundary.
+                if groups and chunk_groups and groups[-1].key == chunk_groups[0].key:
+                    groups[-1].merge(chunk_groups.pop(0))
+                groups.extend(chunk_groups)
+                n_rows += chunk_rows
+
+        # Create directives.
         entries = []
-        index = 0
-
-        # New direct from chia dump code
-        with open(filepath) as infile:
-            inreader = csv.DictReader(infile, delimiter=',', quotechar='"')
-            for key, group in itertools.groupby(inreader, key=self.key_record):
-                group_size = 0
-                amount_out = decimal.Decimal(0)
-                amount_in = decimal.Decimal(0)
-
-                # Collect some facts about this group of transactions.
-                has_coinbase_reward = False
-                has_outgoing_tx = False
-                has_incoming_tx = False
-                has_incoming_to_farmer_reward_addr = False
-
-                time = None
-
-                # TODO: change all asserts to exceptions
-
-                for row in group:
-                    # n.b.: row['sent'] isn't what you think it is, and is irrelevant.
-                    # It has to do with whether the tx has been sent to a node or something
-                    # like that, not whether it is semantically a send transaction.
-
-                    token_name = row['token_name']
-                    if token_name in self.chiawallet_config['ignored_tokens']:
-                        continue
-                    if not token_name in self.chiawallet_config['allowed_tokens']:
-                        raise Exception("Token: {token_name} not recognized")
-
-                    if row['transaction'] in self.chiawallet_config['blocklisted_txs']:
-                        continue
-
-                    this_tx_time = datetime.datetime.fromisoformat(row['time'])
-                    if not time in [None, this_tx_time]:
-                        raise Exception("Transactions in a group must have the same time")
-                    time = this_tx_time
-
-                    amount = decimal.Decimal(row['amount'])
-                    dst_addr = row['destination']
-                    txtype = row['type']
-
-                    # TODO: put this in the config
-                    if amount < 0.000_000_000_010:
-                        continue
-
-                    group_size += 1
-
-                    if (txtype in ['COINBASE_REWARD', 'FEE_REWARD']):
-                        # Block rewards should always go to reward addresses.
-                        assert dst_addr in self.chiawallet_config['farming_reward_addrs']
-                        has_coinbase_reward = True
-                        amount_in += amount
-
-                    elif (txtype in ['OUTGOING_TX']):
-                        # Outgoing tx should never go to farming reward addresses.
-                        assert not dst_addr in self.chiawallet_config['farming_reward_addrs']
-                        has_outgoing_tx = True
-                        amount_out += amount
-
-                    elif (txtype in ['INCOMING_TX']):
-                        # This is the tricky case.  An incoming tx can be:
-                        # - an actual receipt of a coin
-                        # - a pool reward, marked as a farming reward
-                        # - a change coin which needs to be discarded later
-                        # We have to sort these out later.
-                        has_incoming_tx = True
-                        has_incoming_to_farmer_reward_addr = \
-                            dst_addr in self.chiawallet_config['farming_reward_addrs']
-                        amount_in += amount
-
-                    else:
-                        assert False
-
-                # A group might be empty if it contained only (discarded) dust
-                if group_size == 0:
-                    continue
-
-                # These are illegal but shouldn't happen because coinbase rewards shouldn't
-                # ever get grouped with other transactions.
-                assert not (has_coinbase_reward and has_outgoing_tx)
-                assert not (has_coinbase_reward and has_incoming_tx)
-
-                # As of 2023.03.28, the Chia wallet still reports spends with change in a
-                # weird way.  The actual net spend amount is shown as a spend (amount_out),
-                # and the received change coin is shown as a received coin even though the
-                # gross spend coin doesn't show up at all.  This means essentially that we
-                # need to ignore the change coin because it should be subtracted from the
-                # spend coin that we don't see at all, while the send transaction we do see
-                # is already the net amount.
-                # 
-                # We can't really tell which coins are change coins, but if we assume that
-                # one block has at most one logical transaction (spend bundle) then any
-                # block with both an amount_in and amount_out must represent a spend with
-                # change.  Thus, we look for this case, and if we see it, we use the
-                # amount_out and ignore the amount_in.
-                #
-                # As a further complication, at this point we finally decide for certain
-                # ambiguous cases whether to treat an incoming tx as a farming reward.
-                # Specifically, an INCOMING_TX to a farming reward address could either
-                # be a pool payout, or a change coin from a spend.
-
-                is_farming_reward = False
-                if (amount_out > 0 and amount_in > 0):
-                    assert not has_coinbase_reward
-                    net_amount = -amount_out
-
-                elif (amount_out > 0):
-                    assert not has_coinbase_reward
-                    assert not has_incoming_tx
-                    net_amount = -amount_out
-
-                elif (amount_in > 0):
-                    assert not has_outgoing_tx
-                    net_amount = amount_in
-                    is_farming_reward = has_coinbase_reward or has_incoming_to_farmer_reward_addr 
-
-                else:
-                    assert False
-
-                rcvd_quantity = net_amount if net_amount > 0 else ''
-                rcvd_currency = token_name if net_amount > 0 else ''
-                sent_quantity = -net_amount if net_amount < 0 else ''
-                sent_currency = token_name if net_amount < 0 else ''
-
-                meta = beancount.core.data.new_metadata(filepath, index)
+        wm_filter = WatermarkFilter(watermark)
+        for group in groups:
+            group_time = pytz.timezone(rendered_tz).localize(
+                datetime.datetime.fromisoformat(group.first_row_time))
+            if not wm_filter.is_new(group_time.astimezone(pytz.utc), group.key):
+                continue
+
+            # A group might be empty if it contained only (discarded) dust
+            if group.size == 0:
+                continue
+
+            # These are illegal but shouldn't happen because coinbase rewards shouldn't
+            # ever get grouped with other transactions.
+            assert not (group.has_coinbase_reward and group.has_outgoing_tx)
+            assert not (group.has_coinbase_reward and group.has_incoming_tx)
+
+            # As of 2023.03.28, the Chia wallet still reports spends with change in a
+            # weird way.  The actual net spend amount is shown as a spend (amount_out),
+            # and the received change coin is shown as a received coin even though the
+            # gross spend coin doesn't show up at all.  This means essentially that we
+            # need to ignore the change coin because it should be subtracted from the
+            # spend coin that we don't see at all, while the send transaction we do see
+            # is already the net amount.
+            # 
+            # We can't really tell which coins are change coins, but if we assume that
+            # one block has at most one logical transaction (spend bundle) then any
+            # block with both an amount_in and amount_out must represent a spend with
+            # change.  Thus, we look for this case, and if we see it, we use the
+            # amount_out and ignore the amount_in.
+            #
+            # As a further complication, at this point we finally decide for certain
+            # ambiguous cases whether to treat an incoming tx as a farming reward.
+            # Specifically, an INCOMING_TX to a farming reward address could either
+            # be a pool payout, or a change coin from a spend.
+
+            is_farming_reward = False
+            if (group.amount_out > 0 and group.amount_in > 0):
+                assert not group.has_coinbase_reward
+                net_amount = -group.amount_out
+
+            elif (group.amount_out > 0):
+                assert not group.has_coinbase_reward
+                assert not group.has_incoming_tx
+                net_amount = -group.amount_out
+
+            elif (group.amount_in > 0):
+                assert not group.has_outgoing_tx
+                net_amount = group.amount_in
+                is_farming_reward = group.has_coinbase_reward or group.has_incoming_to_farmer_reward_addr 
+
+            else:
+                assert False
+
+            rcvd_quantity = net_amount if net_amount > 0 else ''
+            rcvd_currency = group.token_name if net_amount > 0 else ''
+            sent_quantity = -net_amount if net_amount < 0 else ''
+            sent_currency = group.token_name if net_amount < 0 else ''
+
+            meta = beancount.core.data.new_metadata(filepath, group.index)
+
+            local_dt = pytz.timezone(rendered_tz).localize(group.time)
+            utc_dt = local_dt.astimezone(pytz.timezone('UTC'))  # TODO: pytz.utc?
+            tripod = Tripod(rcvd_quantity, rcvd_currency,
+                            sent_quantity, sent_currency,
+                            '', '')
+            tag = 'mined' if is_farming_reward else 'transfer'
+            if tag == "mined":
+                assert tripod.is_transfer()
+
+            desc = ""
+            if tag == "mined":
+                desc = f"Mining reward of {tripod.amount()} {tripod.currency()}"
+            elif tripod.is_transfer():
+                desc = f"{tripod.narrate()}"
+            else:
+                desc = "Unexpected transaction??"
+
+            links = beancount.core.data.EMPTY_SET
+
+            if tripod.is_transfer():
+                account_int = beancount.core.account.join(
+                    self.account_root, tripod.currency())
 
-                local_dt = pytz.timezone(rendered_tz).localize(time)
-                utc_dt = local_dt.astimezone(pytz.timezone('UTC'))  # TODO: pytz.utc?
-                tripod = Tripod(rcvd_quantity, rcvd_currency,
-                                sent_quantity, sent_currency,
-                                '', '')
-                tag = 'mined' if is_farming_reward else 'transfer'
                 if tag == "mined":
-                    assert tripod.is_transfer()
-
-                desc = ""
-                if tag == "mined":
-                    desc = f"Mining reward of {tripod.amount()} {tripod.currency()}"
-                elif tripod.is_transfer():
-                    desc = f"{tripod.narrate()}"
+                    account_ext = beancount.core.account.join(
+                        self.account_mining_income, "USD")  # TODO
                 else:
-                    desc = "Unexpected transaction??"
-
-                links = beancount.core.data.EMPTY_SET
-
-                if tripod.is_transfer():
-                    account_int = beancount.core.account.join(
-                        self.account_root, tripod.currency())
-
-                    if tag == "mined":
-                        account_ext = beancount.core.account.join(
-                            self.account_mining_income, "USD")  # TODO
+                    if tripod.rcvd:
+                        account_ext = self.network.source(account_int, tripod.currency())
                     else:
-                        if tripod.rcvd:
-                            account_ext = self.network.source(account_int, tripod.currency())
-                        else:
-                            account_ext = self.network.target(account_int, tripod.currency())
-
-                    units = beancount.core.amount.Amount(tripod.amount(), tripod.currency())
-                    sign = Decimal(1 if tripod.rcvd else -1)
-
-                    xch_price = self.config.get_price_fetcher().get_price("XCH", utc_dt)
-                    if xch_price == None:
-                        xch_price = Decimal("0")
-                    mined_cost_basis = beancount.core.position.Cost(xch_price, "USD", None, None)
-
-                    txn = Transaction(meta, utc_dt.date(), beancount.core.flags.FLAG_OKAY,
-                                      None, desc, beancount.core.data.EMPTY_SET, links,
-                        [
-                            Posting(account_int,
-                                    beancount.core.amount.mul(units, sign),
-                                    mined_cost_basis if (tag == "mined") else common.usd_cost_spec(tripod.currency()),
-                                    None, None, None),
-                            Posting(account_ext,
-                                    None if (tag == "mined") else beancount.core.amount.mul(units, -sign),
-                                    None if (tag == "mined") else common.usd_cost_spec(tripod.currency()),
-                                    None, None, None),
-                        ],
-                    )
-                    common.attach_timestamp(txn, utc_dt)
-
-                elif tripod.is_transaction():
-                    assert False, "Unexpected transaction in wallet (expect transfers only)"
-
-                else:
-                    assert False, "not handled yet"
-
-                entries.append(txn)
-
-        return entries
\ No newline at end of file
+                        account_ext = self.network.target(account_int, tripod.currency())
+
+                units = beancount.core.amount.Amount(tripod.amount(), tripod.currency())
+                sign = Decimal(1 if tripod.rcvd else -1)
+
+                xch_price = self.config.get_price_fetcher().get_price("XCH", utc_dt)
+                if xch_price == None:
+                    xch_price = Decimal("0")
+                mined_cost_basis = beancount.core.position.Cost(xch_price, "USD", None, None)
+
+                txn = Transaction(meta, utc_dt.date(), beancount.core.flags.FLAG_OKAY,
+                                  None, desc, beancount.core.data.EMPTY_SET, links,
+                    [
+                        Posting(account_int,
+                                beancount.core.amount.mul(units, sign),
+                                mined_cost_basis if (tag == "mined") else common.usd_cost_spec(tripod.currency()),
+                                None, None, None),
+                        Posting(account_ext,
+                                None if (tag == "mined") else beancount.core.amount.mul(units, -sign),
+                                None if (tag == "mined") else common.usd_cost_spec(tripod.currency()),
+                                None, None, None),
+                    ],
+                )
+                common.attach_timestamp(txn, utc_dt)
+
+            elif tripod.is_transaction():
+                assert False, "Unexpected transaction in wallet (expect transfers only)"
+
+            else:
+                assert False, "not handled yet"
+
+            entries.append(txn)
+
+        return (entries, wm_filter.result())
@@ -20,33 +20,44 @@ from beancount.core.position import Cost
 from beancount.core.amount import Amount
 from beancount.core.number import ZERO, D
 from beangulp.testing import main
-from magicbeans import common
+from magicbeans import chunking, common
+from magicbeans.incremental import Watermark, WatermarkFilter
 from magicbeans.transfers import Link, Network
 
 
+# Start of the CSV header line, following the report's header cruft.
+coinbase_header_prefixes = [
+    # pre 2024
+    "Timestamp,Transaction Type,Asset,Quantity Transacted,",
+    # some time in 2024 they added "ID"
+    "ID,Timestamp,Transaction Type,Asset,Quantity Transacted,",
+]
+
 def coinbase_data_reader(reader):
     """A wrapper for a FileReader which will skip Coinbase CSV header cruft"""
     found_content = False
     for line in reader:
-        # pre 2024
-        if line.startswith("Timestamp,Transaction Type,Asset,Quantity Transacted,"):
-            found_content = True
-
-        # some time in 2024 they added "ID"
-        if line.startswith("ID,Timestamp,Transaction Type,Asset,Quantity Transacted,"):
+        if any(line.startswith(prefix) for prefix in coinbase_header_prefixes):
             found_content = True
 
         if found_content:
             yield line
 
+def _extract_chunk(byte_range, importer, filepath, fieldnames, watermark):
+    """Extract the entries for one chunk of a file, in a worker process."""
+    rows = chunking.read_rows(filepath, fieldnames, byte_range)
+    return importer.extract_rows(filepath, rows, watermark)
+
 class CoinbaseImporter(beangulp.Importer):
     """An importer for Coinbase CSV files."""
 
-    def __init__(self, account_root, account_gains, account_fees, network: Network):
+    def __init__(self, account_root, account_gains, account_fees, network: Network,
+                 parse_workers: int = None):
         self.account_root = account_root
         self.account_gains = account_gains
         self.account_fees = account_fees
         self.network = network
+        self.parse_workers = parse_workers  # Default: one per CPU
 
     def name(self) -> str:
         return 'Coinbase'
@@ -78,121 +89,154 @@ class CoinbaseImporter(beangulp.Importer):
         return datetime.datetime.strptime(m.group(1), "%Y-%m-%d").date()
 
     def extract(self, filepath, existing):
-        # Open the CSV file and create directives.
+        entries, _ = self.extract_incremental(filepath, existing, None)
+        return entries
+
+    def extract_incremental(self, filepath, existing, watermark: Watermark):
+        """Extract entries for rows after the watermark (all rows if None).
+        Rows are identified by the "ID" column where present (2024+ exports),
+        otherwise by timestamp alone.
+
+        Large files are split into chunks which are parsed in parallel by
+        worker processes (see chunking.py)."""
+        plan = chunking.plan_chunks(filepath, coinbase_header_prefixes, self.parse_workers)
+        if plan is None:
+            with open(filepath) as infile:
+                # TODO: this reader wrapper breaks the line numbers
+                reader = coinbase_data_reader(infile)
+                if "2024" in filepath:
+                    print(f"created reader for {filepath}")
+                (entries, wm_filter, _) = self.extract_rows(
+                    filepath, csv.DictReader(reader), watermark)
+            return (entries, wm_filter.result())
+
+        entries = []
+        wm_filter = WatermarkFilter(watermark)
+        n_rows = 0
+        for (chunk_entries, chunk_filter, chunk_rows) in chunking.map_chunks(
+                _extract_chunk, plan, self, filepath, plan.fieldnames, watermark,
+                n_workers=self.parse_workers):
+            chunking.offset_row_indexes(chunk_entries, n_rows)
+            entries.extend(chunk_entries)
+            wm_filter.merge(chunk_filter)
+            n_rows += chunk_rows
+        return (entries, wm_filter.result())
+
+    def extract_rows(self, filepath, rows, watermark: Watermark):
+        """Extract entries from an iterable of row dicts, indexing them from 0.
+        Returns the entries, the WatermarkFilter, and the number of rows."""
         entries = []
-        index = 0
-        with open(filepath) as infile:
-            # TODO: this reader wrapper breaks the line numbers
-            reader = coinbase_data_reader(infile)
-            if "2024" in filepath:
-                print(f"created reader for {filepath}")
-
-            for index, row in enumerate(csv.DictReader(reader)):
-                meta = data.new_metadata(filepath, index)
-
-                timestamp = dateutil.parser.parse(row["Timestamp"])
-                date = timestamp.date()
-                rtype = row["Transaction Type"].lstrip("Advanced Trade ")
-                instrument = row["Asset"]
-                quantity = D(row["Quantity Transacted"])
-                fees = row["Fees and/or Spread"]
-                asset_price_currency = next((row.get(k) for k in
-                    ['Spot Price Currency', 'Price Currency'] if k in row), "")
-                reported_asset_price = next((row.get(k) for k in
-                    ['Spot Price at Transaction', 'Price at Transaction'] if k in row), "")
-                subtotal = row['Subtotal']
-                total = row["Total (inclusive of fees and/or spread)"]
-
-                # Starting some time around 2024, Coinbase started prepending
-                # dollar signs to numbers even when they're defined by
-                # "Price Currency".
-                def make_D(price_str: str):
-                    return D(price_str.lstrip("$").replace("-$", "-"))
-                reported_asset_price = make_D(reported_asset_price)
-                subtotal = make_D(subtotal)
-                total = make_D(total)
-                fees = make_D(fees)
-
-                total_amount = common.rounded_amt(total, asset_price_currency)
-                units = common.rounded_amt(quantity, instrument)
-                fees = common.rounded_amt(D(fees), asset_price_currency)
-                account_cash = account.join(self.account_root, asset_price_currency)
-                account_inst = account.join(self.account_root, instrument)
-
-                desc = "CB: " + row["Notes"].replace("Bought", "Buy").replace("Sold", "Sell")
-                
-                # Excise the "on USD-ETH" or wahtever at the end
-                desc = re.sub(r" on [A-Z]+-[A-Z]+$", "", desc)
-
-                links = set()  # { "ut{0[REF #]}".format(row) }
-
-                # Map some synonyms
-                if rtype == "Withdrawal":
-                    rtype = "Send"
-                elif rtype == "Deposit":
-                    rtype = "Receive"
-                elif rtype == "Advance Trade Sell":
-                    rtype = "Sell"
-
-                if rtype in ("Send", "Receive"):
-                    assert fees.number == ZERO
-
-                    account_external = "UNDETERMINED"
-                    if rtype == "Send":
-                        account_external = self.network.target(account_inst, instrument)
-                    else:
-                        account_external = self.network.source(account_inst, instrument)
-
-                    sign = Decimal(1 if (rtype == "Receive") else -1)
-                    txn = data.Transaction(meta, date, flags.FLAG_OKAY,
-                                           None, desc, data.EMPTY_SET, links,
-                        [
-                            data.Posting(account_inst, amount.mul(units, sign),
-                                         common.usd_cost_spec(instrument), None, None, None),
-                            data.Posting(account_external, amount.mul(units, -sign),
-                                         common.usd_cost_spec(instrument), None, None, None),
-                        ],
-                    )
-
-                elif rtype in ("Buy", "Sell"):
-                    # Used as cost for buys, proceeds for sells.
-                    fee_adjusted_value = total / quantity
-                    desc += f' (@{reported_asset_price}, ' \
-                            f"w fees ~{fee_adjusted_value:.4f})"
-                            
-                    meta['fee-info'] = f"(fees={fees}, total={total}, subtotal={subtotal}); "\
-                        f"fee-adjusted per-unit value: {fee_adjusted_value} {asset_price_currency}"
-
-                    if rtype == "Buy":
-                        postings = [
-                            data.Posting(account_inst, units,
-                                        Cost(fee_adjusted_value, asset_price_currency, None, None),
-                                        None, None, None),
-                            data.Posting(account_cash, -total_amount,
-                                         None, None, None, None),
-                        ]
-                    else:
-                        postings = [
-                            data.Posting(account_inst, -units,
-                                        Cost(None, None, None, None),
-                                        Amount(fee_adjusted_value, asset_price_currency),
-                                        None, None),
-                            data.Posting(account_cash, total_amount,
-                                        None, None, None, None),
-                            data.Posting(self.account_gains,
-                                         None, None, None, None, None),
-                        ]
-
-                    txn = data.Transaction(meta, date, flags.FLAG_OKAY, None,
-                                           desc, data.EMPTY_SET, links, postings)
+        wm_filter = WatermarkFilter(watermark)
+        n_rows = 0
+        for index, row in enumerate(rows):
+            n_rows = index + 1
+            timestamp = dateutil.parser.parse(row["Timestamp"])
+            if not wm_filter.is_new(timestamp, row.get("ID")):
+                continue
+
+            meta = data.new_metadata(filepath, index)
+            date = timestamp.date()
+            rtype = row["Transaction Type"].lstrip("Advanced Trade ")
+            instrument = row["Asset"]
+            quantity = D(row["Quantity Transacted"])
+            fees = row["Fees and/or Spread"]
+            asset_price_currency = next((row.get(k) for k in
+                ['Spot Price Currency', 'Price Currency'] if k in row), "")
+            reported_asset_price = next((row.get(k) for k in
+                ['Spot Price at Transaction', 'Price at Transaction'] if k in row), "")
+            subtotal = row['Subtotal']
+            total = row["Total (inclusive of fees and/or spread)"]
+
+            # Starting some time around 2024, Coinbase started prepending
+            # dollar signs to numbers even when they're defined by
+            # "Price Currency".
+            def make_D(price_str: str):
+                return D(price_str.lstrip("$").replace("-$", "-"))
+            reported_asset_price = make_D(reported_asset_price)
+            subtotal = make_D(subtotal)
+            total = make_D(total)
+            fees = make_D(fees)
+
+            total_amount = common.rounded_amt(total, asset_price_currency)
+            units = common.rounded_amt(quantity, instrument)
+            fees = common.rounded_amt(D(fees), asset_price_currency)
+            account_cash = account.join(self.account_root, asset_price_currency)
+            account_inst = account.join(self.account_root, instrument)
+
+            desc = "CB: " + row["Notes"].replace("Bought", "Buy").replace("Sold", "Sell")
+            
+            # Excise the "on USD-ETH" or wahtever at the end
+            desc = re.sub(r" on [A-Z]+-[A-Z]+$", "", desc)
 
-                else:
-                    logging.error("Unknown row type: %s; skipping", rtype)
-                    continue
-                common.attach_timestamp(txn, timestamp)
-                entries.append(txn)
+            links = set()  # { "ut{0[REF #]}".format(row) }
 
-        return entries
+            # Map some synonyms
+            if rtype == "Withdrawal":
+                rtype = "Send"
+            elif rtype == "Deposit":
+                rtype = "Receive"
+            elif rtype == "Advance Trade Sell":
+                rtype = "Sell"
+
+            if rtype in ("Send", "Receive"):
+                assert fees.number == ZERO
+
+                account_external = "UNDETERMINED"
+                if rtype == "Send":
+                    account_external = self.network.target(account_inst, instrument)
+                else:
+                    account_external = self.network.source(account_inst, instrument)
+
+                sign = Decimal(1 if (rtype == "Receive") else -1)
+                txn = data.Transaction(meta, date, flags.FLAG_OKAY,
+                                       None, desc, data.EMPTY_SET, links,
+                    [
+                        data.Posting(account_inst, amount.mul(units, sign),
+                                     common.usd_cost_spec(instrument), None, None, None),
+                        data.Posting(account_external, amount.mul(units, -sign),
+                                     common.usd_cost_spec(instrument), None, None, None),
+                    ],
+                )
+
+            elif rtype in ("Buy", "Sell"):
+                # Used as cost for buys, proceeds for sells.
+                fee_adjusted_value = total / quantity
+                desc += f' (@{reported_asset_price}, ' \
+                        f"w fees ~{fee_adjusted_value:.4f})"
+                        
+                meta['fee-info'] = f"(fees={fees}, total={total}, subtotal={subtotal}); "\
+                    f"fee-adjusted per-unit value: {fee_adjusted_value} {asset_price_currency}"
+
+                if rtype == "Buy":
+                    postings = [
+                        data.Posting(account_inst, units,
+                                    Cost(fee_adjusted_value, asset_price_currency, None, None),
+                                    None, None, None),
+                        data.Posting(account_cash, -total_amount,
+                                     None, None, None, None),
+                    ]
+                else:
+                    postings = [
+                        data.Posting(account_inst, -units,
+                                    Cost(None, None, None, None),
+                                    Amount(fee_adjusted_value, asset_price_currency),
+                                    None, None),
+                        data.Posting(account_cash, total_amount,
+                                    None, None, None, None),
+                        data.Posting(self.account_gains,
+                                     None, None, None, None, None),
+                    ]
+
+                txn = data.Transaction(meta, date, flags.FLAG_OKAY, None,
+                                       desc, data.EMPTY_SET, links, postings)
+
+            else:
+                logging.error("Unknown row type: %s; skipping", rtype)
+                continue
+            common.attach_timestamp(txn, timestamp)
+            entries.append(txn)
+
+        return (entries, wm_filter, n_rows)
 
     # Example usage; also enables running integration tests
     @staticmethod
@@ -29,6 +29,7 @@ from beangulp.testing import main
 from magicbeans import common
 from magicbeans.common import usd_cost_spec
 from magicbeans.config import Config
+from magicbeans.incremental import Watermark, WatermarkFilter
 from magicbeans.transfers import Link, Network
 import pytz
 
@@ -62,9 +63,17 @@ class CoinbaseProImporter(beangulp.Importer):
 
     # TODO: we could probably clean a lot of this up by using Tripod.
     def extract(self, file, existing_entries=None) -> list:
+        entries, _ = self.extract_incremental(file, existing_entries, None)
+        return entries
+
+    def extract_incremental(self, file, existing_entries, watermark: Watermark):
+        """Extract entries for records after the watermark (all if None).
+        Transfers are identified by transfer id, and trades by order id at
+        the timestamp of the order's first row."""
         with open(file, 'r') as _file:
             transactions = list(csv.DictReader(_file))
         entries = []
+        wm_filter = WatermarkFilter(watermark)
         # Multiple rows representing legs or execution of the same logical transaction
         # are grouped by "order id".  Transfers have no order id, but instead, a
         # "transfer id", which seems to be unique (transfers do not seem to need
@@ -79,6 +88,8 @@ class CoinbaseProImporter(beangulp.Importer):
             if order_id == '':
                 for transfer in transfers:
                     tx_ts = dateutil.parser.parse(transfer["time"]).astimezone(pytz.utc)
+                    if not wm_filter.is_new(tx_ts, transfer['transfer id']):
+                        continue
 
                     value = D(transfer['amount'])
                     currency = transfer['amount/balance unit']
@@ -122,6 +133,11 @@ class CoinbaseProImporter(beangulp.Importer):
                     entries.append(tx)
 
             else:
+                transfers = list(transfers)
+                order_ts = dateutil.parser.parse(transfers[0]["time"]).astimezone(pytz.utc)
+                if not wm_filter.is_new(order_ts, order_id):
+                    continue
+
                 fee_amount = D("0")
                 fee_currency = None
                 increase_amount = D("0")
@@ -261,7 +277,7 @@ class CoinbaseProImporter(beangulp.Importer):
 
                 entries.append(tx)
 
-        return entries
+        return (entries, wm_filter.result())
     
 if __name__ == "__main__":
     main(CoinbaseProImporter.test_instance())
@@ -16,6 +16,7 @@ import sys
 from os import path
 from magicbeans import common
 from magicbeans.config import Config
+from magicbeans.incremental import Watermark
 from magicbeans.transfers import Link, Network
 from magicbeans.tripod import Tripod
 from beancount.core.data import Posting
@@ -113,6 +114,21 @@ class GateIOImporter(beangulp.Importer):
         return self.account_root
 
     def extract(self, filepath, existing):
+        entries, _ = self.extract_incremental(filepath, existing, None)
+        return entries
+
+    def entry_key(self, entry):
+        return entry.meta.get("orderid")
+
+    def extract_incremental(self, filepath, existing, watermark: Watermark):
+        """Extract entries for orders with rows at or after the watermark
+        (all if None).
+
+        Rows are aggregated per order, and an export may end partway through
+        an order's rows, so the watermark is the timestamp of the latest row,
+        and any order with rows at or after it is extracted again, from all
+        its rows, to replace the entry extracted before (see entry_key()).
+        (The "no" column is not reliably populated in exports.)"""
         # Might be worth pulling this out into tripod.py as a Tripod-set builder.
         order_ids = set()
         rcvd_amt = DecDict()
@@ -135,21 +151,37 @@ class GateIOImporter(beangulp.Importer):
 
         entries = []
         with open(filepath) as infile:
+            rows = list(csv.DictReader(infile))
+
+            # Orders with rows at or after the watermark.  Timestamps are
+            # compared as rendered, which sort as they're formatted.
+            open_oids = None
+            if watermark:
+                wm_time = watermark.timestamp.astimezone(
+                    pytz.timezone(rendered_tz)).strftime('%Y-%m-%d %H:%M:%S')
+                open_oids = {row['action_data'] for row in rows if row['time'] >= wm_time}
+
             # Phase one: accumulate amounts on order IDs
-            for index, row in enumerate(csv.DictReader(infile)):
+            latest_dt = watermark.timestamp if watermark else None
+            for index, row in enumerate(rows):
                 # Order ID identifies the user-initiated action that led to the
                 # transactions in order execution.
                 oid = row['action_data']
-                order_ids.add(oid)
-
-                meta = data.new_metadata(filepath, index)
-                if oid not in metadata_dict:
-                    metadata_dict[oid] = meta
+                if open_oids is not None and oid not in open_oids:
+                    continue
 
                 # Translate timestamps and record timestamp windows
                 naive_dt = datetime.datetime.strptime(row['time'], '%Y-%m-%d %H:%M:%S')
                 local_dt = pytz.timezone(rendered_tz).localize(naive_dt)
                 utc_dt = local_dt.astimezone(pytz.timezone('UTC'))
+
+                if latest_dt is None or latest_dt < utc_dt:
+                    latest_dt = utc_dt
+
+                order_ids.add(oid)
+                if oid not in metadata_dict:
+                    metadata_dict[oid] = data.new_metadata(filepath, index, {'orderid': oid})
+
                 if not oid in tx_ts_min or tx_ts_min[oid] > utc_dt:
                     tx_ts_min[oid] = utc_dt
                 if not oid in tx_ts_max or tx_ts_max[oid] < utc_dt:
@@ -304,4 +336,4 @@ class GateIOImporter(beangulp.Importer):
 
                 entries.append(tx)
 
-        return entries
\ No newline at end of file
+        return (entries, Watermark(latest_dt, frozenset()) if latest_dt else None)
\ No newline at end of file
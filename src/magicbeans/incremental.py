@@ -0,0 +1,204 @@
+"""Watermark-based incremental importing of growing exchange exports.
+
+Many exchanges only offer a full-history export, so each new download is a
+superset of the previous one.  Rather than reparsing the whole history on
+every run, an importer can remember a per-source watermark (the timestamp of
+the last record it imported, plus the IDs of the records at exactly that
+timestamp), skip everything up to the watermark while reading, and append
+only the new entries to a cached extraction.
+
+Importers opt in by implementing:
+
+    extract_incremental(filepath, existing, watermark) -> (entries, watermark)
+
+where the incoming watermark may be None (import everything), and the
+returned watermark covers everything imported so far.
+
+Importers whose entries aggregate several records (e.g., an order and its
+fills) may see an entry's records split across two exports.  Such importers
+re-extract the entries with records at or after the watermark, and also
+implement:
+
+    entry_key(entry) -> Optional[str]
+
+identifying the entry (e.g., by order ID), so that re-extracted entries
+replace the cached ones rather than being appended again.
+"""
+
+import datetime
+import json
+import os
+import re
+from typing import Callable, Dict, FrozenSet, List, NamedTuple, Optional
+
+import dateutil.parser
+
+from beancount.core import data
+from beancount.parser import parser
+from magicbeans import writer
+
+
+class Watermark(NamedTuple):
+    """The point up to which a source has already been imported.
+
+    `timestamp` is the (timezone aware) timestamp of the most recent imported
+    record, and `row_ids` holds the IDs of all imported records carrying
+    exactly that timestamp.  Sources without usable record IDs leave `row_ids`
+    empty, in which case all records at the watermark timestamp are treated
+    as already imported."""
+    timestamp: datetime.datetime
+    row_ids: FrozenSet[str]
+
+    def to_json(self) -> dict:
+        return {"timestamp": self.timestamp.isoformat(),
+                "row_ids": sorted(self.row_ids)}
+
+    @staticmethod
+    def from_json(obj: dict) -> 'Watermark':
+        return Watermark(dateutil.parser.isoparse(obj["timestamp"]),
+                         frozenset(obj["row_ids"]))
+
+
+class WatermarkFilter:
+    """Decides which records are new relative to a watermark, and tracks
+    the watermark to persist after the records have been imported.
+
+    Records may be presented in any order; the resulting watermark is the
+    latest timestamp seen, along with the IDs seen at that timestamp."""
+
+    def __init__(self, watermark: Optional[Watermark]):
+        self.watermark = watermark
+        self.n_skipped = 0
+        self._latest_ts = watermark.timestamp if watermark else None
+        self._latest_ids = set(watermark.row_ids) if watermark else set()
+
+    def is_new(self, timestamp: datetime.datetime, row_id: str = None) -> bool:
+        """Return True if the record has not been imported yet.  New records
+        advance the resulting watermark."""
+        wm = self.watermark
+        if wm is not None:
+            if (timestamp < wm.timestamp or
+                    (timestamp == wm.timestamp and
+                     (not row_id or row_id in wm.row_ids))):
+                self.n_skipped += 1
+                return False
+        self._advance(timestamp, row_id)
+        return True
+
+    def _advance(self, timestamp: datetime.datetime, row_id: Optional[str]):
+        if self._latest_ts is None or timestamp > self._latest_ts:
+            self._latest_ts = timestamp
+            self._latest_ids = set()
+        if timestamp == self._latest_ts and row_id:
+            self._latest_ids.add(row_id)
+
+    def merge(self, other: 'WatermarkFilter') -> None:
+        """Fold in the progress of another filter that started from the same
+        watermark (e.g., one which processed a different chunk of a file)."""
+        self.n_skipped += other.n_skipped
+        if other._latest_ts is not None:
+            self._advance(other._latest_ts, None)
+            if other._latest_ts == self._latest_ts:
+                self._latest_ids.update(other._latest_ids)
+
+    def result(self) -> Optional[Watermark]:
+        """Return the watermark covering everything seen so far."""
+        if self._latest_ts is None:
+            return None
+        return Watermark(self._latest_ts, frozenset(self._latest_ids))
+
+
+def source_key(importer, filepath: str) -> str:
+    """Return the key identifying a source.
+
+    Successive exports of the same account have different filenames, so
+    sources are identified by importer and account rather than by file."""
+    key = f"{importer.name()}-{importer.account(filepath)}"
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", key)
+
+
+class WatermarkStore:
+    """Persists watermarks and cached extractions for incremental imports.
+
+    Everything lives in one directory: a watermarks.json file mapping source
+    keys to watermarks, and one <source>.beancount file per source holding
+    all entries extracted from that source so far."""
+
+    def __init__(self, cache_dir: str) -> None:
+        self.cache_dir = cache_dir
+        self.index_path = os.path.join(cache_dir, "watermarks.json")
+        self.watermarks: Dict[str, Watermark] = {}
+
+        os.makedirs(cache_dir, exist_ok=True)
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                for (source, obj) in json.load(f).items():
+                    self.watermarks[source] = Watermark.from_json(obj)
+
+    def get(self, source: str) -> Optional[Watermark]:
+        return self.watermarks.get(source)
+
+    def set(self, source: str, watermark: Optional[Watermark]) -> None:
+        if watermark is not None:
+            self.watermarks[source] = watermark
+
+    def save(self) -> None:
+        """Write the watermarks to disk.  Call this only once the new
+        entries have been appended to the cached extractions."""
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({source: wm.to_json() for (source, wm) in self.watermarks.items()},
+                      f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.index_path)
+
+    def cache_path(self, source: str) -> str:
+        return os.path.join(self.cache_dir, f"{source}.beancount")
+
+    def append_entries(self, source: str, entries: data.Entries) -> None:
+        with open(self.cache_path(source), "a", buffering=writer.BUFFER_SIZE) as out:
+            writer.write_entries(entries, out)
+
+    def replace_entries(self, source: str, entries: data.Entries,
+                        key: Callable[[data.Directive], Optional[str]]) -> None:
+        """Add the entries to the cached extraction, replacing any cached
+        entries with the same key.  The cache is only rewritten if there
+        are any to replace."""
+        keys = {key(entry) for entry in entries} - {None}
+        cached = self.load_entries(source) if keys else []
+        if not any(key(entry) in keys for entry in cached):
+            self.append_entries(source, entries)
+            return
+        path = self.cache_path(source)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", buffering=writer.BUFFER_SIZE) as out:
+            writer.write_entries([e for e in cached if key(e) not in keys] + entries, out)
+        os.replace(tmp_path, path)
+
+    def load_entries(self, source: str) -> data.Entries:
+        path = self.cache_path(source)
+        if not os.path.exists(path):
+            return []
+        entries, errors, _ = parser.parse_file(path)
+        if errors:
+            raise Exception(f"Errors parsing cached extraction {path}: {errors}")
+        return entries
+
+
+def extract_new_entries(importer, filepath: str, store: WatermarkStore) -> data.Entries:
+    """Extract the entries of a file newer than its source's watermark,
+    add them to the source's cached extraction (replacing re-extracted
+    ones, for importers with entry keys), and advance the watermark.
+    Returns the newly extracted entries."""
+    source = source_key(importer, filepath)
+    entries, watermark = importer.extract_incremental(filepath, [], store.get(source))
+    importer.sort(entries)
+    for entry in entries:
+        data.sanity_check_types(entry)
+
+    if entries and hasattr(importer, "entry_key"):
+        store.replace_entries(source, entries, importer.entry_key)
+    elif entries:
+        store.append_entries(source, entries)
+    store.set(source, watermark)
+    store.save()
+    return entries
@@ -0,0 +1,213 @@
+"""Lot lifetimes, for inventory snapshots at arbitrary times.
+
+The detailed log shows, on each page, the inventory of every account as of
+the page's first timestamp.  Computing that with
+summarize.balance_by_account() replays the ledger from the start, once per
+page, and audit questions ("which lots did account X hold at time T?") cost
+the same.
+
+A LotLifetimes index is built in one pass over the booked entries.  Each
+position (account, currency and cost, as keyed in an Inventory) has one or
+more lifetimes: runs over which its quantity is nonzero, with sorted arrays
+of the points at which the quantity changed and the quantities since.  The
+lifetimes are held in an interval tree, so a snapshot finds the positions
+held at a point in O(log n + k) for k positions held, rather than O(n) in
+the length of the ledger.
+
+Points in time are positions in the entries list: the inventory "at" point
+i is the balance of entries[:i], i.e., as balance_by_account() returns when
+stopping at entry i.  Timestamps and dates are mapped to points as that
+function's stop conditions would, by bisection.
+"""
+
+import bisect
+import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+import dateutil.parser
+
+from beancount.core.amount import Amount
+from beancount.core.data import Entries, Transaction
+from beancount.core.inventory import Inventory
+from beancount.core.position import Cost, Position
+
+
+class Lifetime:
+    """A run of a position over which its quantity is nonzero.
+
+    `start` is the first point at which the position is held, and `end` the
+    first at which it no longer is (or None if still held at the end of the
+    ledger).  The quantity is `numbers[i]` from point `changes[i]` on."""
+
+    __slots__ = ("seq", "account", "currency", "cost", "start", "end", "changes", "numbers")
+
+    def __init__(self, seq: int, account: str, currency: str, cost: Optional[Cost],
+                 start: int, number: Decimal) -> None:
+        self.seq = seq      # Order of opening, over all lifetimes
+        self.account = account
+        self.currency = currency
+        self.cost = cost
+        self.start = start
+        self.end: Optional[int] = None
+        self.changes = [start]
+        self.numbers = [number]
+
+    def number_at(self, point: int) -> Decimal:
+        """Return the quantity held at a point within the lifetime."""
+        return self.numbers[bisect.bisect_right(self.changes, point) - 1]
+
+    def position_at(self, point: int) -> Position:
+        return Position(Amount(self.number_at(point), self.currency), self.cost)
+
+    def __repr__(self) -> str:
+        return (f"Lifetime({self.account}, {self.currency} {{{self.cost}}}, "
+                f"[{self.start}, {self.end}))")
+
+
+class _Node:
+    """A node of a (static, centered) interval tree of lifetimes."""
+
+    __slots__ = ("center", "by_start", "by_end", "left", "right")
+
+    def __init__(self, lifetimes: List[Lifetime], end_of_ledger: int) -> None:
+        starts = sorted(lt.start for lt in lifetimes)
+        self.center = starts[len(starts) // 2]
+        end = lambda lt: end_of_ledger if lt.end is None else lt.end
+        here = []
+        left = []
+        right = []
+        for lt in lifetimes:
+            # Those starting at the center stay here, so that each child
+            # has fewer lifetimes than this node.
+            if lt.start < self.center and end(lt) <= self.center:
+                left.append(lt)
+            elif lt.start > self.center:
+                right.append(lt)
+            else:
+                here.append(lt)
+        self.by_start = sorted(here, key=lambda lt: lt.start)
+        self.by_end = sorted(here, key=end, reverse=True)
+        self.left = _Node(left, end_of_ledger) if left else None
+        self.right = _Node(right, end_of_ledger) if right else None
+
+    def stab(self, point: int, end_of_ledger: int, found: List[Lifetime]) -> None:
+        """Collect the lifetimes containing the point."""
+        node = self
+        while node is not None:
+            if point < node.center:
+                # All lifetimes here end after the center.
+                for lt in node.by_start:
+                    if lt.start > point:
+                        break
+                    found.append(lt)
+                node = node.left
+            else:
+                # All lifetimes here start at or before the center.
+                for lt in node.by_end:
+                    if (end_of_ledger if lt.end is None else lt.end) <= point:
+                        break
+                    found.append(lt)
+                node = node.right
+
+
+class LotLifetimes:
+    """Lifetimes of all positions in a booked ledger, indexed by time."""
+
+    def __init__(self, entries: Entries, numeraire: str) -> None:
+        self.numeraire = numeraire
+        self.n_points = len(entries) + 1
+        self.lifetimes: List[Lifetime] = []
+        self._accounts: Dict[str, int] = {}    # Account -> order of first posting
+
+        # Points of timestamped entries, and the running maximum of their
+        # timestamps (for bisection), and the dates of all entries.
+        self._ts_points: List[int] = []
+        self._ts_max: List[datetime.datetime] = []
+        self._dates = [entry.date for entry in entries]
+
+        held: Dict[Tuple[str, str, Optional[Cost]], Lifetime] = {}
+        for (i, entry) in enumerate(entries):
+            timestamp = entry.meta.get("timestamp") if entry.meta else None
+            if timestamp:
+                ts = dateutil.parser.parse(timestamp)
+                self._ts_points.append(i)
+                self._ts_max.append(max(ts, self._ts_max[-1]) if self._ts_max else ts)
+            if not isinstance(entry, Transaction):
+                continue
+            point = i + 1
+            for posting in entry.postings:
+                self._accounts.setdefault(posting.account, len(self._accounts))
+                key = (posting.account, posting.units.currency, posting.cost)
+                lt = held.get(key)
+                if lt is None:
+                    if posting.units.number:
+                        lt = held[key] = Lifetime(len(self.lifetimes), posting.account,
+                                                  posting.units.currency, posting.cost, point,
+                                                  posting.units.number)
+                        self.lifetimes.append(lt)
+                    continue
+                number = lt.numbers[-1] + posting.units.number
+                if not number:
+                    lt.end = point
+                    del held[key]
+                elif lt.changes[-1] == point:
+                    lt.numbers[-1] = number
+                else:
+                    lt.changes.append(point)
+                    lt.numbers.append(number)
+
+        # A position opened and closed by the same entry (e.g., a transfer
+        # passing through an account) is never held at any point.
+        self.lifetimes = [lt for lt in self.lifetimes if lt.end != lt.start]
+        self._tree = _Node(self.lifetimes, self.n_points) if self.lifetimes else None
+
+    #
+    # Points in time
+    #
+
+    def point_at_ts(self, ts: datetime.datetime) -> int:
+        """Return the point of the first entry timestamped at or after ts
+        (or the end of the ledger)."""
+        k = bisect.bisect_left(self._ts_max, ts)
+        return self._ts_points[k] if k < len(self._ts_points) else self.n_points - 1
+
+    def point_at_date(self, date: datetime.date) -> int:
+        """Return the point of the first entry on or after the date."""
+        return bisect.bisect_left(self._dates, date)
+
+    #
+    # Queries
+    #
+
+    def held_at(self, point: int) -> List[Lifetime]:
+        """Return the lifetimes of the positions held at the point, in the
+        order they were opened."""
+        found: List[Lifetime] = []
+        if self._tree is not None:
+            self._tree.stab(point, self.n_points, found)
+        found.sort(key=lambda lt: lt.seq)
+        return found
+
+    def inventories_at(self, point: int, include_numeraire: bool = False
+                       ) -> Dict[str, Inventory]:
+        """Return the inventories by account at the point, as
+        balance_by_account() would.  Accounts holding nothing, or only the
+        numeraire (unless `include_numeraire`), are left out."""
+        by_account: Dict[str, Inventory] = {}
+        for lt in self.held_at(point):
+            inventory = by_account.setdefault(lt.account, Inventory())
+            inventory[(lt.currency, lt.cost)] = lt.position_at(point)
+        if not include_numeraire:
+            for (account, inventory) in list(by_account.items()):
+                if all(p.units.currency == self.numeraire for p in inventory):
+                    by_account.pop(account)
+        return dict(sorted(by_account.items(), key=lambda item: self._accounts[item[0]]))
+
+    def inventories_at_ts(self, ts: datetime.datetime) -> Dict[str, Inventory]:
+        return self.inventories_at(self.point_at_ts(ts))
+
+    def lots_held(self, account: str, ts: datetime.datetime) -> List[Position]:
+        """Return the positions held in the account at the timestamp."""
+        point = self.point_at_ts(ts)
+        return [lt.position_at(point) for lt in self.held_at(point) if lt.account == account]
@@ -0,0 +1,191 @@
+"""Lot lineage: the history of each lot from acquisition to disposal.
+
+Lots move between accounts through transfers, often via the zero-sum
+Assets:Xfer:* buffer accounts of a transfers.Network, and are disposed of in
+pieces.  To audit a disposal, one needs the history of the disposed lot:
+where and when it was acquired, which accounts it passed through, and what
+other parts of it were disposed of.
+
+A LotLineage is built in one forward pass over the booked entries.  Lots are
+identified as in disposals.LotRegistry (by currency and Cost; a transfer
+preserves the Cost, and thus the identity of the lot), so each lot's history
+is found from a disposal leg with one dict lookup.
+"""
+
+import json
+from decimal import Decimal
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, TextIO
+
+from beancount.core.data import Posting, Transaction
+from beancount.core.position import Cost
+from magicbeans.disposals import ASSETS_ACCOUNT, LotRegistry, is_disposal_tx
+from magicbeans.transfers import Network
+
+# Kinds of lot events
+ACQUIRE = "acquire"
+TRANSFER = "transfer"
+DISPOSE = "dispose"
+REDUCE = "reduce"    # Reductions which are neither transfers nor disposals (e.g., fees)
+
+
+class LotEvent(NamedTuple):
+    """One step in the history of a lot.
+
+    For acquisitions `from_account` is None, and for disposals and other
+    reductions `to_account` is None.  `units` is always positive."""
+    kind: str
+    entry: Transaction
+    from_account: Optional[str]
+    to_account: Optional[str]
+    units: Decimal
+
+    def to_json(self) -> dict:
+        return {
+            "kind": self.kind,
+            "date": self.entry.date.isoformat(),
+            "timestamp": self.entry.meta.get("timestamp"),
+            "narration": self.entry.narration,
+            "from": self.from_account,
+            "to": self.to_account,
+            "units": str(self.units),
+        }
+
+
+class LotHistory:
+    """The events of one lot, in ledger order."""
+
+    def __init__(self, lotid: int, currency: str, cost: Cost) -> None:
+        self.lotid = lotid
+        self.currency = currency
+        self.cost = cost
+        self.events: List[LotEvent] = []
+
+    def acquisitions(self) -> List[LotEvent]:
+        return [e for e in self.events if e.kind == ACQUIRE]
+
+    def transfers(self) -> List[LotEvent]:
+        return [e for e in self.events if e.kind == TRANSFER]
+
+    def disposals(self) -> List[LotEvent]:
+        return [e for e in self.events if e.kind == DISPOSE]
+
+    def to_json(self) -> dict:
+        return {
+            "lotid": self.lotid,
+            "currency": self.currency,
+            "cost": str(self.cost.number),
+            "cost_currency": self.cost.currency,
+            "acquired": self.cost.date.isoformat() if self.cost.date else None,
+            "events": [e.to_json() for e in self.events],
+        }
+
+
+class LotLineage:
+    """Histories of all lots in a booked ledger.
+
+    Within each transaction, reductions and augmentations of the same lot
+    are paired up as transfer hops; other augmentations are acquisitions,
+    and other reductions are disposals (in disposal transactions) or plain
+    reductions (e.g., transfer fees).  If a Network is provided, hops into
+    or out of its buffer accounts are recognized as such by
+    is_buffer_account(); otherwise any Assets:Xfer:* account is a buffer.
+    """
+
+    def __init__(self, entries: Sequence[Transaction], registry: LotRegistry,
+                 network: Network = None) -> None:
+        self.registry = registry
+        self.numeraire = registry.numeraire
+        if network:
+            self._buffer_accounts = set(network.buffer_accounts())
+        else:
+            self._buffer_accounts = None
+        self._histories: Dict[int, LotHistory] = {}
+
+        for entry in entries:
+            if isinstance(entry, Transaction):
+                self._add_transaction(entry)
+
+    def _is_lot_posting(self, posting: Posting) -> bool:
+        return (posting.account.startswith(ASSETS_ACCOUNT)
+                and isinstance(posting.cost, Cost)
+                and posting.cost.number is not None
+                and posting.units.currency != self.numeraire)
+
+    def _history(self, posting: Posting) -> Optional[LotHistory]:
+        lotid = self.registry.get_lotid(posting.units.currency, posting.cost)
+        if lotid is None:
+            return None
+        history = self._histories.get(lotid)
+        if history is None:
+            (currency, cost) = self.registry.get_lot(lotid)
+            history = self._histories[lotid] = LotHistory(lotid, currency, cost)
+        return history
+
+    def _add_transaction(self, entry: Transaction) -> None:
+        # Group the transaction's lot postings by lot, then pair up
+        # reductions and augmentations of each lot in posting order.
+        reductions: Dict[int, List[Posting]] = {}
+        augmentations: Dict[int, List[Posting]] = {}
+        for posting in entry.postings:
+            if not self._is_lot_posting(posting):
+                continue
+            history = self._history(posting)
+            if history is None:
+                continue
+            by_lot = augmentations if posting.units.number > 0 else reductions
+            by_lot.setdefault(history.lotid, []).append(posting)
+
+        disposal = is_disposal_tx(entry)
+        for lotid in list(reductions) + [k for k in augmentations if k not in reductions]:
+            history = self._histories[lotid]
+            reduced = reductions.get(lotid, [])
+            augmented = augmentations.get(lotid, [])
+            n_hops = 0 if disposal else min(len(reduced), len(augmented))
+            for (src, dst) in zip(reduced[:n_hops], augmented[:n_hops]):
+                history.events.append(LotEvent(
+                    TRANSFER, entry, src.account, dst.account, dst.units.number))
+            for posting in reduced[n_hops:]:
+                history.events.append(LotEvent(
+                    DISPOSE if disposal else REDUCE, entry,
+                    posting.account, None, -posting.units.number))
+            for posting in augmented[n_hops:]:
+                history.events.append(LotEvent(
+                    ACQUIRE, entry, None, posting.account, posting.units.number))
+
+    def is_buffer_account(self, account: str) -> bool:
+        if self._buffer_accounts is not None:
+            return account in self._buffer_accounts
+        return account.startswith("Assets:Xfer:")
+
+    def __len__(self) -> int:
+        return len(self._histories)
+
+    def history(self, currency: str, cost: Cost) -> Optional[LotHistory]:
+        """Return the history of the lot, or None if it's not in the ledger."""
+        lotid = self.registry.get_lotid(currency, cost)
+        return self._histories.get(lotid) if lotid is not None else None
+
+    def history_of(self, posting: Posting) -> Optional[LotHistory]:
+        """Return the history of the lot of a posting (e.g., a disposal leg)."""
+        return self.history(posting.units.currency, posting.cost)
+
+    def path(self, history: LotHistory, exclude_buffers: bool = False) -> List[str]:
+        """Return the accounts the lot has been held in, in order of arrival."""
+        accounts = []
+        for event in history.events:
+            if event.to_account and event.to_account not in accounts:
+                if not (exclude_buffers and self.is_buffer_account(event.to_account)):
+                    accounts.append(event.to_account)
+        return accounts
+
+    def histories(self) -> Iterator[LotHistory]:
+        """Yield all lot histories, in order of lot ID."""
+        for lotid in sorted(self._histories):
+            yield self._histories[lotid]
+
+    def write_jsonl(self, out: TextIO) -> None:
+        """Export the lineage graph, one JSON object per lot per line.  Lots
+        are nodes, and their events are edges between accounts."""
+        for history in self.histories():
+            out.write(json.dumps(history.to_json()))
+            out.write("\n")
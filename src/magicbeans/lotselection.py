@@ -0,0 +1,339 @@
+"""Explicit lot selection for reductions, ahead of booking.
+
+Beancount books an ambiguous reduction (e.g., `-1 BTC {}`) according to the
+ledger's `booking_method`, which offers only a few fixed strategies.  This
+module instead picks the lots itself, and writes the chosen costs back into
+the (unbooked) postings, so that booking then just matches the specified
+lots.  A reduction spanning several lots is split into one posting per lot,
+and the `{}` augmentation legs of transfers are split alike, so transferred
+lots keep their cost basis.
+
+Lots are tracked per account and currency in heaps ordered for the selection
+strategy, so each lot selected costs O(log n) in the number of lots held.
+Strategies which care about the holding period keep separate heaps for
+short-term and long-term lots, and move lots from one to the other (in
+acquisition order) as time passes.
+
+All reductions are selected for, not only those in capital gains
+transactions, since transfers and fees determine which lots remain to be
+disposed of later.  Where a reduction has no sale price (e.g., a transfer),
+the tax-aware strategies fall back to HIFO.
+"""
+
+import heapq
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from beancount.core.amount import Amount
+from beancount.core.data import Entries, Posting, Transaction
+from beancount.core.position import Cost, CostSpec
+from magicbeans.disposals import is_long_term
+
+
+class Lot:
+    """A lot held in an account, with the number of units remaining."""
+
+    def __init__(self, currency: str, cost: Cost, units: Decimal, seq: int) -> None:
+        self.currency = currency
+        self.cost = cost
+        self.units = units
+        self.seq = seq              # Order of acquisition, for tie-breaking
+        self.long_term = False      # Moved to the long-term heap
+
+    def __repr__(self) -> str:
+        return f"Lot({self.units} {self.currency} {{{self.cost}}})"
+
+
+class Strategy:
+    """A lot selection strategy.
+
+    Lots are ordered by key() (lowest first) within the short-term and the
+    long-term heap of an account; if `uses_term` is False all lots stay in
+    the short-term heap.  choose() picks between the best lots of the two
+    heaps, either of which may be None, given the sale price per unit (or
+    None if not known)."""
+
+    name = None
+    uses_term = False
+
+    def key(self, lot: Lot) -> tuple:
+        return (-lot.cost.number, lot.seq)
+
+    def choose(self, short_term: Optional[Lot], long_term: Optional[Lot],
+               price: Optional[Decimal]) -> Lot:
+        return short_term
+
+
+class FIFO(Strategy):
+    """First in, first out."""
+    name = "fifo"
+
+    def key(self, lot: Lot) -> tuple:
+        return (lot.cost.date, lot.seq)
+
+
+class LIFO(Strategy):
+    """Last in, first out."""
+    name = "lifo"
+
+    def key(self, lot: Lot) -> tuple:
+        return (-lot.cost.date.toordinal(), -lot.seq)
+
+
+class HIFO(Strategy):
+    """Highest cost first, minimizing gains (or maximizing losses)."""
+    name = "hifo"
+
+
+class PreferLongTerm(Strategy):
+    """Long-term lots first, then short-term ones, highest cost first."""
+    name = "prefer-long-term"
+    uses_term = True
+
+    def choose(self, short_term, long_term, price):
+        return long_term or short_term
+
+
+class MinTax(Strategy):
+    """Whichever lot minimizes the tax on the sale, given the marginal tax
+    rates on short-term and long-term gains.  Within each term, that is the
+    highest cost lot."""
+    name = "min-tax"
+    uses_term = True
+
+    def __init__(self, st_rate: Decimal, lt_rate: Decimal) -> None:
+        self.st_rate = st_rate
+        self.lt_rate = lt_rate
+
+    def choose(self, short_term, long_term, price):
+        if not (short_term and long_term):
+            return short_term or long_term
+        if price is None:
+            return max(short_term, long_term, key=lambda lot: lot.cost.number)
+        st_tax = self.st_rate * (price - short_term.cost.number)
+        lt_tax = self.lt_rate * (price - long_term.cost.number)
+        return short_term if st_tax < lt_tax else long_term
+
+
+STRATEGY_NAMES = [FIFO.name, LIFO.name, HIFO.name, PreferLongTerm.name, MinTax.name]
+
+
+def make_strategy(name: str, st_rate: Decimal = None, lt_rate: Decimal = None) -> Strategy:
+    """Return the strategy with the given name; min-tax requires the rates."""
+    if name == MinTax.name:
+        if st_rate is None or lt_rate is None:
+            raise ValueError("min-tax lot selection requires short- and long-term tax rates")
+        return MinTax(st_rate, lt_rate)
+    for cls in [FIFO, LIFO, HIFO, PreferLongTerm]:
+        if cls.name == name:
+            return cls()
+    raise ValueError(f"Unknown lot selection strategy: {name}")
+
+
+class LotPool:
+    """The lots of one currency held in one account."""
+
+    def __init__(self, strategy: Strategy) -> None:
+        self.strategy = strategy
+        self._short: List[Tuple[tuple, Lot]] = []
+        self._long: List[Tuple[tuple, Lot]] = []
+        self._by_date: List[Tuple[tuple, Lot]] = []   # For aging; only if uses_term
+
+    def add(self, lot: Lot) -> None:
+        heapq.heappush(self._short, (self.strategy.key(lot), lot))
+        if self.strategy.uses_term:
+            heapq.heappush(self._by_date, ((lot.cost.date, lot.seq), lot))
+
+    def _age(self, date) -> None:
+        """Move lots which are long-term as of the date to the long-term heap."""
+        while self._by_date:
+            lot = self._by_date[0][1]
+            if lot.units and not is_long_term(lot.cost.date, date):
+                break
+            heapq.heappop(self._by_date)
+            if lot.units:
+                lot.long_term = True
+                heapq.heappush(self._long, (self.strategy.key(lot), lot))
+
+    @staticmethod
+    def _top(heap: List[Tuple[tuple, Lot]], long_term: bool) -> Optional[Lot]:
+        # Entries for used-up lots, and for lots that have since moved to the
+        # long-term heap, are discarded lazily.
+        while heap:
+            lot = heap[0][1]
+            if lot.units and lot.long_term == long_term:
+                return lot
+            heapq.heappop(heap)
+        return None
+
+    def take(self, units: Decimal, date,
+             price: Optional[Decimal]) -> Tuple[List[Tuple[Lot, Decimal]], Decimal]:
+        """Select and remove lots for a reduction of `units` (positive) on
+        the date.  Returns the (lot, units taken) pairs, and the units which
+        could not be taken because the account doesn't hold enough."""
+        if self.strategy.uses_term:
+            self._age(date)
+        taken = []
+        while units > 0:
+            lot = self.strategy.choose(self._top(self._short, False),
+                                       self._top(self._long, True), price)
+            if lot is None:
+                break
+            n = min(units, lot.units)
+            lot.units -= n
+            units -= n
+            taken.append((lot, n))
+        return (taken, units)
+
+
+def _cost_number(spec: CostSpec, units: Decimal) -> Optional[Decimal]:
+    if isinstance(spec.number_per, Decimal) and spec.number_per:
+        return spec.number_per
+    if isinstance(spec.number_total, Decimal):
+        return spec.number_total / abs(units)
+    if isinstance(spec.number_per, Decimal):
+        return spec.number_per
+    return None
+
+
+def _lot_posting(posting: Posting, cost: Cost, units: Decimal) -> Posting:
+    spec = CostSpec(cost.number, None, cost.currency, cost.date, cost.label, False)
+    return posting._replace(units=Amount(units, posting.units.currency), cost=spec)
+
+
+class LotSelector:
+    """Selects lots for the reductions in a stream of unbooked entries.
+
+    Entries must be processed in date order.  Only postings with a cost spec
+    are considered; augmentations with a cost are lots, reductions with an
+    empty cost are selected for, and reductions with a cost are removed from
+    the lots held as specified."""
+
+    def __init__(self, strategy: Strategy) -> None:
+        self.strategy = strategy
+        self.n_selected = 0
+        self._pools: Dict[Tuple[str, str], LotPool] = {}
+        self._lots: Dict[Tuple[str, str, Decimal, str], List[Lot]] = {}
+        self._seq = 0
+
+    def _pool(self, account: str, currency: str) -> LotPool:
+        pool = self._pools.get((account, currency))
+        if pool is None:
+            pool = self._pools[(account, currency)] = LotPool(self.strategy)
+        return pool
+
+    def _augment(self, account: str, currency: str, cost: Cost, units: Decimal) -> None:
+        key = (account, currency, cost.number, cost.currency)
+        same_cost = self._lots.setdefault(key, [])
+        for lot in same_cost:
+            if lot.cost == cost and lot.units:
+                lot.units += units
+                return
+        self._seq += 1
+        lot = Lot(currency, cost, units, self._seq)
+        same_cost.append(lot)
+        self._pool(account, currency).add(lot)
+
+    def _reduce_specified(self, account: str, currency: str, spec: CostSpec,
+                          units: Decimal) -> List[Tuple[Lot, Decimal]]:
+        """Remove `units` (positive) from the lots matching the cost spec,
+        in the order they were acquired (a spec without a date may match
+        several); returns the (lot, units taken) pairs."""
+        number = _cost_number(spec, units)
+        key = (account, currency, number, spec.currency)
+        taken = []
+        for lot in self._lots.get(key, []):
+            if units <= 0:
+                break
+            if lot.units and (spec.date is None or lot.cost.date == spec.date):
+                n = min(units, lot.units)
+                lot.units -= n
+                units -= n
+                taken.append((lot, n))
+        return taken
+
+    def process(self, entry):
+        """Return the entry with lots selected for its reductions."""
+        if not isinstance(entry, Transaction):
+            return entry
+
+        # Reductions go first, so that lots transferred within the entry can
+        # be passed on to its augmentations, in order.
+        replacements: Dict[int, List[Posting]] = {}
+        reduced: Dict[str, List[List]] = {}   # Currency -> [[Cost, units]]
+        for (i, posting) in enumerate(entry.postings):
+            if (not isinstance(posting.cost, CostSpec)
+                    or not isinstance(posting.units, Amount)
+                    or not isinstance(posting.units.number, Decimal)
+                    or posting.units.number >= 0):
+                continue
+            currency = posting.units.currency
+            units = -posting.units.number
+            if _cost_number(posting.cost, units) is not None:
+                taken = self._reduce_specified(posting.account, currency, posting.cost, units)
+                reduced.setdefault(currency, []).extend([lot.cost, n] for (lot, n) in taken)
+                continue
+
+            price = None
+            if posting.price is not None and isinstance(posting.price.number, Decimal):
+                price = posting.price.number
+            pool = self._pool(posting.account, currency)
+            (taken, remaining) = pool.take(units, entry.date, price)
+            if not taken:
+                continue
+            postings = [_lot_posting(posting, lot.cost, -n) for (lot, n) in taken]
+            if remaining:
+                # Not enough held; leave the rest for booking to complain about.
+                postings.append(posting._replace(units=Amount(-remaining, currency)))
+            replacements[i] = postings
+            reduced.setdefault(currency, []).extend([lot.cost, n] for (lot, n) in taken)
+            self.n_selected += 1
+
+        for (i, posting) in enumerate(entry.postings):
+            if (not isinstance(posting.cost, CostSpec)
+                    or not isinstance(posting.units, Amount)
+                    or not isinstance(posting.units.number, Decimal)
+                    or posting.units.number <= 0):
+                continue
+            currency = posting.units.currency
+            units = posting.units.number
+            number = _cost_number(posting.cost, units)
+            if number is not None:
+                if isinstance(posting.cost.currency, str):
+                    cost = Cost(number, posting.cost.currency,
+                                posting.cost.date or entry.date, posting.cost.label)
+                    self._augment(posting.account, currency, cost, units)
+                continue
+
+            # An augmentation without a cost receives lots reduced in the
+            # same entry, i.e., it's the receiving leg of a transfer.
+            postings = []
+            sources = reduced.get(currency, [])
+            while units > 0 and sources:
+                (cost, available) = sources[0]
+                n = min(units, available)
+                postings.append(_lot_posting(posting, cost, n))
+                self._augment(posting.account, currency, cost, n)
+                units -= n
+                if n == available:
+                    sources.pop(0)
+                else:
+                    sources[0][1] -= n
+            if postings:
+                if units:
+                    postings.append(posting._replace(units=Amount(units, currency)))
+                replacements[i] = postings
+
+        if not replacements:
+            return entry
+        postings = []
+        for (i, posting) in enumerate(entry.postings):
+            postings.extend(replacements.get(i, [posting]))
+        return entry._replace(postings=postings)
+
+
+def select_lots(entries: Entries, strategy: Strategy) -> Entries:
+    """Return the entries (in date order) with lots selected for all
+    reductions according to the strategy."""
+    selector = LotSelector(strategy)
+    return [selector.process(entry) for entry in entries]
@@ -0,0 +1,346 @@
+"""Columnar table of disposal legs, for fast summaries.
+
+The summaries of a year's disposals (tax estimates, and the per-asset, per-
+term Form 8949 style tables) only need a few numbers per disposal leg.  A
+DisposalsTable holds these in NumPy columns, one row per disposal leg, so
+that group-bys (by disposal, asset, term, year or month) and cumulative sums
+are vectorized, rather than repeated list comprehensions over
+BookedDisposals summing Decimals.
+
+Money and quantities are stored as fixed-point integers, scaled by a power
+of ten with as many decimal places as the most precise value in the table,
+so they're exact, and so are their sums.  Columns are int64 where their
+sums fit, and Python ints (in object arrays) where they don't, e.g., for
+large amounts of a token at 18 decimal places.  Values which are only known
+per disposal (proceeds, and the short- and long-term gains as classified on
+the transaction) are allocated to its legs pro rata by units, such that
+they add up exactly to the disposal's totals.  Results are converted back
+to Decimals to fill the reports.data classes, at the scale of the values
+summed (as Decimal sums of them would be) rather than the table's, so that,
+e.g., a zero gain is "0", not "0E-28".  For this, each value column has a
+column of the decimal places of its inputs, whose maximum is taken over the
+same groups.
+"""
+
+import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from magicbeans.disposals import TERM_GROUPS, BookedDisposal, is_long_term
+from magicbeans.reports.data import (DisposalsSummary, DisposalsSummaryRow,
+                                     DisposalsSummaryTotalRow, TaxReport, TaxReportRow)
+
+# Columns whose absolute values sum to less than this are int64.
+INT64_LIMIT = 2 ** 63
+
+# Values of the term column
+SHORT = 0
+LONG = 1
+
+# Numeric per-leg columns, summed by group-bys
+VALUE_COLUMNS = ["amount", "cost", "numeraire_proceeds", "other_proceeds", "gain",
+                 "stcg", "ltcg"]
+
+
+def decimal_places(number: Decimal) -> int:
+    """Return the number of decimal places of a Decimal (0 for integers)."""
+    return max(0, -number.as_tuple().exponent)
+
+
+def to_fixed(number: Decimal, decimals: int) -> int:
+    """Convert a Decimal with at most that many decimal places to a
+    fixed-point integer, exactly."""
+    (sign, digits, exponent) = number.as_tuple()
+    if exponent + decimals < 0:
+        raise ValueError(f"{number} has more than {decimals} decimal places")
+    fixed = int("".join(map(str, digits)) or "0") * 10 ** (exponent + decimals)
+    return -fixed if sign else fixed
+
+
+def to_decimal(fixed, decimals: int, places: Optional[int] = None) -> Decimal:
+    """Convert a fixed-point integer to a Decimal (exactly, unlike scaleb(),
+    which rounds to the context's precision), stripping trailing zeros down
+    to `places` decimal places, if given."""
+    fixed = int(fixed)
+    if places is not None:
+        while decimals > places and fixed % 10 == 0:
+            fixed //= 10
+            decimals -= 1
+    return Decimal((int(fixed < 0), tuple(map(int, str(abs(fixed)))), -decimals))
+
+
+def to_array(values: List[int]) -> np.ndarray:
+    """Return a column of fixed-point integers: int64 if its sums can't
+    overflow, or else Python ints."""
+    if sum(abs(v) for v in values) < INT64_LIMIT:
+        return np.array(values, dtype=np.int64)
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def allocate(total: int, weights: Sequence[int]) -> List[int]:
+    """Split a fixed-point total in proportion to the weights, exactly; any
+    remainder from rounding goes to the last share with a nonzero weight."""
+    weight_sum = sum(weights)
+    if not weight_sum:
+        return [0] * (len(weights) - 1) + [total]
+    shares = [total * w // weight_sum for w in weights]
+    last = max(i for (i, w) in enumerate(weights) if w)
+    shares[last] += total - sum(shares)
+    return shares
+
+
+def group_sums(codes: np.ndarray, n_groups: int, values: np.ndarray,
+               ufunc: np.ufunc = np.add) -> np.ndarray:
+    """Sum the values by group code (0 <= code < n_groups), exactly (or
+    reduce them with another ufunc, e.g., np.maximum)."""
+    order = np.argsort(codes, kind="stable")
+    sorted_codes = codes[order]
+    sums = np.zeros(n_groups, dtype=values.dtype)
+    # reduceat needs strictly increasing, in-bounds starts, i.e., those of
+    # the nonempty groups.
+    nonempty = np.flatnonzero(np.bincount(codes, minlength=n_groups))
+    if len(nonempty):
+        starts = np.searchsorted(sorted_codes, nonempty)
+        sums[nonempty] = ufunc.reduceat(values[order], starts)
+    return sums
+
+
+class DisposalsTable:
+    """Disposal legs in columns.
+
+    Per-leg columns (NumPy arrays of equal length):
+      - disposal: index of the disposal (in the order given)
+      - date, disposed: the transaction's date, and the (UTC) date of its
+        timestamp, as datetime64[D]
+      - acquired: the acquisition date of the lot disposed of
+      - asset: index into `assets`
+      - term: SHORT or LONG
+      - and the fixed-point VALUE_COLUMNS, with `decimals` decimal places;
+        gain is the proceeds less cost.
+    `places` has, for each value column, the decimal places of each leg's
+    input (the per-disposal total, for values allocated to legs).
+    """
+
+    def __init__(self, booked_disposals: Sequence[BookedDisposal]) -> None:
+        self.n_disposals = len(booked_disposals)
+        self.assets: List[str] = []
+        asset_codes: Dict[str, int] = {}
+
+        # The exact Decimal values, to find the scale needed to hold them.
+        exact = []
+        places: Dict[str, list] = {name: [] for name in VALUE_COLUMNS}
+        for bd in booked_disposals:
+            n = len(bd.disposal_legs)
+            amounts = [-p.units.number for p in bd.disposal_legs]
+            costs = [p.cost.number * -p.units.number for p in bd.disposal_legs]
+            totals = [bd.numeraire_proceeds, bd.other_proceeds, bd.stcg(), bd.ltcg()]
+            places["amount"].extend(decimal_places(v) for v in amounts)
+            places["cost"].extend(decimal_places(v) for v in costs)
+            for (name, total) in zip(["numeraire_proceeds", "other_proceeds", "stcg", "ltcg"], totals):
+                places[name].extend([decimal_places(total)] * n)
+            places["gain"].extend(max(c, decimal_places(totals[0]), decimal_places(totals[1]))
+                                  for c in places["cost"][-n:])
+            exact.append((amounts, costs, totals))
+        self.places = {name: np.array(values, dtype=np.int32) for (name, values) in places.items()}
+        self.decimals = max((int(a.max()) for a in self.places.values() if len(a)), default=0)
+
+        columns: Dict[str, list] = {name: [] for name in
+            ["disposal", "date", "disposed", "acquired", "asset", "term"] + VALUE_COLUMNS}
+        starts = []
+        for (i, (bd, (amounts, costs, totals))) in enumerate(zip(booked_disposals, exact)):
+            legs = bd.disposal_legs
+            starts.append(len(columns["disposal"]))
+            asset = asset_codes.get(bd.disposed_currency)
+            if asset is None:
+                asset = asset_codes[bd.disposed_currency] = len(self.assets)
+                self.assets.append(bd.disposed_currency)
+            disposed = bd.timestamp().date() if "timestamp" in bd.tx.meta else bd.tx.date
+
+            amounts = [to_fixed(v, self.decimals) for v in amounts]
+            terms = [LONG if _is_long_term_leg(p, bd.tx.date) else SHORT for p in legs]
+            costs = [to_fixed(v, self.decimals) for v in costs]
+            (numeraire_proceeds, other_proceeds, stcg, ltcg) = [to_fixed(v, self.decimals) for v in totals]
+            numeraire_proceeds = allocate(numeraire_proceeds, amounts)
+            other_proceeds = allocate(other_proceeds, amounts)
+            stcg = _allocate_term(stcg, amounts, terms, SHORT)
+            ltcg = _allocate_term(ltcg, amounts, terms, LONG)
+
+            n = len(legs)
+            columns["disposal"].extend([i] * n)
+            columns["date"].extend([bd.tx.date] * n)
+            columns["disposed"].extend([disposed] * n)
+            columns["acquired"].extend(p.cost.date for p in legs)
+            columns["asset"].extend([asset] * n)
+            columns["term"].extend(terms)
+            columns["amount"].extend(amounts)
+            columns["cost"].extend(costs)
+            columns["numeraire_proceeds"].extend(numeraire_proceeds)
+            columns["other_proceeds"].extend(other_proceeds)
+            columns["gain"].extend(np_ + op - c for (np_, op, c)
+                                   in zip(numeraire_proceeds, other_proceeds, costs))
+            columns["stcg"].extend(stcg)
+            columns["ltcg"].extend(ltcg)
+
+        self.disposal = np.array(columns["disposal"], dtype=np.int64)
+        self.date = np.array(columns["date"], dtype="datetime64[D]")
+        self.disposed = np.array(columns["disposed"], dtype="datetime64[D]")
+        self.acquired = np.array(columns["acquired"], dtype="datetime64[D]")
+        self.asset = np.array(columns["asset"], dtype=np.int32)
+        self.term = np.array(columns["term"], dtype=np.int8)
+        for name in VALUE_COLUMNS:
+            setattr(self, name, to_array(columns[name]))
+        self._starts = np.array(starts, dtype=np.int64)
+
+    def __len__(self) -> int:
+        return len(self.disposal)
+
+    @property
+    def year(self) -> np.ndarray:
+        return self.date.astype("datetime64[Y]").astype(np.int64) + 1970
+
+    @property
+    def month(self) -> np.ndarray:
+        return self.date.astype("datetime64[M]").astype(np.int64) % 12 + 1
+
+    def group_by(self, *keys: np.ndarray
+                 ) -> Tuple[np.ndarray, Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+        """Sum the value columns over legs grouped by the given key columns
+        (e.g., table.asset, table.term, table.year).  Returns the distinct
+        keys (one row per group, in sorted order), and the sums and their
+        decimal places by column."""
+        stacked = np.stack([np.asarray(k, dtype=np.int64) for k in keys], axis=1)
+        (groups, codes) = np.unique(stacked, axis=0, return_inverse=True)
+        codes = codes.reshape(-1)
+        return (groups,
+                {name: group_sums(codes, len(groups), getattr(self, name))
+                 for name in VALUE_COLUMNS},
+                {name: group_sums(codes, len(groups), self.places[name], np.maximum)
+                 for name in VALUE_COLUMNS})
+
+    def _per_disposal(self, column: np.ndarray, ufunc: np.ufunc = np.add) -> np.ndarray:
+        return ufunc.reduceat(column, self._starts)
+
+    def to_decimal(self, fixed, places: int) -> Decimal:
+        """Convert a fixed-point value of the table, or a sum of values with
+        at most `places` decimal places, to a Decimal with that many."""
+        return to_decimal(fixed, self.decimals, int(places))
+
+    #
+    # Report data
+    #
+
+    def tax_report(self, st_rate: Decimal, lt_rate: Decimal) -> TaxReport | None:
+        """Compute total gains/losses and tax per disposed asset, or return
+        None if there are no disposals."""
+        if not len(self):
+            return None
+        (groups, sums, places) = self.group_by(self.asset)
+        by_asset = {self.assets[code]: (self.to_decimal(stcg, stcg_places),
+                                        self.to_decimal(ltcg, ltcg_places))
+                    for ((code,), stcg, ltcg, stcg_places, ltcg_places)
+                    in zip(groups, sums["stcg"], sums["ltcg"], places["stcg"], places["ltcg"])}
+
+        zero = Decimal("0")
+        total_row = TaxReportRow("(total)", zero, zero, zero, zero, zero)
+        rows = []
+        for asset in sorted(by_asset):
+            (stcg, ltcg) = by_asset[asset]
+            ltcg_tax = ltcg * lt_rate
+            stcg_tax = stcg * st_rate
+            rows.append(TaxReportRow(asset, ltcg, stcg, ltcg_tax, stcg_tax, ltcg_tax + stcg_tax))
+            total_row = TaxReportRow("(total)",
+                                     total_row.ltcg + ltcg,
+                                     total_row.stcg + stcg,
+                                     total_row.ltcg_tax + ltcg_tax,
+                                     total_row.stcg_tax + stcg_tax,
+                                     total_row.total_tax + ltcg_tax + stcg_tax)
+        return TaxReport(rows, total_row)
+
+    def disposals_summaries(self) -> List[Tuple[str, str, DisposalsSummary]]:
+        """Return the disposals summaries for each asset (in sorted order)
+        and term group (short, long or mixed), as (asset, term group name,
+        summary) tuples, with a row per disposal.  (See consolidation for
+        grouped rows.)"""
+        if not len(self):
+            return []
+
+        # Per-disposal columns
+        sums = {name: self._per_disposal(getattr(self, name)) for name in VALUE_COLUMNS}
+        places = {name: self._per_disposal(self.places[name], np.maximum)
+                  for name in VALUE_COLUMNS}
+        first = self._starts
+        asset = self.asset[first]
+        acquired_min = np.minimum.reduceat(self.acquired.astype(np.int64), first)
+        acquired_max = np.maximum.reduceat(self.acquired.astype(np.int64), first)
+        various = acquired_min != acquired_max
+        acquired = np.where(various, np.iinfo(np.int64).min, acquired_min)
+        date = self.date[first]
+
+        has_st = sums["stcg"] != 0
+        has_lt = sums["ltcg"] != 0
+        termgroups = [has_st & ~has_lt, has_lt & ~has_st, has_st & has_lt]
+
+        summaries = []
+        for code in sorted(range(len(self.assets)), key=lambda c: self.assets[c]):
+            for (termgroup_name, in_termgroup) in zip(TERM_GROUPS, termgroups):
+                selected = np.flatnonzero((asset == code) & in_termgroup)
+                if len(selected):
+                    summaries.append((self.assets[code], termgroup_name, self._summary(
+                        self.assets[code], selected, sums, places, date, acquired, various)))
+        return summaries
+
+    def _summary(self, asset: str, selected: np.ndarray, sums: Dict[str, np.ndarray],
+                 places: Dict[str, np.ndarray], date: np.ndarray, acquired: np.ndarray,
+                 various: np.ndarray) -> DisposalsSummary:
+        values = {name: column[selected] for (name, column) in sums.items()}
+        places = {name: column[selected] for (name, column) in places.items()}
+        value = lambda name, j: self.to_decimal(values[name][j], places[name][j])
+        cum_stcg = np.cumsum(values["stcg"])
+        cum_ltcg = np.cumsum(values["ltcg"])
+        cum_stcg_places = np.maximum.accumulate(places["stcg"])
+        cum_ltcg_places = np.maximum.accumulate(places["ltcg"])
+        rows = []
+        for (j, i) in enumerate(selected):
+            rows.append(DisposalsSummaryRow(
+                asset,
+                value("amount", j),
+                date[i].item(),
+                "Various" if various[i] else _to_date(acquired[i]),
+                value("numeraire_proceeds", j),
+                value("other_proceeds", j),
+                value("cost", j),
+                value("gain", j),
+                value("stcg", j),
+                self.to_decimal(cum_stcg[j], cum_stcg_places[j]),
+                value("ltcg", j),
+                self.to_decimal(cum_ltcg[j], cum_ltcg_places[j]),
+            ))
+        total_row = DisposalsSummaryTotalRow(*[
+            self.to_decimal(values[name].sum(), places[name].max()) for name in
+            ["amount", "numeraire_proceeds", "other_proceeds", "cost", "gain", "stcg", "ltcg"]])
+        return DisposalsSummary("<TITLE>", rows, total_row)
+
+
+def _to_date(days) -> datetime.date:
+    return np.datetime64(int(days), "D").item()
+
+
+def _is_long_term_leg(posting, disposed: datetime.date) -> bool:
+    # Use the term classified by the magicbeans.capgains plugin, if any.
+    term = posting.meta.get("term") if posting.meta else None
+    if term is not None:
+        return term == "long"
+    return is_long_term(posting.cost.date, disposed)
+
+
+def _allocate_term(total: int, amounts: List[int], terms: List[int], term: int) -> List[int]:
+    """Allocate a disposal's gains of one term to its legs of that term (or
+    to all legs, if none is of the term)."""
+    weights = [a if t == term else 0 for (a, t) in zip(amounts, terms)]
+    if not any(weights):
+        weights = amounts
+    return allocate(total, weights)
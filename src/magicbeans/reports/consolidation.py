@@ -0,0 +1,107 @@
+"""Consolidation of disposals into the grouped rows of the 8949 summaries.
+
+Very active traders dispose of the same lots many times a day; the summaries
+report these as one row per asset, acquisition date (or "Various"), disposal
+date and term group.  A DisposalsConsolidator reads the disposals once,
+accumulating each group's totals in place as disposals stream in, and then
+emits the rows of each asset and term group's summary directly, with no
+further passes over the disposals.
+"""
+
+import datetime
+from typing import Dict, Iterable, List, Tuple
+
+from beancount.core.number import ZERO
+from magicbeans.disposals import TERM_GROUPS, BDGroupKey, BookedDisposal
+from magicbeans.reports.data import (DisposalsSummary, DisposalsSummaryRow,
+                                     DisposalsSummaryTotalRow)
+
+
+class _Group:
+    """Running totals of the disposals in one group."""
+
+    __slots__ = ("key", "seq", "disposed_amount", "numeraire_proceeds", "other_proceeds",
+                 "disposed_cost", "stcg", "ltcg")
+
+    def __init__(self, key: BDGroupKey, seq: int) -> None:
+        self.key = key
+        self.seq = seq              # Order of first appearance
+        self.disposed_amount = ZERO
+        self.numeraire_proceeds = ZERO
+        self.other_proceeds = ZERO
+        self.disposed_cost = ZERO
+        self.stcg = ZERO
+        self.ltcg = ZERO
+
+    def sort_key(self) -> Tuple[datetime.date, int]:
+        return (self.key.disposed, self.seq)
+
+
+class DisposalsConsolidator:
+    """Groups disposals by (asset, acquisition date, disposal date, term
+    group), as they're added.  Disposals with neither short nor long term
+    gains aren't summarized."""
+
+    def __init__(self) -> None:
+        self.n_disposals = 0
+        # (asset, term group) -> group key -> group
+        self._groups: Dict[Tuple[str, str], Dict[BDGroupKey, _Group]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(groups) for groups in self._groups.values())
+
+    def add(self, bd: BookedDisposal) -> None:
+        self.n_disposals += 1
+        key = BDGroupKey.new(bd)
+        if key.term is None:
+            return
+        groups = self._groups.setdefault((key.asset, key.term), {})
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = _Group(key, self.n_disposals)
+        group.disposed_amount += bd.disposed_amount()
+        group.numeraire_proceeds += bd.numeraire_proceeds
+        group.other_proceeds += bd.other_proceeds
+        group.disposed_cost += bd.disposed_cost
+        group.stcg += bd.stcg()
+        group.ltcg += bd.ltcg()
+
+    def add_all(self, booked_disposals: Iterable[BookedDisposal]) -> "DisposalsConsolidator":
+        for bd in booked_disposals:
+            self.add(bd)
+        return self
+
+    def summaries(self) -> List[Tuple[str, str, DisposalsSummary]]:
+        """Return the disposals summaries for each asset (in sorted order)
+        and term group (short, long or mixed), as (asset, term group name,
+        summary) tuples.  Rows are ordered by disposal date, and then by
+        first appearance."""
+        order = {name: i for (i, name) in enumerate(TERM_GROUPS)}
+        return [(asset, term, self._summary(groups.values()))
+                for ((asset, term), groups) in sorted(
+                    self._groups.items(), key=lambda item: (item[0][0], order[item[0][1]]))]
+
+    @staticmethod
+    def _summary(groups: Iterable[_Group]) -> DisposalsSummary:
+        rows = []
+        totals = [ZERO] * 7
+        for group in sorted(groups, key=_Group.sort_key):
+            gain = group.numeraire_proceeds + group.other_proceeds - group.disposed_cost
+            values = (group.disposed_amount, group.numeraire_proceeds, group.other_proceeds,
+                      group.disposed_cost, gain, group.stcg, group.ltcg)
+            totals = [t + v for (t, v) in zip(totals, values)]
+            rows.append(DisposalsSummaryRow(
+                group.key.asset,
+                group.disposed_amount,
+                group.key.disposed,
+                group.key.acquired,
+                group.numeraire_proceeds,
+                group.other_proceeds,
+                group.disposed_cost,
+                gain,
+                group.stcg,
+                totals[5],
+                group.ltcg,
+                totals[6],
+            ))
+        return DisposalsSummary("<TITLE>", rows, DisposalsSummaryTotalRow(*totals))
@@ -0,0 +1,143 @@
+"""Report renderer writing each kind of table to a CSV file.
+
+For loading the report's numbers into a spreadsheet, or diffing them between
+runs, without compiling the PDF.  Each kind of table (tax estimates,
+disposals summaries, and the detailed log's inventories, acquisitions and
+disposals) goes to its own file, `<path>-<table>.csv`, with a header row.
+Rows are written as they're rendered, with numbers at full precision, and
+each is labelled with the section (the latest header or subheader) it
+belongs to.  Text, paragraphs and the cover page aren't tabular, and are
+left out.
+"""
+
+import csv
+from decimal import Decimal
+from typing import Dict, List
+
+from beancount.core.amount import Amount
+from magicbeans.reports.data import (AcquisitionsReportRow, CoverPage, DisposalsReport,
+                                     DisposalsSummary, InventoryReport, MiningSummaryRow,
+                                     TaxReport)
+from magicbeans.reports.renderer import Renderer, plain_text
+from magicbeans.writer import BUFFER_SIZE
+
+# The columns of each table, after the section
+COLUMNS: Dict[str, List[str]] = {
+    "tax": ["asset", "ltcg", "stcg", "ltcg_tax", "stcg_tax", "total_tax"],
+    "disposals-summary": ["title", "disposed_amount", "disposed_currency", "acquisition_date",
+                          "date", "numeraire_proceeds", "other_proceeds", "disposed_cost",
+                          "gain", "stcg", "cum_stcg", "ltcg", "cum_ltcg"],
+    "inventory": ["ts", "account", "units", "currency", "cost", "cost_currency", "acquired",
+                  "lot_id"],
+    "acquisitions": ["date", "narration", "amount", "currency", "cost_ea", "total_cost",
+                     "lot_id"],
+    "disposals": ["date", "acquisition_date", "narration", "disposed_amount",
+                  "disposed_currency", "numeraire_proceeds", "other_proceeds",
+                  "disposed_cost", "gain", "stcg", "cum_stcg", "ltcg", "cum_ltcg", "lots"],
+    "mining": ["currency", "month", "n_awards", "amount_mined", "avg_award_size",
+               "cumul_total", "avg_cost", "fmv_earned", "cumulative_fmv"],
+}
+
+TOTAL = "Total"
+
+
+class CsvRenderer(Renderer):
+    """Writes the report's tables to CSV files named after the path."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.section = ""
+        self._files = {}
+        self._writers = {}
+
+    def table_path(self, table: str) -> str:
+        return f"{self.path}-{table}.csv"
+
+    def close(self) -> None:
+        for f in self._files.values():
+            f.close()
+
+    def write_paragraph(self, text: str) -> None:
+        pass
+
+    def write_text(self, text: str) -> None:
+        pass
+
+    def newpage(self) -> None:
+        pass
+
+    def header(self, title: str) -> None:
+        self.section = plain_text(title)
+
+    def subheader(self, title: str, q: str = None) -> None:
+        self.section = plain_text(title)
+
+    def subreport_header(self, title: str, q: str = None) -> None:
+        self.section = plain_text(title)
+
+    def coverpage(self, page: CoverPage) -> None:
+        pass
+
+    def details_page(self,
+                     inventory_report: InventoryReport,
+                     acquisitions_report_rows: List[AcquisitionsReportRow],
+                     disposals_report: DisposalsReport) -> None:
+        for account in inventory_report.accounts:
+            for (pos, lot_id) in account.positions_and_ids:
+                self._row("inventory", inventory_report.ts, account.account, pos.units.number,
+                          pos.units.currency, pos.cost.number, pos.cost.currency,
+                          pos.cost.date, lot_id)
+
+        for row in acquisitions_report_rows:
+            self._row("acquisitions", row.date, row.narration, row.amount, row.cur,
+                      row.cost_ea, row.total_cost, row.lotid)
+
+        for row in disposals_report.rows:
+            lots = "; ".join(f"{-leg.units.number} {leg.units.currency} {{{leg.cost.number} "
+                             f"{leg.cost.currency} {leg.cost.date}}}" + (f" #{lot_id}" if lot_id else "")
+                             for (leg, lot_id) in row.disposal_legs_and_ids)
+            self._row("disposals", row.date, row.acquisition_date, row.narration,
+                      row.disposed_amount, row.disposed_currency, row.numeraire_proceeds,
+                      row.other_proceeds, row.disposed_cost, row.gain, row.stcg,
+                      row.cum_stcg, row.ltcg, row.cum_ltcg, lots)
+
+    def tax_report(self, tax_report: TaxReport) -> None:
+        for row in tax_report.rows + [tax_report.total_row._replace(asset=TOTAL)]:
+            self._row("tax", *row)
+
+    def disposals_summary(self, title: str, disposals_summary: DisposalsSummary) -> None:
+        title = plain_text(title)
+        for row in disposals_summary.rows:
+            self._row("disposals-summary", title, row.disposed_amount, row.disposed_currency,
+                      row.acquisition_date, row.date, row.numeraire_proceeds,
+                      row.other_proceeds, row.disposed_cost, row.gain, row.stcg,
+                      row.cum_stcg, row.ltcg, row.cum_ltcg)
+        total = disposals_summary.total_row
+        self._row("disposals-summary", title, total.disposed_amount, TOTAL, None, None,
+                  total.numeraire_proceeds, total.other_proceeds, total.disposed_cost,
+                  total.gain, total.stcg, None, total.ltcg, None)
+
+    def mining_summary(self, rows: List[MiningSummaryRow]) -> None:
+        for row in rows:
+            self._row("mining", *row)
+
+    def _row(self, table: str, *values) -> None:
+        writer = self._writers.get(table)
+        if writer is None:
+            f = open(self.table_path(table), "w", newline="", buffering=BUFFER_SIZE)
+            self._files[table] = f
+            writer = self._writers[table] = csv.writer(f)
+            writer.writerow(["section"] + COLUMNS[table])
+        writer.writerow([self.section] + [_cell(v) for v in values])
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, Amount):
+        # Some report rows hold numeraire amounts, rather than numbers.
+        value = value.number
+    if isinstance(value, Decimal):
+        # Fixed point, as spreadsheets don't all read "0E-8"
+        return f"{value:f}"
+    return value
@@ -1,69 +1,179 @@
+import concurrent.futures
 import datetime
 from decimal import Decimal
-from typing import List
+from typing import List, Optional, Sequence, Union
 from tabulate import tabulate
 
 from beanquery.query import run_query
 from beanquery.query_render import render_text
 from magicbeans import queries
-from magicbeans.reports import driver
+from magicbeans.reports import driver, form8949, modelfile, selection
+from magicbeans.reports.csvreport import CsvRenderer
+from magicbeans.reports.htmlreport import HtmlRenderer
+from magicbeans.reports.latexsplit import LATEXMK, SplitLaTeXRenderer
+from magicbeans.reports.latexstream import StreamingLaTeXRenderer
+from magicbeans.reports.renderer import Renderer
+from magicbeans.reports.selection import ReportSelection
+from magicbeans.reports.text import TextRenderer
 
 #
 # Default report generator.  Creates a report with
 # a cover page, tax year summaries, and detailed disposals reports.
 #
 
-def generate(tax_years: List[int], numeraire: str, currencies: List[str], ledger_path: str, out_path: str):
+# Federal plus California.  TODO: Configure
+FED_ST_RATE = Decimal("0.37")
+FED_LT_RATE = Decimal("0.20")
+STATE_RATE = Decimal("0.133")
+ST_RATE = FED_ST_RATE + STATE_RATE
+LT_RATE = FED_LT_RATE + STATE_RATE
+
+def generate(tax_years: List[int], numeraire: str, currencies: List[str], ledger_path: str, out_path: str,
+			 *, split_years: Optional[str] = None, compiler: Sequence[str] = LATEXMK,
+			 cache_dir: Optional[str] = None, models_dir: Optional[str] = None,
+			 report_format: Union[str, Sequence[str]] = "latex", export_8949: Optional[str] = None,
+			 rows_8949: str = form8949.GROUP, model_path: Optional[str] = None,
+			 report_selection: Optional[ReportSelection] = None):
+	"""Generate the report, in one of renderer.FORMATS.  With `split_years`
+	(an assembly mode of latexsplit), each year's detailed log is compiled
+	separately, in parallel, with the compiler command.  With `cache_dir`,
+	rendered pages and tables (and compiled years) are cached there, and
+	reused when unchanged.  With `models_dir`, the report's data models are
+	kept there, and only those depending on changed entries are recomputed.
+	The latex options don't apply to the other formats.  With
+	`export_8949` (one of form8949.FORMATS), the 8949 rows (one of
+	form8949.ROW_KINDS) are also exported.
+
+	The format may also be a list of formats.  With `model_path`, or more
+	than one format, the report's data model is saved to that path (or the
+	output path plus ".model") as it's computed, and then rendered from it
+	in each format, in parallel; see render().
+
+	With `report_selection`, only its sections (of selection.SECTIONS),
+	assets and pages of the detailed log are computed; the 8949 export
+	is of its assets too."""
 	print(f"Generating report for beancount file {ledger_path} "
           f"and writing to {out_path}")
 
-	db = driver.ReportDriver(ledger_path, out_path, numeraire)
+	formats = [report_format] if isinstance(report_format, str) else list(report_format)
+	if model_path is None and len(formats) > 1:
+		model_path = out_path + ".model"
+	if model_path:
+		renderer = modelfile.ModelWriter(model_path)
+	else:
+		renderer = make_renderer(formats[0], out_path, split_years, compiler, cache_dir)
+	sel = report_selection if report_selection else ReportSelection()
+	db = driver.ReportDriver(ledger_path, out_path, numeraire, renderer, models_dir, sel)
 
-	db.coverpage(datetime.datetime.now(), tax_years, currencies)
+	if sel.assets is not None:
+		currencies = sorted(sel.assets)
+	db.coverpage(datetime.datetime.now(), tax_years, currencies, sel.describe())
 
 	print()
 	db.renderer.newpage()
 
-	print("Generating tax liability reports:")
-	db.renderer.header("Capital Gains/Loss Tax Liability Estimates")
-
-	# Federal plus California.  TODO: Configure
-	fed_st_rate = Decimal("0.37")
-	fed_lt_rate = Decimal("0.20")
-	state_rate = Decimal("0.133")
-	db.renderer.write_paragraph(f"""
-		The following are rough estimates of the capital gains tax liability (or 
-		credit, shown as negative values, in the case of losses) for each year. 
-		These estimates are simple multiplications of the gain/loss by the tax 
-		rate, using a marginal federal short-term capital gains tax rate of 
-		{fed_st_rate:.0%} and long-term rate of {fed_lt_rate:.0%}, and a state 
-		rate of {state_rate:.1%}.""".replace("%", "\%"))
-
-	for ty in tax_years:
-		print(f"  {ty}", end="", flush=True)
-		db.renderer.subheader(f"{ty} Gain/Loss and Est. Tax Liability")
-		db.run_tax_estimate_report(ty, fed_st_rate + state_rate, fed_lt_rate + state_rate)
-
-	print("Generating tax summaries:")
-	for ty in tax_years:
-		print(f"  {ty}", end="", flush=True)
-
-		db.renderer.header(f"{ty} Tax Reporting Info")
-
-		db.renderer.subheader(f"{ty} Disposals and Gain/Loss, Order-level (for 8949)")
-		db.run_disposals_summaries(ty, consolidate=True)
-
-		db.run_mining_income_sched_c(f"{ty} Mining Income (for Sched. C)", ty)
-
-	print()
-
-	print("Generating detailed disposals reports:")
-	for ty in tax_years:
-		start = datetime.date(ty, 1, 1)
-		end = datetime.date(ty+1, 1, 1)
-		print(f"  {ty}", flush=True)
-		db.run_detailed_log(start, end)
-
-	print()
-
-	db.close()
\ No newline at end of file
+	if sel.has_section(selection.TAX):
+		print("Generating tax liability reports:")
+		db.renderer.header("Capital Gains/Loss Tax Liability Estimates")
+
+		db.renderer.write_paragraph(f"""
+			The following are rough estimates of the capital gains tax liability (or 
+			credit, shown as negative values, in the case of losses) for each year. 
+			These estimates are simple multiplications of the gain/loss by the tax 
+			rate, using a marginal federal short-term capital gains tax rate of 
+			{FED_ST_RATE:.0%} and long-term rate of {FED_LT_RATE:.0%}, and a state 
+			rate of {STATE_RATE:.1%}.""".replace("%", "\%"))
+
+		for ty in tax_years:
+			print(f"  {ty}", end="", flush=True)
+			db.renderer.subheader(f"{ty} Gain/Loss and Est. Tax Liability")
+			db.run_tax_estimate_report(ty, ST_RATE, LT_RATE)
+
+	if sel.has_section(selection.SUMMARIES) or sel.has_section(selection.MINING):
+		print("Generating tax summaries:")
+		for ty in tax_years:
+			print(f"  {ty}", end="", flush=True)
+
+			db.renderer.header(f"{ty} Tax Reporting Info")
+
+			if sel.has_section(selection.SUMMARIES):
+				db.renderer.subheader(f"{ty} Disposals and Gain/Loss, Order-level (for 8949)")
+				db.run_disposals_summaries(ty, consolidate=True)
+
+			if sel.has_section(selection.MINING):
+				db.run_mining_income_sched_c(f"{ty} Mining Income (for Sched. C)", ty)
+
+		print()
+
+	if sel.has_section(selection.LOG):
+		print("Generating detailed disposals reports:")
+		for ty in tax_years:
+			start = datetime.date(ty, 1, 1)
+			end = datetime.date(ty+1, 1, 1)
+			print(f"  {ty}", flush=True)
+			# Saved models record the units, whether or not they're split.
+			units = hasattr(db.renderer, "begin_unit")
+			if units:
+				db.renderer.begin_unit(str(ty), f"{ty} Transaction Log")
+			db.run_detailed_log(start, end)
+			if units:
+				db.renderer.end_unit()
+
+		print()
+
+	if export_8949:
+		path_8949 = f"{out_path}-8949.{export_8949}"
+		print(f"Exporting 8949 rows to {path_8949}:")
+		n_rows = db.write_form_8949(path_8949, tax_years, export_8949, rows_8949)
+		print(f"  {n_rows} rows")
+
+	if sel.has_section(selection.LINEAGE):
+		print("Exporting lot lineage:")
+		db.write_lot_lineage(out_path + "-lineage.jsonl")
+
+	db.close()
+
+	if model_path:
+		render(model_path, formats, out_path, split_years=split_years, compiler=compiler,
+			   cache_dir=cache_dir)
+
+def render(model_path: str, formats: Sequence[str], out_path: str, *, split_years: Optional[str] = None,
+		   compiler: Sequence[str] = LATEXMK, cache_dir: Optional[str] = None):
+	"""Render the report model saved by generate() in each of the formats,
+	in parallel processes, without reading the ledger.  Years are only
+	split in the latex format."""
+	print(f"Rendering report model {model_path} as {', '.join(formats)}")
+	jobs = [(model_path, fmt, out_path, split_years if fmt == "latex" else None, compiler, cache_dir)
+			for fmt in formats]
+	if len(jobs) == 1:
+		render_format(*jobs[0])
+		return
+	with concurrent.futures.ProcessPoolExecutor(max_workers=len(jobs)) as executor:
+		for future in [executor.submit(render_format, *job) for job in jobs]:
+			future.result()
+
+def render_format(model_path: str, report_format: str, out_path: str, split_years: Optional[str],
+				  compiler: Sequence[str], cache_dir: Optional[str]):
+	"""Render the saved report model in one format."""
+	renderer = make_renderer(report_format, out_path, split_years, compiler, cache_dir)
+	n_calls = modelfile.replay(model_path, renderer)
+	renderer.close()
+	print(f"Rendered {report_format} report from {n_calls} parts")
+
+def make_renderer(report_format: str, out_path: str, split_years: Optional[str] = None,
+				  compiler: Sequence[str] = LATEXMK, cache_dir: Optional[str] = None) -> Renderer:
+	"""Return the renderer of the format, writing to the output path (plus
+	an extension, a table name for csv, or "-html" for the html directory)."""
+	if report_format == "latex":
+		if split_years:
+			return SplitLaTeXRenderer(out_path, split_years, compiler, cache_dir=cache_dir)
+		return StreamingLaTeXRenderer(out_path, cache_dir)
+	if split_years:
+		raise ValueError(f"Years can only be split in the latex format, not {report_format}")
+	if report_format == "text":
+		return TextRenderer(out_path + ".txt")
+	if report_format == "csv":
+		return CsvRenderer(out_path)
+	if report_format == "html":
+		return HtmlRenderer(out_path + "-html")
+	raise ValueError(f"Unknown report format {report_format}")
\ No newline at end of file
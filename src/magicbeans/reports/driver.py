@@ -1,7 +1,8 @@
+import bisect
 import datetime
 from decimal import Decimal
 import sys
-from typing import Dict, Iterator, List, NamedTuple, Sequence
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, TypeVar
 
 import dateutil
 import dateutil.parser
@@ -12,15 +13,30 @@ from beancount.core.data import Transaction
 from beancount.core.number import ZERO
 from beancount.ops import summarize
 from magicbeans import common
-from magicbeans.disposals import BDGroupKey, BookedDisposal, BookedDisposalGroup, InventoryBlock, format_money, get_disposal_postings, is_disposal_tx, is_non_numeraire_proceeds_leg, sum_amounts, LotIndex
+from magicbeans.disposals import BookedDisposal, InventoryBlock, format_money, get_disposal_postings, is_disposal_tx, is_non_numeraire_proceeds_leg, sum_amounts, LotRegistry
+from magicbeans.lifetimes import LotLifetimes
+from magicbeans.lineage import LotLineage
 from magicbeans.mining import MINING_BENEFICIARY_ACCOUNT, MINING_INCOME_ACCOUNT, MiningStats, is_mining_tx
-from magicbeans.reports.data import AcquisitionsReportRow, CoverPage, DisposalsReport, DisposalsReportRow, AccountInventoryReport, DisposalsSummary, DisposalsSummaryRow, DisposalsSummaryTotalRow, InventoryReport, MiningSummaryRow, TaxReport, TaxReportRow
-from magicbeans.reports.latex import LaTeXRenderer
+from magicbeans.reports import form8949
+from magicbeans.reports.columnar import DisposalsTable
+from magicbeans.reports.consolidation import DisposalsConsolidator
+from magicbeans.reports.data import AcquisitionsReportRow, CoverPage, DisposalsReport, DisposalsReportRow, AccountInventoryReport, DisposalsSummary, InventoryReport, MiningSummaryRow, TaxReport
+from magicbeans.reports.latexstream import StreamingLaTeXRenderer
+from magicbeans.reports.modelstore import ModelStore
+from magicbeans.reports.renderer import Renderer
+from magicbeans.reports.selection import ReportSelection
 
 from beancount import loader
 from beanquery.query import run_query
 
 
+T = TypeVar("T")
+
+# The data models of one page of the detailed log: its start and end
+# timestamps, inventory report, acquisitions rows and disposals report.
+DetailedLogPage = Tuple[datetime.datetime, datetime.datetime, InventoryReport,
+						List[AcquisitionsReportRow], DisposalsReport]
+
 def beancount_quarter(ty: int, quarter_n: int):
 	return f"{ty}-Q{quarter_n}"
 
@@ -51,7 +67,8 @@ assets from that lot, and identifies the lot by the original cost basis (per uni
 and date of acquisition.  To facilitate auditing, where possible the report will
 show a "lot ID" for the disposed lot, to cross reference against either the
 starting inventory table, or previous transactions (e.g., acquisitions, transfers,
-or disposals).  This lot ID is unique only within one page of the report.
+or disposals).  Lot IDs are assigned once for the whole report, so a lot has
+the same ID on every page on which it appears.
 
 Finally, the disposals table shows the sum of the cost bases of all disposed lots
 in the "Cost" column, and in additional columns, the overall gain and loss, 
@@ -61,6 +78,12 @@ The third and final section (perhaps omitted in abbreviated versions of the repo
 contains a complete history of all mining rewards, for reference.
 """
 
+def make_tax_report(booked_disposals: Sequence[BookedDisposal],
+		st_rate: Decimal, lt_rate: Decimal) -> TaxReport | None:
+	"""Compute total gains/losses and tax per disposed asset, or return None
+	if there are no disposals."""
+	return DisposalsTable(booked_disposals).tax_report(st_rate, lt_rate)
+
 class ReportDriver:
 	"""Wraps a beancount file and facilitates building reports off of it.
 
@@ -71,12 +94,18 @@ class ReportDriver:
 
 	# TODO: query(), render(), and query_and_render() may be obsolete now.
 
-	def __init__(self, ledger_path: str, out_path: str, numeraire: str) -> None:
+	def __init__(self, ledger_path: str, out_path: str, numeraire: str,
+			  renderer: Renderer = None, models_dir: str = None,
+			  selection: ReportSelection = None) -> None:
 		"""Load the beancount file at the given path and parse it for queries, 
-		and initialize the output report file."""
+		and initialize the output report file (unless a renderer is given).
+		With a models directory, data models are kept there, and reused by
+		later runs as far as the ledger is unchanged (see modelstore.py).
+		With a selection, only the transactions of its assets, and only
+		its pages of the detailed log, are reported (see selection.py)."""
 
 		# self.renderer = TextRenderer(out_path)
-		self.renderer = LaTeXRenderer(out_path)
+		self.renderer = renderer if renderer else StreamingLaTeXRenderer(out_path)
 
 		entries, errors, options = loader.load_file(ledger_path)
 		if errors:
@@ -89,20 +118,75 @@ class ReportDriver:
 		self.options = options
 
 		self.numeraire = numeraire
+		self.selection = selection if selection else ReportSelection()
+
+		# Report-wide lot IDs, shared by all pages of the detailed log.
+		self.lot_registry = LotRegistry(entries, numeraire)
+		self._lot_lineage = None
+		self._lot_lifetimes = None
+
+		self._dates = [entry.date for entry in entries]
+		self._entry_indexes: Dict[int, int] = None
+		self.models = None
+		if models_dir:
+			self.models = ModelStore(models_dir, entries, (numeraire,) + self.selection.identity())
+			change = self.models.earliest_change()
+			print(f"Recomputing report data from {change}" if change else
+				  "No changes to the ledger, reusing report data")
+
+	def lot_lineage(self) -> LotLineage:
+		"""Return the lineage of all lots in the ledger (built on first use)."""
+		if self._lot_lineage is None:
+			self._lot_lineage = LotLineage(self.entries, self.lot_registry)
+		return self._lot_lineage
+
+	def lot_lifetimes(self) -> LotLifetimes:
+		"""Return the index of position lifetimes, for inventories at any time
+		(built on first use)."""
+		if self._lot_lifetimes is None:
+			self._lot_lifetimes = LotLifetimes(self.entries, self.numeraire)
+		return self._lot_lifetimes
+
+	def write_lot_lineage(self, path: str):
+		"""Export the lot lineage graph for auditing (see lineage.py)."""
+		with open(path, "w") as out:
+			self.lot_lineage().write_jsonl(out)
 
 	def write_text(self, text: str):
 		"""Legacy function to allow caller to write direclty to underlying file"""
 		self.renderer.write_text(text)
 
 	def close(self):
+		if self.models:
+			print(f"Reused {self.models.n_reused} report data models, "
+				  f"computed {self.models.n_computed}")
+			self.models.save()
 		self.renderer.close()
 
+	def model(self, key: tuple, boundary: int, compute: Callable[[], T]) -> T:
+		"""Return compute(), or the same as computed by an earlier run if the
+		entries up to the boundary index are unchanged (see modelstore.py)."""
+		if self.models is None:
+			return compute()
+		return self.models.get(key, boundary, compute)
+
+	def boundary_at_date(self, date: datetime.date) -> int:
+		"""Return the index of the first entry on or after the date."""
+		return bisect.bisect_left(self._dates, date)
+
+	def entry_index(self, entry) -> int:
+		"""Return the index of an entry in the ledger."""
+		if self._entry_indexes is None:
+			self._entry_indexes = {id(e): i for (i, e) in enumerate(self.entries)}
+		return self._entry_indexes[id(entry)]
+
 	def coverpage(self, timestamp: datetime.date,
-				  tax_years: List[int], cryptos: List[str]):
+				  tax_years: List[int], cryptos: List[str], notes: Sequence[str] = ()):
 		page = CoverPage("Magicbeans Tax Report", [
 			f"Generated {timestamp}",
 			f"Covering tax years {', '.join([str(ty) for ty in tax_years])}",
-			f"Reporting on cryptocurrencies {', '.join(cryptos)}"
+			f"Reporting on cryptocurrencies {', '.join(cryptos)}",
+			*notes
 		   ],
 		   REPORT_ABSTRACT)
 		self.renderer.coverpage(page)
@@ -129,10 +213,16 @@ class ReportDriver:
 			return False
 		return True
 
+	def selects(self, e: Transaction) -> bool:
+		"""Return true if the transaction is about a selected asset."""
+		return self.selection.selects(e, self.numeraire)
+
 	def partition_entries(self, entries, numeraire: str):
 		"""Return a tuple of entry lists, one for each type of entry:
 		disposals, purchases (non-mining acquisitions), and mining
-		acquisitions."""
+		acquisitions, of the selected assets."""
+		if self.selection.assets is not None:
+			entries = list(filter(self.selects, entries))
 		disposals = list(filter(is_disposal_tx, entries))
 		mining_awards = list(filter(is_mining_tx, entries))
 		purchases = list(filter(lambda e: self.is_acquisition_tx(e, numeraire), entries))
@@ -144,22 +234,7 @@ class ReportDriver:
 
 	def get_inventory_at_ts(self, ts: datetime):
 		"""Get the inventory as of the given timestamp."""
-
-		def ts_cutoff_fn(entry):
-			if 'timestamp' in entry.meta:
-				tx_ts = dateutil.parser.parse(entry.meta['timestamp'])
-				return tx_ts >= ts
-			return False
-
-		(inventories_by_acct, _) = summarize.balance_by_account(
-			self.entries, stop_fn=ts_cutoff_fn)
-
-		# Remove numeraire-only accounts; we don't need to track those
-		for (account, inventory) in list(inventories_by_acct.items()):
-			if all([p.units.currency == self.numeraire for p in inventory]):
-				inventories_by_acct.pop(account)
-
-		return inventories_by_acct
+		return self.lot_lifetimes().inventories_at_ts(ts)
 
 	def get_inventory_and_entries(self, start: datetime.date, end: datetime.date):
 		"""For a time period, get the inventory at the start and all entries in the period"""
@@ -178,6 +253,11 @@ class ReportDriver:
 		# the caller really need this raw inventories_by_acct dict?
 		return (inventories_by_acct, all_entries)
 
+	def get_entries(self, start: datetime.date, end: datetime.date):
+		"""Get the entries in a time period (as get_inventory_and_entries()
+		does, without computing the inventory)."""
+		return self.entries[self.boundary_at_date(start):self.boundary_at_date(end)]
+
 	def make_inventory_report(self, start, inventory_blocks, lot_index):
 		"""Construct an inventory report object."""
 		account_inventory_reports = [] 
@@ -240,111 +320,40 @@ class ReportDriver:
 				period_mining_stats.total_fmv, None))
 		return acquisitions_report_rows
 
-	def run_disposals_summaries(self, ty: int, consolidate: bool = False):
-		"""Generate a summary of disposals for the period."""
+	def make_disposals_summaries(self, ty: int, consolidate: bool
+							  ) -> Optional[List[Tuple[str, str, DisposalsSummary]]]:
+		"""Return the disposals summaries for the year by asset and term
+		group, or None if there are no disposals."""
 		booked_disposals: Sequence[BookedDisposal] = self.get_booked_disposals(ty)
-		disposed_assets = set([bd.disposed_asset() for bd in booked_disposals])
-
-		if not disposed_assets:
-			self.renderer.write_text("(No disposals in this period.)")
-			return	
+		if not booked_disposals:
+			return None
 
-		# Depending on whether we're consolidating
-		bd_items: Sequence[BookedDisposal] | Sequence[BookedDisposalGroup] = booked_disposals
 		if consolidate:
-			groups_dict: Dict[BDGroupKey, BookedDisposalGroup] = {}
-
-			for bd in booked_disposals:
-				key = BDGroupKey.new(bd)
-				if key not in groups_dict:
-					groups_dict[key] = BookedDisposalGroup(bd)
-				else:
-					groups_dict[key].add(bd)
-
-			bd_items = [group for group in groups_dict.values()]
-
-			print(f"Num bd: {len(booked_disposals)}, Num groups: {len(bd_items)}, Total grouped bd: {sum([len(group.disposals) for group in bd_items])}")
+			consolidator = DisposalsConsolidator().add_all(booked_disposals)
+			print(f"Num bd: {consolidator.n_disposals}, Num groups: {len(consolidator)}")
+			return consolidator.summaries()
+		else:
+			return DisposalsTable(booked_disposals).disposals_summaries()
 
-			stcg_ind = sum([bd.stcg() for bd in booked_disposals])
-			ltcg_ind = sum([bd.ltcg() for bd in booked_disposals])
-			stcg_grp = sum([group.stcg() for group in bd_items])
-			ltcg_grp = sum([group.ltcg() for group in bd_items])
-			print(f"Indiv: STCG {stcg_ind}, LTCG {ltcg_ind}, Grouped: STCG {stcg_grp}, LTCG {ltcg_grp}")
+	def run_disposals_summaries(self, ty: int, consolidate: bool = False):
+		"""Generate a summary of disposals for the period."""
+		summaries = self.model(("disposals_summaries", ty, consolidate),
+						 self.boundary_at_date(datetime.date(ty + 1, 1, 1)),
+						 lambda: self.make_disposals_summaries(ty, consolidate))
+		if summaries is None:
+			self.renderer.write_text("(No disposals in this period.)")
+			return	
 
 		# Super dumb we have to manually paginate.  We need to have a better
 		# general solution to long tables.
 		used_rows = 0
-		for asset in sorted(disposed_assets):
-			disposals_for_asset = [bd for bd in bd_items if bd.disposed_asset() == asset]
-
-			st_disposals = [bd for bd in disposals_for_asset if bd.stcg() and not bd.ltcg()]
-			lt_disposals = [bd for bd in disposals_for_asset if bd.ltcg() and not bd.stcg()]
-			mixed_disposals = [bd for bd in disposals_for_asset if bd.stcg() and bd.ltcg()]
-
-			disposals_by_termgroup = [("Short Term", st_disposals), ("Long Term", lt_disposals), ("Mixed", mixed_disposals)]
-
-			for (termgroup_name, disposals) in disposals_by_termgroup:
-				if not disposals:
-					continue
-
-				if used_rows + len(disposals) > 80:
-					self.renderer.newpage()
-					used_rows = 0
-
-				# TODO: fix type hinting here
-				disposals_summary: DisposalsSummary = self.make_disposals_summary(disposals)
-				
-				self.renderer.disposals_summary(f"{asset} {termgroup_name} Disposals", disposals_summary)
-				used_rows += len(disposals)
+		for (asset, termgroup_name, disposals_summary) in summaries:
+			if used_rows + len(disposals_summary.rows) > 80:
+				self.renderer.newpage()
+				used_rows = 0
 
-	def make_disposals_summary(self, bd_items: Sequence[BookedDisposal | BookedDisposalGroup]) -> DisposalsSummary:
-		"""Construct a disposals report object with tx's grouped at the trade level."""
-
-		cumulative_stcg = Decimal("0")
-		cumulative_ltcg = Decimal("0")
-		disposals_report_rows = []
-		total_row = DisposalsSummaryTotalRow( Decimal(0), Decimal(0), Decimal(0), Decimal(0), Decimal(0), Decimal(0), Decimal(0)) 
-
-		# May be a BookedDisposalGroup or a BookedDisposal
-		for bd in bd_items:
-			numer_proc = bd.total_numeriare_proceeds().number
-			other_proc = bd.total_other_proceeds_value().number
-			disposed_cost = bd.total_disposed_cost().number
-			# gain = amount.sub(amount.add(numer_proc, other_proc), disposed_cost)
-			gain = numer_proc + other_proc - disposed_cost
-			cumulative_stcg += bd.stcg()
-			cumulative_ltcg += bd.ltcg()
-
-			total_row = DisposalsSummaryTotalRow(
-				total_row.disposed_amount + bd.disposed_amount(),
-				total_row.numeraire_proceeds + numer_proc,
-				total_row.other_proceeds + other_proc,
-				total_row.disposed_cost + disposed_cost,
-				total_row.gain + gain,
-				total_row.stcg + bd.stcg(),
-				total_row.ltcg + bd.ltcg()
-			)
-
-			disposals_report_rows.append(
-				DisposalsSummaryRow(
-					bd.disposed_asset(),
-					bd.disposed_amount(),
-					bd.disposal_date(),
-					bd.acquisition_date(),
-					numer_proc,
-					other_proc,
-					disposed_cost,
-					gain,
-					bd.stcg(),
-					cumulative_stcg,
-					bd.ltcg(),
-					cumulative_ltcg,
-				)
-			)
-
-		# return DisposalsReport(self.numeraire,
-		# 		disposals_report_rows, cumulative_stcg, cumulative_ltcg, False)
-		return DisposalsSummary("<TITLE>", disposals_report_rows, total_row)
+			self.renderer.disposals_summary(f"{asset} {termgroup_name} Disposals", disposals_summary)
+			used_rows += len(disposals_summary.rows)
 
 	def make_disposals_report_detailed(self, booked_disposals: Sequence[BookedDisposal], lot_index):
 		"""Construct a disposals report object.
@@ -394,36 +403,13 @@ class ReportDriver:
 	def run_tax_estimate_report(self, ty: int, st_rate: Decimal, lt_rate: Decimal):
 		"""Compute total gains/losses and tax."""
 
-		booked_disposals = self.get_booked_disposals(ty)
-		disposed_assets = set([bd.disposed_asset() for bd in booked_disposals])
-
-		if not disposed_assets:
+		report = self.model(("tax_report", ty, st_rate, lt_rate),
+					  self.boundary_at_date(datetime.date(ty + 1, 1, 1)),
+					  lambda: make_tax_report(self.get_booked_disposals(ty), st_rate, lt_rate))
+		if not report:
 			self.renderer.write_text("(No disposals in this period.)")
 			return	
 
-		total_tax = Decimal("0")
-		total_row = TaxReportRow("(total)", Decimal("0"), Decimal("0"), Decimal("0"), Decimal("0"), Decimal("0"))
-
-		rows: List[TaxReportRow] = []
-		for asset in sorted(disposed_assets):
-			disposals_for_asset = [bd for bd in booked_disposals if bd.disposed_asset() == asset]
-
-			stcg: Decimal = sum([bd.stcg() for bd in disposals_for_asset])
-			ltcg: Decimal = sum([bd.ltcg() for bd in disposals_for_asset])
-			ltcg_tax = ltcg * lt_rate
-			stcg_tax = stcg * st_rate
-			rows.append(TaxReportRow(asset, ltcg, stcg, ltcg_tax, stcg_tax, ltcg_tax + stcg_tax))
-
-			total_tax += ltcg_tax + stcg_tax
-			total_row = TaxReportRow("(total)",
-							total_row.ltcg + ltcg,
-							total_row.stcg + stcg,
-							total_row.ltcg_tax + ltcg_tax,
-							total_row.stcg_tax + stcg_tax,
-							total_row.total_tax + ltcg_tax + stcg_tax)
-
-		report = TaxReport(rows, total_row)
-
 		self.renderer.tax_report(report)
 
 	def get_booked_disposals(self, ty: int):
@@ -432,15 +418,27 @@ class ReportDriver:
 		end = datetime.date(ty+1, 1, 1)
 		inclusive_end = end - datetime.timedelta(days=1)
 
-		# Get the disposals to report.  (Given disposals are all we need, there might be a
-		# simpler way to obtain them.)
-		(inventories_by_acct, all_entries) = self.get_inventory_and_entries(start, end)
+		# Get the disposals to report.
+		all_entries = self.get_entries(start, end)
 		all_txs = list(filter(lambda x: isinstance(x, Transaction), all_entries))
 		(disposals, purchases, mining_awards) = self.partition_entries(all_txs, self.numeraire)
 		booked_disposals = [BookedDisposal(e, self.numeraire) for e in disposals]
 
 		return booked_disposals
 
+	def iter_booked_disposals(self, ty: int) -> Iterator[BookedDisposal]:
+		"""Yield the disposals of the given tax year, as get_booked_disposals()
+		but without holding them all."""
+		for e in self.get_entries(datetime.date(ty, 1, 1), datetime.date(ty+1, 1, 1)):
+			if isinstance(e, Transaction) and is_disposal_tx(e) and self.selects(e):
+				yield BookedDisposal(e, self.numeraire)
+
+	def write_form_8949(self, path: str, tax_years: List[int], fmt: str, row_kind: str) -> int:
+		"""Export the 8949 rows of the tax years (see form8949.py); returns
+		the number of rows written."""
+		return form8949.export(
+			(bd for ty in tax_years for bd in self.iter_booked_disposals(ty)), path, fmt, row_kind)
+
 	def run_detailed_log(self, start: datetime.date, end: datetime.date):
 		"""Generate a detailed log report of activity during the period."""
 		inclusive_end = end - datetime.timedelta(days=1)
@@ -448,97 +446,115 @@ class ReportDriver:
 			raise ValueError(f"Start and end dates must be in same tax year: {start}, {end}")
 		ty = start.year
 
-		# This is a little confusing -- we'll call get_inventory_and_entries()
-		# multiple times; the first time for the entire period, to get all
-		# entries, and then subsequent times to get an inventory for the date
-		# for each page.
-		(_, all_entries) = self.get_inventory_and_entries(start, end)
-		all_txs = list(filter(lambda x: isinstance(x, Transaction), all_entries))
+		all_entries = self.get_entries(start, end)
+		all_txs = [e for e in all_entries if isinstance(e, Transaction) and self.selects(e)]
 
 		self.renderer.header(f"{ty} Transaction Log")
 		self.renderer.subheader(f"{ty} Disposals and Gain/Loss summary (repeated)")
 		self.run_disposals_summaries(ty)
 
-		pages: List[List[Transaction]] = list(paginate_entries(all_txs, 80))
-		n_pages = len(pages)
-		for page_num in range(len(pages)):
+		# Pages are paginated lazily, one ahead (for the end of each page's
+		# date range), and each page's reports are dropped once rendered, so
+		# only one page is held at a time.
+		n_pages = sum(1 for _ in paginate_entries(all_txs, 80))
+		pages: Iterator[List[Transaction]] = paginate_entries(all_txs, 80)
+		next_page: Optional[List[Transaction]] = next(pages, None)
+		for page_num in range(n_pages):
 			# The transactions on this page
-			tx_page: List[Transaction] = list(pages[page_num])
-
-			# Get the timestamp window of these transactions
-			page_date_start: datetime.date = (start if page_num == 0 else tx_page[0].date)
-			page_ts_start: datetime.datetime = datetime.datetime.combine(page_date_start, datetime.time.min)
-			for e in tx_page:
-				if 'timestamp' in e.meta:
-					page_ts_start = dateutil.parser.parse(e.meta['timestamp'])
-					break
-
-			page_date_end: datetime.date = (inclusive_end if page_num == len(pages) - 1
-			   else max(tx_page[-1].date, pages[page_num + 1][0].date - datetime.timedelta(days=1)))
-			page_ts_end: datetime.datetime = datetime.datetime.combine(page_date_end, datetime.time.max)
-			for e in reversed(tx_page):
-				if 'timestamp' in e.meta:
-					page_ts_end = dateutil.parser.parse(e.meta['timestamp'])
-					break
+			tx_page: List[Transaction] = next_page
+			next_page = next(pages, None)
+			if not self.selection.has_page(page_num):
+				continue
+
+			# A page depends on the entries up to the next page's first
+			# transaction, which sets its end date.
+			boundary = (self.entry_index(next_page[0]) if next_page is not None
+			   else self.boundary_at_date(end))
+			(page_ts_start, page_ts_end, inv_report, acquisitions_report_rows, disposals_report) = self.model(
+				("detailed_log_page", ty, page_num), boundary,
+				lambda: self.make_detailed_log_page(start, inclusive_end, page_num, tx_page, next_page))
 
 			# Progress; also, context in case of error later
 			print(f"    page {page_num}, {page_ts_start} -- {page_ts_end}")
 
-			# Partition entries into disposals, acquisitions, and mining awards
-			(disposals, purchases, mining_awards) = self.partition_entries(tx_page, self.numeraire)
-
-			# inventories_by_acct is a dict mapping account names to inventories, which
-			# in turn are dicts mapping currencies to lists of positions.
-			inventories_by_acct = self.get_inventory_at_ts(page_ts_start)
-
-			# First organize inventories by currency, and sort, so that we can
-			# assign lot IDs in order.
-			inventory_blocks: List[InventoryBlock] = []
-			for acct in inventories_by_acct.keys():
-				for (cur, positions) in inventories_by_acct[acct].split().items():
-					inventory_blocks.append(
-						InventoryBlock(
-							cur, acct,
-							sorted(positions, key=lambda x: -abs(x.units.number))))
-			inventory_blocks.sort()
-
-			# Collect inventory and acquisition reports
-			# Populate the lot index, and assign IDs to the interesting lots
-			all_acquisitions = purchases + mining_awards
-			lot_index = LotIndex(inventory_blocks, all_acquisitions, disposals, self.numeraire)
-			inv_report = self.make_inventory_report(page_ts_start, inventory_blocks, lot_index)
-			acquisitions_report_rows = self.make_acquisitions_report(purchases, mining_awards, lot_index)
-
-			booked_disposals = [BookedDisposal(e, self.numeraire) for e in disposals]
-			disposals_report = self.make_disposals_report_detailed(booked_disposals, lot_index)
-
 			# Render.
 			self.renderer.newpage()
 			self.renderer.subheader(
 				f"{ty} Detailed Activity Log ({page_num+1}/{n_pages}): "
 				+ f"{page_ts_start.strftime('%m-%d %H:%M:%S UTC')} -- {page_ts_end.strftime('%m-%d %H:%M:%S UTC')}")
 			self.renderer.details_page(inv_report, acquisitions_report_rows, disposals_report)
+			del inv_report, acquisitions_report_rows, disposals_report
+
+	def make_detailed_log_page(self, start: datetime.date, inclusive_end: datetime.date, page_num: int,
+							tx_page: List[Transaction], next_page: Optional[List[Transaction]]
+							) -> DetailedLogPage:
+		"""Compute the data models of a page of the detailed log for the
+		period, given its transactions and the next page's (if any)."""
+		# Get the timestamp window of these transactions
+		page_date_start: datetime.date = (start if page_num == 0 else tx_page[0].date)
+		page_ts_start: datetime.datetime = datetime.datetime.combine(page_date_start, datetime.time.min)
+		for e in tx_page:
+			if 'timestamp' in e.meta:
+				page_ts_start = dateutil.parser.parse(e.meta['timestamp'])
+				break
+
+		page_date_end: datetime.date = (inclusive_end if next_page is None
+		   else max(tx_page[-1].date, next_page[0].date - datetime.timedelta(days=1)))
+		page_ts_end: datetime.datetime = datetime.datetime.combine(page_date_end, datetime.time.max)
+		for e in reversed(tx_page):
+			if 'timestamp' in e.meta:
+				page_ts_end = dateutil.parser.parse(e.meta['timestamp'])
+				break
+
+		# Partition entries into disposals, acquisitions, and mining awards
+		(disposals, purchases, mining_awards) = self.partition_entries(tx_page, self.numeraire)
+
+		# inventories_by_acct is a dict mapping account names to inventories, which
+		# in turn are dicts mapping currencies to lists of positions.
+		inventories_by_acct = self.get_inventory_at_ts(page_ts_start)
+
+		# First organize inventories by currency, and sort.
+		inventory_blocks: List[InventoryBlock] = []
+		for acct in inventories_by_acct.keys():
+			for (cur, positions) in inventories_by_acct[acct].split().items():
+				if self.selection.assets is not None and cur not in self.selection.assets:
+					continue
+				inventory_blocks.append(
+					InventoryBlock(
+						cur, acct,
+						sorted(positions, key=lambda x: -abs(x.units.number))))
+		inventory_blocks.sort()
+
+		# Collect inventory and acquisition reports, showing IDs for the
+		# lots referenced by this page's disposals
+		lot_index = self.lot_registry.page_view(disposals)
+		inv_report = self.make_inventory_report(page_ts_start, inventory_blocks, lot_index)
+		acquisitions_report_rows = self.make_acquisitions_report(purchases, mining_awards, lot_index)
 
-	def run_mining_income_sched_c(self, title: str, ty: int):
-		self.renderer.subreport_header(title)
+		booked_disposals = [BookedDisposal(e, self.numeraire) for e in disposals]
+		disposals_report = self.make_disposals_report_detailed(booked_disposals, lot_index)
+
+		return (page_ts_start, page_ts_end, inv_report, acquisitions_report_rows, disposals_report)
 
+	def make_mining_summary(self, ty: int) -> Optional[List[MiningSummaryRow]]:
+		"""Return the mining summary rows for the year by month, or None if
+		there was no mining."""
 		# see this:
 		# def iter_entry_dates(entries, date_begin, date_end):
-		ty_entries = [e for e in self.entries if e.date.year == ty]
+		ty_entries = self.get_entries(datetime.date(ty, 1, 1), datetime.date(ty + 1, 1, 1))
 
 		currency = "XCH"  # TODO: generalize!
 		mining_stats_by_month = [MiningStats(currency) for _ in range(12)]
 
 		found_mining_tx = False
 		for e in ty_entries:
-			if is_mining_tx(e):
+			if is_mining_tx(e) and self.selects(e):
 				found_mining_tx = True
 				month = e.date.month - 1
 				accrue_mining_stats(e, mining_stats_by_month[month])
 
 		if not found_mining_tx:
-			self.renderer.write_text("(No mining transactions in this period.)")
-			return
+			return None
 
 		rows = []
 
@@ -558,6 +574,16 @@ class ReportDriver:
 				stats.avg_price(),
 				stats.total_fmv,
 				cumulative_fmv))
+		return rows
+
+	def run_mining_income_sched_c(self, title: str, ty: int):
+		self.renderer.subreport_header(title)
+
+		rows = self.model(("mining_summary", ty), self.boundary_at_date(datetime.date(ty + 1, 1, 1)),
+						  lambda: self.make_mining_summary(ty))
+		if rows is None:
+			self.renderer.write_text("(No mining transactions in this period.)")
+			return
 
 		self.renderer.mining_summary(rows)
 
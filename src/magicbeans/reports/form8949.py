@@ -0,0 +1,129 @@
+"""Export of the Form 8949 rows, for import into other tax tools.
+
+Walks the booked disposals once, in ledger order, writing one row per
+disposal, or per consolidated group of disposals (by BDGroupKey: asset,
+acquisition date, disposal date and term group, as in the report's 8949
+summaries), to a CSV or JSONL file as it goes.  Nothing is kept per row: a
+disposal's row is written as soon as it's read, and a group's once the
+disposals move on to a later date, so only the groups of one day are held
+at a time.  (A disposal dated before the day being grouped, out of ledger
+order, starts a group of its own.)
+
+Unlike the report's summaries, disposals with neither short nor long term
+gains (e.g., disposed of at cost) are included, with an empty term.
+"""
+
+import csv
+import datetime
+import json
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, NamedTuple, TextIO
+
+from beancount.core.number import ZERO
+from magicbeans.disposals import BDGroupKey, BookedDisposal
+from magicbeans.writer import BUFFER_SIZE
+
+FORMATS = ["csv", "jsonl"]
+
+# One row per disposal, or per group of disposals
+DISPOSAL = "disposal"
+GROUP = "group"
+ROW_KINDS = [DISPOSAL, GROUP]
+
+
+class Form8949Row(NamedTuple):
+    description: str        # Description of property, e.g. "0.5 BTC"
+    asset: str
+    amount: Decimal
+    acquired: str           # Date, or "Various"
+    disposed: datetime.date
+    proceeds: Decimal
+    cost: Decimal
+    gain: Decimal
+    term: str               # One of TERM_GROUPS, or ""
+
+
+FIELDS = list(Form8949Row._fields)
+
+
+def _text(value) -> str:
+    # Decimals in fixed point, as not all tools read e.g. "0E-8"
+    return f"{value:f}" if isinstance(value, Decimal) else str(value)
+
+
+def _row(key: BDGroupKey, amount: Decimal, proceeds: Decimal, cost: Decimal) -> Form8949Row:
+    return Form8949Row(f"{amount:f} {key.asset}", key.asset, amount, str(key.acquired),
+                       key.disposed, proceeds, cost, proceeds - cost, key.term or "")
+
+
+def disposal_rows(booked_disposals: Iterable[BookedDisposal]) -> Iterator[Form8949Row]:
+    """Yield a row for each disposal."""
+    for bd in booked_disposals:
+        yield _row(BDGroupKey.new(bd), bd.disposed_amount(),
+                   bd.numeraire_proceeds + bd.other_proceeds, bd.disposed_cost)
+
+
+def group_rows(booked_disposals: Iterable[BookedDisposal]) -> Iterator[Form8949Row]:
+    """Yield a row for each group of disposals, ordered by disposal date and
+    then by first appearance."""
+    day = None
+    # Key -> [amount, proceeds, cost], in order of first appearance
+    groups: Dict[BDGroupKey, List[Decimal]] = {}
+    for bd in booked_disposals:
+        key = BDGroupKey.new(bd)
+        if key.disposed != day:
+            if day is None or key.disposed > day:
+                yield from _group_rows(groups)
+                groups = {}
+                day = key.disposed
+            else:
+                # Out of order; don't mix it into the current day's groups.
+                yield from group_rows([bd])
+                continue
+        totals = groups.get(key)
+        if totals is None:
+            totals = groups[key] = [ZERO, ZERO, ZERO]
+        totals[0] += bd.disposed_amount()
+        totals[1] += bd.numeraire_proceeds + bd.other_proceeds
+        totals[2] += bd.disposed_cost
+    yield from _group_rows(groups)
+
+
+def _group_rows(groups: Dict[BDGroupKey, List[Decimal]]) -> Iterator[Form8949Row]:
+    for (key, (amount, proceeds, cost)) in groups.items():
+        yield _row(key, amount, proceeds, cost)
+
+
+def write_csv(rows: Iterable[Form8949Row], out: TextIO) -> int:
+    """Write the rows under a header row; returns the number written."""
+    writer = csv.writer(out)
+    writer.writerow(FIELDS)
+    n_rows = 0
+    for row in rows:
+        writer.writerow([_text(value) for value in row])
+        n_rows += 1
+    return n_rows
+
+
+def write_jsonl(rows: Iterable[Form8949Row], out: TextIO) -> int:
+    """Write the rows as JSON objects, one per line (with numbers as
+    strings, to keep their precision); returns the number written."""
+    n_rows = 0
+    for row in rows:
+        out.write(json.dumps({field: _text(value) for (field, value) in zip(FIELDS, row)}))
+        out.write("\n")
+        n_rows += 1
+    return n_rows
+
+
+def export(booked_disposals: Iterable[BookedDisposal], path: str,
+           fmt: str = "csv", row_kind: str = GROUP) -> int:
+    """Write the rows of the disposals to the file, in one of FORMATS, with
+    one of ROW_KINDS; returns the number of rows written."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown 8949 export format {fmt}")
+    if row_kind not in ROW_KINDS:
+        raise ValueError(f"Unknown 8949 row kind {row_kind}")
+    rows = (group_rows if row_kind == GROUP else disposal_rows)(booked_disposals)
+    with open(path, "w", newline="", buffering=BUFFER_SIZE) as out:
+        return (write_csv if fmt == "csv" else write_jsonl)(rows, out)
@@ -0,0 +1,125 @@
+"""Content-addressed cache of rendered report fragments.
+
+Adding one late transaction to the ledger used to mean re-rendering (and
+recompiling) every page of every year, though nearly all of them come out
+the same.  The detailed log's pages and the summary tables are instead
+rendered as fragments, each cached under a hash of its inputs: the data
+models passed to the renderer (InventoryReport, acquisitions rows,
+DisposalsReport and so on), the rendering method, and the renderer's source.
+On regeneration, only fragments whose inputs changed are rendered again.
+
+Inputs are hashed by value: NamedTuples (including beancount's) field by
+field, except for `meta`, which holds source file positions that don't
+affect rendering and would shift whenever an earlier entry is added.
+
+Compiled documents are cached the same way, under a hash of their source,
+so a split report (see latexsplit) only recompiles the years in which some
+fragment changed.
+"""
+
+import datetime
+import hashlib
+import os
+import shutil
+import tempfile
+from decimal import Decimal
+from typing import List, Optional, Set, Tuple
+
+
+def canonical(obj) -> str:
+    """Return a string identifying a data model value."""
+    if isinstance(obj, tuple) and hasattr(obj, "_fields"):
+        fields = ",".join(f"{field}={canonical(value)}"
+                          for (field, value) in zip(obj._fields, obj) if field != "meta")
+        return f"{type(obj).__name__}({fields})"
+    if isinstance(obj, (list, tuple)):
+        return "[" + ",".join(canonical(x) for x in obj) + "]"
+    if isinstance(obj, (set, frozenset)):
+        return "{" + ",".join(sorted(canonical(x) for x in obj)) + "}"
+    if isinstance(obj, dict):
+        return "{" + ",".join(f"{canonical(k)}:{canonical(v)}" for (k, v) in sorted(obj.items())) + "}"
+    if obj is None or isinstance(obj, (str, int, float, bool, Decimal, datetime.date)):
+        return repr(obj)
+    raise TypeError(f"Can't fingerprint {type(obj).__name__} {obj!r}")
+
+
+def fingerprint(*inputs) -> str:
+    return hashlib.sha256(canonical(inputs).encode()).hexdigest()
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class FragmentCache:
+    """Rendered fragments and compiled documents, as files in a directory.
+
+    A fragment is stored with the names of the LaTeX packages it uses, which
+    the document must load wherever the fragment is used."""
+
+    def __init__(self, directory: str, salt: str = "") -> None:
+        self.directory = directory
+        self.salt = salt
+        self.hits = 0
+        self.misses = 0
+        self._used: Set[str] = set()
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, kind: str, *inputs) -> str:
+        return fingerprint(self.salt, kind, *inputs)
+
+    def get(self, key: str) -> Optional[Tuple[str, List[str]]]:
+        """Return the (text, package names) of a fragment, if cached."""
+        path = self._path(key, ".tex")
+        self._used.add(path)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+        self.hits += 1
+        with open(path, encoding="utf-8", newline="") as f:
+            packages = f.readline().split()
+            return (f.read(), packages)
+
+    def put(self, key: str, text: str, packages: List[str]) -> None:
+        self._write(self._path(key, ".tex"), (" ".join(packages) + "\n" + text).encode("utf-8"))
+
+    def get_pdf(self, tex_path: str, pdf_path: str) -> bool:
+        """Copy the compiled PDF of the .tex file's source to pdf_path, if
+        cached; returns whether it was."""
+        cached = self._path(file_digest(tex_path), ".pdf")
+        self._used.add(cached)
+        if not os.path.exists(cached):
+            return False
+        shutil.copyfile(cached, pdf_path)
+        return True
+
+    def put_pdf(self, tex_path: str, pdf_path: str) -> None:
+        cached = self._path(file_digest(tex_path), ".pdf")
+        self._used.add(cached)
+        with open(pdf_path, "rb") as f:
+            self._write(cached, f.read())
+
+    def prune(self) -> int:
+        """Remove the entries not used since the cache was opened; returns
+        the number removed."""
+        removed = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if path not in self._used:
+                os.remove(path)
+                removed += 1
+        return removed
+
+    def _path(self, key: str, extension: str) -> str:
+        return os.path.join(self.directory, key + extension)
+
+    def _write(self, path: str, content: bytes) -> None:
+        # Write and rename, so an interrupted run can't leave a partial entry.
+        (fd, tmp_path) = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
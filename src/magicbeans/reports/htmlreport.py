@@ -0,0 +1,398 @@
+"""Static HTML report, with its data in chunks loaded on demand.
+
+The PDF of a very active ledger runs to thousands of pages, which are slow
+to compile and to open.  HtmlRenderer instead writes a directory holding a
+small index.html (the cover page and table of contents, and the code to
+render the rest) and the report's data, as the data models of data.py in
+compressed JSON chunks: one per section of the report (e.g., a year's tax
+reporting info, or its transaction log), and one per PAGES_PER_CHUNK pages
+of the detailed log.  The browser loads a section's chunk when it's opened,
+and the pages' chunks only when a page is.  Chunks are written as each
+section (or run of pages) ends, so generation holds one section at a time,
+and takes time linear in the size of the report, with no LaTeX.
+
+Browsers won't fetch() files from a file:// URL, so to keep the report
+viewable offline, straight from the directory, each chunk is a script
+passing its data (gzipped JSON, base64-encoded) to the index page, which
+decompresses it with DecompressionStream.
+"""
+
+import base64
+import datetime
+import gzip
+import json
+import os
+from decimal import Decimal
+from typing import List, Optional
+
+from magicbeans.reports.data import (AcquisitionsReportRow, CoverPage, DisposalsReport,
+                                     DisposalsSummary, InventoryReport, MiningSummaryRow,
+                                     TaxReport)
+from magicbeans.reports.renderer import Renderer, plain_text
+from magicbeans.writer import BUFFER_SIZE
+
+DATA_DIR = "data"
+INDEX_FILENAME = "index.html"
+PAGES_PER_CHUNK = 20
+
+
+def jsonable(obj):
+    """Convert a data model value to JSON-compatible values: NamedTuples
+    (including beancount's, less their `meta`) to objects, Decimals to
+    strings (keeping their precision) and dates to ISO format."""
+    if isinstance(obj, tuple) and hasattr(obj, "_fields"):
+        return {field: jsonable(value)
+                for (field, value) in zip(obj._fields, obj) if field != "meta"}
+    if isinstance(obj, (list, tuple)):
+        return [jsonable(x) for x in obj]
+    if isinstance(obj, (set, frozenset)):
+        return sorted(jsonable(x) for x in obj)
+    if isinstance(obj, Decimal):
+        return f"{obj:f}"
+    if isinstance(obj, (datetime.date, datetime.datetime)):
+        return obj.isoformat()
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    raise TypeError(f"Can't convert {type(obj).__name__} {obj!r} to JSON")
+
+
+class HtmlRenderer(Renderer):
+    """Writes the report to a directory, as index.html and data chunks."""
+
+    def __init__(self, directory: str, pages_per_chunk: int = PAGES_PER_CHUNK) -> None:
+        self.directory = directory
+        self.pages_per_chunk = pages_per_chunk
+        os.makedirs(os.path.join(directory, DATA_DIR), exist_ok=True)
+        self.cover: Optional[dict] = None
+        # Titles and chunk names of the sections, for the table of contents
+        self.sections: List[dict] = []
+        self.n_chunks = 0
+        self._items: Optional[list] = None
+        self._pages: list = []
+        self._pages_chunk: Optional[str] = None
+
+    def close(self) -> None:
+        self._end_section()
+        report = {"cover": self.cover, "sections": self.sections}
+        # Escape "</", so no string can end the script element.
+        report_json = json.dumps(report).replace("</", "<\\/")
+        with open(os.path.join(self.directory, INDEX_FILENAME), "w", encoding="utf-8") as out:
+            out.write(_INDEX.replace("%REPORT%", report_json))
+
+    def write_paragraph(self, text: str) -> None:
+        self._item("paragraph", text=plain_text(text))
+
+    def write_text(self, text: str) -> None:
+        self._item("text", text=text)
+
+    def newpage(self) -> None:
+        pass
+
+    def header(self, title: str) -> None:
+        self._end_section()
+        self._start_section(plain_text(title))
+
+    def subheader(self, title: str, q: str = None) -> None:
+        self._item("subheader", title=plain_text(title))
+
+    def subreport_header(self, title: str, q: str = None) -> None:
+        self.subheader(title, q)
+
+    def coverpage(self, page: CoverPage) -> None:
+        self.cover = {"title": plain_text(page.title),
+                      "summary_lines": [plain_text(line) for line in page.summary_lines],
+                      "text": plain_text(page.text)}
+
+    def details_page(self,
+                     inventory_report: InventoryReport,
+                     acquisitions_report_rows: List[AcquisitionsReportRow],
+                     disposals_report: DisposalsReport) -> None:
+        # The page's subheader titles its (collapsed) entry in the section.
+        title = self._items.pop()["title"] if self._items and self._items[-1]["kind"] == "subheader" else ""
+        if self._pages_chunk is None:
+            self._pages_chunk = self._chunk_name()
+        self._item("page", title=title, chunk=self._pages_chunk, index=len(self._pages))
+        self._pages.append({"inventory": jsonable(inventory_report),
+                            "acquisitions": jsonable(acquisitions_report_rows),
+                            "disposals": jsonable(disposals_report)})
+        if len(self._pages) >= self.pages_per_chunk:
+            self._end_pages()
+
+    def tax_report(self, tax_report: TaxReport) -> None:
+        self._item("tax_report", report=jsonable(tax_report))
+
+    def disposals_summary(self, title: str, disposals_summary: DisposalsSummary) -> None:
+        self._item("disposals_summary", title=plain_text(title), summary=jsonable(disposals_summary))
+
+    def mining_summary(self, rows: List[MiningSummaryRow]) -> None:
+        self._item("mining_summary", rows=jsonable(rows))
+
+    def _item(self, kind: str, **fields) -> None:
+        if self._items is None:
+            self._start_section("")
+        fields["kind"] = kind
+        self._items.append(fields)
+
+    def _start_section(self, title: str) -> None:
+        self._items = []
+        self.sections.append({"title": title, "chunk": self._chunk_name()})
+
+    def _end_section(self) -> None:
+        self._end_pages()
+        if self._items is not None:
+            self._write_chunk(self.sections[-1]["chunk"], self._items)
+            self._items = None
+
+    def _end_pages(self) -> None:
+        if self._pages:
+            self._write_chunk(self._pages_chunk, self._pages)
+            self._pages = []
+            self._pages_chunk = None
+
+    def _chunk_name(self) -> str:
+        self.n_chunks += 1
+        return f"{self.n_chunks:05d}"
+
+    def chunk_path(self, name: str) -> str:
+        return os.path.join(self.directory, DATA_DIR, name + ".js")
+
+    def _write_chunk(self, name: str, data) -> None:
+        compressed = gzip.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"), mtime=0)
+        with open(self.chunk_path(name), "w", buffering=BUFFER_SIZE) as out:
+            out.write(f'magicbeans.chunk("{name}","')
+            out.write(base64.b64encode(compressed).decode("ascii"))
+            out.write('");\n')
+
+
+def read_chunk(path: str):
+    """Return the data of a chunk file (as the index page decodes it)."""
+    with open(path) as f:
+        script = f.read()
+    encoded = script[script.index('","') + 3:script.rindex('")')]
+    return json.loads(gzip.decompress(base64.b64decode(encoded)))
+
+
+_INDEX = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Magicbeans Tax Report</title>
+<style>
+body { font-family: Helvetica, Arial, sans-serif; font-size: 13px; margin: 1em 2em; }
+details.section > summary { font-size: 1.4em; font-weight: bold; margin: 0.6em 0; cursor: pointer; }
+details.page > summary { font-weight: bold; margin: 0.3em 0; cursor: pointer; }
+table { border-collapse: collapse; margin: 0.5em 0 1em 0; }
+caption { font-weight: bold; text-align: left; }
+th, td { padding: 1px 6px; border-bottom: 1px solid #ddd; vertical-align: top; }
+th { border-bottom: 1px solid #888; }
+td.num { text-align: right; font-variant-numeric: tabular-nums; }
+tr.total td { border-top: 1px solid #888; font-weight: bold; }
+.gray { color: #888; }
+.columns { display: flex; gap: 2em; align-items: flex-start; }
+.error { color: #b00; }
+</style>
+</head>
+<body>
+<div id="report"></div>
+<script>
+const REPORT = %REPORT%;
+
+// Chunks are scripts calling magicbeans.chunk() with gzipped, base64-encoded
+// JSON (see htmlreport.py).
+const loaded = {};
+const waiting = {};
+const magicbeans = {chunk(name, data) { waiting[name](data); }};
+
+function loadChunk(name) {
+  if (!loaded[name]) {
+    loaded[name] = new Promise((resolve, reject) => {
+      waiting[name] = resolve;
+      const script = document.createElement("script");
+      script.src = "data/" + name + ".js";
+      script.onerror = () => reject(new Error("Couldn't load " + script.src));
+      document.head.appendChild(script);
+    }).then(inflate);
+  }
+  return loaded[name];
+}
+
+async function inflate(encoded) {
+  const bytes = Uint8Array.from(atob(encoded), c => c.charCodeAt(0));
+  const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("gzip"));
+  return JSON.parse(await new Response(stream).text());
+}
+
+function el(tag, text, className) {
+  const node = document.createElement(tag);
+  if (text !== undefined && text !== null) node.textContent = text;
+  if (className) node.className = className;
+  return node;
+}
+
+// Numbers are decimal strings, or beancount Amounts; zero shows as blank.
+function num(value, places) {
+  if (value && typeof value === "object") value = value.number;
+  if (value === null || value === undefined || Number(value) === 0) return "";
+  return Number(value).toFixed(places);
+}
+
+function table(caption, headers, rows, totalRow) {
+  const t = el("table");
+  if (caption) t.appendChild(el("caption", caption));
+  const head = t.appendChild(el("tr"));
+  headers.forEach(h => head.appendChild(el("th", h)));
+  const addRow = (cells, className) => {
+    const tr = t.appendChild(el("tr", null, className));
+    cells.forEach(cell => {
+      if (cell instanceof Node) { tr.appendChild(el("td")).appendChild(cell); return; }
+      const isNum = /^-?[0-9.]+$/.test(cell);
+      tr.appendChild(el("td", cell, isNum ? "num" : ""));
+    });
+  };
+  rows.forEach(r => addRow(r));
+  if (totalRow) addRow(totalRow, "total");
+  return t;
+}
+
+function taxReport(report) {
+  const row = (asset, r) => [asset, num(r.ltcg, 2), num(r.stcg, 2), num(r.ltcg_tax, 2),
+                              num(r.stcg_tax, 2), num(r.total_tax, 2)];
+  return table(null,
+    ["Asset", "Long term gain/loss", "Short term gain/loss", "LTCG Tax", "STCG Tax", "Total Tax"],
+    report.rows.map(r => row(r.asset, r)), row("Total", report.total_row));
+}
+
+function disposalsSummary(title, summary) {
+  const proceeds = r => num(Number(r.numeraire_proceeds) + Number(r.other_proceeds), 2);
+  const t = summary.total_row;
+  return table(title,
+    ["Assets", "Date Acquired", "Date Disposed", "Proceeds", "Cost", "Gain", "STCG", "(cumul)", "LTCG", "(cumul)"],
+    summary.rows.map(r => [num(r.disposed_amount, 4) + " " + r.disposed_currency, r.acquisition_date, r.date,
+                           proceeds(r), num(r.disposed_cost, 2), num(r.gain, 2), num(r.stcg, 2),
+                           el("span", num(r.cum_stcg, 2), "gray"), num(r.ltcg, 2), el("span", num(r.cum_ltcg, 2), "gray")]),
+    ["Total: " + num(t.disposed_amount, 8), "", "", proceeds(t), num(t.disposed_cost, 2), num(t.gain, 2),
+     num(t.stcg, 2), "", num(t.ltcg, 2), ""]);
+}
+
+function miningSummary(rows) {
+  if (!rows.length) return el("p", "(No mining income)");
+  const last = rows[rows.length - 1];
+  return table(null,
+    ["Month", "#Awards", "Amount mined", "Asset", "Avg award size", "Cumulative total", "Avg. cost", "FMV earned", "Cumulative FMV"],
+    rows.map(r => [String(r.month), String(r.n_awards), num(r.amount_mined, 8), r.currency, num(r.avg_award_size, 8),
+                   num(r.cumul_total, 4), num(r.avg_cost, 4), num(r.fmv_earned, 4), num(r.cumulative_fmv, 2)]),
+    ["Total cumulative fair market value of all mined tokens:", "", "", "", "", "", "", "", num(last.cumulative_fmv, 2)]);
+}
+
+function lotRef(leg, id) {
+  const cost = leg.cost || {};
+  return num(-leg.units.number, 4) + " " + leg.units.currency + " {" + (id ? "#" + id + " " : "") +
+    num(cost.number, 4) + " " + cost.currency + " " + cost.date + "}";
+}
+
+function inventory(report) {
+  const rows = [];
+  report.accounts.forEach(a => {
+    const n = a.positions_and_ids.length;
+    rows.push([el("b", a.account), "", "", ""]);
+    rows.push([num(a.total.number, 6), "total in " + n + " lot" + (n > 1 ? "s" : ""), "", "ID"]);
+    a.positions_and_ids.forEach(([pos, id]) =>
+      rows.push([num(pos.units.number, 6), num(pos.cost.number, 4), pos.cost.date, id ? "#" + id : ""]));
+  });
+  if (!rows.length) rows.push(["No inventory to report", "", "", ""]);
+  return table("Inventory " + report.ts, ["Units", "Cost", "Acquired", ""], rows);
+}
+
+function acquisitions(rows) {
+  return table("Acquisitions", ["Date", "", "Cost ea.", "Total cost", "Lot ID", ""],
+    rows.map(r => [r.date, num(r.amount, 6) + " " + r.cur, num(r.cost_ea, 4), num(r.total_cost, 2),
+                   r.lotid ? "#" + r.lotid : "", el("span", r.narration, "gray")]));
+}
+
+function disposals(report) {
+  const rows = [];
+  report.rows.forEach(r => {
+    const proceeds = el("span", num(r.numeraire_proceeds, 2));
+    if (num(r.other_proceeds, 2)) {
+      proceeds.append(proceeds.textContent ? " + " : "", el("i", num(r.other_proceeds, 2)));
+    }
+    rows.push([r.date, num(r.disposed_amount, 4) + " " + r.disposed_currency, proceeds, num(r.disposed_cost, 2),
+               num(r.gain, 2), num(r.stcg, 2), el("span", num(r.cum_stcg, 2), "gray"), num(r.ltcg, 2),
+               el("span", num(r.cum_ltcg, 2), "gray")]);
+    rows.push(["", el("span", r.narration, "gray"), "", "", "", "", "", "", ""]);
+    r.numeraire_proceeds_legs.forEach(leg =>
+      rows.push(["+", num(leg.units.number, 4) + " " + leg.units.currency, "", "", "", "", "", "", ""]));
+    r.other_proceeds_legs.forEach(leg =>
+      rows.push(["+", num(leg.units.number, 4) + " " + leg.units.currency + " value ea " + num(leg.cost.number, 4),
+                 "", "", "", "", "", "", ""]));
+    r.disposal_legs_and_ids.forEach(([leg, id], i) => {
+      let ref = lotRef(leg, id);
+      if (i === r.disposal_legs_and_ids.length - 1 && r.num_legs_omitted > 0) {
+        ref += ", and " + r.num_legs_omitted + " more (smaller) lot(s)";
+      }
+      rows.push(["\\u2212", ref, "", "", "", "", "", "", ""]);
+    });
+  });
+  return table("Disposals", ["Date", "", "Proceeds", "Cost", "Gain", "STCG", "(cumul)", "LTCG", "(cumul)"], rows,
+    ["", "Total", "", "", "", "", num(report.cumulative_stcg, 2), "", num(report.cumulative_ltcg, 2)]);
+}
+
+function renderPage(page) {
+  const columns = el("div", null, "columns");
+  columns.appendChild(el("div")).appendChild(inventory(page.inventory));
+  const right = columns.appendChild(el("div"));
+  right.appendChild(acquisitions(page.acquisitions));
+  right.appendChild(disposals(page.disposals));
+  return columns;
+}
+
+// Render into the node's contents, from a chunk loaded when it's first opened.
+function lazily(details, load, render) {
+  details.addEventListener("toggle", () => {
+    if (!details.open || details.dataset.loaded) return;
+    details.dataset.loaded = "1";
+    const status = details.appendChild(el("p", "Loading\\u2026"));
+    load().then(data => { status.remove(); render(data); },
+                error => { status.textContent = String(error); status.className = "error"; });
+  });
+}
+
+function renderItem(item, parent) {
+  switch (item.kind) {
+    case "paragraph":
+      item.text.split(/\\n\\s*\\n/).forEach(p => parent.appendChild(el("p", p)));
+      break;
+    case "text": parent.appendChild(el("p", item.text)); break;
+    case "subheader": parent.appendChild(el("h3", item.title)); break;
+    case "tax_report": parent.appendChild(taxReport(item.report)); break;
+    case "disposals_summary": parent.appendChild(disposalsSummary(item.title, item.summary)); break;
+    case "mining_summary": parent.appendChild(miningSummary(item.rows)); break;
+    case "page": {
+      const details = parent.appendChild(el("details", null, "page"));
+      details.appendChild(el("summary", item.title || "Page"));
+      lazily(details, () => loadChunk(item.chunk), pages => details.appendChild(renderPage(pages[item.index])));
+      break;
+    }
+  }
+}
+
+function renderReport() {
+  const root = document.getElementById("report");
+  if (REPORT.cover) {
+    document.title = REPORT.cover.title;
+    root.appendChild(el("h1", REPORT.cover.title));
+    REPORT.cover.summary_lines.forEach(line => root.appendChild(el("p", line)));
+    renderItem({kind: "paragraph", text: REPORT.cover.text}, root);
+  }
+  REPORT.sections.forEach(section => {
+    const details = root.appendChild(el("details", null, "section"));
+    details.appendChild(el("summary", section.title));
+    lazily(details, () => loadChunk(section.chunk), items => items.forEach(item => renderItem(item, details)));
+  });
+}
+
+renderReport();
+</script>
+</body>
+</html>
+"""
@@ -4,6 +4,7 @@ from beanquery.query_render import render_text
 from magicbeans import disposals
 from magicbeans.disposals import abbrv_disposal, format_money
 from magicbeans.reports.data import AcquisitionsReportRow, CoverPage, DisposalsReport, DisposalsReportRow, DisposalsSummary, DisposalsSummaryRow, DisposalsSummaryTotalRow, InventoryReport, MiningSummaryRow, TaxReport
+from magicbeans.reports.renderer import Renderer
 
 from pylatex import Document, Table, Section, Subsection, Command, Center, MultiColumn, MiniPage, TextColor, Package, VerticalSpace, HFill, NewLine, Tabular, Tabularx, LongTable
 from pylatex.base_classes import Environment, Float
@@ -73,6 +74,39 @@ def proceeds_text(row: DisposalsSummaryTotalRow) -> str:
 	return proceeds
 
 
+def max_unindexed_lots(inventory_report: InventoryReport) -> int:
+	"""Return the max number of unindexed lots to show per account, so the
+	inventory fits on the page."""
+	# Estimate how constrained for space we'll be, so we can selectively abbreviate
+	# the display of unindexed lots, which are not critical for the report.  This is
+	# some sophisticated logic that probably belongs in the driver.
+
+	# Count the number of indexed and unindexed lots per account
+	n_indexed_by_acct = {}
+	n_unindexed_by_acct = {}
+	for a in inventory_report.accounts:
+		n_indexed_lots = len([x for x in a.positions_and_ids if x[1]])
+		n_indexed_by_acct[a.account] = n_indexed_lots
+		n_unindexed_by_acct[a.account] = len(a.positions_and_ids) - n_indexed_lots
+		
+	# How many rows will we used with a particular max_unindexed_per account?
+	def count_rows(n_indexed_lots_by_acct, n_unindexed_lots_by_acct, max_unindexed_per):
+		total = 0
+		accts = n_indexed_lots_by_acct.keys()
+		assert(accts == n_unindexed_lots_by_acct.keys())
+		for acct in accts:
+			n_indexed = n_indexed_lots_by_acct[acct]
+			n_unindexed = n_unindexed_lots_by_acct[acct]
+			total += min(n_unindexed, max_unindexed_per) + n_indexed
+		return total
+	
+	# Set the max number of unindexed lots to show by brute force
+	max_unindexed_per = max(n_unindexed_by_acct.values()) if n_unindexed_by_acct.values() else 100
+	max_rows = 56
+	while max_unindexed_per >= 0 and count_rows(n_indexed_by_acct, n_unindexed_by_acct, max_unindexed_per) > max_rows:
+		max_unindexed_per -= 1
+	return max_unindexed_per
+
 class Multicols(Environment):
 	packages = [Package('multicol')]
 	escape = False
@@ -110,7 +144,7 @@ class Tblr(Tabular):
 		Environment.__init__(self, options=None, arguments=NoEscape(start_args),
 							 *args, **kwargs)
 
-class LaTeXRenderer():
+class LaTeXRenderer(Renderer):
 	def __init__(self, path: str) -> None:
 		"""Initialize with the PyLaTeX doc to write to."""
 		self.path = path
@@ -272,34 +306,7 @@ class LaTeXRenderer():
 	#
 
 	def inventory(self, inventory_report: InventoryReport):
-		# Estimate how constrained for space we'll be, so we can selectively abbreviate
-		# the display of unindexed lots, which are not critical for the report.  This is
-		# some sophisticated logic that probably belongs in the driver.
-
-		# Count the number of indexed and unindexed lots per account
-		n_indexed_by_acct = {}
-		n_unindexed_by_acct = {}
-		for a in inventory_report.accounts:
-			n_indexed_lots = len([x for x in a.positions_and_ids if x[1]])
-			n_indexed_by_acct[a.account] = n_indexed_lots
-			n_unindexed_by_acct[a.account] = len(a.positions_and_ids) - n_indexed_lots
-			
-		# How many rows will we used with a particular max_unindexed_per account?
-		def count_rows(n_indexed_lots_by_acct, n_unindexed_lots_by_acct, max_unindexed_per):
-			total = 0
-			accts = n_indexed_lots_by_acct.keys()
-			assert(accts == n_unindexed_lots_by_acct.keys())
-			for acct in accts:
-				n_indexed = n_indexed_lots_by_acct[acct]
-				n_unindexed = n_unindexed_lots_by_acct[acct]
-				total += min(n_unindexed, max_unindexed_per) + n_indexed
-			return total
-		
-		# Set the max number of unindexed lots to show by brute force
-		max_unindexed_per = max(n_unindexed_by_acct.values()) if n_unindexed_by_acct.values() else 100
-		max_rows = 56
-		while max_unindexed_per >= 0 and count_rows(n_indexed_by_acct, n_unindexed_by_acct, max_unindexed_per) > max_rows:
-			max_unindexed_per -= 1
+		max_unindexed_per = max_unindexed_lots(inventory_report)
 
 		# Build the report
 		# with self.doc.create(Tblr("|r r r X|", 4, width=r"0.95\linewidth" )) as table:
@@ -329,7 +336,7 @@ class LaTeXRenderer():
 				table.add_hline()
 
 				# If we have nothing to show here, don't even render the table.
-				if max_unindexed_per <= 0 and n_indexed_by_acct[a.account] == 0:
+				if max_unindexed_per <= 0 and not any(lot_id for (_, lot_id) in a.positions_and_ids):
 					continue
 
 				last_line_added = 0
@@ -0,0 +1,136 @@
+"""LaTeX renderer that splits the report into separately compiled units.
+
+A multi-year report is hundreds of pages, nearly all of them the detailed
+transaction logs, and compiling it is one serial latexmk job which makes
+several passes over every page.  SplitLaTeXRenderer writes each unit
+(typically, one tax year's detailed log) as a document of its own, with
+the same preamble, and compiles the units concurrently, each in its own
+compiler process.  The main document (cover page, tax estimates and
+summaries) is compiled last, as the assembly step:
+
+  - "single": the main document includes each unit's pages in place with
+    pdfpages, listing them in its table of contents, for one PDF.  The
+    units' pages are copied rather than typeset, so this is cheap.
+  - "linked": the main document has a section per unit linking to the
+    unit's own PDF (<path>-<name>.pdf), kept next to it.
+
+Page numbers of included units start from 1 in each unit.
+
+The compiler is a command line, run in the output directory with the .tex
+file name appended, which must write the PDF alongside; any stand-in
+producing a file of that name will do (for example, to test without TeX).
+"""
+
+import concurrent.futures
+import os
+import subprocess
+from typing import List, NamedTuple, Optional, Sequence
+
+from pylatex import Package
+
+from magicbeans.reports.latexstream import StreamingLaTeXRenderer, _Body, escape
+
+ASSEMBLY_MODES = ["single", "linked"]
+
+LATEXMK = ["latexmk", "-pdf", "-interaction=nonstopmode"]
+
+
+class Unit(NamedTuple):
+    name: str
+    title: str
+    path: str       # Without extension
+
+
+def compile_tex(compiler: Sequence[str], tex_path: str) -> str:
+    """Compile a .tex file in its directory; returns the PDF's path."""
+    (directory, filename) = os.path.split(os.path.abspath(tex_path))
+    subprocess.run(list(compiler) + [filename], cwd=directory, check=True,
+                   stdout=subprocess.DEVNULL)
+    pdf_path = os.path.splitext(tex_path)[0] + ".pdf"
+    if not os.path.exists(pdf_path):
+        raise FileNotFoundError(f"Compiling {tex_path} produced no {pdf_path}")
+    return pdf_path
+
+
+class SplitLaTeXRenderer(StreamingLaTeXRenderer):
+    """StreamingLaTeXRenderer writing units between begin_unit() and
+    end_unit() to documents of their own, compiled in parallel."""
+
+    def __init__(self, path: str, assembly: str = "single",
+                 compiler: Sequence[str] = LATEXMK, n_workers: Optional[int] = None,
+                 cache_dir: Optional[str] = None) -> None:
+        """With a cache directory, compiled PDFs are cached there along with
+        the fragments, and units whose source is unchanged aren't recompiled."""
+        if assembly not in ASSEMBLY_MODES:
+            raise ValueError(f"Unknown assembly mode {assembly}, expected one of {ASSEMBLY_MODES}")
+        super().__init__(path, cache_dir)
+        self.assembly = assembly
+        self.compiler = list(compiler)
+        self.n_workers = n_workers
+        self.units: List[Unit] = []
+        self._unit_bodies: List[_Body] = []
+        self._main_body: Optional[_Body] = None
+        if assembly == "single":
+            self.doc.packages.add(Package("pdfpages"))
+        else:
+            self.doc.packages.add(Package("hyperref"))
+
+    def begin_unit(self, name: str, title: str) -> None:
+        """Render to a new unit until end_unit().  The title is LaTeX, as
+        for header()."""
+        if self._main_body is not None:
+            raise ValueError(f"Unit {self.units[-1].name} not ended before unit {name}")
+        unit = Unit(name, title, f"{self.path}-{name}")
+        self.units.append(unit)
+        self._main_body = self.body
+        self.body = _Body(unit.path + ".body.tex")
+
+    def end_unit(self) -> None:
+        if self._main_body is None:
+            raise ValueError("No unit to end")
+        self._unit_bodies.append(self.body)
+        (self.body, self._main_body) = (self._main_body, None)
+
+        unit = self.units[-1]
+        filename = os.path.basename(unit.path) + ".pdf"
+        if self.assembly == "single":
+            toc = f"1,section,1,{{{unit.title}}},unit:{unit.name}"
+            self.body.item(rf"\includepdf[pages=-,addtotoc={{{toc}}}]{{{filename}}}")
+        else:
+            self.header(unit.title)
+            self.body.item(rf"\href{{run:{filename}}}{{{escape(f'See {filename}')}}}")
+
+    def write_tex(self) -> List[str]:
+        """Write the units' and the main .tex files; returns their paths
+        (the main document's last)."""
+        if self._main_body is not None:
+            self.end_unit()
+        paths = [self._write_document(body, unit.path + ".tex")
+                 for (unit, body) in zip(self.units, self._unit_bodies)]
+        return paths + [super().write_tex()]
+
+    def compile(self) -> str:
+        """Compile the units in parallel, and then the main document; returns
+        the main PDF's path."""
+        unit_paths = [unit.path + ".tex" for unit in self.units]
+        n_workers = self.n_workers or os.cpu_count() or 1
+        if self.assembly == "linked":
+            # Nothing waits on the units.
+            unit_paths.append(self.path + ".tex")
+        if unit_paths:
+            # Threads suffice, as each compile is a process of its own.
+            with concurrent.futures.ThreadPoolExecutor(max_workers=n_workers) as executor:
+                list(executor.map(self._compile_document, unit_paths))
+        if self.assembly == "linked":
+            return self.path + ".pdf"
+        # Not cached, as its source doesn't change with the units it includes.
+        return compile_tex(self.compiler, self.path + ".tex")
+
+    def _compile_document(self, tex_path: str) -> str:
+        pdf_path = os.path.splitext(tex_path)[0] + ".pdf"
+        if self.cache is not None and self.cache.get_pdf(tex_path, pdf_path):
+            return pdf_path
+        compile_tex(self.compiler, tex_path)
+        if self.cache is not None:
+            self.cache.put_pdf(tex_path, pdf_path)
+        return pdf_path
@@ -0,0 +1,511 @@
+"""LaTeX renderer that streams the document straight to a file.
+
+LaTeXRenderer builds a PyLaTeX object tree for every table cell (Tabularx,
+MultiColumn, TextColor, SmallText...) and keeps the whole Document in memory
+until close().  For reports with thousands of disposals that tree, and
+escaping through it, takes most of the time.
+
+StreamingLaTeXRenderer produces the same LaTeX, byte for byte, but writes
+table rows from string templates as they are rendered, escaping text with a
+single str.translate().  Only the document body is streamed (to a side file,
+since the preamble lists the packages used, which are only known at the
+end); close() writes the head, copies the body over and compiles as
+LaTeXRenderer does.  Memory use is flat in the size of the report.
+
+Elements which occur only a few times (sections, the cover page, and the
+\\begin and \\end of environments) are still produced by PyLaTeX, so their
+formatting can't drift from LaTeXRenderer's.
+"""
+
+import functools
+import io
+import os
+import re
+import shutil
+from typing import Dict, List, Optional, Tuple
+
+from pylatex import (Document, HFill, MiniPage, NewLine, NewPage, Package, Section,
+                     Subsection, Tabularx, VerticalSpace)
+from pylatex.basic import SmallText
+from pylatex.utils import NoEscape
+
+from magicbeans import disposals
+from magicbeans.reports import latex
+from magicbeans.reports.fragments import FragmentCache, file_digest
+from magicbeans.reports.data import (AcquisitionsReportRow, CoverPage, DisposalsReport,
+                                     DisposalsSummary, InventoryReport, MiningSummaryRow,
+                                     TaxReport)
+from magicbeans.reports.latex import (LaTeXRenderer, Multicols, Small, dec2, dec4, dec6, dec8,
+                                      max_unindexed_lots, proceeds_text)
+from magicbeans.writer import BUFFER_SIZE
+
+# As pylatex.utils.escape_latex()
+_ESCAPES = str.maketrans({
+    "&": r"\&", "%": r"\%", "$": r"\$", "#": r"\#", "_": r"\_", "{": r"\{", "}": r"\}",
+    "~": r"\textasciitilde{}", "^": r"\^{}", "\\": r"\textbackslash{}", "\n": "\\newline%\n",
+    "-": "{-}", "\xa0": "~", "[": "{[}", "]": "{]}",
+})
+
+# Separates items in containers, as PyLaTeX's Container.content_separator.
+SEP = "%\n"
+
+# Marks where the body goes in the dumped Document.
+_BODY_MARKER = "\x00BODY\x00"
+
+WIDTH = NoEscape(r"0.95\linewidth")
+NEWLINE = NewLine().dumps()
+PARAGRAPH_BREAK = "\n\n".translate(_ESCAPES)
+
+_TABULARX = Package("tabularx")
+_XCOLOR = Package("xcolor")
+_PACKAGE_RE = re.compile(r"\\usepackage\{([^}]*)\}")
+
+# Renderer code, for fragment cache keys
+_SOURCE_DIGEST = "".join(file_digest(module) for module in [__file__, latex.__file__])
+
+
+def escape(text) -> str:
+    """Escape text like pylatex.utils.escape_latex() (for plain strings)."""
+    return str(text).translate(_ESCAPES)
+
+
+def bold(text: str) -> str:
+    return rf"\textbf{{{escape(text)}}}"
+
+
+def gray(text) -> str:
+    content = "" if text is None else escape(text)
+    # As ContainerCommand, which only ends nonempty content with a separator.
+    return rf"\textcolor{{gray}}{{{SEP}{content + SEP if content else ''}}}"
+
+
+def table_text(text: str) -> str:
+    return rf"\begin{{small}}{SEP}{bold(text)}{SEP}\end{{small}}"
+
+
+def multicolumn(size: int, align: str, content: str) -> str:
+    """A MultiColumn cell, with already escaped content."""
+    return rf"\multicolumn{{{size}}}{{{align}}}{{{content}}}"
+
+
+def row(*cells: str) -> str:
+    """A table row, of already escaped cells."""
+    return "&".join(cells) + r"\\"
+
+
+HLINE = r"\hline"
+HDASHLINE = r"\hdashline"
+
+
+def fragment(method):
+    """Cache the output of a rendering method in the renderer's fragment
+    cache, if it has one, keyed on the method's arguments."""
+    @functools.wraps(method)
+    def render(self, *args):
+        if self.cache is None:
+            return method(self, *args)
+        key = self.cache.key(method.__name__, *args)
+        cached = self.cache.get(key)
+        if cached is None:
+            cached = self._capture(method, args)
+            self.cache.put(key, *cached)
+        (text, package_names) = cached
+        for name in package_names:
+            self._use_package(Package(name))
+        self.body.item(text)
+    return render
+
+
+def _environment(env) -> Tuple[str, str]:
+    """Return the \\begin and \\end of an (empty) PyLaTeX environment."""
+    (begin, end) = env.dumps_as_content().split(SEP + SEP)
+    return (begin, end)
+
+
+class _Body:
+    """Writes the items of nested containers, separated as PyLaTeX does, to
+    a file."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.out = open(path, "w", buffering=BUFFER_SIZE)
+        self.n_items = 0
+        self._first = [True]
+
+    def close(self) -> None:
+        self.out.close()
+
+    def item(self, text: str) -> None:
+        if self._first[-1]:
+            self._first[-1] = False
+        else:
+            self.out.write(SEP)
+        self.out.write(text)
+        self.n_items += 1
+
+    def begin(self, begin: str) -> None:
+        self.item(begin + SEP)
+        self._first.append(True)
+
+    def end(self, end: str) -> None:
+        self._first.pop()
+        self.out.write(SEP + end)
+
+
+class StreamingLaTeXRenderer(LaTeXRenderer):
+    """LaTeXRenderer writing its output as it goes.  (The Document built by
+    LaTeXRenderer's constructor only provides the head.)"""
+
+    def __init__(self, path: str, cache_dir: Optional[str] = None) -> None:
+        """With a cache directory, pages and tables are kept in a
+        FragmentCache there, and only rendered when their inputs change."""
+        super().__init__(path)
+        self.body = _Body(path + ".body.tex")
+        self.cache = FragmentCache(cache_dir, _SOURCE_DIGEST) if cache_dir else None
+        self._environments: Dict[str, Tuple[str, str]] = {}
+        self._head_and_tail: Optional[Tuple[str, str]] = None
+        self._fragment_packages: Optional[List[str]] = None
+
+    def close(self):
+        self.write_tex()
+        self.compile()
+        self.close_cache()
+
+    def close_cache(self) -> None:
+        """Report on and prune the fragment cache, if any, of fragments not
+        used in this report."""
+        if self.cache is not None:
+            print(f"Reused {self.cache.hits} of {self.cache.hits + self.cache.misses} "
+                  f"cached fragments, pruned {self.cache.prune()} unused")
+
+    def write_tex(self) -> str:
+        """Assemble the .tex file; returns its path."""
+        return self._write_document(self.body, self.path + ".tex")
+
+    def _write_document(self, body: _Body, tex_path: str) -> str:
+        """Write a document of the body, with the head and tail of self.doc
+        (which are fixed from the first call on)."""
+        body.close()
+        if self._head_and_tail is None:
+            self.doc.append(NoEscape(_BODY_MARKER))
+            (head, tail) = self.doc.dumps().split(_BODY_MARKER)
+            self._head_and_tail = (head, tail)
+        (head, tail) = self._head_and_tail
+        if not body.n_items:
+            # No separator before the (absent) first item
+            head = head[:-len(SEP)]
+        with open(tex_path, "w", buffering=BUFFER_SIZE) as out:
+            out.write(head)
+            with open(body.path) as f:
+                shutil.copyfileobj(f, out, BUFFER_SIZE)
+            out.write(tail)
+        os.remove(body.path)
+        return tex_path
+
+    def compile(self):
+        _TexFile().generate_pdf(self.path, clean_tex=False)
+
+    #
+    # Helpers
+    #
+
+    def _use_package(self, package: Package) -> None:
+        self.doc.packages.add(package)
+        if self._fragment_packages is not None:
+            (name,) = _PACKAGE_RE.fullmatch(package.dumps()).groups()
+            self._fragment_packages.append(name)
+
+    def _uses(self, obj) -> None:
+        """Record the packages the PyLaTeX equivalent of an item would add."""
+        for package in obj.packages:
+            self._use_package(package)
+
+    def _capture(self, method, args) -> Tuple[str, List[str]]:
+        """Render into a string, rather than the body; returns the text and
+        the names of the packages it uses."""
+        (out, first) = (self.body.out, self.body._first)
+        (self.body.out, self.body._first) = (io.StringIO(), [True])
+        self._fragment_packages = []
+        try:
+            method(self, *args)
+            return (self.body.out.getvalue(), self._fragment_packages)
+        finally:
+            (self.body.out, self.body._first) = (out, first)
+            self._fragment_packages = None
+
+    def _item(self, obj) -> None:
+        """Write a PyLaTeX object as an item."""
+        self._uses(obj)
+        self.body.item(obj.dumps_as_content())
+
+    def _begin(self, env) -> str:
+        """Begin a PyLaTeX environment; returns its end."""
+        self._uses(env)
+        (begin, end) = _environment(env)
+        self.body.begin(begin)
+        return end
+
+    def _begin_table(self, spec: str) -> str:
+        """Begin a 0.95 line width tabularx table; returns its end."""
+        if spec not in self._environments:
+            self._environments[spec] = _environment(Tabularx(spec, width_argument=WIDTH))
+        self._use_package(_TABULARX)
+        (begin, end) = self._environments[spec]
+        self.body.begin(begin)
+        return end
+
+    #
+    # Renderer interface
+    #
+
+    def write_paragraph(self, text: str):
+        self.body.item(text)
+        self.body.item(PARAGRAPH_BREAK)
+
+    def write_text(self, text: str):
+        self.body.item(escape(text))
+
+    def newpage(self):
+        self._item(NewPage())
+
+    def header(self, title: str):
+        self._item(NewPage())
+        self._item(Section(NoEscape(title), numbering=True))
+
+    def subheader(self, title: str, q: str = None):
+        self._item(Subsection(NoEscape(title), numbering=False))
+
+    def subreport_header(self, title: str, q: str = None):
+        self.subheader(title)
+        if q:
+            self.body.item(escape('Query: {q}'))
+
+    def coverpage(self, page: CoverPage):
+        end_multicols = self._begin(Multicols(arguments="2"))
+        self.header(page.title)
+        end_small = self._begin(Small())
+        for line in page.summary_lines:
+            self.write_paragraph(line)
+        self.write_paragraph(page.text)
+        self.body.item(r"\vfill\null")
+        self.body.item(r"\columnbreak")
+        self.body.item(r"\tableofcontents")
+        self.body.end(end_small)
+        self.body.end(end_multicols)
+
+    @fragment
+    def details_page(self,
+                     inventory_report: InventoryReport,
+                     acquisitions_report_rows: List[AcquisitionsReportRow],
+                     disposals_report: DisposalsReport):
+        end = self._begin(MiniPage(width=r"0.3\textwidth", pos="t", content_pos="t"))
+        self.body.item(r"\vspace{0pt}")
+        self.inventory(inventory_report)
+        self.body.end(end)
+
+        self._item(HFill())
+        end = self._begin(MiniPage(width=r"0.7\textwidth", pos="t", content_pos="t"))
+        self.body.item(r"\vspace{0pt}")
+        self.acquisitions(acquisitions_report_rows)
+        self._item(VerticalSpace("8pt"))
+        self.body.item(NEWLINE)
+        self.disposals_report_detailed("Disposals", disposals_report)
+        self.body.end(end)
+
+    @fragment
+    def tax_report(self, tax_report: TaxReport):
+        end_small = self._begin(SmallText())
+        wide = ">{\\raggedleft\\arraybackslash}p{4cm}"
+        narrow = ">{\\raggedleft\\arraybackslash}p{2cm}"
+        end = self._begin_table(f"X {wide} {wide} {narrow} {narrow} {narrow} ")
+        item = self.body.item
+        item(HLINE)
+        item(row("Asset", "Long term gain/loss", "Short term gain/loss",
+                 "LTCG Tax", "STCG Tax", "Total Tax"))
+        for (rownum, r) in enumerate(tax_report.rows + [tax_report.total_row]):
+            if rownum == len(tax_report.rows) or rownum % 5 == 0:
+                item(HLINE)
+            asset = "Total" if rownum == len(tax_report.rows) else r.asset
+            item(row(escape(asset), escape(dec2(r.ltcg)), escape(dec2(r.stcg)),
+                     escape(dec2(r.ltcg_tax)), escape(dec2(r.stcg_tax)),
+                     escape(dec2(r.total_tax))))
+        self.body.end(end)
+        item(NEWLINE)
+        self.body.end(end_small)
+
+    def inventory(self, inventory_report: InventoryReport):
+        max_unindexed_per = max_unindexed_lots(inventory_report)
+        item = self.body.item
+
+        end = self._begin_table("|r r X r|")
+        timestamp_str = inventory_report.ts.strftime("%Y-%m-%d %H:%M:%S UTC")
+        item(row(multicolumn(4, "c", table_text(f"Inventory {timestamp_str}"))))
+        if not inventory_report.accounts:
+            item(HLINE)
+            item(row(multicolumn(4, "c", escape("No inventory to report"))))
+            item(HLINE)
+            item(row("", "", "", ""))
+        else:
+            item(HLINE)
+
+        for a in inventory_report.accounts:
+            item(row(multicolumn(4, "c", bold(a.account))))
+            item(HLINE)
+
+            n_lots = len(a.positions_and_ids)
+            item(row(escape(dec6(a.total.number)),
+                     multicolumn(2, "l", escape(f"total in {n_lots} lot{'s' if n_lots > 1 else ''}")),
+                     "ID"))
+            item(HLINE)
+
+            if max_unindexed_per <= 0 and not any(lot_id for (_, lot_id) in a.positions_and_ids):
+                continue
+
+            just_showed_ellipsis = False
+            for (line_no, (pos, lot_id)) in enumerate(a.positions_and_ids):
+                if (line_no < max_unindexed_per or lot_id):
+                    item(row(escape(dec6(pos.units.number)), escape(dec4(pos.cost.number)),
+                             escape(pos.cost.date), escape(f"#{lot_id}" if lot_id else "")))
+                    just_showed_ellipsis = False
+                elif not just_showed_ellipsis:
+                    item(HDASHLINE)
+                    just_showed_ellipsis = True
+
+            if just_showed_ellipsis:
+                item(row(multicolumn(4, "|c|", r"\textbf{$\cdots$}")))
+
+            item(HLINE)
+        self.body.end(end)
+
+    def acquisitions(self, acquisitions_report_rows: List[AcquisitionsReportRow]):
+        item = self.body.item
+        end = self._begin_table("r l r r X r")
+        item(row(multicolumn(6, "c", table_text("Acquisitions"))))
+        item(HLINE)
+        item(row("Date", "", "Cost ea.", "Total cost", "", "Lot ID"))
+        item(HLINE)
+
+        for r in acquisitions_report_rows:
+            item(row(escape(r.date), escape(f"{dec6(r.amount)} {r.cur}"), escape(dec4(r.cost_ea)),
+                     escape(dec2(r.total_cost)), "", escape(f"#{r.lotid}" if r.lotid else "")))
+            item(row("", multicolumn(5, "l", gray(r.narration))))
+
+        item(HLINE)
+        self.body.end(end)
+
+    @fragment
+    def disposals_summary(self, title: str, disposals_summary: DisposalsSummary):
+        item = self.body.item
+        cspec = ">{\\raggedleft\\arraybackslash}p{1.6cm}"
+        end = self._begin_table("r r r X" + f" {cspec}" * 7)
+        item(row(multicolumn(11, "c", table_text(title))))
+        item(HLINE)
+        item(row("Assets", "Date Acquired", "Date Disposed", "", "Proceeds", "Cost", "Gain",
+                 "STCG", "(cumul)", "LTCG", "(cumul)"))
+
+        if disposals_summary.rows:
+            self._use_package(_XCOLOR)
+        for (rownum, r) in enumerate(disposals_summary.rows):
+            if rownum % 5 == 0:
+                item(HLINE)
+            item(row(escape(f"{dec4(r.disposed_amount)} {r.disposed_currency}"),
+                     escape(r.acquisition_date),
+                     escape(r.date),
+                     "",
+                     escape(dec2(r.numeraire_proceeds + r.other_proceeds)),
+                     escape(dec2(r.disposed_cost)),
+                     escape(dec2(r.gain)),
+                     escape(dec2(r.stcg)),
+                     gray(dec2(r.cum_stcg)),
+                     escape(dec2(r.ltcg)),
+                     gray(dec2(r.cum_ltcg))))
+
+        item(HLINE)
+        trow = disposals_summary.total_row
+        item(row(multicolumn(3, "r", escape(f"Total: {dec8(trow.disposed_amount)} ")),
+                 "",
+                 escape(dec2(trow.numeraire_proceeds + trow.other_proceeds)),
+                 escape(dec2(trow.disposed_cost)),
+                 escape(dec2(trow.gain)),
+                 escape(dec2(trow.stcg)),
+                 "",
+                 escape(dec2(trow.ltcg)),
+                 ""))
+        self.body.end(end)
+        item(NEWLINE)
+
+    def disposals_report_detailed(self, title: str, disposals_report: DisposalsReport):
+        item = self.body.item
+        end = self._begin_table("r X r r r r r r r")
+        item(row(multicolumn(9, "c", table_text(title))))
+        item(HLINE)
+        item(row(multicolumn(1, "l", "Date"), "", "Proceeds", "Cost", "Gain", "STCG", "(cumul)",
+                 "LTCG", "(cumul)"))
+
+        if disposals_report.rows:
+            self._use_package(_XCOLOR)
+        plus_leg = r"$+$&{}&&&&&&&\\"
+        for (rownum, r) in enumerate(disposals_report.rows):
+            if disposals_report.show_details or rownum % 5 == 0:
+                item(HLINE)
+
+            item(row(escape(r.date),
+                     escape(f"{dec4(r.disposed_amount)} {r.disposed_currency}"),
+                     proceeds_text(r),
+                     escape(dec2(r.disposed_cost)),
+                     escape(dec2(r.gain)),
+                     escape(dec2(r.stcg)),
+                     gray(dec2(r.cum_stcg)),
+                     escape(dec2(r.ltcg)),
+                     gray(dec2(r.cum_ltcg))))
+            item(row("", multicolumn(8, "l", gray(r.narration))))
+
+            for leg in r.numeraire_proceeds_legs:
+                item(plus_leg.format(escape(f"{dec4(leg.units.number)} {leg.units.currency}")))
+
+            for leg in r.other_proceeds_legs:
+                msg = f"{dec4(leg.units.number)} {leg.units.currency} value ea {dec4(leg.cost.number)}"
+                item(row("$+$", multicolumn(5, "l", escape(msg)), "", "", ""))
+
+            for (i, (leg, id)) in enumerate(r.disposal_legs_and_ids):
+                msg = f"{disposals.disposal_inventory_ref_neg(leg, id)}"
+                if i == len(r.disposal_legs_and_ids) - 1 and r.num_legs_omitted > 0:
+                    msg = msg + f", and {r.num_legs_omitted} more (smaller) lot(s)"
+                item(row("$-$", multicolumn(5, "l", escape(msg)), "", "", ""))
+
+        item(HLINE)
+        item(row("", "Total", "", "", "", "",
+                 escape(dec2(disposals_report.cumulative_stcg)), "",
+                 escape(dec2(disposals_report.cumulative_ltcg))))
+        self.body.end(end)
+        item(NEWLINE)
+
+    @fragment
+    def mining_summary(self, rows: List[MiningSummaryRow]):
+        item = self.body.item
+        cwide = ">{\\raggedleft\\arraybackslash}p{2.4cm}"
+        cnarr = ">{\\raggedleft\\arraybackslash}p{1.0cm}"
+        cmid = ">{\\raggedleft\\arraybackslash}X"
+        end = self._begin_table(f"{cnarr} {cnarr} {cwide} {cnarr} {cwide}" + f" {cmid}" * 4)
+        item(HLINE)
+        item(row("Month", "\\#Awards", "Amount mined", "Asset", "Avg award size",
+                 "Cumulative total", "Avg. cost", "FMV earned", "Cumulative FMV"))
+
+        for r in rows:
+            item(HLINE)
+            item(row(escape(r.month), escape(r.n_awards), escape(dec8(r.amount_mined)),
+                     escape(r.currency), escape(dec8(r.avg_award_size)),
+                     escape(dec4(r.cumul_total)), escape(dec4(r.avg_cost)),
+                     escape(dec4(r.fmv_earned)), escape(dec2(r.cumulative_fmv))))
+
+        item(HLINE)
+        item(row(multicolumn(6, "r", "Total cumulative fair market value of all mined tokens:"),
+                 "", "", escape(dec2(rows[-1].cumulative_fmv))))
+        self.body.end(end)
+
+
+class _TexFile(Document):
+    """Compiles an already written .tex file, the way Document does."""
+
+    def generate_tex(self, filepath=None):
+        pass
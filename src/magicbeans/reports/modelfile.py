@@ -0,0 +1,312 @@
+"""The report's data model as a file, to render from later or in parallel.
+
+Computing a report (booking the ledger, building each page's inventory,
+acquisitions and disposals) is separate from rendering it, but both used to
+happen in one run, so each format meant another pass over the ledger.  A
+ModelWriter is a Renderer which records the report instead: each call the
+driver makes to it (a header, a page of the detailed log, a summary table)
+is written to a file as it's made, with its data models (see data.py).
+replay() then makes the same calls on any other renderer, without the
+ledger, as many times as needed and in as many processes.
+
+The file is a header, and then a sequence of records, each the big-endian
+32-bit length of its payload and the payload: the name of the renderer
+method and its arguments, in a compact binary encoding of the data models.
+Each value is a tag byte and its content:
+
+  - None, True and False: just the tag.
+  - Integers: a varint (zigzag-encoded LEB128); lengths are varints too.
+  - Strings: UTF-8 bytes, or, for short strings already written in the
+    file (assets, accounts), a reference to the first.
+  - Decimals: the coefficient (and sign) and exponent, as varints.
+  - Dates: the ordinal, as a varint; datetimes in ISO format.
+  - Lists and tuples: their length and items.
+  - NamedTuples: the index of their type in RECORD_TYPES (the data models,
+    and the beancount types they hold), and their fields; beancount's
+    `meta`, which renderers don't use, isn't kept.
+
+Nothing but the values is written, so records are less than half the size
+of the equivalent pickles, and reading them constructs only the data
+models.
+"""
+
+import datetime
+import struct
+from decimal import Decimal
+from typing import BinaryIO, Dict, Iterator, List, Tuple
+
+from beancount.core.amount import Amount
+from beancount.core.data import Posting
+from beancount.core.position import Cost, Position
+from magicbeans.reports import data
+from magicbeans.reports.renderer import Renderer
+from magicbeans.writer import BUFFER_SIZE
+
+MAGIC = b"MBRM"
+VERSION = 1
+
+# The types of NamedTuples in the data model, by index; append only.
+RECORD_TYPES = [
+    data.CoverPage, data.TaxReportRow, data.TaxReport, data.DisposalsSummaryRow,
+    data.DisposalsSummaryTotalRow, data.DisposalsSummary, data.AccountInventoryReport,
+    data.InventoryReport, data.AcquisitionsReportRow, data.DisposalsReportRow,
+    data.DisposalsReport, data.MiningSummaryRow, Amount, Cost, Position, Posting,
+]
+
+# Methods which only some renderers have (see latexsplit); replay() skips
+# them on the others.
+OPTIONAL_METHODS = {"begin_unit", "end_unit"}
+
+# Strings no longer than this are written once, and then referenced.
+MAX_INTERNED_LENGTH = 64
+
+_LENGTH = struct.Struct(">I")
+
+(_NONE, _TRUE, _FALSE, _INT, _STR, _STR_REF, _DECIMAL, _DATE, _DATETIME, _LIST,
+ _TUPLE, _RECORD) = range(12)
+
+_TYPE_INDEXES = {t: i for (i, t) in enumerate(RECORD_TYPES)}
+
+
+def _write_varint(out: bytearray, n: int) -> None:
+    n = n * 2 if n >= 0 else -n * 2 - 1  # Zigzag
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+class _Encoder:
+    def __init__(self) -> None:
+        self.strings: Dict[str, int] = {}
+
+    def encode(self, out: bytearray, value) -> None:
+        if value is None:
+            out.append(_NONE)
+        elif value is True:
+            out.append(_TRUE)
+        elif value is False:
+            out.append(_FALSE)
+        elif isinstance(value, int):
+            out.append(_INT)
+            _write_varint(out, value)
+        elif isinstance(value, str):
+            self._encode_str(out, value)
+        elif isinstance(value, Decimal):
+            (sign, digits, exponent) = value.as_tuple()
+            if not isinstance(exponent, int):
+                raise ValueError(f"Can't encode {value}")
+            coefficient = int("".join(map(str, digits)))
+            out.append(_DECIMAL)
+            # The sign separately, for -0
+            _write_varint(out, coefficient * 2 + sign)
+            _write_varint(out, exponent)
+        elif isinstance(value, datetime.datetime):
+            out.append(_DATETIME)
+            self._encode_bytes(out, value.isoformat().encode())
+        elif isinstance(value, datetime.date):
+            out.append(_DATE)
+            _write_varint(out, value.toordinal())
+        elif isinstance(value, tuple) and hasattr(value, "_fields"):
+            index = _TYPE_INDEXES.get(type(value))
+            if index is None:
+                raise TypeError(f"Can't encode {type(value).__name__} {value!r}")
+            out.append(_RECORD)
+            _write_varint(out, index)
+            for (field, item) in zip(value._fields, value):
+                self.encode(out, None if field == "meta" else item)
+        elif isinstance(value, (list, tuple)):
+            out.append(_LIST if isinstance(value, list) else _TUPLE)
+            _write_varint(out, len(value))
+            for item in value:
+                self.encode(out, item)
+        else:
+            raise TypeError(f"Can't encode {type(value).__name__} {value!r}")
+
+    def _encode_str(self, out: bytearray, value: str) -> None:
+        ref = self.strings.get(value)
+        if ref is not None:
+            out.append(_STR_REF)
+            _write_varint(out, ref)
+            return
+        if len(value) <= MAX_INTERNED_LENGTH:
+            self.strings[value] = len(self.strings)
+        out.append(_STR)
+        self._encode_bytes(out, value.encode())
+
+    @staticmethod
+    def _encode_bytes(out: bytearray, value: bytes) -> None:
+        _write_varint(out, len(value))
+        out += value
+
+
+class _Decoder:
+    def __init__(self) -> None:
+        self.strings: List[str] = []
+
+    def decode(self, buf: bytes) -> object:
+        (value, pos) = self._decode(buf, 0)
+        if pos != len(buf):
+            raise ValueError("Trailing data in record")
+        return value
+
+    def _decode(self, buf: bytes, pos: int) -> Tuple[object, int]:
+        tag = buf[pos]
+        pos += 1
+        if tag == _NONE:
+            return (None, pos)
+        if tag == _TRUE:
+            return (True, pos)
+        if tag == _FALSE:
+            return (False, pos)
+        if tag == _INT:
+            return _read_varint(buf, pos)
+        if tag == _STR:
+            (value, pos) = self._decode_bytes(buf, pos)
+            s = value.decode()
+            if len(s) <= MAX_INTERNED_LENGTH:
+                self.strings.append(s)
+            return (s, pos)
+        if tag == _STR_REF:
+            (ref, pos) = _read_varint(buf, pos)
+            return (self.strings[ref], pos)
+        if tag == _DECIMAL:
+            (signed_coefficient, pos) = _read_varint(buf, pos)
+            (exponent, pos) = _read_varint(buf, pos)
+            digits = tuple(int(d) for d in str(signed_coefficient >> 1))
+            return (Decimal((signed_coefficient & 1, digits, exponent)), pos)
+        if tag == _DATETIME:
+            (value, pos) = self._decode_bytes(buf, pos)
+            return (datetime.datetime.fromisoformat(value.decode()), pos)
+        if tag == _DATE:
+            (ordinal, pos) = _read_varint(buf, pos)
+            return (datetime.date.fromordinal(ordinal), pos)
+        if tag in (_LIST, _TUPLE):
+            (n, pos) = _read_varint(buf, pos)
+            items = []
+            for _ in range(n):
+                (item, pos) = self._decode(buf, pos)
+                items.append(item)
+            return (items if tag == _LIST else tuple(items), pos)
+        if tag == _RECORD:
+            (index, pos) = _read_varint(buf, pos)
+            record_type = RECORD_TYPES[index]
+            fields = []
+            for _ in record_type._fields:
+                (item, pos) = self._decode(buf, pos)
+                fields.append(item)
+            return (record_type(*fields), pos)
+        raise ValueError(f"Unknown tag {tag} in record")
+
+    @staticmethod
+    def _decode_bytes(buf: bytes, pos: int) -> Tuple[bytes, int]:
+        (n, pos) = _read_varint(buf, pos)
+        return (buf[pos:pos + n], pos + n)
+
+
+def _read_varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    n = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            break
+        shift += 7
+    return ((n >> 1) if not n & 1 else -((n + 1) >> 1), pos)
+
+
+class ModelWriter(Renderer):
+    """Records the report, as made by the driver, to a file."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.n_records = 0
+        self._encoder = _Encoder()
+        self._file: BinaryIO = open(path, "wb", buffering=BUFFER_SIZE)
+        self._file.write(MAGIC + bytes([VERSION]))
+
+    def close(self) -> None:
+        self._file.close()
+
+    def write_paragraph(self, text: str) -> None:
+        self._record("write_paragraph", text)
+
+    def write_text(self, text: str) -> None:
+        self._record("write_text", text)
+
+    def newpage(self) -> None:
+        self._record("newpage")
+
+    def header(self, title: str) -> None:
+        self._record("header", title)
+
+    def subheader(self, title: str, q: str = None) -> None:
+        self._record("subheader", title, q)
+
+    def subreport_header(self, title: str, q: str = None) -> None:
+        self._record("subreport_header", title, q)
+
+    def coverpage(self, page: data.CoverPage) -> None:
+        self._record("coverpage", page)
+
+    def details_page(self,
+                     inventory_report: data.InventoryReport,
+                     acquisitions_report_rows: List[data.AcquisitionsReportRow],
+                     disposals_report: data.DisposalsReport) -> None:
+        self._record("details_page", inventory_report, acquisitions_report_rows, disposals_report)
+
+    def tax_report(self, tax_report: data.TaxReport) -> None:
+        self._record("tax_report", tax_report)
+
+    def disposals_summary(self, title: str, disposals_summary: data.DisposalsSummary) -> None:
+        self._record("disposals_summary", title, disposals_summary)
+
+    def mining_summary(self, rows: List[data.MiningSummaryRow]) -> None:
+        self._record("mining_summary", rows)
+
+    def begin_unit(self, name: str, title: str) -> None:
+        self._record("begin_unit", name, title)
+
+    def end_unit(self) -> None:
+        self._record("end_unit")
+
+    def _record(self, method: str, *args) -> None:
+        payload = bytearray()
+        self._encoder.encode(payload, (method, args))
+        self._file.write(_LENGTH.pack(len(payload)))
+        self._file.write(payload)
+        self.n_records += 1
+
+
+def read_records(path: str) -> Iterator[Tuple[str, tuple]]:
+    """Yield the (method name, arguments) of each call recorded in the file."""
+    decoder = _Decoder()
+    with open(path, "rb", buffering=BUFFER_SIZE) as f:
+        header = f.read(len(MAGIC) + 1)
+        if header[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} isn't a report model file")
+        if header[len(MAGIC):] != bytes([VERSION]):
+            raise ValueError(f"{path} is of an unsupported version; rerun the report")
+        while True:
+            prefix = f.read(_LENGTH.size)
+            if not prefix:
+                return
+            (length,) = _LENGTH.unpack(prefix)
+            payload = f.read(length)
+            if len(prefix) < _LENGTH.size or len(payload) < length:
+                raise ValueError(f"{path} is truncated")
+            yield decoder.decode(payload)
+
+
+def replay(path: str, renderer: Renderer) -> int:
+    """Make the calls recorded in the file on the renderer (which is left
+    open); returns the number of calls."""
+    n_calls = 0
+    for (method, args) in read_records(path):
+        if method in OPTIONAL_METHODS and not hasattr(renderer, method):
+            continue
+        getattr(renderer, method)(*args)
+        n_calls += 1
+    return n_calls
@@ -0,0 +1,139 @@
+"""Report data models kept across runs, for incremental recomputation.
+
+A correction to a recent trade shouldn't mean recomputing every page,
+summary and tax estimate since the ledger began.  A ModelStore keeps the
+data models computed by a report run (the detailed log's pages, the
+disposals summaries, tax estimates and mining summaries), along with a
+digest of each entry of the ledger they were computed from.
+
+Each model depends on a prefix of the (sorted, booked) entries: everything
+up to and including a "boundary" entry, such as the first entry of the
+next page or year (which may be the end of the ledger, for the last page).
+On a rerun, the store compares the digests to find the earliest changed
+entry; models whose prefix ends before it are reused, and the rest are
+recomputed.  Entry digests ignore source positions (filename and lineno),
+which change whenever an entry is added earlier in a file.
+
+Models are pickled one per file as they're computed, rather than held in
+memory, under an index of the entry digests and each model's boundary.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+from beancount.core.data import Entries, Transaction
+from magicbeans.reports.fragments import canonical
+
+# Bump when the data models or their computation change.
+VERSION = 1
+
+INDEX_FILENAME = "index.pickle"
+
+# Metadata which doesn't affect the meaning of an entry
+_POSITION_KEYS = ("filename", "lineno")
+
+T = TypeVar("T")
+
+
+def _meta(meta) -> Optional[dict]:
+    if meta is None:
+        return None
+    return {k: v for (k, v) in meta.items() if k not in _POSITION_KEYS}
+
+
+def entry_digest(entry) -> bytes:
+    postings = entry.postings if isinstance(entry, Transaction) else []
+    value = (entry, _meta(entry.meta), [_meta(p.meta) for p in postings])
+    return hashlib.sha256(canonical(value).encode()).digest()[:16]
+
+
+class ModelStore:
+    """Data models of a report on the entries, reused from the previous run
+    on the same ledger where the entries they depend on are unchanged."""
+
+    def __init__(self, directory: str, entries: Entries, identity: tuple = ()) -> None:
+        """`identity` holds anything else the models depend on (e.g., the
+        numeraire); if it changed since the last run, nothing is reused."""
+        self.directory = directory
+        self.entries = entries
+        self.digests = [entry_digest(entry) for entry in entries]
+        self.identity = (VERSION,) + tuple(identity)
+        self.n_reused = 0
+        self.n_computed = 0
+        # Key -> (boundary, filename), for this run
+        self._index: Dict[str, Tuple[int, str]] = {}
+
+        os.makedirs(directory, exist_ok=True)
+        (old_digests, self._old_index) = self._load_index()
+        self.first_change = _first_difference(old_digests, self.digests)
+
+    def earliest_change(self) -> Optional[str]:
+        """Describe the earliest changed entry (None if nothing changed)."""
+        if self.first_change is None:
+            return None
+        if self.first_change >= len(self.entries):
+            return "the end of the ledger"
+        entry = self.entries[self.first_change]
+        return (entry.meta or {}).get("timestamp") or str(entry.date)
+
+    def get(self, key: tuple, boundary: int, compute: Callable[[], T]) -> T:
+        """Return the model for the key, reused if it depends only on entries
+        up to the boundary index (inclusive; len(entries) for the end of the
+        ledger) and those are unchanged, or else computed and stored."""
+        key_str = canonical(key)
+        filename = hashlib.sha256(key_str.encode()).hexdigest()[:32] + ".pickle"
+        old = self._old_index.get(key_str)
+        if (old is not None and old[0] == boundary
+                and (self.first_change is None or boundary < self.first_change)):
+            try:
+                with open(os.path.join(self.directory, old[1]), "rb") as f:
+                    model = pickle.load(f)
+                self._index[key_str] = old
+                self.n_reused += 1
+                return model
+            except (OSError, pickle.UnpicklingError, EOFError):
+                pass
+        model = compute()
+        self._write(filename, pickle.dumps(model, pickle.HIGHEST_PROTOCOL))
+        self._index[key_str] = (boundary, filename)
+        self.n_computed += 1
+        return model
+
+    def save(self) -> None:
+        """Write the index of this run's models, and remove the others."""
+        index = {"identity": self.identity, "digests": self.digests, "models": self._index}
+        self._write(INDEX_FILENAME, pickle.dumps(index, pickle.HIGHEST_PROTOCOL))
+        used = {filename for (_, filename) in self._index.values()}
+        for name in os.listdir(self.directory):
+            if name != INDEX_FILENAME and name not in used:
+                os.remove(os.path.join(self.directory, name))
+
+    def _load_index(self) -> Tuple[List[bytes], Dict[str, Tuple[int, str]]]:
+        path = os.path.join(self.directory, INDEX_FILENAME)
+        try:
+            with open(path, "rb") as f:
+                index = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return ([], {})
+        if index.get("identity") != self.identity:
+            return ([], {})
+        return (index["digests"], index["models"])
+
+    def _write(self, filename: str, content: bytes) -> None:
+        # Write and rename, so an interrupted run can't leave a partial file.
+        (fd, tmp_path) = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, os.path.join(self.directory, filename))
+
+
+def _first_difference(old: List[bytes], new: List[bytes]) -> Optional[int]:
+    """Return the first index at which the lists differ, counting the end of
+    the shorter one, or None if they're equal."""
+    for (i, (a, b)) in enumerate(zip(old, new)):
+        if a != b:
+            return i
+    return None if len(old) == len(new) else min(len(old), len(new))
@@ -0,0 +1,74 @@
+"""The interface between the report driver and the output formats.
+
+The driver computes each part of the report (see data.py) and hands it to a
+Renderer, which writes it out: LaTeXRenderer (and StreamingLaTeXRenderer)
+for the PDF report, TextRenderer for a plain text file, CsvRenderer for
+spreadsheets of each kind of table, and HtmlRenderer for a static web
+page.  Renderers get everything the report holds, in order, but needn't
+show all of it.
+
+Paragraphs and titles may hold LaTeX escapes (e.g., "\\%"), since they're
+written for the PDF report; plain_text() undoes them for other formats.
+"""
+
+import re
+from typing import List
+
+from magicbeans.reports.data import (AcquisitionsReportRow, CoverPage, DisposalsReport,
+                                     DisposalsSummary, InventoryReport, MiningSummaryRow,
+                                     TaxReport)
+
+FORMATS = ["latex", "text", "csv", "html"]
+
+_LATEX_ESCAPE_RE = re.compile(r"\\([&%$#_{}])")
+
+
+def plain_text(text: str) -> str:
+    """Undo the LaTeX escaping of special characters in the text."""
+    return _LATEX_ESCAPE_RE.sub(r"\1", text)
+
+
+class Renderer:
+    """Writes the parts of a report, in the order given, to some output."""
+
+    def close(self) -> None:
+        """Finish writing the report."""
+        raise NotImplementedError
+
+    def write_paragraph(self, text: str) -> None:
+        raise NotImplementedError
+
+    def write_text(self, text: str) -> None:
+        raise NotImplementedError
+
+    def newpage(self) -> None:
+        raise NotImplementedError
+
+    def header(self, title: str) -> None:
+        """Start a section of the report."""
+        raise NotImplementedError
+
+    def subheader(self, title: str, q: str = None) -> None:
+        raise NotImplementedError
+
+    def subreport_header(self, title: str, q: str = None) -> None:
+        raise NotImplementedError
+
+    def coverpage(self, page: CoverPage) -> None:
+        raise NotImplementedError
+
+    def details_page(self,
+                     inventory_report: InventoryReport,
+                     acquisitions_report_rows: List[AcquisitionsReportRow],
+                     disposals_report: DisposalsReport) -> None:
+        """Render a page of the detailed log."""
+        raise NotImplementedError
+
+    def tax_report(self, tax_report: TaxReport) -> None:
+        raise NotImplementedError
+
+    def disposals_summary(self, title: str, disposals_summary: DisposalsSummary) -> None:
+        raise NotImplementedError
+
+    def mining_summary(self, rows: List[MiningSummaryRow]) -> None:
+        raise NotImplementedError
@@ -0,0 +1,102 @@
+"""Choosing the parts of the report to generate.
+
+A full report computes the tax estimates, the 8949 summaries, the mining
+summaries and the detailed log of every year, for every asset, which is
+slow when only, say, one year's BTC disposals are wanted.  A
+ReportSelection names the sections to generate, the assets to report on
+and the range of pages of each year's detailed log.  It's applied as the
+report is computed, not as it's rendered: transactions of other assets are
+dropped when the driver classifies the entries (so their disposals are
+never booked), and the sections and pages left out are never computed.
+
+A transaction's assets (see tx_assets()) are those it disposes of, for a
+disposal, so that a trade of BTC for ETH is a BTC disposal, and those it
+holds otherwise (e.g., those bought, mined or transferred).
+"""
+
+from typing import FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from beancount.core.data import Transaction
+from magicbeans.disposals import get_disposal_postings, is_disposal_tx
+
+TAX = "tax"                 # Tax liability estimates
+SUMMARIES = "summaries"     # Disposals summaries, for 8949
+MINING = "mining"           # Mining income, for Sched. C
+LOG = "log"                 # Detailed transaction log
+LINEAGE = "lineage"         # Lot lineage export
+SECTIONS = [TAX, SUMMARIES, MINING, LOG, LINEAGE]
+
+# First and last page numbers (from 1, inclusive); no last page for all
+# pages from the first.
+PageRange = Tuple[int, Optional[int]]
+
+
+def parse_pages(text: str) -> PageRange:
+    """Parse a page range: "3", "3-5", or "3-" for pages 3 on."""
+    (first, sep, last) = text.partition("-")
+    try:
+        pages = (int(first), (int(last) if last else None) if sep else int(first))
+    except ValueError:
+        raise ValueError(f"Invalid page range {text!r}") from None
+    if pages[0] < 1 or (pages[1] is not None and pages[1] < pages[0]):
+        raise ValueError(f"Invalid page range {text!r}")
+    return pages
+
+
+def tx_assets(entry: Transaction, numeraire: str) -> Set[str]:
+    """Return the assets a transaction is about."""
+    if is_disposal_tx(entry):
+        return {p.units.currency for p in get_disposal_postings(entry, numeraire)}
+    return {p.units.currency for p in entry.postings if p.units.currency != numeraire}
+
+
+class ReportSelection(NamedTuple):
+    """The parts of a report to generate; by default, all of it."""
+    sections: FrozenSet[str] = frozenset(SECTIONS)
+    assets: Optional[FrozenSet[str]] = None     # None for all
+    pages: Optional[PageRange] = None           # None for all
+
+    @staticmethod
+    def new(sections: Optional[Iterable[str]] = None, assets: Optional[Iterable[str]] = None,
+            pages: Optional[PageRange] = None) -> "ReportSelection":
+        """Return the selection; None means all sections, assets or pages."""
+        if sections is not None:
+            sections = frozenset(sections)
+            unknown = sections.difference(SECTIONS)
+            if unknown:
+                raise ValueError(f"Unknown report sections {', '.join(sorted(unknown))}")
+        return ReportSelection(frozenset(SECTIONS) if sections is None else sections,
+                               None if assets is None else frozenset(assets),
+                               pages)
+
+    def has_section(self, section: str) -> bool:
+        return section in self.sections
+
+    def has_page(self, page_num: int) -> bool:
+        """Whether the detailed log's page (numbered from 0) is selected."""
+        if self.pages is None:
+            return True
+        (first, last) = self.pages
+        return first <= page_num + 1 and (last is None or page_num + 1 <= last)
+
+    def selects(self, entry: Transaction, numeraire: str) -> bool:
+        """Whether the transaction is about any of the selected assets."""
+        return self.assets is None or not self.assets.isdisjoint(tx_assets(entry, numeraire))
+
+    def identity(self) -> tuple:
+        """What the report's data models depend on (see modelstore.py):
+        the assets, as pages and sections are computed independently."""
+        return () if self.assets is None else (tuple(sorted(self.assets)),)
+
+    def describe(self) -> List[str]:
+        """Describe what's left out of the report, if anything."""
+        lines = []
+        if self.sections != frozenset(SECTIONS):
+            lines.append(f"Including sections {', '.join(s for s in SECTIONS if s in self.sections)}")
+        if self.assets is not None:
+            lines.append(f"Including only assets {', '.join(sorted(self.assets))}")
+        if self.pages is not None:
+            (first, last) = self.pages
+            pages = f"page {first}" if first == last else f"pages {first}-{last or ''}"
+            lines.append(f"Including {pages} of each year's detailed log")
+        return lines
@@ -1,49 +1,59 @@
 import calendar
-from contextlib import contextmanager
 import datetime
 from decimal import Decimal
+import re
 import textwrap
 from typing import List
-from beancount.core.amount import Amount
 from beancount.core.data import Posting
 from beanquery.query_render import render_text
 from magicbeans import common, disposals
 from magicbeans.disposals import abbrv_disposal, format_money
-from magicbeans.reports.data import AccountInventoryReport, InventoryReport, MiningSummaryRow
+from magicbeans.reports.data import AcquisitionsReportRow, CoverPage, DisposalsReport, DisposalsSummary, InventoryReport, MiningSummaryRow, TaxReport, TaxReportRow
+from magicbeans.reports.latex import dec2, dec4, dec6, dec8, max_unindexed_lots
+from magicbeans.reports.renderer import Renderer, plain_text
+from magicbeans.writer import BUFFER_SIZE
 from pyfiglet import Figlet
 
 # TODO: parameterize the width of this report
-class TextRenderer():
+WIDTH = 140
+
+class TextRenderer(Renderer):
+	"""Renders the report as plain text, writing each row to the file as it
+	goes (much faster than compiling the PDF, for checking the numbers)."""
+
 	def __init__(self, out_path) -> None:
 		"""Initialize with the file to write to."""
-		# TODO: verify this is closed on destruction
-		self.file = open(out_path, 'w')
+		self.file = open(out_path, 'w', buffering=BUFFER_SIZE)
 		self.fig = Figlet(width=120)
 
 	def close(self):
 		self.file.close()
 
 	def write_paragraph(self, text: str):
-		self.file.write(text + "\n\n")
+		for paragraph in re.split(r"\n\s*\n", plain_text(text).strip()):
+			self.file.write(textwrap.fill(" ".join(paragraph.split()), width=WIDTH) + "\n\n")
 
 	def write_text(self, text: str):
-		self.file.write(text)
+		self.file.write(text + "\n")
+
+	def newpage(self):
+		self.file.write("\n")
 
 	def header(self, title: str):
-		self.file.write(self.fig.renderText(title))
-		
+		self.file.write("\n" + self.fig.renderText(plain_text(title)))
+
 	def subheader(self, title: str, q: str = None):
 		self.subreport_header(title, q)
 
 	def subreport_header(self, title: str, q: str = None):
-		result = " " + ("_" * 140) + f" \n|{title:_^140}|\n"
+		result = " " + ("_" * 140) + f" \n|{plain_text(title):_^140}|\n"
 		if q:
 			# Text wrapping is useful if you're consuming as a text file;
 			#   if you convert to PDF that will wrap for you.
 			# result += "\n".join(textwrap.wrap(q, width=140,
 			#       initial_indent="", subsequent_indent="  ")) + "\n"
 			result += q + "\n"
-		self.file.write(result)
+		self.file.write(result + "\n")
 
 	def beanquery_table(self, rtypes, rrows, footer=None):
 		"""Render the results of a beanquery query as a table"""
@@ -58,42 +68,158 @@ class TextRenderer():
 
 		self.file.write('\n')
 
+	def coverpage(self, page: CoverPage):
+		self.header(page.title)
+		for line in page.summary_lines:
+			self.file.write(plain_text(line) + "\n")
+		self.file.write("\n")
+		self.write_paragraph(page.text)
+
+	def details_page(self,
+			inventory_report: InventoryReport,
+			acquisitions_report_rows: List[AcquisitionsReportRow],
+			disposals_report: DisposalsReport):
+		self.inventory(inventory_report)
+		self.acquisitions(acquisitions_report_rows)
+		self.disposals_report_detailed("Disposals", disposals_report)
+
+	#
+	# Overall tax report
+	#
+
+	def tax_report(self, tax_report: TaxReport):
+		self.file.write(
+			f"{'Asset':<12} "
+			f"{'Long term gain/loss':>20} "
+			f"{'Short term gain/loss':>20} "
+			f"{'LTCG Tax':>14} "
+			f"{'STCG Tax':>14} "
+			f"{'Total Tax':>14}\n\n")
+		for row in tax_report.rows:
+			self._tax_row(row.asset, row)
+		self.file.write("\n")
+		self._tax_row("Total", tax_report.total_row)
+		self.file.write("\n")
+
+	def _tax_row(self, asset: str, row: TaxReportRow):
+		self.file.write(
+			f"{asset:<12} "
+			f"{dec2(row.ltcg):>20} "
+			f"{dec2(row.stcg):>20} "
+			f"{dec2(row.ltcg_tax):>14} "
+			f"{dec2(row.stcg_tax):>14} "
+			f"{dec2(row.total_tax):>14}\n")
+
 	#
 	# Inventory report
 	#
 
 	def inventory(self, inventory_report: InventoryReport):
-		self.file.write(f"Inventories as of {inventory_report.date}\n\n")
+		timestamp_str = inventory_report.ts.strftime("%Y-%m-%d %H:%M:%S UTC")
+		self.file.write(f"Inventory {timestamp_str}\n\n")
+		if not inventory_report.accounts:
+			self.file.write("No inventory to report\n\n")
+			return
+
+		# As in the PDF, lots without IDs beyond the first few are elided.
+		max_unindexed_per = max_unindexed_lots(inventory_report)
 		for acct in inventory_report.accounts:
-			self.file.write(f"{acct.account} total: {acct.total}\n")
-			for (pos, lot_id) in acct.positions_and_ids:
-				self.file.write(f"  {disposals.disposal_inventory_desc(pos, lot_id)}\n")
+			n_lots = len(acct.positions_and_ids)
+			self.file.write(f"{acct.account} total: {dec6(acct.total.number)} "
+							f"{acct.total.currency} in {n_lots} lot{'s' if n_lots > 1 else ''}\n")
+			just_showed_ellipsis = False
+			for (line_no, (pos, lot_id)) in enumerate(acct.positions_and_ids):
+				if line_no < max_unindexed_per or lot_id:
+					self.file.write(
+						f"  {dec6(pos.units.number):>18} {pos.units.currency:<6} "
+						f"{dec4(pos.cost.number):>14} {pos.cost.currency:<4} {pos.cost.date}"
+						+ (f"  #{lot_id}" if lot_id else "") + "\n")
+					just_showed_ellipsis = False
+				elif not just_showed_ellipsis:
+					self.file.write("  ...\n")
+					just_showed_ellipsis = True
+		self.file.write("\n")
+
+	#
+	# Acquisitions report
+	#
+
+	def acquisitions(self, acquisitions_report_rows: List[AcquisitionsReportRow]):
+		self.file.write(
+			f"Acquisitions\n\n"
+			f"{'Date':<10} {'Amount':>26} "
+			f"{'Cost ea.':>14} "
+			f"{'Total cost':>14} "
+			f"{'Lot ID':>8}  Narration\n\n")
+		for row in acquisitions_report_rows:
+			self.file.write(
+				f"{str(row.date):<10} {dec6(row.amount) + ' ' + row.cur:>26} "
+				f"{dec4(row.cost_ea):>14} "
+				f"{dec2(row.total_cost):>14} "
+				f"{'#' + str(row.lotid) if row.lotid else '':>8}  {row.narration or ''}\n")
 		self.file.write("\n")
 
 	#
-	# Disposals report
+	# Disposals summary and detailed report
 	#
 
-	def disposals(self, disposals_report):
+	def disposals_summary(self, title: str, disposals_summary: DisposalsSummary):
+		self.file.write(
+			f"{plain_text(title)}\n\n"
+			f"{'Assets':>24} {'Date Acquired':>13} {'Date Disposed':>13} "
+			f"{'Proceeds':>14} "
+			f"{'Cost':>14} "
+			f"{'Gain':>14} "
+			f"{'STCG':>14} "
+			f"{'(cumul)':>14} "
+			f"{'LTCG':>14} "
+			f"{'(cumul)':>14}\n\n")
+		for row in disposals_summary.rows:
+			self.file.write(
+				f"{dec4(row.disposed_amount) + ' ' + row.disposed_currency:>24} "
+				f"{row.acquisition_date:>13} {str(row.date):>13} "
+				f"{dec2(row.numeraire_proceeds + row.other_proceeds):>14} "
+				f"{dec2(row.disposed_cost):>14} "
+				f"{dec2(row.gain):>14} "
+				f"{dec2(row.stcg):>14} "
+				f"{dec2(row.cum_stcg):>14} "
+				f"{dec2(row.ltcg):>14} "
+				f"{dec2(row.cum_ltcg):>14}\n")
+
+		trow = disposals_summary.total_row
+		self.file.write(
+			f"\n{'Total: ' + dec8(trow.disposed_amount):>52} "
+			f"{dec2(trow.numeraire_proceeds + trow.other_proceeds):>14} "
+			f"{dec2(trow.disposed_cost):>14} "
+			f"{dec2(trow.gain):>14} "
+			f"{dec2(trow.stcg):>14} "
+			f"{'':>14} "
+			f"{dec2(trow.ltcg):>14}\n\n")
+
+	def disposals_report_detailed(self, title: str, disposals_report: DisposalsReport):
+		self.file.write(f"{title}\n\n")
 		self._start_disposals_table()
 		for row in disposals_report.rows:
 			self._disposal_row(
-				row.date, row.narration,
+				row.date, row.narration or "",
 				row.numeraire_proceeds, row.other_proceeds, row.disposed_cost,
 				row.gain, row.stcg, row.cum_stcg, row.ltcg, row.cum_ltcg,
 				row.disposed_currency, [p[0] for p in row.disposal_legs_and_ids])
-			if disposals_report.extended:
-				self.file.write(f"USD proceeds: {format_money(row.numeraire_proceeds)}\n")
+			if disposals_report.show_details:
+				self.file.write(f"{'':11}USD proceeds: {format_money(row.numeraire_proceeds)}\n")
 				for leg in row.numeraire_proceeds_legs:
-					self.file.write(f"  + {leg.units}\n")
+					self.file.write(f"{'':11}  + {leg.units}\n")
 
-				self.file.write(f"Other proceeds: total value {format_money(row.other_proceeds)}\n")
+				self.file.write(f"{'':11}Other proceeds: total value {format_money(row.other_proceeds)}\n")
 				for leg in row.other_proceeds_legs:
-					self.file.write(f"  + {leg.units} value ea {format_money(leg.cost)}\n")
-				
-				self.file.write(f"Total disposed cost: {format_money(row.disposed_cost)}\n")
+					self.file.write(f"{'':11}  + {leg.units} value ea {format_money(leg.cost)}\n")
+
+				self.file.write(f"{'':11}Total disposed cost: {format_money(row.disposed_cost)}\n")
 				for (leg, id) in row.disposal_legs_and_ids:
-					self.file.write(f"  - {disposals.disposal_inventory_ref(leg, id)}\n")
+					self.file.write(f"{'':11}  - {disposals.disposal_inventory_ref_neg(leg, id)}\n")
+				if row.num_legs_omitted > 0:
+					self.file.write(f"{'':11}  and {row.num_legs_omitted} more (smaller) lot(s)\n")
+		self._end_disposals_table(disposals_report.cumulative_stcg, disposals_report.cumulative_ltcg)
 
 	def _start_disposals_table(self):
 		self.file.write(
@@ -132,7 +258,7 @@ class TextRenderer():
 			f"{format_money(cumulative_stcg):>11} "
 			f"{format_money(ltcg):>10} "
 			f"{format_money(cumulative_ltcg):>11}\n")
-		
+
 		# TODO: abbrv_disposal probably shouldn't be over there
 		rendered_lots = (f"{disposed_currency} " +
 						 ", ".join([abbrv_disposal(d) for d in lots]))
@@ -142,26 +268,20 @@ class TextRenderer():
 			width=64, initial_indent="           ", subsequent_indent="           ")))
 		self.file.write("\n")
 
-	# Use amount?  use format_money() ?
-	def _end_disposals_table(self,
-			cum_numer_proceeds: Decimal, cum_other_proceeds: Decimal,
-	       	cum_cost, cum_gain, cum_stcg: Decimal, cum_ltcg: Decimal):
-		self.file.write("\n")
+	def _end_disposals_table(self, cum_stcg: Decimal, cum_ltcg: Decimal):
 		self.file.write(
 			f"\n{'':<10} {'Total':<64} "
-			f"{cum_numer_proceeds:>10.2f} "
-			f"{cum_other_proceeds:>10.2f} "
-			f"{cum_cost:>10} "
-			f"{cum_gain:>10} "
+			f"{'':>10} "
+			f"{'':>10} "
+			f"{'':>10} "
+			f"{'':>10} "
 			f"{'STCG':>10} "
-			f"{cum_stcg:>11.2f} "
+			f"{format_money(cum_stcg):>11} "
 			f"{'LTCG':>10} "
-			f"{cum_ltcg:>11.2f}\n")
-
+			f"{format_money(cum_ltcg):>11}\n\n")
 
-	# TODO: placeholder pseudocode, untested
 	def mining_summary(self, rows: List[MiningSummaryRow]):
-		self.write_text("\n"
+		self.file.write("\n"
 			f"{'Month':<6}"
 			f"{'#Awards':>8}"
 			f"{'Amount mined':>24}"
@@ -172,24 +292,24 @@ class TextRenderer():
 			f"{'Cumulative FMV':>20}\n\n")
 
 		if len(rows) == 0:
-			self.write_text("\n(No mining income)\n")
+			self.file.write("\n(No mining income)\n")
 			return
 
 		for row in rows:
 			tok_price_units = f"USD/{row.currency}"
-			self.write_text(
-				f"{calendar.month_abbr[row.month + 1]:<6}"
-				f"{row.n_events:>8}"
+			self.file.write(
+				f"{calendar.month_abbr[row.month]:<6}"
+				f"{row.n_awards:>8}"
 				f"{common.format_money(row.amount_mined, row.currency, 8, 24)}"
-				f"{common.format_money(row.avg_award_size(), row.currency, 8, 20)}"
-				f"{common.format_money(row.cumulative_mined, row.currency, 4, 24)}"
-				f"{common.format_money(row.avg_price(), tok_price_units, 4, 20)}"
-				f"{common.format_money(row.total_fmv, 'USD', 4, 20)}"
+				f"{common.format_money(row.avg_award_size, row.currency, 8, 20)}"
+				f"{common.format_money(row.cumul_total, row.currency, 4, 24)}"
+				f"{common.format_money(row.avg_cost, tok_price_units, 4, 20)}"
+				f"{common.format_money(row.fmv_earned, 'USD', 4, 20)}"
 				f"{common.format_money(row.cumulative_fmv, 'USD', 2, 20)}"
 				"\n")
 			last_row = row  # Remember the last row for printing the summary line
 
-		self.write_text(f"\n{'':6}{'':8}"
+		self.file.write(f"\n{'':6}{'':8}"
 				f"{'Total cumulative fair market value of all mined tokens:':>{24 + 20 + 24 + 20 + 20}}"
 				f"{common.format_money(last_row.cumulative_fmv, 'USD', 2, 20)}")
-		self.write_text("\n\n")
\ No newline at end of file
+		self.file.write("\n\n")
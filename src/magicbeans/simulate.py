@@ -0,0 +1,115 @@
+"""Compare capital gains and tax under different lot selection strategies.
+
+Choosing a booking strategy for a tax year used to mean editing the ledger's
+`booking_method`, rerunning the whole pipeline, and comparing PDFs.  A
+simulation instead books the same (unbooked) ledger once per strategy, each
+in its own process, and tabulates short- and long-term gains and estimated
+tax per year and asset, computed as in the report's tax estimates.  No
+report is rendered.
+"""
+
+import concurrent.futures
+import os
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from tabulate import tabulate
+
+from beancount import loader
+from beancount.core import data
+from beancount.parser import booking, parser
+from magicbeans import lotselection
+from magicbeans.disposals import BookedDisposal, is_disposal_tx
+from magicbeans.reports.data import TaxReport, TaxReportRow
+from magicbeans.reports.driver import make_tax_report
+
+# Tax reports of one strategy, by tax year (None if no disposals that year)
+StrategyResult = Dict[int, Optional[TaxReport]]
+
+
+def book_with_strategy(ledger_path: str, strategy: lotselection.Strategy
+                       ) -> Tuple[data.Entries, List, dict]:
+    """Load a ledger as beancount's loader does, but with lots selected by
+    the strategy ahead of booking.  Returns (entries, errors, options)."""
+    (entries, errors, options) = parser.parse_file(ledger_path)
+    entries.sort(key=data.entry_sortkey)
+    entries = lotselection.select_lots(entries, strategy)
+    (entries, booking_errors) = booking.book(entries, options)
+    errors.extend(booking_errors)
+    (entries, errors) = loader.run_transformations(entries, errors, options, None)
+    return (entries, errors, options)
+
+
+def simulate_strategy(ledger_path: str, strategy_name: str, tax_years: Sequence[int],
+                      numeraire: str, st_rate: Decimal, lt_rate: Decimal
+                      ) -> Tuple[StrategyResult, List[str]]:
+    """Book the ledger with one strategy, and compute its tax reports.
+    Returns the reports and any booking errors (as strings)."""
+    strategy = lotselection.make_strategy(strategy_name, st_rate, lt_rate)
+    (entries, errors, _) = book_with_strategy(ledger_path, strategy)
+
+    disposals_by_year: Dict[int, List[BookedDisposal]] = {ty: [] for ty in tax_years}
+    for entry in entries:
+        if entry.date.year in disposals_by_year and is_disposal_tx(entry):
+            disposals_by_year[entry.date.year].append(BookedDisposal(entry, numeraire))
+
+    result = {ty: make_tax_report(bds, st_rate, lt_rate)
+              for (ty, bds) in disposals_by_year.items()}
+    return (result, [str(e.message) for e in errors])
+
+
+def simulate(ledger_path: str, strategy_names: Sequence[str], tax_years: Sequence[int],
+             numeraire: str, st_rate: Decimal, lt_rate: Decimal,
+             n_workers: Optional[int] = None) -> Dict[str, StrategyResult]:
+    """Simulate each strategy in a worker process, returning the results by
+    strategy name."""
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    n_workers = min(n_workers, len(strategy_names))
+    args = (tax_years, numeraire, st_rate, lt_rate)
+
+    if n_workers < 2:
+        outcomes = [simulate_strategy(ledger_path, name, *args) for name in strategy_names]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(simulate_strategy, ledger_path, name, *args)
+                       for name in strategy_names]
+            outcomes = [future.result() for future in futures]
+
+    results = {}
+    for (name, (result, errors)) in zip(strategy_names, outcomes):
+        if errors:
+            print(f"!!! {len(errors)} errors booking with {name} lot selection, e.g.:")
+            for error in errors[:3]:
+                print(f"!!!   {error}")
+        results[name] = result
+    return results
+
+
+def format_comparison(results: Dict[str, StrategyResult], tax_years: Sequence[int]) -> str:
+    """Return a table comparing the strategies' gains and estimated tax, per
+    year and asset, and for each year in total."""
+    headers = ["Year", "Asset", "Strategy", "STCG", "LTCG", "Est. Tax"]
+    table = []
+    for ty in tax_years:
+        reports = {name: result.get(ty) for (name, result) in results.items()}
+        assets = sorted(set(row.asset for report in reports.values() if report
+                            for row in report.rows))
+        for asset in assets + ["(total)"]:
+            for (name, report) in reports.items():
+                row = _find_row(report, asset)
+                table.append([ty, asset, name,
+                              f"{row.stcg:,.2f}", f"{row.ltcg:,.2f}", f"{row.total_tax:,.2f}"])
+    return tabulate(table, headers=headers, disable_numparse=True,
+                    colalign=("left", "left", "left", "right", "right", "right"))
+
+
+def _find_row(report: Optional[TaxReport], asset: str) -> TaxReportRow:
+    if report:
+        if asset == report.total_row.asset:
+            return report.total_row
+        for row in report.rows:
+            if row.asset == asset:
+                return row
+    zero = Decimal("0")
+    return TaxReportRow(asset, zero, zero, zero, zero, zero)
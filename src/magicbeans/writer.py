@@ -0,0 +1,238 @@
+"""Fast serialization of importer output to beancount syntax.
+
+Beancount's generic printer builds a new EntryPrinter (and display context
+formatters) per entry, dispatches on the directive type, aligns postings
+with regexes and renders through a StringIO.  That adds up on large ledgers,
+and the import pipeline prints every entry twice (02-extracted and
+03-extracted-sorted).
+
+This module formats the transactions our importers actually produce
+(a few postings with amounts, Cost or CostSpec, price, and string/number
+metadata) directly, and writes the output in large buffered batches.  The
+output is byte-for-byte identical to beancount's printer with the default
+display context; any entry outside the supported shapes is formatted by
+the printer itself.
+"""
+
+import datetime
+import textwrap
+from decimal import Decimal
+from typing import List, TextIO, Tuple
+
+from beancount.core import amount
+from beancount.core.data import Commodity, Entries, Transaction
+from beancount.core.position import Cost, CostSpec
+from beancount.parser import printer
+from beangulp import extract
+
+# Number of entries to format before writing them out in one go.
+BATCH_SIZE = 1000
+
+# Buffer size to use when opening output files.
+BUFFER_SIZE = 1024 * 1024
+
+META_IGNORE = printer.EntryPrinter.META_IGNORE
+
+
+class Unsupported(Exception):
+    """Raised when an entry can't be formatted by the fast path."""
+
+
+def open_output(path: str) -> TextIO:
+    """Open a file for writing serialized entries, with a large buffer."""
+    return open(path, "w", buffering=BUFFER_SIZE)
+
+
+def _escape(string: str) -> str:
+    return string.replace('\\', r'\\').replace('"', r'\"')
+
+
+def _number(number) -> str:
+    if not isinstance(number, Decimal):
+        raise Unsupported(number)
+    return f"{number:f}"
+
+
+def _amount(amt: amount.Amount) -> str:
+    return f"{_number(amt.number)} {amt.currency}"
+
+
+def _cost(cost) -> str:
+    parts = []
+    if isinstance(cost, Cost):
+        if isinstance(cost.number, Decimal):
+            parts.append(f"{cost.number:f} {cost.currency}")
+        if cost.date:
+            parts.append(cost.date.isoformat())
+        if cost.label:
+            parts.append(f'"{cost.label}"')
+    elif isinstance(cost, CostSpec):
+        if isinstance(cost.number_per, Decimal) or isinstance(cost.number_total, Decimal):
+            amount_parts = []
+            if isinstance(cost.number_per, Decimal):
+                amount_parts.append(f"{cost.number_per:f}")
+            if isinstance(cost.number_total, Decimal):
+                amount_parts.append("#")
+                amount_parts.append(f"{cost.number_total:f}")
+            if isinstance(cost.currency, str):
+                amount_parts.append(cost.currency)
+            parts.append(" ".join(amount_parts))
+        if cost.date:
+            parts.append(cost.date.isoformat())
+        if cost.label:
+            parts.append(f'"{cost.label}"')
+        if cost.merge:
+            parts.append("*")
+    else:
+        raise Unsupported(cost)
+    return ", ".join(parts)
+
+
+def _write_metadata(meta, prefix: str, out: List[str]) -> None:
+    if meta is None:
+        return
+    for (key, value) in meta.items():
+        if key in META_IGNORE:
+            continue
+        if isinstance(value, str):
+            out.append(f'{prefix}{key}: "{_escape(value)}"\n')
+        elif isinstance(value, bool):
+            out.append(f'{prefix}{key}: {"TRUE" if value else "FALSE"}\n')
+        elif isinstance(value, (Decimal, datetime.date, amount.Amount)):
+            out.append(f'{prefix}{key}: {value}\n')
+        elif value is None:
+            out.append(f'{prefix}{key}: \n')
+        else:
+            # Dicts and inventories are skipped by the printer; anything else
+            # is an error there.  Either way, leave it to the printer.
+            raise Unsupported(value)
+
+
+def _position(posting) -> Tuple[int, str]:
+    """Render the units, cost and price of a posting (which must have units),
+    and return it along with the offset of its currency, for alignment."""
+    units = posting.units
+    number_str = _number(units.number)
+    currency = units.currency
+    if not currency[:1].isupper():
+        raise Unsupported(currency)
+    pos_str = f"{number_str} {currency}"
+    if posting.cost is not None:
+        pos_str = f"{pos_str} {{{_cost(posting.cost)}}}"
+    if posting.price is not None:
+        pos_str = f"{pos_str} @ {_amount(posting.price)}"
+    return (len(number_str) + 1, pos_str)
+
+
+def _format_transaction(entry: Transaction) -> str:
+    out = []
+    strings = []
+    if entry.payee:
+        strings.append(f'"{_escape(entry.payee)}"')
+    if entry.narration:
+        strings.append(f'"{_escape(entry.narration)}"')
+    elif entry.payee:
+        strings.append('""')
+    if entry.tags:
+        strings.extend(f"#{tag}" for tag in sorted(entry.tags))
+    if entry.links:
+        strings.extend(f"^{link}" for link in sorted(entry.links))
+    out.append(f"{entry.date} {entry.flag} {' '.join(strings)}\n")
+    _write_metadata(entry.meta, "  ", out)
+
+    # Align the postings' amounts on the first character of their currencies.
+    accounts = []
+    positions = []   # (offset of currency or None, position string)
+    for posting in entry.postings:
+        accounts.append(f"{posting.flag} {posting.account}" if posting.flag
+                        else posting.account)
+        if isinstance(posting.units, amount.Amount):
+            positions.append(_position(posting))
+        elif posting.price is not None:
+            raise Unsupported(posting)
+        else:
+            positions.append((None, ""))
+
+    width_account = max(map(len, accounts)) if accounts else 1
+    max_before = max_after = max_unknown = 0
+    for (index, pos_str) in positions:
+        if index is None:
+            max_unknown = max(len(pos_str), max_unknown)
+        else:
+            max_before = max(index, max_before)
+            max_after = max(len(pos_str) - index, max_after)
+    width_position = max(max_before + max_after, max_unknown)
+    max_after = width_position - max_before
+
+    for (posting, account, (index, pos_str)) in zip(entry.postings, accounts, positions):
+        if index is None:
+            aligned = pos_str.ljust(width_position)
+        else:
+            aligned = pos_str[:index].rjust(max_before) + pos_str[index:].ljust(max_after)
+        line = f"  {account:{width_account}}  {aligned:{max(1, width_position)}}"
+        out.append(line.rstrip() + "\n")
+        if posting.meta:
+            _write_metadata(posting.meta, "    ", out)
+
+    return "".join(out)
+
+
+def format_entry(entry) -> str:
+    """Format an entry exactly like beancount.parser.printer.format_entry()."""
+    if type(entry) is Transaction:
+        try:
+            return _format_transaction(entry)
+        except Unsupported:
+            pass
+    return printer.format_entry(entry)
+
+
+def write_entries(entries: Entries, out: TextIO) -> None:
+    """Write entries exactly like beancount.parser.printer.print_entries()."""
+    batch = []
+    previous_type = type(entries[0]) if entries else None
+    for entry in entries:
+        # Insert a newline between transactions and between blocks of
+        # directives of the same type.
+        entry_type = type(entry)
+        if entry_type in (Transaction, Commodity) or entry_type is not previous_type:
+            batch.append("\n")
+            previous_type = entry_type
+        batch.append(format_entry(entry))
+        if len(batch) >= BATCH_SIZE:
+            out.write("".join(batch))
+            batch.clear()
+    out.write("".join(batch))
+
+
+def write_extracted_entries(extracted, out: TextIO) -> None:
+    """Write extracted entries exactly like beangulp's
+    extract.print_extracted_entries().  Entries marked as duplicates are
+    written as comments."""
+    batch = []
+    if extracted and extract.HEADER:
+        batch.append(extract.HEADER + "\n")
+
+    for (filepath, entries, account, importer) in extracted:
+        batch.append(extract.SECTION.format(filepath) + "\n\n")
+
+        for entry in entries:
+            duplicate = entry.meta.pop(extract.DUPLICATE, False)
+            string = format_entry(entry)
+            # If the entry is a duplicate, comment it out and report of which
+            # other entry this is a duplicate.
+            if duplicate:
+                if isinstance(duplicate, type(entry)):
+                    filename = duplicate.meta.get("filename")
+                    lineno = duplicate.meta.get("lineno")
+                    if filename and lineno:
+                        batch.append(f"; duplicate of {filename}:{lineno}\n")
+                string = textwrap.indent(string, "; ")
+            batch.append(string)
+            batch.append("\n")
+            if len(batch) >= BATCH_SIZE:
+                out.write("".join(batch))
+                batch.clear()
+
+        batch.append("\n")
+    out.write("".join(batch))